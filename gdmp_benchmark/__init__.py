@@ -2,4 +2,6 @@
 GDMP Benchmarker package
 Used to run benchmarks for the Gaia Data Mining platform
 """
-from .gdmp_benchmark import Results, Timing, Notebook, Status, GDMPBenchmarker
+from .results import Results, Timing, Status
+from .notebooks import Notebook
+from .benchmarker import GDMPBenchmarker
@@ -0,0 +1,10 @@
+"""
+Load generation agent of distributed runs, see Agent
+
+Run with: python -m gdmp_benchmark.agent --listen 0.0.0.0:7077
+"""
+import sys
+from gdmp_benchmark.gdmp_benchmark import agent_main
+
+if __name__ == "__main__":
+    agent_main(sys.argv[1:])
@@ -0,0 +1,658 @@
+"""
+Command line arguments of the benchmarker
+"""
+import os
+import argparse
+from typing import List, Optional
+from gdmp_benchmark.results import InvalidConfigurationError
+from gdmp_benchmark.store import RunJournal
+from gdmp_benchmark.load import ArrivalProfile, CredentialPool, LoadProfile, Prewarm
+from gdmp_benchmark.notebooks import NoteCache
+from gdmp_benchmark.handlers import NOTEBOOK_HANDLERS
+from gdmp_benchmark.benchmarker import RUNNERS
+from gdmp_benchmark.distributed import Coordinator, parse_address
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the parser of the command line arguments
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    # pylint: disable=too-many-statements
+    user_config_docs = """The user configuration file in JSON format.
+            { "users": [{    
+                            "username": "user1",
+                            "shirouser": {
+                                "name": "user1",
+                                "password": "pass1"
+                            }          
+                       }]
+            }
+    """
+
+    notebook_config_docs = """The notebook configuration file in JSON format.
+            { "notebooks" : [{
+                               "name" : "GaiaDMPSetup",
+                               "filepath" : "/path/GaiaDMP_validation.json",
+                               "totaltime" : 50,
+                               "results" : []
+                            }] 
+            }
+    """
+    parser = argparse.ArgumentParser(
+        description="Gaia Data Mining Platform Benchmarking Tool"
+    )
+
+    parser.add_argument(
+        "--zeppelin_url", required=True, type=str, default=1, help="Zeppelin URL"
+    )
+    parser.add_argument(
+        "--usercount",
+        type=int,
+        required=True,
+        default=1,
+        help="Number of users (default: 1)",
+    )
+    parser.add_argument(
+        "--notebook_config",
+        type=str,
+        required=True,
+        default="",
+        help=notebook_config_docs,
+    )
+    parser.add_argument(
+        "--user_config", type=str, required=True, default="", help=user_config_docs
+    )
+    parser.add_argument(
+        "--delay_start",
+        type=int,
+        default=0,
+        help="Number of seconds to delay start of test (default: 0)",
+    )
+    parser.add_argument(
+        "--delay_notebook",
+        type=int,
+        default=0,
+        help="Number of seconds to delay each notebook (default: 0)",
+    )
+    parser.add_argument(
+        "--delete",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Whether to delete the notebooks after the test, --no-delete keeps them "
+        "(default: delete)",
+    )
+
+    parser.add_argument(
+        "--notebook_handler",
+        type=str,
+        choices=sorted(NOTEBOOK_HANDLERS),
+        default="zdairi",
+        help="How notebooks are run: via zdairi subprocesses or the Zeppelin "
+        "REST API with persistent sessions (default: zdairi)",
+    )
+
+    parser.add_argument(
+        "--runner",
+        type=str,
+        choices=RUNNERS,
+        default="pool",
+        help="How concurrent users are run: one process per user (pool) or "
+        "one coroutine per user on a single event loop (asyncio) (default: pool)",
+    )
+
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=NoteCache.DEFAULT_DIR,
+        help=f"Directory of the cache of remote notebooks (default: {NoteCache.DEFAULT_DIR})",
+    )
+    parser.add_argument(
+        "--cache_max_size",
+        type=int,
+        default=512,
+        help="Maximum size of the notebook cache in MB (default: 512)",
+    )
+    parser.add_argument(
+        "--cache_max_age",
+        type=int,
+        default=60,
+        help="Number of seconds a cached notebook is used before it is "
+        "revalidated (default: 60)",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use notebooks that are already in the cache",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Fetch remote notebooks on every run, without caching them",
+    )
+
+    parser.add_argument(
+        "--arrival_profile",
+        type=str,
+        choices=ArrivalProfile.KINDS,
+        default=None,
+        help="Run as an open-loop test, launching notebooks at a target arrival "
+        "rate regardless of completion, instead of each user running them back-to-back",
+    )
+    parser.add_argument(
+        "--arrival_rate",
+        type=float,
+        default=1.0,
+        help="Notebook arrivals per minute, the starting rate of a ramp (default: 1)",
+    )
+    parser.add_argument(
+        "--arrival_end_rate",
+        type=float,
+        default=0.0,
+        help="Notebook arrivals per minute at the end of a ramp (default: 0)",
+    )
+    parser.add_argument(
+        "--arrival_steps",
+        type=str,
+        default="",
+        help="Steps of a step profile, as comma separated seconds:rate pairs (i.e. 600:1,600:2)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=int,
+        default=60,
+        help="Length of an open-loop test in seconds (default: 60)",
+    )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=0,
+        help="Maximum concurrent notebooks of an open-loop test, unbounded if 0 (default: 0)",
+    )
+
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=0,
+        help="Number of warm-up runs of the notebooks by each user, excluded from "
+        "the statistics (default: 0)",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=1,
+        help="Number of measured runs of the notebooks by each user (default: 1)",
+    )
+    parser.add_argument(
+        "--measure_duration",
+        type=float,
+        default=0,
+        help="Repeat the measured runs for this many seconds, instead of a number "
+        "of iterations (default: 0)",
+    )
+
+    parser.add_argument(
+        "--load_profile",
+        type=str,
+        default="",
+        help="Vary the number of active users, as comma separated seconds:users "
+        "stages, each user repeating the measured runs while it is active "
+        "(i.e. 600:40,1800:40,300:0 ramps up to 40 users over 10 minutes, holds "
+        "for 30 minutes and ramps down over 5 minutes)",
+    )
+    parser.add_argument(
+        "--load_start_users",
+        type=int,
+        default=0,
+        help="Number of active users at the start of a load profile (default: 0)",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Run the notebooks with 1, 2, 4, 8... users up to the user count in one "
+        "session, summarising the throughput versus latency and its knee",
+    )
+    parser.add_argument(
+        "--sweep_usercounts",
+        type=str,
+        default="",
+        help="Comma separated numbers of users of a sweep, instead of doubling",
+    )
+
+    parser.add_argument(
+        "--credential_mode",
+        type=str,
+        choices=CredentialPool.MODES,
+        default=None,
+        help="Share the credentials of the user configuration between the users, "
+        "which may outnumber them, each with its own session: assigned in turn "
+        "(round-robin), or leased for the run of each user (leased)",
+    )
+    parser.add_argument(
+        "--sessions_per_credential",
+        type=int,
+        default=1,
+        help="Number of users that lease a credential at a time (default: 1)",
+    )
+
+    parser.add_argument(
+        "--journal",
+        type=str,
+        default="",
+        help="Record the notebooks created and completed by the run in this file, "
+        "to resume the run or delete its notebooks if it is interrupted",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the run of the journal, skipping the notebooks it completed "
+        "and deleting the notebooks it left behind",
+    )
+
+    parser.add_argument(
+        "--notebook_concurrency",
+        type=int,
+        default=1,
+        help="Maximum number of notebooks each user runs at a time, notebooks start "
+        "once the notebooks they depend on have completed (default: 1)",
+    )
+
+    parser.add_argument(
+        "--max_errors",
+        type=int,
+        default=0,
+        help="Skip the remaining notebooks of all the users once this many notebooks "
+        "have failed, never if 0 (default: 0)",
+    )
+    parser.add_argument(
+        "--max_user_errors",
+        type=int,
+        default=0,
+        help="Skip the remaining notebooks of all the users once a user has failed this "
+        "many notebooks in a row, never if 0 (default: 0)",
+    )
+    parser.add_argument(
+        "--timeout_factor",
+        type=float,
+        default=3.0,
+        help="Stop a notebook that runs longer than this multiple of its expected time, "
+        "unless its configuration sets a timeout. Never if 0 (default: 3)",
+    )
+    parser.add_argument(
+        "--paragraph_timeout",
+        type=float,
+        default=0,
+        help="Stop a paragraph that runs longer than this many seconds, never if 0 "
+        "(default: 0)",
+    )
+
+    parser.add_argument(
+        "--results_db",
+        type=str,
+        default=None,
+        help="Database of past results, every run is appended and compared with the "
+        "previous runs (default: none, the results are not recorded)",
+    )
+    parser.add_argument(
+        "--revision",
+        type=str,
+        default="",
+        help="Git revision of the benchmarks, recorded with the results "
+        "(default: the revision of this checkout)",
+    )
+    parser.add_argument(
+        "--baseline_runs",
+        type=int,
+        default=10,
+        help="Number of previous runs in the baseline the results are compared with (default: 10)",
+    )
+    parser.add_argument(
+        "--regression_alpha",
+        type=float,
+        default=0.01,
+        help="Significance level of a regression versus the baseline (default: 0.01)",
+    )
+    parser.add_argument(
+        "--adaptive_thresholds",
+        action="store_true",
+        help="Classify notebook times as SLOW/FAST with bands learned from the past "
+        "runs with the same number of users, instead of the notebook configuration",
+    )
+    parser.add_argument(
+        "--threshold_width",
+        type=float,
+        default=3.0,
+        help="Width of the learned bands, in median absolute deviations either side "
+        "of the median (default: 3)",
+    )
+    parser.add_argument(
+        "--export_thresholds",
+        type=str,
+        default="",
+        help="Write the notebook configuration, with the bands learned from the past "
+        "runs including this one, to this file",
+    )
+
+    parser.add_argument(
+        "--metrics_endpoint",
+        type=str,
+        action="append",
+        default=[],
+        help="Poll this metrics endpoint during the run, Prometheus metrics or the "
+        "applications of the Spark REST API (ending with /api/v1/applications). "
+        "Can be repeated",
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=5.0,
+        help="Seconds between polls of the metrics endpoints (default: 5)",
+    )
+    parser.add_argument(
+        "--metrics_filter",
+        type=str,
+        default="",
+        help="Regular expression of the Prometheus series to keep, all if empty",
+    )
+
+    parser.add_argument(
+        "--spark_jobs",
+        action="store_true",
+        help="Summarise the Spark jobs launched by each paragraph, from the Spark "
+        "monitoring REST API",
+    )
+
+    parser.add_argument(
+        "--prewarm",
+        action="store_true",
+        help="Warm up the interpreters of each user before the run, and report "
+        "their cold start latency",
+    )
+
+    parser.add_argument(
+        "--prewarm_interpreters",
+        type=str,
+        default="",
+        help="Comma separated interpreters to warm up (i.e. spark.pyspark,md,sh), "
+        "those used by the notebooks by default",
+    )
+
+    parser.add_argument(
+        "--restart_interpreters",
+        action="store_true",
+        help="Restart the interpreters before warming them up, so they start cold",
+    )
+
+    parser.add_argument(
+        "--prewarm_timeout",
+        type=int,
+        default=600,
+        help="Seconds the warm-up of a user may take",
+    )
+
+    parser.add_argument(
+        "--agent",
+        action="append",
+        default=[],
+        help="host:port of an agent to distribute the users across, see the agent "
+        "command. Can be repeated",
+    )
+
+    parser.add_argument(
+        "--agent_authkey",
+        type=str,
+        default=os.environ.get("GDMP_AGENT_AUTHKEY", ""),
+        help="Key shared with the agents, $GDMP_AGENT_AUTHKEY by default",
+    )
+
+    parser.add_argument(
+        "--profile_dir",
+        type=str,
+        default="",
+        help="Profile the harness, writing cProfile profiles of its hot paths and "
+        "samples of its CPU, memory, open files and processes to this directory",
+    )
+    parser.add_argument(
+        "--sample_interval",
+        type=float,
+        default=1.0,
+        help="Seconds between samples of the resources of the harness (default: 1)",
+    )
+
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=("json", "ndjson"),
+        default="json",
+        help="Print all the results as JSON at the end of the run (json), or a "
+        "JSON record per line as each notebook completes followed by a summary "
+        "record (ndjson) (default: json)",
+    )
+
+    parser.add_argument(
+        "--slack_webhook",
+        type=str,
+        required=False,
+        default=None,
+        help="Whether to delete the notebooks after the test",
+    )
+    return parser
+
+
+def build_agent_parser() -> argparse.ArgumentParser:
+    """
+    Build the parser of the command line arguments of an agent of distributed runs
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Gaia Data Mining Platform Benchmarking Agent"
+    )
+    parser.add_argument(
+        "--listen",
+        type=str,
+        default="0.0.0.0:7077",
+        help="host:port to listen on for coordinators",
+    )
+    parser.add_argument(
+        "--authkey",
+        type=str,
+        default=os.environ.get("GDMP_AGENT_AUTHKEY", ""),
+        help="Key shared with the coordinators, $GDMP_AGENT_AUTHKEY by default",
+    )
+    parser.add_argument(
+        "--directory",
+        type=str,
+        default="",
+        help="Directory of the configurations of the runs, a temporary one by default",
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=0,
+        help="Exit after serving this many runs, never if 0",
+    )
+    return parser
+
+
+def build_cleanup_parser() -> argparse.ArgumentParser:
+    """
+    Build the parser of the command line arguments of the cleanup command
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Delete the notebooks left behind by a Gaia Data Mining Platform "
+        "benchmark"
+    )
+    parser.add_argument(
+        "--journal", type=str, required=True, help="The journal of the run"
+    )
+    parser.add_argument(
+        "--zeppelin_url",
+        type=str,
+        default="",
+        help="URL of the Zeppelin server, the one of the run by default",
+    )
+    parser.add_argument(
+        "--user_config",
+        type=str,
+        default="",
+        help="Path to the user configuration file, the one of the run by default",
+    )
+    parser.add_argument(
+        "--notebook_handler",
+        type=str,
+        choices=sorted(NOTEBOOK_HANDLERS),
+        default="zdairi",
+        help="How notebooks are deleted (default: zdairi)",
+    )
+    return parser
+
+
+def parse_arrival_profile(args: argparse.Namespace) -> Optional[ArrivalProfile]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        ArrivalProfile: The arrival profile of an open-loop test, None for a closed-loop one
+    """
+    if not args.arrival_profile:
+        return None
+    return ArrivalProfile(
+        kind=args.arrival_profile,
+        rate=args.arrival_rate,
+        duration=args.duration,
+        end_rate=args.arrival_end_rate,
+        steps=[
+            [int(length), float(rate)]
+            for length, rate in (
+                step.split(":") for step in args.arrival_steps.split(",") if step
+            )
+        ],
+    )
+
+
+def parse_load_profile(args: argparse.Namespace) -> Optional[LoadProfile]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        LoadProfile: The load profile of the run, None for a fixed number of users
+    """
+    if not args.load_profile:
+        return None
+    return LoadProfile(
+        stages=[
+            [float(length), int(users)]
+            for length, users in (
+                stage.split(":") for stage in args.load_profile.split(",") if stage
+            )
+        ],
+        start_users=args.load_start_users,
+    )
+
+
+def parse_sweep(args: argparse.Namespace) -> Optional[List[int]]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        list: The numbers of users of a sweep, doubling up to the user count unless
+            they are given, None without a sweep
+    """
+    if args.sweep_usercounts:
+        return [int(count) for count in args.sweep_usercounts.split(",") if count]
+    if not args.sweep:
+        return None
+    usercounts = [1]
+    while usercounts[-1] * 2 < args.usercount:
+        usercounts.append(usercounts[-1] * 2)
+    return usercounts + [args.usercount] if args.usercount > 1 else usercounts
+
+
+def parse_credential_pool(args: argparse.Namespace) -> Optional[CredentialPool]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        CredentialPool: The pool of the credentials shared by the users, None if
+            each user has its own
+    """
+    if not args.credential_mode:
+        return None
+    return CredentialPool(args.credential_mode, args.sessions_per_credential)
+
+
+def parse_note_cache(args: argparse.Namespace) -> Optional[NoteCache]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        NoteCache: The cache of the remote notebooks, None if they are not cached
+    Raises:
+        InvalidConfigurationError: If running offline without the cache
+    """
+    if args.no_cache:
+        if args.offline:
+            raise InvalidConfigurationError("Running --offline needs the notebook cache")
+        return None
+    return NoteCache(
+        directory=args.cache_dir,
+        max_size=args.cache_max_size * 1024 * 1024,
+        max_age=args.cache_max_age,
+        offline=args.offline,
+    )
+
+
+def parse_journal(args: argparse.Namespace) -> Optional[RunJournal]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        RunJournal: The journal of the run, None if it does not keep one
+    Raises:
+        InvalidConfigurationError: If a run is resumed without its journal
+    """
+    if not args.journal:
+        if args.resume:
+            raise InvalidConfigurationError("Resuming a run needs its --journal")
+        return None
+    return RunJournal(args.journal, resume=args.resume)
+
+
+def parse_prewarm(args: argparse.Namespace) -> Optional[Prewarm]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        Prewarm: The warm-up of the interpreters, None if they are not warmed up
+    """
+    if not args.prewarm:
+        return None
+    return Prewarm(
+        interpreters=[
+            name.strip() for name in args.prewarm_interpreters.split(",") if name.strip()
+        ],
+        restart=args.restart_interpreters,
+        timeout=args.prewarm_timeout,
+    )
+
+
+def parse_coordinator(args: argparse.Namespace) -> Optional[Coordinator]:
+    """
+    Args:
+        args: The command line arguments
+    Returns:
+        Coordinator: The coordinator of a distributed run, None for a local one
+    Raises:
+        InvalidConfigurationError: If an agent address or the key is missing or invalid
+    """
+    if not args.agent:
+        return None
+    if not args.agent_authkey:
+        raise InvalidConfigurationError("A distributed run needs the key of the agents")
+    return Coordinator(
+        [parse_address(agent) for agent in args.agent], args.agent_authkey.encode("utf-8")
+    )
@@ -0,0 +1,495 @@
+"""
+Benchmarker of the Gaia Data Mining Platform, running the notebooks of concurrent users
+"""
+# pylint: disable-msg=too-many-locals
+# pylint: disable-msg=too-many-arguments
+# pylint: disable-msg=too-many-positional-arguments
+import os
+import asyncio
+import functools
+import logging
+from datetime import datetime
+from contextlib import ExitStack
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional
+from dataclasses import asdict
+from gdmp_benchmark.results import InvalidConfigurationError, Results, Status, flatten_results
+from gdmp_benchmark.store import LatencyHistogram, LatencyStatistics, RunJournal
+from gdmp_benchmark.load import (
+    ArrivalProfile, CircuitBreaker, CredentialContention, CredentialPool, LoadProfile, Prewarm,
+)
+from gdmp_benchmark.monitoring import MetricsPoller, SparkJobCollector, profiled
+from gdmp_benchmark.notebooks import Notebook
+from gdmp_benchmark.handlers import ThreadedAsyncNotebookHandler
+from gdmp_benchmark.scheduling import UserScheduler
+
+if TYPE_CHECKING:
+    from gdmp_benchmark.distributed import Coordinator
+
+
+RUNNERS = ("pool", "asyncio")
+
+
+class GDMPBenchmarker(UserScheduler):
+    # pylint: disable=too-many-instance-attributes
+    """Class used to run benchmarks for the Gaia Data Mining platform"""
+
+    @profiled
+    def run(
+        self,
+        usercount: int = 1,
+        notebook_config: str = "",
+        delay_start: int = 0,
+        delay_notebook: int = 0,
+        delete: bool = True,
+        runner: str = "pool",
+        on_result: Optional[Callable[[int, Results], None]] = None,
+        arrival_profile: Optional[ArrivalProfile] = None,
+        max_in_flight: int = 0,
+        warmup: int = 0,
+        iterations: int = 1,
+        measure_duration: float = 0,
+        thresholds: Optional[dict] = None,
+        notebook_concurrency: int = 1,
+        max_errors: int = 0,
+        max_user_errors: int = 0,
+        timeout_factor: float = 3.0,
+        paragraph_timeout: float = 0,
+        metrics: Optional[MetricsPoller] = None,
+        spark_jobs: bool = False,
+        prewarm: Optional[Prewarm] = None,
+        coordinator: Optional["Coordinator"] = None,
+        users: Optional[List[int]] = None,
+        load_profile: Optional[LoadProfile] = None,
+        credential_pool: Optional[CredentialPool] = None,
+        journal: Optional[RunJournal] = None,
+    ) -> list:
+        """
+        Wrapper method to run a notebook test, either as a concurrent benchmark or as a single one
+        Args:
+            usercount: Number of users
+            notebook_config: Notebook configuration file,
+            delay_start: Number of seconds to delay start of test
+            delay_notebook: Number of seconds to delay each notebook
+            delete: Whether to delete the notebooks after the test
+            runner: How concurrent users are run, "pool" for one process per user
+                or "asyncio" for one coroutine per user on a single event loop
+            on_result: Called in this process with the user number and the Results
+                of each notebook, as soon as the notebook completes. Results are also
+                aggregated in the statistics, see summarise()
+            arrival_profile: Run as an open-loop test, launching notebooks at the arrival
+                times of the profile instead of each user running them back-to-back
+            max_in_flight: Maximum number of concurrent executions in an open-loop test
+            warmup: Number of warm-up runs of the notebooks by each user, before the
+                measured ones. Warm-up results are tagged and excluded from the statistics.
+                Repetitions do not apply to open-loop tests
+            iterations: Number of measured runs of the notebooks by each user
+            measure_duration: Repeat the measured runs for this many seconds instead
+                of a number of iterations
+            thresholds: Learned bands of expected times of the notebooks (see
+                ResultStore.thresholds), used for the SLOW/FAST verdict instead of
+                the times in the notebook configuration
+            notebook_concurrency: Maximum number of notebooks each user runs at a time.
+                Notebooks start once the notebooks they depend on have completed. This
+                and the dependencies do not apply to open-loop tests
+            max_errors: Skip the remaining notebooks of all the users once this many
+                notebooks have failed, never if 0
+            max_user_errors: Skip the remaining notebooks of all the users once a user
+                has failed this many notebooks in a row, never if 0
+            timeout_factor: Stop a notebook that runs longer than this multiple of its
+                expected time, unless its configuration sets a timeout. Never if 0
+            paragraph_timeout: Stop a paragraph that runs longer than this many seconds,
+                unless the notebook configuration sets a paragraph timeout. Never if 0
+            metrics: Poll metrics endpoints during the run, adding the samples taken
+                while each notebook ran to its Results
+            spark_jobs: Summarise the Spark jobs launched by each paragraph from the
+                Spark monitoring REST API, see SparkJobCollector
+            prewarm: Warm up the interpreters of each user before the run, recording
+                their cold start latency in cold_start
+            coordinator: Distribute the users across the agents of the coordinator,
+                each running its users with the runner. Not for open-loop tests
+            users: The numbers of the users to run, 1 to usercount by default. Used by
+                the agents of a distributed run, each running a part of the users
+            load_profile: Vary the number of active users over the run, each user
+                repeating the measured runs while it is active, instead of the start
+                delay and repetitions. The run has as many users as the peak of the
+                profile, unless the users are given. Not for open-loop tests
+            credential_pool: Share the credentials of the user configuration between
+                the users, which may outnumber them. Contention of the credentials
+                is reported in contention. Leased credentials are only for local
+                closed-loop runs
+            journal: Record the notebooks created and completed in this journal, or
+                resume the run of the journal, skipping the notebooks it completed and
+                deleting the notebooks it left behind. Not for distributed runs, and
+                open-loop tests cannot be resumed
+        Returns:
+            List of Results
+        Raises:
+            InvalidConfigurationError: If the runner, the iterations, the notebook
+                concurrency, the timeouts, the notebook dependencies or the journal
+                are invalid, or if an agent of a distributed run fails
+            ValueError: If the user count exceeds the users of the configuration
+            OSError: If the notebook configuration or a notebook cannot be read
+        """
+        if runner not in RUNNERS:
+            raise InvalidConfigurationError(f"Unknown runner: {runner}")
+        if warmup < 0 or iterations < 1 or measure_duration < 0:
+            raise InvalidConfigurationError(
+                "Warm-up runs, iterations and duration must not be negative, "
+                "with at least one iteration"
+            )
+        if notebook_concurrency < 1:
+            raise InvalidConfigurationError("Notebook concurrency must be at least 1")
+        if timeout_factor < 0 or paragraph_timeout < 0:
+            raise InvalidConfigurationError("Timeouts must not be negative")
+        if arrival_profile is not None and (coordinator or load_profile) is not None:
+            raise InvalidConfigurationError(
+                "Open-loop tests cannot be distributed, nor have a load profile"
+            )
+        self._share_credentials(
+            credential_pool, coordinator is None and arrival_profile is None
+        )
+        usercount = (
+            load_profile.peak if load_profile is not None and users is None else usercount
+        )
+        repeat = {
+            "warmup": warmup,
+            "iterations": iterations,
+            "measure_duration": measure_duration,
+            "notebook_concurrency": notebook_concurrency,
+        }
+        self._size_workers(usercount * notebook_concurrency, max_in_flight)
+
+        def parse_notebook_config(note_config: str):
+            """
+            Parse the notebook configuration
+            Args:
+                note_config: Notebook config as string
+            Returns:
+                list: Notebook list
+            """
+            notebook_list = []
+            notebook_json = self.get_note(path=note_config, cache=self.note_cache)[
+                "notebooks"
+            ]
+            for notebook in notebook_json:
+                notebook_list.append(Notebook(**notebook))
+            return notebook_list
+
+        notebooks = parse_notebook_config(notebook_config)
+        self._dependencies(notebooks)
+        self._set_limits(notebooks, thresholds, timeout_factor, paragraph_timeout)
+        self._open_journal(
+            journal,
+            {
+                "zeppelin_url": self.zeppelin_url,
+                "user_config": self.userconfig,
+                "notebook_config": notebook_config,
+                "usercount": usercount,
+                "warmup": warmup,
+                "iterations": iterations,
+                "delete": delete,
+            },
+            distributed=coordinator is not None,
+            open_loop=arrival_profile is not None,
+        )
+        self.cold_start = (
+            asyncio.run(self._prewarm(usercount, notebooks, prewarm))
+            if prewarm is not None
+            else {}
+        )
+        self.statistics, self.deletion = LatencyStatistics(), {}
+        self.breaker = CircuitBreaker(max_errors, max_user_errors)
+        self.spark_jobs = SparkJobCollector() if spark_jobs else None
+        self._on_result = functools.partial(self._record_result, on_result=on_result)
+        self.metrics = metrics
+        # The agents of a distributed run schedule their users as they start
+        windows = self._windows(load_profile) if coordinator is None else None
+        try:
+            with metrics or ExitStack(), self._stopping():
+                if coordinator is not None:
+                    self._check_usercount(usercount)
+                    results = coordinator.run(
+                        self,
+                        usercount,
+                        self.get_note(path=notebook_config, cache=self.note_cache),
+                        dict(
+                            repeat,
+                            delay_start=delay_start,
+                            delay_notebook=delay_notebook,
+                            delete=delete,
+                            runner=runner,
+                            thresholds=thresholds,
+                            max_errors=max_errors,
+                            max_user_errors=max_user_errors,
+                            timeout_factor=timeout_factor,
+                            paragraph_timeout=paragraph_timeout,
+                            spark_jobs=spark_jobs,
+                            # Sent as its stages, its class may be the one of __main__
+                            load_profile=load_profile and asdict(load_profile),
+                            credential_pool=credential_pool and credential_pool.to_dict(),
+                        ),
+                        self._on_result,
+                    )
+                elif arrival_profile is not None:
+                    results = asyncio.run(
+                        self._run_open_loop(
+                            usercount=usercount,
+                            notebooks=notebooks,
+                            profile=arrival_profile,
+                            max_in_flight=max_in_flight,
+                            delete=delete,
+                        )
+                    )
+                elif runner == "asyncio":
+                    results = asyncio.run(
+                        self._run_async(
+                            usercount=usercount,
+                            notebooks=notebooks,
+                            delay_start=delay_start,
+                            delay_notebook=delay_notebook,
+                            delete=delete,
+                            users=users,
+                            windows=windows,
+                            **repeat,
+                        )
+                    )
+                    if usercount == 1 and users is None:
+                        results = results[0]
+                elif usercount > 1 or users is not None:
+                    results = self._run_parallel(
+                        usercount=usercount,
+                        notebooks=notebooks,
+                        delay_start=delay_start,
+                        delay_notebook=delay_notebook,
+                        delete=delete,
+                        users=users,
+                        windows=windows,
+                        **repeat,
+                    )
+                else:
+                    # A single user sharing a credential runs as user 1
+                    user = 1 if credential_pool is not None else 0
+                    results = self._run_single(
+                        user,
+                        notebooks,
+                        bool(user),
+                        delay_start,
+                        delay_notebook,
+                        delete,
+                        window=(windows or {}).get(1),
+                        **repeat,
+                    )
+            self._annotate(results)
+        finally:
+            self._on_result = None
+            self.metrics = None
+            self._remove_session_directory()
+        return results
+
+    def _size_workers(self, notebooks: int, max_in_flight: int) -> None:
+        """
+        Size the threads running a synchronous notebook handler on the event loop,
+        so each notebook that may run at once has its own
+        Args:
+            notebooks: Number of notebooks the users may run at once
+            max_in_flight: Maximum number of concurrent executions of an open-loop test
+        """
+        if isinstance(self.async_notebook_handler, ThreadedAsyncNotebookHandler):
+            self.async_notebook_handler.workers(max(notebooks, max_in_flight, 1))
+
+    def _share_credentials(
+        self, credential_pool: Optional[CredentialPool], local: bool
+    ) -> None:
+        """
+        Share the credentials between the users of a run, or stop sharing them
+        Args:
+            credential_pool: The pool of the shared credentials, None not to share them
+            local: Whether the run is a local closed-loop one
+        Raises:
+            InvalidConfigurationError: If credentials are leased in another run, or
+                there are no credentials
+        """
+        if credential_pool is not None and credential_pool.mode == "leased" and not local:
+            raise InvalidConfigurationError(
+                "Leased credentials are only for local closed-loop runs"
+            )
+        self.credential_pool = credential_pool
+        self.contention = None
+        if credential_pool is not None:
+            credential_pool.start(len(self.credential_names))
+            self.contention = CredentialContention()
+            # Created before the workers start, so they share it
+            self._session_directory()
+
+    def _open_journal(
+        self,
+        journal: Optional[RunJournal],
+        header: dict,
+        distributed: bool = False,
+        open_loop: bool = False,
+    ) -> None:
+        """
+        Start the journal of a run, or resume the run of the journal, deleting the
+        notebooks it left behind
+        Args:
+            journal: The journal of the run, None not to keep one
+            header: The arguments of the run
+            distributed: Whether the run is distributed across agents
+            open_loop: Whether the run is an open-loop test
+        Raises:
+            InvalidConfigurationError: If the run cannot be journaled, or the journal
+                is not the one of the run
+        """
+        self.journal = None
+        if journal is None:
+            return
+        if distributed or (open_loop and journal.resume):
+            raise InvalidConfigurationError(
+                "Distributed runs cannot be journaled, nor open-loop tests resumed"
+            )
+        journal.open(header)
+        self.journal = journal
+        if journal.resume:
+            self.cleanup(journal)
+
+    def cleanup(self, journal: RunJournal) -> List[str]:
+        """
+        Delete the notebooks a run created and did not delete, recording them as
+        deleted in its journal, unless the run keeps its notebooks
+        Args:
+            journal: The journal of the run
+        Returns:
+            list: The IDs of the deleted notebooks
+        """
+        records = RunJournal.read(journal.path)
+        if records and not records[0].get("delete", True):
+            logging.info("The run of journal %s keeps its notebooks", journal.path)
+            return []
+        deleted = []
+        for notebookid, config in RunJournal.created(records).items():
+            if not os.path.exists(config):
+                logging.warning(
+                    "Cannot delete notebook %s, configuration %s is missing",
+                    notebookid,
+                    config,
+                )
+                continue
+            if self.notebook_handler.delete_notebook(notebookid=notebookid, config=config):
+                journal.notebook_deleted(notebookid)
+                deleted.append(notebookid)
+        return deleted
+
+    def _annotate(self, results: list) -> None:
+        """
+        Add the polled metrics to the results that were not published in this process
+        Args:
+            results: The results of the run, a list per user or a single list
+        """
+        if self.metrics is None:
+            return
+        for result in flatten_results(results):
+            if not result.metrics:
+                self.metrics.annotate(result)
+
+    def sweep(
+        self,
+        usercounts: List[int],
+        notebook_config: str = "",
+        thresholds: Optional[Dict[int, dict]] = None,
+        **arguments,
+    ) -> tuple:
+        """
+        Run the notebooks at increasing numbers of users in one session, to find
+        where the platform saturates
+        Args:
+            usercounts: The numbers of users of each run
+            notebook_config: Notebook configuration file
+            thresholds: Learned bands of expected times of the runs with each number
+                of users, see run(). The notebook configuration for the others
+            arguments: The other arguments of each run, see run()
+        Returns:
+            dict: The results of each run, by number of users
+            dict: The throughput and latency of each run, and the knee of the curve
+        Raises:
+            InvalidConfigurationError: If the numbers of users are invalid, or the
+                runs are open-loop, have a load profile or a journal
+        """
+        if not usercounts or min(usercounts) < 1:
+            raise InvalidConfigurationError("A sweep needs numbers of users of at least 1")
+        if arguments.get("arrival_profile") or arguments.get("load_profile"):
+            raise InvalidConfigurationError(
+                "A sweep varies the number of users of closed-loop runs"
+            )
+        if arguments.get("journal"):
+            raise InvalidConfigurationError("Sweeps cannot be journaled")
+        results = {}
+        points = []
+        for usercount in sorted(set(usercounts)):
+            results[usercount] = self.run(
+                usercount=usercount,
+                notebook_config=notebook_config,
+                thresholds=(thresholds or {}).get(usercount),
+                **arguments,
+            )
+            points.append(self.sweep_point(usercount, results[usercount], self.statistics))
+        return results, {"points": points, "knee": self.knee(points)}
+
+    @staticmethod
+    def sweep_point(
+        usercount: int, results: list, statistics: LatencyStatistics
+    ) -> dict:
+        """
+        Summarise the throughput and latency of a run of a sweep
+        Args:
+            usercount: Number of users of the run
+            results: The results of the run, a list per user or a single list
+            statistics: The latency statistics of the run
+        Returns:
+            dict: The measured executions and errors, the throughput in executions
+                per minute from the first start to the last finish, the latency
+                across notebooks and its power, the throughput per second of latency
+        """
+        measured = [
+            result
+            for result in flatten_results(results)
+            if not result.warmup and result.result != Status.SKIPPED
+        ]
+        latency = LatencyHistogram()
+        for histogram in statistics.notebooks.values():
+            latency.merge(histogram)
+        span = 0.0
+        if measured:
+            span = (
+                max(datetime.fromisoformat(result.time.finish) for result in measured)
+                - min(datetime.fromisoformat(result.time.start) for result in measured)
+            ).total_seconds()
+        throughput = len(measured) * 60 / span if span > 0 else 0.0
+        return {
+            "users": usercount,
+            "executions": len(measured),
+            "errors": sum(result.result in CircuitBreaker.ERRORS for result in measured),
+            "duration": round(span, 6),
+            "throughput": round(throughput, 6),
+            "latency": {
+                "mean": round(latency.mean, 6),
+                "p50": latency.percentile(50),
+                "p90": latency.percentile(90),
+                "p99": latency.percentile(99),
+            },
+            "power": round(throughput / latency.mean, 6) if latency.mean else 0.0,
+        }
+
+    @staticmethod
+    def knee(points: List[dict]) -> Optional[dict]:
+        """
+        Find the knee of a throughput versus latency curve, the run that maximises
+        the power, throughput divided by latency. Below it, more users add more
+        throughput than latency, above it the platform saturates and they mostly
+        queue
+        Args:
+            points: The points of the curve, see sweep_point()
+        Returns:
+            dict: The point at the knee, None without measured executions
+        """
+        points = [point for point in points if point["power"] > 0]
+        return max(points, key=lambda point: point["power"], default=None)
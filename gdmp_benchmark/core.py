@@ -0,0 +1,499 @@
+"""
+State of the benchmarker shared by its runners, see GDMPBenchmarker
+"""
+# pylint: disable-msg=too-many-arguments
+# pylint: disable-msg=too-many-positional-arguments
+import os
+import atexit
+import threading
+import shutil
+import tempfile
+from contextlib import contextmanager, asynccontextmanager
+from multiprocessing import current_process
+from typing import Callable, Dict, Optional, Union
+import simplejson as json
+from simplejson.errors import JSONDecodeError
+import requests
+from gdmp_benchmark.results import InvalidConfigurationError, Results
+from gdmp_benchmark.store import LatencyStatistics
+from gdmp_benchmark.load import CircuitBreaker
+from gdmp_benchmark.monitoring import Profiler
+from gdmp_benchmark.notebooks import NoteCache, PooledNotebook
+from gdmp_benchmark.handlers import (
+    ASYNC_NOTEBOOK_HANDLERS, NOTEBOOK_HANDLERS, NotebookHandler, ThreadedAsyncNotebookHandler,
+    ZDairiNotebookHandler, ZeppelinRestNotebookHandler,
+)
+
+
+class BenchmarkerCore:
+    # pylint: disable=too-many-instance-attributes
+    """
+    State of the users of the benchmarker shared by its runners. Base of GDMPBenchmarker
+    """
+
+    DEFAULT_DIR = "/tmp/"
+    DEFAULT_USER_CONFIG = "user1.yml"
+    BREAKER_POLL = 0.1
+
+    def __init__(
+        self,
+        userconfig: str = "",
+        zeppelin_url: str = "",
+        verbose: bool = False,
+        notebook_handler: Union[NotebookHandler, str] = ZDairiNotebookHandler,
+        note_cache: Union[NoteCache, bool] = True,
+        profiler: Optional[Profiler] = None,
+        directory: str = "",
+    ):
+        self.verbose = verbose
+        self.profiler = profiler
+        if directory:
+            self.DEFAULT_DIR = directory.rstrip("/") + "/"  # pylint: disable=invalid-name
+        if note_cache is True:
+            note_cache = NoteCache()
+        self.note_cache = note_cache or None
+        self.zeppelin_url = zeppelin_url.strip("/")
+        self.userconfig = userconfig
+        self.notebooks = []
+        self.default_userconfig = self.DEFAULT_USER_CONFIG
+        self.total_users = self.generate_zdairi_user_configs()
+        if isinstance(notebook_handler, str):
+            if notebook_handler not in NOTEBOOK_HANDLERS:
+                raise InvalidConfigurationError(
+                    f"Unknown notebook handler: {notebook_handler}"
+                )
+            notebook_handler = NOTEBOOK_HANDLERS[notebook_handler]
+        self.notebook_handler = notebook_handler
+        self.async_notebook_handler = ASYNC_NOTEBOOK_HANDLERS.get(
+            notebook_handler
+        ) or ThreadedAsyncNotebookHandler(notebook_handler)
+        self._on_result = None
+        self._result_queue = None
+        self._user = 0
+        self._notebook_pools = {}
+        self._running = {}
+        self._pool_lock = threading.Lock()
+        self._result_lock = threading.Lock()
+        self.statistics = LatencyStatistics()
+        self.breaker = CircuitBreaker()
+        self.metrics = None
+        self.spark_jobs = None
+        self.cold_start = {}
+        self.credential_pool = None
+        self.contention = None
+        self._credentials = {}
+        self._session_dir = None
+        self.journal = None
+        self.deletion = {}
+
+    def __getstate__(self):
+        """Get the state to pickle for the worker processes, without the result callback"""
+        state = self.__dict__.copy()
+        state["_on_result"] = None
+        state["statistics"] = None
+        state["_pool_lock"] = None
+        state["_result_lock"] = None
+        state["metrics"] = None
+        state["contention"] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state in a worker process"""
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+        self._result_lock = threading.Lock()
+
+    def _checkout_notebook(self, user: int, key: str) -> Optional[PooledNotebook]:
+        """
+        Take a notebook that is not running from the pool of a user
+        Args:
+            user: The user number
+            key: The key of the notebook content
+        Returns:
+            PooledNotebook: The notebook, marked as busy, None if there is none
+        """
+        with self._pool_lock:
+            for pooled in self._notebook_pools.setdefault(user, {}).get(key, []):
+                if not pooled.busy:
+                    pooled.busy = True
+                    return pooled
+        return None
+
+    def _add_notebook(self, user: int, key: str, pooled: PooledNotebook) -> PooledNotebook:
+        """
+        Add a notebook created by a user to its pool, marked as busy
+        Args:
+            user: The user number
+            key: The key of the notebook content
+            pooled: The notebook
+        Returns:
+            PooledNotebook: The notebook
+        """
+        pooled.busy = True
+        with self._pool_lock:
+            self._notebook_pools.setdefault(user, {}).setdefault(key, []).append(pooled)
+        return pooled
+
+    def _discard_notebook(self, user: int, key: str, pooled: PooledNotebook) -> None:
+        """
+        Remove a notebook from the pool of a user, so it is not reused
+        Args:
+            user: The user number
+            key: The key of the notebook content
+            pooled: The notebook
+        """
+        with self._pool_lock:
+            self._notebook_pools.get(user, {}).get(key, []).remove(pooled)
+
+    def _take_pool(self, user: int) -> list:
+        """
+        Remove the pool of a user, at the end of its run
+        Args:
+            user: The user number
+        Returns:
+            list: The notebooks of the pool
+        """
+        with self._pool_lock:
+            pool = self._notebook_pools.pop(user, {})
+        return [pooled for notebooks in pool.values() for pooled in notebooks]
+
+    @contextmanager
+    def _in_flight(self, notebookid: str, config: str):
+        """
+        Register a notebook as running in this process for the duration of the block,
+        so it can be stopped if the breaker opens
+        Args:
+            notebookid: The ID of the notebook, nothing is registered if empty
+            config: The user configuration running it
+        """
+        if notebookid:
+            with self._pool_lock:
+                self._running[notebookid] = config
+        try:
+            yield
+        finally:
+            with self._pool_lock:
+                self._running.pop(notebookid, None)
+
+    @contextmanager
+    def _stopping(self):
+        """
+        Stop the notebooks running in this process once the breaker opens, for the
+        duration of the block. They are stopped in Zeppelin like the notebooks that
+        time out, so their users can skip the remaining notebooks at once
+        """
+        done = threading.Event()
+
+        def watch():
+            stopped = set()
+            while not done.wait(self.BREAKER_POLL):
+                if not self.breaker.is_open:
+                    continue
+                with self._pool_lock:
+                    running = [
+                        (notebookid, config)
+                        for notebookid, config in self._running.items()
+                        if notebookid not in stopped
+                    ]
+                for notebookid, config in running:
+                    stopped.add(notebookid)
+                    ZeppelinRestNotebookHandler.stop_notebook(notebookid, config)
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        try:
+            yield
+        finally:
+            done.set()
+            watcher.join()
+
+    def _record_result(self, user: int, result: Results, on_result: Callable) -> None:
+        """
+        Record a published result in the statistics, and pass it on to the result callback.
+        The notebooks of a user can run in several threads, so the results are recorded
+        one at a time, and the callback is never called concurrently
+        Args:
+            user: The user number
+            result: The results
+            on_result: The result callback
+        """
+        with self._result_lock:
+            self.breaker.record(user, result)
+            self.statistics.add(user, result)
+            if self.contention is not None:
+                self.contention.add(user, result)
+            if self.metrics is not None:
+                self.metrics.annotate(result)
+            if on_result is not None:
+                on_result(user, result)
+
+    def summarise(self) -> dict:
+        """
+        Summarise the latency of each notebook of the last run, across all users
+        and repetitions
+        Returns:
+            dict: Count, mean, standard deviation, min, p50, p90, p99, max, histogram
+                and result counts of each notebook
+        """
+        return self.statistics.to_dict()
+
+    def _publish(self, user: int, result: Results) -> None:
+        """
+        Publish a result as soon as its notebook completes, either to the result
+        callback or, from a worker process, to the queue forwarding to it
+        Args:
+            user: The user number
+            result: The results
+        """
+        if self._result_queue is not None:
+            self._result_queue.put((user, result))
+        elif self._on_result is not None:
+            self._on_result(user, result)
+
+    @staticmethod
+    def _forward_results(queue, on_result: Callable) -> None:
+        """
+        Forward the results published by the worker processes to the result callback
+        Args:
+            queue: The queue the results are published to, ended by None
+            on_result: The result callback
+        """
+        for item in iter(queue.get, None):
+            on_result(*item)
+
+    @staticmethod
+    def get_note(path: str, cache: Optional[NoteCache] = None) -> Dict[str, str]:
+        """
+        Get the json file given a path (URL or file), and return as a json object
+        Args:
+            path: URL or path of the file
+            cache: Cache to get URLs through
+        Returns:
+            dict: The json object
+        """
+        if path.startswith("http") and cache is not None:
+            data = json.loads(cache.get(path).decode("utf-8"), strict=False)
+        elif path.startswith("http"):
+            res = requests.get(path, timeout=30).text
+            data = json.loads(res, strict=False)
+        else:
+            with open(path, encoding="utf-8") as config_file:
+                data = json.load(config_file)
+        return data
+
+    def generate_zdairi_user_configs(self) -> int:
+        """
+        Generate the user configurations that can be used by the zdairi lib
+        These need to be yml files with the following format:
+            zeppelin_url:
+            zeppelin_auth:
+            zeppelin_user:
+            zeppelin_password:
+        Returns:
+             int: Number of users
+        Raises:
+            InvalidConfigurationError: If User configuration is not a valid Json file
+        """
+        counter = 1
+        self.credential_names = []
+        if not self.userconfig:
+            return 0
+        try:
+            with open(self.userconfig, encoding="utf-8") as user_file:
+                user_dictionary = json.load(user_file)
+        except JSONDecodeError as exc:
+            raise InvalidConfigurationError(
+                "User configuration is not a valid json file!"
+            ) from exc
+
+        user_list = user_dictionary.get("users", [])
+        for user in user_list:
+            shiro_user = user.get("shirouser", {})
+            if shiro_user:
+                with open(
+                    self.DEFAULT_DIR + "user" + str(counter) + ".yml",
+                    "w",
+                    encoding="utf-8",
+                ) as user_file:
+                    user_file.write("zeppelin_url: " + self.zeppelin_url + "\n")
+                    user_file.write("zeppelin_auth: true\n")
+                    user_file.write("zeppelin_user: " + shiro_user.get("name") + "\n")
+                    user_file.write(
+                        "zeppelin_password: " + shiro_user.get("password") + "\n"
+                    )
+                self.credential_names.append(shiro_user.get("name"))
+                counter += 1
+
+        return len(user_list)
+
+    def _get_user_config(self, concurrent: bool, user: int = 0) -> str:
+        """
+        Args:
+            concurrent (bool): Whether this is a concurrent test
+            user (int): The user number, if it is not bound to the current process
+        Returns:
+            config (str): The user config path
+        """
+
+        if concurrent and not user:
+            user = self._user
+        if user and self.credential_pool is not None:
+            config = self._session_config(user)
+        elif user:
+            config = self.DEFAULT_DIR + "user" + str(user) + ".yml"
+        elif concurrent:
+            cur_process = current_process()
+            # pylint: disable=protected-access
+            counter = cur_process._identity[0]
+            config = self.DEFAULT_DIR + "user" + str(counter) + ".yml"
+        else:
+            config = self.DEFAULT_DIR + self.default_userconfig
+        return config
+
+    def _session_config(self, user: int) -> str:
+        """
+        Get the configuration of the session of a user sharing a credential, a copy of
+        the configuration of the credential, so each user logs in with its own session.
+        It holds the password, so it is only readable by its owner, in a private
+        directory
+        Args:
+            user: The user number
+        Returns:
+            str: The path of the configuration
+        """
+        credential, _ = self._credentials.get(user) or (
+            self.credential_pool.assign(user),
+            0.0,
+        )
+        config = os.path.join(
+            self._session_directory(), f"session{user}-user{credential}.yml"
+        )
+        if not os.path.exists(config):
+            # Notebooks of the same user may run in threads, so replace it atomically
+            partial = f"{config}.{os.getpid()}.{threading.get_ident()}"
+            with open(f"{self.DEFAULT_DIR}user{credential}.yml", "rb") as source:
+                descriptor = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(descriptor, "wb") as copy:
+                    shutil.copyfileobj(source, copy)
+            os.replace(partial, config)
+        return config
+
+    def _session_directory(self) -> str:
+        """
+        Get the private directory of the session configurations, creating it if needed.
+        It is removed at exit, should the run not remove it
+        Returns:
+            str: The path of the directory
+        """
+        if self._session_dir is None:
+            self._session_dir = tempfile.mkdtemp(prefix="gdmp-sessions-", dir=self.DEFAULT_DIR)
+            atexit.register(shutil.rmtree, self._session_dir, True)
+        return self._session_dir
+
+    def _remove_session_configs(self, user: int) -> None:
+        """
+        Remove the copies of the credential configurations of a user, which hold their
+        passwords, once its run is over and its notebooks deleted
+        Args:
+            user: The user number
+        """
+        if self.credential_pool is None or not user or self._session_dir is None:
+            return
+        prefix = f"session{user}-user"
+        for filename in os.listdir(self._session_dir):
+            if filename.startswith(prefix) and filename.endswith(".yml"):
+                try:
+                    os.remove(os.path.join(self._session_dir, filename))
+                except FileNotFoundError:
+                    pass
+
+    def _remove_session_directory(self) -> None:
+        """
+        Remove the directory of the session configurations once the run is over
+        """
+        if self._session_dir is not None:
+            shutil.rmtree(self._session_dir, ignore_errors=True)
+            self._session_dir = None
+
+    def _credential(self, user: int) -> dict:
+        """
+        Args:
+            user: The user number
+        Returns:
+            dict: The name of the credential the user shares, and the seconds it
+                waited to lease it, empty unless credentials are shared
+        """
+        if self.credential_pool is None or not user:
+            return {}
+        credential, lease_wait = self._credentials.get(user) or (
+            self.credential_pool.assign(user),
+            0.0,
+        )
+        names = self.credential_names
+        return {
+            "name": names[credential - 1] if credential <= len(names) else f"user{credential}",
+            "lease_wait": round(lease_wait, 6),
+        }
+
+    def _note_name(self, user: int, filepath: str) -> str:
+        """
+        Args:
+            user: The user number
+            filepath: The file the notebook is created from
+        Returns:
+            str: The name of the notebook, in a folder of the user if it shares
+                its credential
+        """
+        if self.credential_pool is None or not user:
+            return filepath
+        return os.path.join(
+            os.path.dirname(filepath), f"session{user}", os.path.basename(filepath)
+        )
+
+    @contextmanager
+    def _session(self, user: int):
+        """
+        Lease a credential for the run of a user, if credentials are shared
+        Args:
+            user: The user number
+        """
+        if self.credential_pool is None:
+            yield
+            return
+        with self.credential_pool.lease(user) as lease:
+            self._credentials[user] = lease
+            try:
+                yield
+            finally:
+                del self._credentials[user]
+
+    @asynccontextmanager
+    async def _session_async(self, user: int):
+        """
+        Lease a credential for the run of a user from a coroutine, if credentials
+        are shared
+        Args:
+            user: The user number
+        """
+        if self.credential_pool is None:
+            yield
+            return
+        async with self.credential_pool.lease_async(user) as lease:
+            self._credentials[user] = lease
+            try:
+                yield
+            finally:
+                del self._credentials[user]
+
+    @staticmethod
+    def _write_data_to_file(data: dict, filepath: str, name: str = "") -> None:
+        """
+        Write some data to a file
+        Args:
+            data: Dictionary of the data
+            filepath: The file to write to
+            name: The name of the notebook, the file path by default
+        """
+        data["name"] = name or filepath
+        with open(filepath, "w+", encoding="utf-8") as cred:
+            json.dump(data, cred)
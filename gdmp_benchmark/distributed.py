@@ -0,0 +1,456 @@
+"""
+Distributed runs: agents running a share of the users, and the coordinator combining
+their results
+"""
+# pylint: disable-msg=too-many-locals
+import os
+import math
+import time
+import threading
+import shutil
+import tempfile
+import logging
+from datetime import datetime, timedelta
+from contextlib import ExitStack
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, Connection
+from multiprocessing.connection import wait as wait_connections
+from typing import Callable, List
+import simplejson as json
+from gdmp_benchmark.results import ISO_FORMAT, InvalidConfigurationError, Results
+from gdmp_benchmark.load import CredentialPool, LoadProfile
+from gdmp_benchmark.handlers import NOTEBOOK_HANDLERS
+from gdmp_benchmark.benchmarker import GDMPBenchmarker
+
+
+def parse_address(address: str) -> tuple:
+    """
+    Args:
+        address: A "host:port" address
+    Returns:
+        tuple: The host and the port
+    Raises:
+        InvalidConfigurationError: If the address is invalid
+    """
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise InvalidConfigurationError(f"Invalid address, expected host:port: {address}")
+    return host, int(port)
+
+
+def shift_timestamp(value: str, offset: float) -> str:
+    """
+    Args:
+        value: A timestamp in ISO format
+        offset: Seconds to subtract from it
+    Returns:
+        str: The shifted timestamp, or the value if it is not a timestamp
+    """
+    try:
+        shifted = datetime.fromisoformat(value) - timedelta(seconds=offset)
+    except (TypeError, ValueError):
+        return value
+    return shifted.strftime(ISO_FORMAT)
+
+
+def shift_result(result: Results, offset: float) -> Results:
+    """
+    Correct the timestamps of results recorded by a host whose clock is ahead of
+    this one by offset seconds
+    Args:
+        result: The results
+        offset: Seconds the clock of the host is ahead
+    Returns:
+        Results: The results, with the timestamps on the clock of this host
+    """
+    result.time.start = shift_timestamp(result.time.start, offset)
+    result.time.finish = shift_timestamp(result.time.finish, offset)
+    for paragraph in result.paragraphs:
+        paragraph.start = shift_timestamp(paragraph.start, offset)
+        paragraph.finish = shift_timestamp(paragraph.finish, offset)
+    return result
+
+
+class Agent:
+    """
+    Load generation agent of a distributed run. Serves a coordinator, running the users
+    it is assigned with a local benchmarker, and streaming their results back as their
+    notebooks complete. Messages are tuples of a kind and its arguments, pickled over
+    a multiprocessing connection authenticated with a shared key:
+        ("clock",): Answered with ("clock", time), to estimate the clock offset
+        ("run", assignment): Prepare the run, answered with ("ready",) or ("error", message)
+        ("start", time): Start the run at this time of the agent clock, answered with
+            ("result", user, Results) as notebooks complete and ("alive",) every HEARTBEAT
+            seconds, then ("done", results, deletion) or ("error", message)
+        ("stop", reason): Skip the remaining notebooks
+        ("close",): End the session
+    """
+
+    HEARTBEAT = 5.0
+
+    def __init__(self, address: tuple, authkey: bytes, directory: str = ""):
+        """
+        Args:
+            address: Host and port to listen on, any free port if 0
+            authkey: Key shared with the coordinator
+            directory: Directory of the configurations of the runs, a temporary one
+                removed on close if empty
+        """
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.temporary = not directory
+        self.directory = directory or tempfile.mkdtemp(prefix="gdmp-agent-")
+        self.clock = time.time
+
+    def serve(self, sessions: int = 0) -> None:
+        """
+        Serve coordinators, one session at a time
+        Args:
+            sessions: Number of sessions to serve, forever if 0
+        """
+        served = 0
+        while not sessions or served < sessions:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError) as err:
+                logging.warning("Rejected a connection: %s", err)
+                continue
+            with conn:
+                self.handle(conn)
+            served += 1
+
+    def close(self) -> None:
+        """Stop listening, and remove the temporary directory of the runs"""
+        self.listener.close()
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def prepare(self, assignment: dict) -> tuple:
+        """
+        Write the configurations of an assignment to a directory of the session, and
+        create the benchmarker running it
+        Args:
+            assignment: The users to run, the user and notebook configurations, the
+                Zeppelin URL, the notebook handler and the arguments of the run
+        Returns:
+            GDMPBenchmarker: The benchmarker
+            dict: The arguments of its run
+        """
+        directory = tempfile.mkdtemp(dir=self.directory)
+        userconfig = os.path.join(directory, "users.json")
+        notebook_config = os.path.join(directory, "notebooks.json")
+        for path, config in (
+            (userconfig, assignment["user_config"]),
+            (notebook_config, assignment["notebook_config"]),
+        ):
+            with open(path, "w", encoding="utf-8") as config_file:
+                json.dump(config, config_file)
+        benchmarker = GDMPBenchmarker(
+            userconfig=userconfig,
+            zeppelin_url=assignment["zeppelin_url"],
+            notebook_handler=assignment["notebook_handler"],
+            directory=directory,
+        )
+        load_profile = assignment["run"].get("load_profile")
+        credential_pool = assignment["run"].get("credential_pool")
+        return benchmarker, dict(
+            assignment["run"],
+            load_profile=load_profile and LoadProfile(**load_profile),
+            credential_pool=credential_pool and CredentialPool(**credential_pool),
+            usercount=len(assignment["users"]),
+            notebook_config=notebook_config,
+            users=assignment["users"],
+        )
+
+    def handle(self, conn: Connection) -> None:
+        """
+        Serve a session of a coordinator, then remove the configurations of its runs,
+        which hold the passwords of the users
+        Args:
+            conn: The connection to the coordinator
+        """
+        lock = threading.Lock()
+
+        def send(*message):
+            with lock:
+                try:
+                    conn.send(message)
+                except OSError as err:
+                    logging.warning("Coordinator disconnected: %s", err)
+
+        benchmarker, arguments, runner, prepared = None, {}, None, []
+        try:
+            for message in iter(conn.recv, ("close",)):
+                if message[0] == "clock":
+                    send("clock", self.clock())
+                elif message[0] == "run":
+                    try:
+                        benchmarker, arguments = self.prepare(message[1])
+                    except (InvalidConfigurationError, OSError, KeyError, TypeError) as err:
+                        send("error", f"{type(err).__name__}: {err}")
+                        continue
+                    prepared.append(benchmarker.DEFAULT_DIR)
+                    send("ready")
+                elif message[0] == "start":
+                    runner = threading.Thread(
+                        target=self._run, args=(benchmarker, arguments, message[1], send)
+                    )
+                    runner.start()
+                elif message[0] == "stop" and benchmarker is not None:
+                    benchmarker.breaker.open(message[1])
+        except EOFError:
+            logging.warning("Coordinator closed the session")
+        finally:
+            if runner is not None:
+                runner.join()
+            for directory in prepared:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _run(
+        self,
+        benchmarker: GDMPBenchmarker,
+        arguments: dict,
+        start: float,
+        send: Callable,
+    ) -> None:
+        """
+        Wait for the start of a run, then run it
+        Args:
+            benchmarker: The benchmarker running the users of the agent
+            arguments: The arguments of the run
+            start: The start time of the run, on the agent clock
+            send: Sends a message to the coordinator
+        """
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stopped, send), daemon=True)
+        heartbeat.start()
+        try:
+            time.sleep(max(start - self.clock(), 0))
+            message = (
+                "done",
+                benchmarker.run(
+                    on_result=lambda user, result: send("result", user, result), **arguments
+                ),
+                benchmarker.deletion,
+            )
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            # Any failure is reported, the coordinator would otherwise wait for the run
+            logging.exception(err)
+            message = ("error", f"{type(err).__name__}: {err}")
+        finally:
+            stopped.set()
+            heartbeat.join()
+        send(*message)
+
+    def _heartbeat(self, stopped: threading.Event, send: Callable) -> None:
+        """Tell the coordinator the run is alive every HEARTBEAT seconds, until it stops"""
+        while not stopped.wait(self.HEARTBEAT):
+            send("alive")
+
+
+class Coordinator:
+    """
+    Coordinator of a distributed run, partitioning the users across agents on one or
+    more hosts (see Agent). All the agents prepare their users before any of them
+    starts, then all start at the same time. Results are streamed back as notebooks
+    complete, and their timestamps corrected to the clock of the coordinator. An agent
+    silent for SILENCE_TIMEOUT seconds fails the run
+    """
+
+    CLOCK_ROUNDS = 5
+    START_DELAY = 1.0
+    SILENCE_TIMEOUT = 60.0
+
+    def __init__(self, agents: List[tuple], authkey: bytes):
+        """
+        Args:
+            agents: Host and port of each agent
+            authkey: Key shared with the agents
+        """
+        if not agents:
+            raise InvalidConfigurationError("A distributed run needs agents")
+        self.agents = agents
+        self.authkey = authkey
+        self.clock = time.time
+        self.sessions = []
+
+    def clock_offset(self, conn: Connection) -> tuple:
+        """
+        Estimate how far the clock of an agent is ahead of this one, from the exchange
+        with the shortest round trip
+        Args:
+            conn: The connection to the agent
+        Returns:
+            float: The offset in seconds
+            float: The round trip time in seconds
+        """
+        best = (0.0, math.inf)
+        for _ in range(self.CLOCK_ROUNDS):
+            sent = self.clock()
+            conn.send(("clock",))
+            _, agent_time = conn.recv()
+            received = self.clock()
+            if received - sent < best[1]:
+                best = (agent_time - (sent + received) / 2, received - sent)
+        return best
+
+    @staticmethod
+    def partition(usercount: int, agents: int) -> List[List[int]]:
+        """
+        Args:
+            usercount: Number of users
+            agents: Number of agents
+        Returns:
+            list: The user numbers of each agent, assigned in turn
+        """
+        return [list(range(1, usercount + 1))[index::agents] for index in range(agents)]
+
+    @staticmethod
+    def _send(conn: Connection, message: tuple) -> None:
+        """Send a message to an agent, unless it has disconnected"""
+        try:
+            conn.send(message)
+        except OSError as err:
+            logging.warning("Agent disconnected: %s", err)
+
+    def _receive(self, conn: Connection, address: tuple):
+        """Receive a message from an agent, raising its errors and its silence"""
+        try:
+            if not conn.poll(self.SILENCE_TIMEOUT):
+                raise InvalidConfigurationError(
+                    f"Agent {address} silent for {self.SILENCE_TIMEOUT} seconds"
+                )
+            message = conn.recv()
+        except EOFError as err:
+            raise InvalidConfigurationError(f"Agent {address} disconnected") from err
+        if message[0] == "error":
+            raise InvalidConfigurationError(f"Agent {address} failed: {message[1]}")
+        return message
+
+    def run(
+        self,
+        benchmarker: GDMPBenchmarker,
+        usercount: int,
+        notebook_config: dict,
+        arguments: dict,
+        on_result: Callable[[int, Results], None],
+    ) -> list:
+        """
+        Run the users of a benchmark on the agents
+        Args:
+            benchmarker: The benchmarker of the run, whose circuit breaker stops all
+                the agents once it opens
+            usercount: Number of users
+            notebook_config: The notebook configuration
+            arguments: The arguments of the run of each agent
+            on_result: Called with the user number and the Results of each notebook,
+                as soon as an agent reports it
+        Returns:
+            list: The results of each user, or of the user of a single user run
+        Raises:
+            InvalidConfigurationError: If an agent fails, disconnects or goes silent
+        """
+        with open(benchmarker.userconfig, encoding="utf-8") as user_file:
+            user_config = json.load(user_file)
+        # Known handlers are sent by name, their class may be the one of __main__
+        handlers = {handler: name for name, handler in NOTEBOOK_HANDLERS.items()}
+        self.sessions = []
+        with ExitStack() as stack:
+            for address, users in zip(
+                self.agents, self.partition(usercount, len(self.agents))
+            ):
+                if not users:
+                    continue
+                conn = stack.enter_context(Client(address, authkey=self.authkey))
+                stack.callback(self._send, conn, ("close",))
+                offset, rtt = self.clock_offset(conn)
+                self.sessions.append(
+                    {"conn": conn, "address": address, "users": users,
+                     "offset": offset, "rtt": rtt}
+                )
+                conn.send(
+                    (
+                        "run",
+                        {
+                            "users": users,
+                            "user_config": user_config,
+                            "notebook_config": notebook_config,
+                            "zeppelin_url": benchmarker.zeppelin_url,
+                            "notebook_handler": handlers.get(
+                                benchmarker.notebook_handler, benchmarker.notebook_handler
+                            ),
+                            "run": arguments,
+                        },
+                    )
+                )
+            try:
+                # Barrier: every agent is ready before any of them starts
+                for session in self.sessions:
+                    self._receive(session["conn"], session["address"])
+                start = self.clock() + self.START_DELAY
+                for session in self.sessions:
+                    session["conn"].send(("start", start + session["offset"]))
+                results = self._collect(benchmarker, on_result)
+            except InvalidConfigurationError as err:
+                for session in self.sessions:
+                    self._send(session["conn"], ("stop", str(err)))
+                raise
+        if usercount == 1:
+            return results[0]
+        return results
+
+    def _collect(self, benchmarker: GDMPBenchmarker, on_result: Callable) -> list:
+        """
+        Collect the results of the agents until all of them are done, passing each
+        result on as it arrives and stopping all the agents if the breaker opens.
+        The deletion of the notebooks of each user is added to the benchmarker
+        Args:
+            benchmarker: The benchmarker of the run
+            on_result: The result callback
+        Returns:
+            list: The results of each user, in user order
+        """
+        by_conn = {session["conn"]: session for session in self.sessions}
+        by_user = {}
+        heard = {conn: time.monotonic() for conn in by_conn}
+        stopped = False
+        while by_conn:
+            for conn in wait_connections(list(by_conn), timeout=self.SILENCE_TIMEOUT):
+                session = by_conn[conn]
+                message = self._receive(conn, session["address"])
+                heard[conn] = time.monotonic()
+                if message[0] == "result":
+                    _, user, result = message
+                    on_result(user, shift_result(result, session["offset"]))
+                elif message[0] == "done":
+                    benchmarker.deletion.update(message[2])
+                    for user, user_results in zip(session["users"], message[1]):
+                        by_user[user] = [
+                            shift_result(result, session["offset"])
+                            for result in user_results
+                        ]
+                    del by_conn[conn]
+            for conn, session in by_conn.items():
+                if time.monotonic() - heard[conn] >= self.SILENCE_TIMEOUT:
+                    raise InvalidConfigurationError(
+                        f"Agent {session['address']} silent for {self.SILENCE_TIMEOUT} seconds"
+                    )
+            if benchmarker.breaker.is_open and not stopped:
+                stopped = True
+                for conn in by_conn:
+                    conn.send(("stop", benchmarker.breaker.reason))
+        return [by_user[user] for user in sorted(by_user)]
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            dict: The users, clock offset and round trip time of each agent of the last run
+        """
+        return {
+            f"{session['address'][0]}:{session['address'][1]}": {
+                "users": session["users"],
+                "clock_offset": session["offset"],
+                "rtt": session["rtt"],
+            }
+            for session in self.sessions
+        }
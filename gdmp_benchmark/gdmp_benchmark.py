@@ -3,948 +3,240 @@ Module that can be used to run benchmarks against an instance of the Gaia Data M
 """
 # pylint: disable-msg=too-many-locals
 # pylint: disable-msg=too-many-arguments
-
+# pylint: disable-msg=too-many-positional-arguments
+import os
 import sys
-import subprocess
-import time
-import string
-import random
-import hashlib
-from enum import Enum
 import argparse
-import logging
-from datetime import datetime
-from multiprocessing import Pool, current_process
-from typing import List, Dict, Protocol
-from dataclasses import dataclass, field, fields
+from contextlib import ExitStack
+from typing import List, Optional
+from dataclasses import asdict
 import simplejson as json
-from simplejson.errors import JSONDecodeError
-import requests
-
-
-class InvalidConfigurationError(Exception):
-    """Exception to be raised when the configuration passed in is invalid"""
-
-    __module__ = Exception.__module__
-
-    def __init__(self, message):
-        self.message = message
-        super().__init__(message)
-
-
-def validate_not_empty(val):
+from gdmp_benchmark.results import (
+    AlertStrategies, ISO_FORMAT, InvalidConfigurationError, ParagraphTiming, Results,
+    SlackAlerter, Status, Timing, flatten_results,
+)
+from gdmp_benchmark.store import (
+    LatencyHistogram, LatencyStatistics, NDJSONResultWriter, ResultStore, RunJournal,
+    export_thresholds, git_revision, mann_whitney_u,
+)
+from gdmp_benchmark.load import (
+    ArrivalProfile, CircuitBreaker, CredentialContention, CredentialPool, LoadProfile, Prewarm,
+)
+from gdmp_benchmark.monitoring import (
+    MetricsPoller, Profiler, ResourceSampler, SparkJobCollector, parse_prometheus,
+)
+from gdmp_benchmark.json_select import (
+    NOTEBOOK_RESULT_FIELDS, parse_json_fields, project_json, select_json,
+)
+from gdmp_benchmark.notebooks import (
+    ExactValidator, HashValidator, NoteCache, Notebook, NumberValidator, RegexValidator,
+    make_validator, make_validators, notebook_interpreters, paragraph_job_urls,
+    parse_notebook_output, parse_paragraph_timings, validate_output,
+)
+from gdmp_benchmark.handlers import (
+    AsyncZeppelinRestNotebookHandler, ZDairiNotebookHandler, ZeppelinRestNotebookHandler,
+)
+from gdmp_benchmark.benchmarker import GDMPBenchmarker
+from gdmp_benchmark.distributed import Agent, Coordinator, parse_address, shift_result
+from gdmp_benchmark.arguments import (
+    build_agent_parser, build_cleanup_parser, build_parser, parse_arrival_profile,
+    parse_coordinator, parse_credential_pool, parse_journal, parse_load_profile,
+    parse_note_cache, parse_prewarm, parse_sweep,
+)
+
+__all__ = [
+    "Agent", "agent_main", "AlertStrategies", "ArrivalProfile",
+    "AsyncZeppelinRestNotebookHandler", "build_agent_parser", "build_cleanup_parser",
+    "build_parser", "CircuitBreaker", "cleanup_main", "Coordinator", "CredentialContention",
+    "CredentialPool", "ExactValidator", "export_thresholds", "flatten_results",
+    "GDMPBenchmarker", "git_revision", "HashValidator", "InvalidConfigurationError",
+    "ISO_FORMAT", "LatencyHistogram", "LatencyStatistics", "learn_thresholds", "LoadProfile",
+    "main", "make_validator", "make_validators", "mann_whitney_u", "MetricsPoller",
+    "NDJSONResultWriter", "Notebook", "notebook_interpreters", "NOTEBOOK_RESULT_FIELDS",
+    "NoteCache", "NumberValidator", "paragraph_job_urls", "ParagraphTiming", "parse_address",
+    "parse_arrival_profile", "parse_coordinator", "parse_credential_pool", "parse_journal",
+    "parse_json_fields", "parse_load_profile", "parse_note_cache", "parse_notebook_output",
+    "parse_paragraph_timings", "parse_prewarm", "parse_prometheus", "parse_sweep", "Prewarm",
+    "Profiler", "project_json", "record_history", "RegexValidator", "ResourceSampler",
+    "Results", "ResultStore", "RunJournal", "select_json", "shift_result", "SlackAlerter",
+    "SparkJobCollector", "Status", "summarise_run", "Timing", "validate_output",
+    "write_profile", "ZDairiNotebookHandler", "ZeppelinRestNotebookHandler",
+]
+
+
+def record_history(
+    args: argparse.Namespace, benchmarker: GDMPBenchmarker, results: list
+) -> dict:
     """
+    Record the results of a run in the results database, compare them with the past
+    runs and export the learned thresholds if requested
     Args:
-        val: The value to validate
-    Raises:
-         ValueError: If value is empty
+        args: The command line arguments
+        benchmarker: The benchmarker that ran the notebooks
+        results: The results of the run
+    Returns:
+        dict: The run ID and the comparison, for the summary
     """
-
-    if not val:
-        msg = "Value is empty"
-        raise ValueError(msg)
-
-
-def validate_positive(val):
-    """
-    Args:
-        val: The value to validate
-    Raises:
-         ValueError: If value is not positive
-         TypeError: If value is not an int
-    """
-    if not isinstance(val, int):
-        msg = f"Value is not an int: {val}"
-        raise TypeError(msg)
-
-    if val < 0:
-        msg = f"Value is not positive: {val}"
-        raise ValueError(msg)
-
-
-def validate(instance):
-    """
-    Validate the parameter types of a class instance
-    Args:
-        instance: The instance of a class
-    Raises:
-         TypeError: If type does not match Type hint
-    """
-    for fld in fields(instance):
-        attr = getattr(instance, fld.name)
-        if not isinstance(attr, fld.type):
-            msg = f"Field {fld.name} is of type {type(attr)}, should be {fld.type}"
-            raise TypeError(msg)
-
-
-class Status(str, Enum):
-    """Status of the timing for a notebook run"""
-
-    SLOW = "SLOW"
-    FAST = "FAST"
-    PASS = "PASS"
-    ERROR = "ERROR"
-    FAIL = "FAIL"
-    SUCCESS = "SUCCESS"
-
-    def __str__(self):
-        return self.value
-
-    def __repr__(self):
-        return self.value
-
-    def to_json(self):
-        """Return as json"""
-        return self.value
-
-
-@dataclass
-class Timing:
-    """
-    Stores the Timing info of Notebook run.
-    Attributes:
-        result (Status): The result of the operation.
-        totaltime (int): The total execution time
-        start (str): The start time of the notebook run
-        finish (str): The end time of the notebook run
-        expected (str): The expected execution time
-    """
-
-    result: Status
-    totaltime: int
-    start: str
-    finish: str
-    expected: int = 0
-
-    def __post_init__(self):
-        validate(self)
-        validate_positive(self.totaltime)
-
-    @property
-    def percent_change(self) -> str:
-        """
-        Get percentage change (Total time - expected time) / expected_time
-        Returns:
-            str: Percentage change
-        """
-        if self.expected and self.totaltime > 0:
-            return f"{((self.totaltime - self.expected) / self.expected) * 100:.2f}"
-        return "0"
-
-    def __str__(self):
-        return str(
-            {
-                "result": self.result,
-                "elapsed": f"{self.totaltime:.2f}",
-                "percent": self.percent_change,
-                "start": self.start,
-                "finish": self.finish,
-            }
+    with ResultStore(args.results_db) as store:
+        run_id = store.record_run(
+            results,
+            zeppelin_url=args.zeppelin_url,
+            usercount=args.usercount,
+            revision=args.revision or git_revision(),
+            notebook_config=args.notebook_config,
         )
-
-    def __repr__(self):
-        """Return repr view"""
-        return str(
-            {
-                "result": self.result,
-                "elapsed": f"{self.totaltime:.2f}",
-                "percent": self.percent_change,
-                "start": self.start,
-                "finish": self.finish,
-            }
-        )
-
-    def to_json(self):
-        """Return as json"""
+        if args.export_thresholds:
+            with open(args.export_thresholds, "w", encoding="utf-8") as config_file:
+                json.dump(
+                    export_thresholds(
+                        benchmarker.get_note(
+                            path=args.notebook_config, cache=benchmarker.note_cache
+                        ),
+                        store.thresholds(
+                            args.zeppelin_url, args.usercount, width=args.threshold_width
+                        ),
+                    ),
+                    config_file,
+                    indent=4,
+                )
         return {
-            "result": self.result.to_json(),
-            "elapsed": f"{self.totaltime:.2f}",
-            "percent": self.percent_change,
-            "start": self.start,
-            "finish": self.finish,
+            "run": run_id,
+            "comparison": store.compare(
+                run_id, window=args.baseline_runs, alpha=args.regression_alpha
+            ),
         }
 
-    def to_dict(self):
-        """Return as dictionary"""
-        dict_view = self.__dict__
-        dict_view["percent_change"] = self.percent_change
-        return dict_view
-
 
-@dataclass
-class Results:
-    # pylint: disable=too-many-instance-attributes
-    # Need to refactor this
+def learn_thresholds(
+    args: argparse.Namespace, sweep: Optional[List[int]]
+) -> Optional[dict]:
     """
-    Stores Results Info.
-
-    Attributes:
-        result (Status): The result of the operation.
-        msg (str): A message describing the result.
-        output (List[str]): A list of output strings.
-        notebookid (str): The ID of the notebook.
-        user_config (str): The user configuration in JSON format.
-        messages (List[str]): A list of messages.
-        logs (str): Additional logs.
-        time (Timing): The timing information.
-        outputs (dict): Additional outputs.
-        name (str): A name attribute.
+    Learn the expected times of the notebooks from the results database, if requested
+    Args:
+        args: The command line arguments
+        sweep: The numbers of users of a sweep, None without a sweep
+    Returns:
+        dict: The learned bands of each notebook, by number of users for a sweep, None
+            unless they are learned
+    Raises:
+        InvalidConfigurationError: If thresholds are learned or exported without the
+            results database, or for a load profile, which varies the number of users
     """
-
-    result: Status
-    msg: str
-    output: list
-    notebookid: str
-    user_config: str
-    messages: list
-    logs: str = ""
-    time: Timing = field(default_factory=Timing)
-    outputs: dict = field(default_factory=dict)
-    name: str = ""
-
-    def __post_init__(self):
-        """post_init method"""
-        validate(self)
-
-    def to_dict(self):
-        """Return as dictionary"""
-        return {
-            "result": self.result,
-            "msg": self.msg,
-            "output": self.output,
-            "notebookid": self.notebookid,
-            "user_config": self.user_config,
-            "messages": self.messages,
-            "logs": self.logs,
-            "time": self.time.__dict__,
-            "outputs": self.outputs,
-            "name": self.name,
-        }
-
-    def __str__(self):
-        return str(
-            {
-                "name": self.name,
-                "result": str(self.result),
-                "outputs": self.outputs,
-                "messages": self.messages,
-                "time": self.time,
-                "logs": self.msg,
-            }
+    if not (args.adaptive_thresholds or args.export_thresholds):
+        return None
+    if not args.results_db:
+        raise InvalidConfigurationError(
+            "Learning thresholds needs the results database"
         )
-
-    def __repr__(self):
-        return str(
-            {
-                "name": self.name,
-                "result": str(self.result),
-                "outputs": self.outputs,
-                "messages": self.messages,
-                "time": self.time,
-                "logs": self.msg,
-            }
+    if args.load_profile:
+        raise InvalidConfigurationError(
+            "Thresholds are learned by number of users, which a load profile varies"
         )
-
-    def to_json(self) -> str:
-        """Convert to JSON"""
-
-        return json.dumps(str(
-            {
-                "name": self.name,
-                "result": str(self.result),
-                "outputs": self.outputs,
-                "messages": self.messages,
-                "time": self.time.to_json(),
-                "logs": self.logs,
+    if not args.adaptive_thresholds:
+        return None
+    with ResultStore(args.results_db) as store:
+        if sweep is not None:
+            return {
+                usercount: store.thresholds(
+                    args.zeppelin_url, usercount, width=args.threshold_width
+                )
+                for usercount in sorted(set(sweep))
             }
-        ))
-
-
-class AlertStrategies(Enum):
-    """
-    Alerting Strategies
-    """
-
-    ONLY_ON_ERROR = "ONLY_ON_ERROR"
-    SLOW_AND_ERROR = "SLOW_AND_ERROR"
-    ALLWAYS = "ALLWAYS"
-
-
-ALERT_STRATEGIES_MAP = {
-    AlertStrategies.ONLY_ON_ERROR: (Status.ERROR, Status.FAIL),
-    AlertStrategies.SLOW_AND_ERROR: (Status.ERROR, Status.FAIL, Status.SLOW),
-    AlertStrategies.ALLWAYS: (
-        Status.ERROR,
-        Status.FAIL,
-        Status.SLOW,
-        Status.FAST,
-        Status.PASS,
-    ),
-}
-
-
-class SlackAlerter:
-    """Slack Alerter Class, used to send out alerts to slack channels"""
-
-    def __init__(self, webhook):
-        self.webhook = webhook
-
-    @staticmethod
-    def send_http(msg: str, url: str):
-        """Send an http request with msg as a 'text' parameter"""
-        response = requests.post(
-            url,
-            json={"text": msg},
-            headers={"Content-Type": "application/json"},
-            timeout=300,
+        return store.thresholds(
+            args.zeppelin_url, args.usercount, width=args.threshold_width
         )
 
-        if response.status_code == 200:
-            logging.info("Message sent successfully to Slack!")
-        else:
-            logging.warning(
-                "Failed to send message. Status code: %s", response.status_code
-            )
-
-    def send_alert(self, content: list, alert_strategy: AlertStrategies) -> None:
-        """Send an alert"""
-        for test in content:
-            if test.result in ALERT_STRATEGIES_MAP.get(
-                alert_strategy, True
-            ) or test.time.result in ALERT_STRATEGIES_MAP.get(alert_strategy, True):
-                self.send_http(self.format_message(test), self.webhook)
-                return
-
-    @staticmethod
-    def format_message(content: Results) -> str:
-        """Format a message"""
-        return json.dumps(content, default=str)
 
-
-@dataclass
-class Notebook:
+def write_profile(
+    directory: str, profiler: Profiler, sampler: ResourceSampler
+) -> dict:
     """
-    Stores Notebook info
-    Attributes:
-         name (str): The name of the notebook
-         filepath (str): The filepath of the notebook
-         totaltime (int): The totaltime of the notebook
-         results (list):  The results of the notebook
+    Write the resource samples of a profiled run to the profile directory, and merge
+    the profiles of its processes
+    Args:
+        directory: The profile directory
+        profiler: The profiler of the benchmarker
+        sampler: The sampler of the resources of the harness
+    Returns:
+        dict: The resource and hot path summaries, for the summary
     """
-
-    name: str
-    filepath: str
-    totaltime: int
-    results: list
-
-    def __post_init__(self):
-        validate(self)
-        validate_positive(self.totaltime)
-        validate_not_empty(self.name)
-        self.expected_output = self.results
-        self.expectedtime = self.totaltime
-
-
-class NotebookHandler(Protocol):
-    """Protocol for a Notebook handling Class"""
-
-    @staticmethod
-    def create_notebook(config: str, filepath: str, messages: list) -> str:
-        """Create a notebook"""
-        # pylint: disable=W0107
-        pass
-
-    @staticmethod
-    def execute_notebook(
-        config: str, notebookid: str, filepath: str, messages: list
-    ) -> tuple:
-        """Execute a notebook"""
-        # pylint: disable=W0107
-        pass
-
-    @staticmethod
-    def print_notebook(notebookid: str, config: str) -> dict:
-        """Print a notebook"""
-        # pylint: disable=W0107
-        pass
-
-    @staticmethod
-    def delete_notebook(notebookid: str, config: str) -> None:
-        """
-        Args:
-            notebookid (str): The ID of the notebook to delete
-            config (str): The configuration for the user
-        Returns:
-            None
-        """
-        # pylint: disable=W0107
-        pass
+    with open(
+        os.path.join(directory, "resources.json"), "w", encoding="utf-8"
+    ) as resources_file:
+        json.dump(sampler.to_dict(), resources_file, indent=4)
+    return {
+        "profile": {
+            "directory": directory,
+            "resources": sampler.summary(),
+            "hot_paths": profiler.merge(),
+        }
+    }
 
 
-class ZDairiNotebookHandler:
+def summarise_run(
+    args: argparse.Namespace,
+    benchmarker: GDMPBenchmarker,
+    results: list,
+    thresholds: Optional[dict],
+    sampler: ResourceSampler,
+    sweep: Optional[dict] = None,
+) -> dict:
     """
-    Implementation of the Notebook Handler Protocol.cProvides methods for creating, executing,
-    printing and deleting notebooks
+    Summarise a run of the command line, recording it in the results history
+    Args:
+        args: The command line arguments
+        benchmarker: The benchmarker that ran the notebooks
+        results: The results of the run, by number of users for a sweep
+        thresholds: The learned thresholds the results were classified with, by
+            number of users for a sweep
+        sampler: The sampler of the resources of the harness
+        sweep: The throughput versus latency curve of a sweep, see GDMPBenchmarker.sweep
+    Returns:
+        dict: The summary
     """
-
-    @staticmethod
-    def delete_notebook(notebookid: str, config: str) -> None:
-        """
-        Args:
-            notebookid (str): The ID of the notebook to delete
-            config (str): The configuration for the user
-        """
-
-        batcmd = (
-            "zdairi --config " + config + " notebook delete --notebook " + notebookid
-        )
-        with subprocess.Popen(
-            batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
-        ):
-            pass
-
-    @staticmethod
-    def create_notebook(config: str, filepath: str, messages: list) -> str:
-        """
-        Args:
-            config (str): The configuration for the user
-            filepath (str): The path for the notebook to create
-            messages (list): The list of messages to append to
-        Returns:
-            notebookid: The ID for the new notebook
-        """
-
-        try:
-            # Make notebook
-            batcmd = (
-                "zdairi --config " + config + " notebook create --filepath " + filepath
-            )
-            with subprocess.Popen(
-                batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
-            ) as pipe:
-                zdairi_result = pipe.communicate()[0]
-                result = zdairi_result.decode().split("\n")
-                text = result[0]
-                notebookid = text.split(": ")[1]
-
-        except JSONDecodeError as json_err:
-            logging.exception(json_err)
-            messages.append(
-                "Exception encountered while trying to create a notebook: "
-                + filepath
-                + " for user in config: "
-                + config
-            )
-            messages.append(zdairi_result.decode())
-
-        return notebookid
-
-    @staticmethod
-    def print_notebook(notebookid: str, config: str) -> dict:
-        """
-        Print notebook
-        Args:
-            notebookid: ID of the notebook
-            config: User configuration file
-        Returns:
-            dict: JSON dictionary of notebook
-        """
-        batcmd = (
-            "zdairi --config " + config + " notebook print --notebook " + notebookid
+    arrival_profile = parse_arrival_profile(args)
+    load_profile = parse_load_profile(args)
+    summary = {"latency": benchmarker.summarise()} if sweep is None else {"sweep": sweep}
+    if load_profile is not None:
+        summary["load_profile"] = dict(
+            asdict(load_profile), peak=load_profile.peak, duration=load_profile.duration
         )
-        with subprocess.Popen(
-            batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
-        ) as pipe:
-            zdairi_output = pipe.communicate()[0]
-            json_notebook = json.loads(
-                "".join(zdairi_output.decode().split("\n")), strict=False
-            )
-        return json_notebook
-
-    @staticmethod
-    def execute_notebook(
-        config: str, notebookid: str, filepath: str, messages: list
-    ) -> tuple:
-        """
-        Execute a notebook
-        Args:
-            config (str): The configuration for the user
-            notebookid (str): The notebook ID
-            filepath (str): The path for the notebook to create
-            messages (list): The list of messages to append to
-        Returns:
-            output: A list of output, each element being a single cell output
-            msg: Result message
-            status: Status message
-        """
-
-        output = []
-        msg = ""
-        status = ""
-        try:
-            # Run notebook
-            batcmd = (
-                "zdairi --config " + config + " notebook run --notebook " + notebookid
-            )
-            with subprocess.Popen(
-                batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
-            ) as pipe:
-                _ = pipe.communicate()[0].decode()
-
-            json_notebook = ZDairiNotebookHandler.print_notebook(
-                notebookid=notebookid, config=config
-            )
-
-            for cell in json_notebook["paragraphs"]:
-                if len(cell.get("results", [])) > 0:
-                    status = Status[cell["results"]["code"].upper()]
-                    if cell["results"]["code"] == Status.SUCCESS.value:
-                        status = Status.SUCCESS
-                    elif len(cell["results"].get("msg")) > 0:
-                        result_msg = cell["results"]["msg"][0]["data"].strip()
-                        output.append(result_msg)
-                        if status == "ERROR":
-                            msg = result_msg
-                            break
-
-        except JSONDecodeError as json_err:
-            logging.exception(json_err)
-            status = Status.FAIL
-            messages.append(
-                "Exception encountered while trying to create a notebook: "
-                + filepath
-                + " for user in config: "
-                + config
-            )
-            messages.append(output)
-
-        return output, msg, status
-
-
-class GDMPBenchmarker:
-    """Class used to run benchmarks for the Gaia Data Mining platform"""
-
-    DEFAULT_DIR = "/tmp/"
-    DEFAULT_USER_CONFIG = "user1.yml"
-
-    def __init__(
-        self,
-        userconfig: str = "",
-        zeppelin_url: str = "",
-        verbose: bool = False,
-        notebook_handler: NotebookHandler = ZDairiNotebookHandler,
-    ):
-        self.verbose = verbose
-        self.zeppelin_url = zeppelin_url.strip("/")
-        self.userconfig = userconfig
-        self.notebooks = []
-        self.default_userconfig = self.DEFAULT_USER_CONFIG
-        self.total_users = self.generate_zdairi_user_configs()
-        self.notebook_handler = notebook_handler
-
-    @staticmethod
-    def get_note(path: str) -> Dict[str, str]:
-        """Get the json file given a path (URL or file), and return as a json object"""
-        if path.startswith("http"):
-            res = requests.get(path, timeout=30).text
-            data = json.loads(res, strict=False)
-        else:
-            with open(path, encoding="utf-8") as config_file:
-                data = json.load(config_file)
-        return data
-
-    def generate_zdairi_user_configs(self) -> int:
-        """
-        Generate the user configurations that can be used by the zdairi lib
-        These need to be yml files with the following format:
-            zeppelin_url:
-            zeppelin_auth:
-            zeppelin_user:
-            zeppelin_password:
-        Returns:
-             int: Number of users
-        Raises:
-            InvalidConfigurationError: If User configuration is not a valid Json file
-        """
-        counter = 1
-        if not self.userconfig:
-            return 0
-        try:
-            with open(self.userconfig, encoding="utf-8") as user_file:
-                user_dictionary = json.load(user_file)
-        except JSONDecodeError as exc:
-            raise InvalidConfigurationError(
-                "User configuration is not a valid json file!"
-            ) from exc
-
-        user_list = user_dictionary.get("users", [])
-        for user in user_list:
-            shiro_user = user.get("shirouser", {})
-            if shiro_user:
-                with open(
-                    self.DEFAULT_DIR + "user" + str(counter) + ".yml",
-                    "w",
-                    encoding="utf-8",
-                ) as user_file:
-                    user_file.write("zeppelin_url: " + self.zeppelin_url + "\n")
-                    user_file.write("zeppelin_auth: true\n")
-                    user_file.write("zeppelin_user: " + shiro_user.get("name") + "\n")
-                    user_file.write(
-                        "zeppelin_password: " + shiro_user.get("password") + "\n"
-                    )
-                counter += 1
-
-        return len(user_list)
-
-    def _get_user_config(self, concurrent: bool) -> str:
-        """
-        Args:
-            concurrent (bool): Whether this is a concurrent test
-        Returns:
-            config (str): The user config path
-        """
-
-        if concurrent:
-            cur_process = current_process()
-            # pylint: disable=protected-access
-            counter = cur_process._identity[0]
-            config = self.DEFAULT_DIR + "user" + str(counter) + ".yml"
-        else:
-            config = self.DEFAULT_DIR + self.default_userconfig
-        return config
-
-    @staticmethod
-    def _write_data_to_file(data: dict, filepath: str) -> None:
-        """
-        Write some data to a file
-        Args:
-            data: Dictionary of the data
-            filepath: The file to write to
-        """
-        data["name"] = filepath
-        with open(filepath, "w+", encoding="utf-8") as cred:
-            json.dump(data, cred)
-
-    def run_notebook(
-        self, filepath: str, name: str, concurrent: bool = False
-    ) -> Results:
-        """
-        Run a Zeppelin notebook, given a path and name for it.
-        Return the status of the job and how long it took to execute
-        Args:
-            filepath: String with the filepath
-            name: Name of the notebooks
-            concurrent: Whether the notebook is part of a concurrent run
-        Returns:
-            Results: The results
-        """
-
-        tmpfile = self.DEFAULT_DIR + name + ".json"
-        messages = []
-        start = time.time()
-        starttime_iso = datetime.now()
-
-        config = self._get_user_config(concurrent)
-        data = self.get_note(path=filepath)
-        self._write_data_to_file(data=data, filepath=tmpfile)
-
-        # Create Notebook
-        notebookid = self.notebook_handler.create_notebook(
-            config=config, filepath=tmpfile, messages=messages
-        )
-
-        # Run Notebook
-        output, msg, status = self.notebook_handler.execute_notebook(
-            config=config, notebookid=notebookid, filepath=tmpfile, messages=messages
+    if benchmarker.cold_start:
+        summary["cold_start"] = benchmarker.cold_start
+    if benchmarker.deletion:
+        summary["deletion"] = benchmarker.deletion
+    if benchmarker.breaker.enabled:
+        summary["circuit_breaker"] = benchmarker.breaker.to_dict()
+    if benchmarker.contention is not None:
+        summary["credentials"] = benchmarker.contention.to_dict()
+    if arrival_profile is not None:
+        summary["open_loop"] = GDMPBenchmarker.open_loop_summary(
+            results, sum(length for length, _, _ in arrival_profile.segments())
         )
-
-        end = time.time()
-        endtime_iso = datetime.now()
-
-        timing = Timing(
-            result=Status.PASS,
-            totaltime=int(end - start),
-            start=starttime_iso.strftime("%Y-%m-%dT%H:%M:%S.%f%z"),
-            finish=endtime_iso.strftime("%Y-%m-%dT%H:%M:%S.%f%z"),
-        )
-
-        return Results(
-            result=status,
-            msg=msg,
-            output=output,
-            time=timing,
-            notebookid=notebookid,
-            user_config=config,
-            messages=messages,
-        )
-
-    def run(
-        self,
-        usercount: int = 1,
-        notebook_config: str = "",
-        delay_start: int = 0,
-        delay_notebook: int = 0,
-        delete: bool = True,
-    ) -> list:
-        """
-        Wrapper method to run a notebook test, either as a concurrent benchmark or as a single one
-        Args:
-            usercount: Number of users
-            notebook_config: Notebook configuration file,
-            delay_start: Number of seconds to delay start of test
-            delay_notebook: Number of seconds to delay each notebook
-            delete: Whether to delete the notebooks after the test
-        Returns:
-            List of Results
-        """
-
-        def parse_notebook_config(note_config: str):
-            """
-            Parse the notebook configuration
-            Args:
-                note_config: Notebook config as string
-            Returns:
-                list: Notebook list
-            """
-            notebook_list = []
-            notebook_json = self.get_note(path=note_config)["notebooks"]
-            for notebook in notebook_json:
-                notebook_list.append(Notebook(**notebook))
-            return notebook_list
-
-        notebooks = parse_notebook_config(notebook_config)
-        if usercount > 1:
-            results = self._run_parallel(
-                usercount=usercount,
-                notebooks=notebooks,
-                delay_start=delay_start,
-                delay_notebook=delay_notebook,
-                delete=delete,
+    # The number of users of a load profile varies, so it has no baseline to compare with
+    recorded = bool(args.results_db) and load_profile is None
+    if recorded and sweep is None:
+        summary.update(record_history(args, benchmarker, results))
+    elif recorded:
+        # Each run of a sweep is recorded with its number of users
+        summary["history"] = {
+            usercount: record_history(
+                argparse.Namespace(**dict(vars(args), usercount=usercount)),
+                benchmarker,
+                point,
             )
-        else:
-            results = self._run_single(
-                0, notebooks, False, delay_start, delay_notebook, delete
-            )
-        return results
-
-    def _run_parallel(
-        self,
-        usercount: int = 1,
-        notebooks: List = None,
-        delay_start: int = 0,
-        delay_notebook: int = 0,
-        delete: bool = True,
-    ):
-        """
-        Run the benchmarks in the given configuration as a parallel test
-        with multiple concurrent users
-        Args:
-            usercount: Number of users
-            notebooks: Notebook List
-            delay_start: Delay start in seconds
-            delay_notebook: Delay to start of notebook in seconds
-            delete: Whether to delete the notebooks after the run
-        Returns:
-            dict: The results
-        Raises:
-            ValueError: If User count exceeds maximum
-        """
-        if usercount > self.total_users:
-            err_msg = """
-            User count exceeds the number of users that 
-            were passed in the configuration!
-            """
-            raise ValueError(err_msg)
-        with Pool(processes=usercount) as pool:
-            results = pool.starmap(
-                self._run_single,
-                list(
-                    zip(
-                        range(1, usercount + 1),
-                        [notebooks] * usercount,
-                        [True] * usercount,
-                        [delay_start] * usercount,
-                        [delay_notebook] * usercount,
-                        [delete] * usercount,
-                    )
-                ),
-            )
-        pool.close()
-        pool.join()
-        return results
-
-    @staticmethod
-    def _validate_output(actual, expected, cell_number):
-        """
-        Validate actual vs expected output
-        Args:
-            actual: Actual output
-            expected: Expected output
-            cell_number: Cell number
-        Returns:
-             bool: Whether the output is valid
-             Status: Result Status
-             str: Output message
-        """
-        out_valid = True
-        result_status_msg = Status.PASS
-        output_msg = ""
-
-        if actual != expected:
-            if expected != "":
-                out_valid = False
-                result_status_msg = Status.FAIL
-                output_msg = (
-                    f"Expected/Actual output missmatch " f"of cell #{cell_number}!"
-                )
-
-        return out_valid, result_status_msg, output_msg
-
-    def _run_single(
-        self,
-        iterable: int = 0,
-        notebooks: List = None,
-        concurrent: bool = False,
-        delay_start: int = 0,
-        delay_notebook: int = 0,
-        delete: bool = True,
-    ) -> list:
-        """
-        Run a single instance of the benchmark test
-        Args:
-            iterable: Order of the user in a concurrent run
-            notebooks: Notebook list
-            concurrent: Whether this is part of a concurrent run
-            delay_start: Delay ot the start of the run in seconds
-            delay_notebook: Delay to the start of the notebook in seconds
-            delete: Whether to delete the notebooks after the run
-        Returns:
-           list: The results
-        """
-
-        results = []
-        time.sleep(delay_start * iterable)
-        created_notebooks = []
-
-        for notebook in notebooks:
-            output_valid = True
-            generated_name = "".join(
-                random.choice(string.ascii_uppercase + string.digits) for _ in range(10)
-            )
-            result = self.run_notebook(
-                notebook.filepath, generated_name, concurrent
-            )  # Results
-            created_notebooks.append([result.notebookid, result.user_config])
-
-            if len(notebook.expected_output) > 0 and result.result != Status.ERROR:
-                for i, cell in enumerate(result.output):
-                    actual_output = hashlib.md5(str(cell).encode("utf-8")).hexdigest()
-                    expected_output = notebook.expected_output.get(str(i), "")
-                    output_valid, result.result, res_message = self._validate_output(
-                        actual_output, expected_output, i
-                    )
-                    if not output_valid:
-                        result.messages.append(res_message)
-                        result.logs += res_message
-                        break
-
-            # Add result data to Results object
-            result.name = notebook.name
-            result.outputs = {"valid": output_valid}
-
-            if result.time.totaltime > notebook.expectedtime:
-                result.time.result = Status.SLOW
-            elif result.time.totaltime < (notebook.expectedtime / 2):
-                result.time.result = Status.ERROR
-            else:
-                result.time.result = Status.FAST
-
-            result.time.expected = notebook.expectedtime
-            results.append(result)
-            # Run Notebook delay here
-            time.sleep(delay_notebook)
-
-        if delete:
-            for notebook in created_notebooks:
-                self.notebook_handler.delete_notebook(
-                    notebookid=notebook[0], config=notebook[1]
-                )
-
-        return results
+            for usercount, point in results.items()
+        }
+    if thresholds is not None:
+        summary["thresholds"] = thresholds
+    if args.profile_dir:
+        summary.update(write_profile(args.profile_dir, benchmarker.profiler, sampler))
+    return summary
 
 
 def main(args: List[str] = None):
     """Main method"""
-    user_config_docs = """The user configuration file in JSON format.
-            { "users": [{    
-                            "username": "user1",
-                            "shirouser": {
-                                "name": "user1",
-                                "password": "pass1"
-                            }          
-                       }]
-            }
-    """
-
-    notebook_config_docs = """The notebook configuration file in JSON format.
-            { "notebooks" : [{
-                               "name" : "GaiaDMPSetup",
-                               "filepath" : "/path/GaiaDMP_validation.json",
-                               "totaltime" : 50,
-                               "results" : []
-                            }] 
-            }
-    """
-    parser = argparse.ArgumentParser(
-        description="Gaia Data Mining Platform Benchmarking Tool"
-    )
-
-    parser.add_argument(
-        "--zeppelin_url", required=True, type=str, default=1, help="Zeppelin URL"
-    )
-    parser.add_argument(
-        "--usercount",
-        type=int,
-        required=True,
-        default=1,
-        help="Number of users (default: 1)",
-    )
-    parser.add_argument(
-        "--notebook_config",
-        type=str,
-        required=True,
-        default="",
-        help=notebook_config_docs,
-    )
-    parser.add_argument(
-        "--user_config", type=str, required=True, default="", help=user_config_docs
-    )
-    parser.add_argument(
-        "--delay_start",
-        type=int,
-        default=0,
-        help="Number of seconds to delay start of test (default: 0)",
-    )
-    parser.add_argument(
-        "--delay_notebook",
-        type=int,
-        default=0,
-        help="Number of seconds to delay each notebook (default: 0)",
-    )
-    parser.add_argument(
-        "--delete",
-        action="store_true",
-        help="Whether to delete the notebooks after the test",
-    )
-
-    parser.add_argument(
-        "--slack_webhook",
-        type=str,
-        required=False,
-        default=None,
-        help="Whether to delete the notebooks after the test",
-    )
-    args = parser.parse_args(args)
+    args = build_parser().parse_args(args)
     zeppelin_url = args.zeppelin_url
     usercount = args.usercount
     notebook_config = args.notebook_config
@@ -952,10 +244,32 @@ def main(args: List[str] = None):
     delay_start = args.delay_start
     delay_notebook = args.delay_notebook
     alerter = SlackAlerter(args.slack_webhook) if args.slack_webhook else None
-
-    print("{")
-    print(
-        f"""
+    sweep = parse_sweep(args)
+    thresholds = learn_thresholds(args, sweep)
+    arrival_profile = parse_arrival_profile(args)
+    coordinator = parse_coordinator(args)
+
+    writer = None
+    if args.output_format == "ndjson":
+        writer = NDJSONResultWriter()
+        writer.write(
+            {
+                "type": "config",
+                "endpoint": zeppelin_url,
+                "testconfig": notebook_config,
+                "userconfig": user_config,
+                "usercount": usercount,
+                "delaystart": delay_start,
+                "delaynotebook": delay_notebook,
+                "warmup": args.warmup,
+                "iterations": args.iterations,
+                "measureduration": args.measure_duration,
+            }
+        )
+    else:
+        print("{")
+        print(
+            f"""
         "config": {{
             "endpoint":   "{zeppelin_url}",
             "testconfig": "{notebook_config}",
@@ -965,29 +279,108 @@ def main(args: List[str] = None):
             "delaynotebook":  "{delay_notebook}"
         }},
         """
-    )
-    print("}")
+        )
+        print("}")
 
-    print("---start---")
+        print("---start---")
 
-    results = GDMPBenchmarker(
+    benchmarker = GDMPBenchmarker(
         userconfig=user_config,
         zeppelin_url=zeppelin_url,
         verbose=False,
-    ).run(
-        usercount=usercount,
-        notebook_config=notebook_config,
-        delay_start=delay_start,
-        delay_notebook=delay_notebook,
+        notebook_handler=args.notebook_handler,
+        note_cache=parse_note_cache(args),
+        profiler=Profiler(args.profile_dir) if args.profile_dir else None,
     )
+    sampler = ResourceSampler(args.sample_interval)
+    with sampler if args.profile_dir else ExitStack():
+        arguments = {
+            "notebook_config": notebook_config,
+            "delay_start": delay_start,
+            "delay_notebook": delay_notebook,
+            "delete": args.delete,
+            "runner": args.runner,
+            "on_result": writer,
+            "arrival_profile": arrival_profile,
+            "max_in_flight": args.max_in_flight,
+            "warmup": args.warmup,
+            "iterations": args.iterations,
+            "measure_duration": args.measure_duration,
+            "thresholds": thresholds,
+            "notebook_concurrency": args.notebook_concurrency,
+            "max_errors": args.max_errors,
+            "max_user_errors": args.max_user_errors,
+            "timeout_factor": args.timeout_factor,
+            "paragraph_timeout": args.paragraph_timeout,
+            "metrics": MetricsPoller(
+                args.metrics_endpoint, args.metrics_interval, args.metrics_filter
+            )
+            if args.metrics_endpoint
+            else None,
+            "spark_jobs": args.spark_jobs,
+            "prewarm": parse_prewarm(args),
+            "coordinator": coordinator,
+            "load_profile": parse_load_profile(args),
+            "credential_pool": parse_credential_pool(args),
+            "journal": parse_journal(args),
+        }
+        if sweep is not None:
+            results, curve = benchmarker.sweep(sweep, **arguments)
+        else:
+            results, curve = benchmarker.run(usercount=usercount, **arguments), None
+    summary = summarise_run(args, benchmarker, results, thresholds, sampler, curve)
+    if coordinator is not None:
+        summary["distributed"] = coordinator.to_dict()
 
     if alerter is not None:
         alerter.send_alert(
-            content=results, alert_strategy=AlertStrategies.ONLY_ON_ERROR
+            content=results
+            if curve is None
+            else [result for point in results.values() for result in flatten_results(point)],
+            alert_strategy=AlertStrategies.ONLY_ON_ERROR,
         )
-    print(json.dumps(results, default=lambda o: o.to_dict(), indent=4))
-    print("---end---")
+    if writer is not None:
+        writer.write_summary(**summary)
+    else:
+        print(json.dumps(results, default=lambda o: o.to_dict(), indent=4))
+        print("---summary---")
+        print(json.dumps(summary, indent=4))
+        print("---end---")
+
+
+def agent_main(args: List[str] = None):
+    """Run an agent of distributed runs"""
+    args = build_agent_parser().parse_args(args)
+    if not args.authkey:
+        raise InvalidConfigurationError("An agent needs a key shared with the coordinators")
+    agent = Agent(
+        parse_address(args.listen), args.authkey.encode("utf-8"), args.directory
+    )
+    print(f"Agent listening on {agent.address[0]}:{agent.address[1]}", flush=True)
+    try:
+        agent.serve(args.sessions)
+    finally:
+        agent.close()
+
+
+def cleanup_main(args: List[str] = None):
+    """Delete the notebooks an interrupted run left behind, from its journal"""
+    args = build_cleanup_parser().parse_args(args)
+    records = RunJournal.read(args.journal)
+    if not records or records[0].get("type") != "run":
+        raise InvalidConfigurationError(f"No run in journal {args.journal}")
+    benchmarker = GDMPBenchmarker(
+        userconfig=args.user_config or records[0]["user_config"],
+        zeppelin_url=args.zeppelin_url or records[0]["zeppelin_url"],
+        notebook_handler=args.notebook_handler,
+        note_cache=False,
+    )
+    deleted = benchmarker.cleanup(RunJournal(args.journal))
+    print(json.dumps({"deleted": deleted}, indent=4))
 
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    if sys.argv[1:2] == ["cleanup"]:
+        cleanup_main(sys.argv[2:])
+    else:
+        main(sys.argv[1:])
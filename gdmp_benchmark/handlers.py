@@ -0,0 +1,992 @@
+"""
+Notebook handlers, running the notebooks with zdairi or the Zeppelin REST API
+"""
+# pylint: disable-msg=too-many-locals
+# pylint: disable-msg=too-many-arguments
+# pylint: disable-msg=too-many-positional-arguments
+import os
+import signal
+import subprocess
+import time
+import asyncio
+import functools
+import contextvars
+import threading
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Protocol
+import simplejson as json
+from simplejson.errors import JSONDecodeError
+import requests
+from gdmp_benchmark.results import ISO_FORMAT, ParagraphTiming, Status, timed_phase
+from gdmp_benchmark.json_select import NOTEBOOK_RESULT_FIELDS, parse_json_fields
+from gdmp_benchmark.notebooks import (
+    add_job_urls, paragraph_title, parse_notebook_output, parse_paragraph_timings,
+    read_user_config, time_limit,
+)
+
+
+class NotebookHandler(Protocol):
+    """Protocol for a Notebook handling Class"""
+
+    @staticmethod
+    def create_notebook(config: str, filepath: str, messages: list) -> str:
+        """Create a notebook"""
+        # pylint: disable=W0107
+        pass
+
+    @staticmethod
+    def execute_notebook(
+        config: str,
+        notebookid: str,
+        filepath: str,
+        messages: list,
+        paragraphs: list = None,
+        phases: dict = None,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> tuple:
+        """
+        Execute a notebook, appending the timing of each paragraph to paragraphs
+        and adding the time spent running and printing it to phases. A notebook
+        that runs longer than the timeout, or a paragraph longer than the paragraph
+        timeout, is stopped and its status is TIMEOUT
+        """
+        # pylint: disable=W0107
+        pass
+
+    @staticmethod
+    def print_notebook(notebookid: str, config: str) -> dict:
+        """Print a notebook"""
+        # pylint: disable=W0107
+        pass
+
+    @staticmethod
+    def clear_notebook(notebookid: str, config: str) -> bool:
+        """
+        Clear the output of all the paragraphs of a notebook, so it can be run again.
+        Returns whether it was cleared
+        """
+        # pylint: disable=W0107
+        pass
+
+    @staticmethod
+    def delete_notebook(notebookid: str, config: str) -> bool:
+        """
+        Args:
+            notebookid (str): The ID of the notebook to delete
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was deleted
+        """
+        # pylint: disable=W0107
+        pass
+
+
+class ZDairiNotebookHandler:
+    """
+    Implementation of the Notebook Handler Protocol.cProvides methods for creating, executing,
+    printing and deleting notebooks. zdairi cannot clear a notebook, so the notebooks reused
+    by later runs are cleared with the Zeppelin REST API (see clear_notebook), which needs
+    the Zeppelin URL of the user configuration to be reachable from the harness
+    """
+
+    @staticmethod
+    def delete_notebook(notebookid: str, config: str) -> bool:
+        """
+        Args:
+            notebookid (str): The ID of the notebook to delete
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was deleted
+        """
+
+        batcmd = (
+            "zdairi --config " + config + " notebook delete --notebook " + notebookid
+        )
+        with subprocess.Popen(
+            batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
+        ) as pipe:
+            output = pipe.communicate()[0].decode(errors="replace")
+        if pipe.returncode:
+            logging.warning("Notebook %s was not deleted: %s", notebookid, output)
+            return False
+        return True
+
+    @staticmethod
+    def clear_notebook(notebookid: str, config: str) -> bool:
+        """
+        Clear the output of all the paragraphs of a notebook. zdairi has no command
+        for this, so it is done with the Zeppelin REST API, using the same configuration
+        Args:
+            notebookid (str): The ID of the notebook to clear
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was cleared
+        """
+        return ZeppelinRestNotebookHandler.clear_notebook(
+            notebookid=notebookid, config=config
+        )
+
+    @staticmethod
+    def create_notebook(config: str, filepath: str, messages: list) -> str:
+        """
+        Args:
+            config (str): The configuration for the user
+            filepath (str): The path for the notebook to create
+            messages (list): The list of messages to append to
+        Returns:
+            notebookid: The ID for the new notebook
+        """
+
+        try:
+            # Make notebook
+            batcmd = (
+                "zdairi --config " + config + " notebook create --filepath " + filepath
+            )
+            with subprocess.Popen(
+                batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
+            ) as pipe:
+                zdairi_result = pipe.communicate()[0]
+                result = zdairi_result.decode().split("\n")
+                text = result[0]
+                notebookid = text.split(": ")[1]
+
+        except JSONDecodeError as json_err:
+            logging.exception(json_err)
+            messages.append(
+                "Exception encountered while trying to create a notebook: "
+                + filepath
+                + " for user in config: "
+                + config
+            )
+            messages.append(zdairi_result.decode())
+
+        return notebookid
+
+    @staticmethod
+    def print_notebook(notebookid: str, config: str) -> dict:
+        """
+        Print notebook. Only the fields used by the results are parsed from the
+        output of zdairi, see NOTEBOOK_RESULT_FIELDS
+        Args:
+            notebookid: ID of the notebook
+            config: User configuration file
+        Returns:
+            dict: JSON dictionary of notebook
+        """
+        batcmd = (
+            "zdairi --config " + config + " notebook print --notebook " + notebookid
+        )
+        with subprocess.Popen(
+            batcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True
+        ) as pipe:
+            zdairi_output = pipe.communicate()[0]
+        return parse_json_fields(zdairi_output, NOTEBOOK_RESULT_FIELDS)
+
+    @staticmethod
+    def execute_notebook(
+        config: str,
+        notebookid: str,
+        filepath: str,
+        messages: list,
+        paragraphs: list = None,
+        phases: dict = None,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> tuple:
+        """
+        Execute a notebook. zdairi runs the whole notebook in one command, so only the
+        notebook timeout applies: the command is killed and the notebook is stopped
+        with the Zeppelin REST API
+        Args:
+            config (str): The configuration for the user
+            notebookid (str): The notebook ID
+            filepath (str): The path for the notebook to create
+            messages (list): The list of messages to append to
+            paragraphs (list): The list to append the timing of each paragraph to
+            phases (dict): The time spent in each phase, to add the run and print times to
+            timeout (float): Seconds the notebook may run, no limit if 0
+            paragraph_timeout (float): Not supported by zdairi
+        Returns:
+            output: A list of output, each element being a single cell output
+            msg: Result message
+            status: Status message
+        """
+        # pylint: disable=unused-argument
+        output = []
+        msg = ""
+        status = ""
+        timed_out = False
+        try:
+            # Run notebook
+            batcmd = (
+                "zdairi --config " + config + " notebook run --notebook " + notebookid
+            )
+            with timed_phase(phases, "execute.run"), subprocess.Popen(
+                batcmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                shell=True,
+                start_new_session=True,
+            ) as pipe:
+                try:
+                    _ = pipe.communicate(timeout=timeout or None)[0].decode()
+                except subprocess.TimeoutExpired:
+                    # Kill the shell and zdairi, then stop the notebook in Zeppelin
+                    os.killpg(pipe.pid, signal.SIGKILL)
+                    pipe.communicate()
+                    ZeppelinRestNotebookHandler.stop_notebook(
+                        notebookid=notebookid, config=config
+                    )
+                    timed_out = True
+
+            with timed_phase(phases, "execute.print"):
+                json_notebook = ZDairiNotebookHandler.print_notebook(
+                    notebookid=notebookid, config=config
+                )
+            output, msg, status = parse_notebook_output(json_notebook)
+            if paragraphs is not None:
+                paragraphs.extend(parse_paragraph_timings(json_notebook))
+            if timed_out:
+                status = Status.TIMEOUT
+                msg = f"Notebook timed out after {timeout} seconds"
+                messages.append(msg)
+
+        except JSONDecodeError as json_err:
+            logging.exception(json_err)
+            status = Status.FAIL
+            messages.append(
+                "Exception encountered while trying to create a notebook: "
+                + filepath
+                + " for user in config: "
+                + config
+            )
+            messages.append(output)
+
+        return output, msg, status
+
+
+class ZeppelinRestNotebookHandler:
+    """
+    Implementation of the Notebook Handler Protocol that talks to the Zeppelin REST API directly.
+    A persistent HTTP session is kept per user configuration, so each user logs in once
+    and reuses keep-alive connections for every subsequent request, logging in again
+    when the session expires
+    """
+
+    TIMEOUT = 30
+    # Session, Zeppelin URL and login form of each user configuration
+    _sessions: Dict[str, tuple] = {}
+    _sessions_lock = threading.Lock()
+    _login_locks: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def get_session(cls, config: str) -> tuple:
+        """
+        Get the logged in session for a user configuration, creating it if needed.
+        The configuration is read once, and each configuration logs in under its own
+        lock, so a slow login does not hold up the other users
+        Args:
+            config (str): The configuration for the user
+        Returns:
+            requests.Session: The session
+            str: The Zeppelin URL
+        Raises:
+            requests.HTTPError: If the login fails
+        """
+        with cls._sessions_lock:
+            cached = cls._sessions.get(config)
+            login_lock = cls._login_locks.setdefault(config, threading.Lock())
+        if cached is None:
+            with login_lock:
+                with cls._sessions_lock:
+                    cached = cls._sessions.get(config)
+                if cached is None:
+                    user_config = read_user_config(config)
+                    login = None
+                    if user_config.get("zeppelin_auth", "false").lower() == "true":
+                        login = {
+                            "userName": user_config.get("zeppelin_user", ""),
+                            "password": user_config.get("zeppelin_password", ""),
+                        }
+                    cached = (
+                        requests.Session(), user_config.get("zeppelin_url", "").strip("/"), login
+                    )
+                    cls._login(*cached)
+                    with cls._sessions_lock:
+                        cls._sessions[config] = cached
+        return cached[:2]
+
+    @classmethod
+    def _login(cls, session: requests.Session, url: str, login: Optional[dict]) -> None:
+        """
+        Log a session in to Zeppelin, unless it does not authenticate
+        Args:
+            session: The session
+            url: The Zeppelin URL
+            login: The user name and password, None without authentication
+        Raises:
+            requests.HTTPError: If the login fails
+        """
+        if login is not None:
+            response = session.post(url + "/api/login", data=login, timeout=cls.TIMEOUT)
+            response.raise_for_status()
+
+    @classmethod
+    def close_sessions(cls) -> None:
+        """Close all the open sessions"""
+        with cls._sessions_lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+            cls._login_locks.clear()
+        for session, _, _ in sessions:
+            session.close()
+
+    @classmethod
+    def _request(cls, method: str, config: str, path: str, **kwargs) -> dict:
+        """
+        Send a request to the Zeppelin REST API, logging in again once if the session
+        has expired
+        Args:
+            method: HTTP method
+            config: The configuration for the user
+            path: Path of the API endpoint
+        Returns:
+            dict: The JSON response
+        Raises:
+            requests.HTTPError: If the response status is an error
+        """
+        session, url = cls.get_session(config)
+        kwargs.setdefault("timeout", cls.TIMEOUT)
+        response = session.request(method, url + path, **kwargs)
+        if response.status_code in (401, 403):
+            # The session has expired, log in again once
+            with cls._sessions_lock:
+                login = cls._sessions.get(config, (None, None, None))[2]
+                login_lock = cls._login_locks.setdefault(config, threading.Lock())
+            if login is not None:
+                with login_lock:
+                    cls._login(session, url, login)
+                response = session.request(method, url + path, **kwargs)
+        response.raise_for_status()
+        return json.loads(response.text, strict=False) if response.text else {}
+
+    @classmethod
+    def delete_notebook(cls, notebookid: str, config: str) -> bool:
+        """
+        Args:
+            notebookid (str): The ID of the notebook to delete
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was deleted
+        """
+        try:
+            cls._request("DELETE", config, "/api/notebook/" + notebookid)
+        except requests.RequestException as req_err:
+            logging.exception(req_err)
+            return False
+        return True
+
+    @classmethod
+    def clear_notebook(cls, notebookid: str, config: str) -> bool:
+        """
+        Clear the output of all the paragraphs of a notebook
+        Args:
+            notebookid (str): The ID of the notebook to clear
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was cleared
+        """
+        try:
+            cls._request("PUT", config, "/api/notebook/" + notebookid + "/clear")
+        except requests.RequestException as req_err:
+            logging.exception(req_err)
+            return False
+        return True
+
+    @classmethod
+    def stop_notebook(cls, notebookid: str, config: str, paragraphid: str = "") -> None:
+        """
+        Stop a running paragraph, or all the running paragraphs of a notebook
+        Args:
+            notebookid (str): The ID of the notebook to stop
+            config (str): The configuration for the user
+            paragraphid (str): The ID of the paragraph to stop, all of them if empty
+        """
+        path = "/api/notebook/job/" + notebookid
+        if paragraphid:
+            path += "/" + paragraphid
+        try:
+            cls._request("DELETE", config, path)
+        except requests.RequestException as req_err:
+            logging.exception(req_err)
+
+    @classmethod
+    def restart_interpreter(cls, setting: str, config: str, notebookid: str = "") -> None:
+        """
+        Restart an interpreter setting, only the session of the notebook if the
+        interpreter is scoped or isolated per note or per user
+        Args:
+            setting (str): The ID of the interpreter setting, i.e. "spark"
+            config (str): The configuration for the user
+            notebookid (str): The notebook whose session to restart
+        """
+        try:
+            cls._request(
+                "PUT",
+                config,
+                "/api/interpreter/setting/restart/" + setting,
+                json={"noteId": notebookid} if notebookid else {},
+            )
+        except requests.RequestException as req_err:
+            logging.exception(req_err)
+
+    @classmethod
+    def create_notebook(cls, config: str, filepath: str, messages: list) -> str:
+        """
+        Args:
+            config (str): The configuration for the user
+            filepath (str): The path for the notebook to create
+            messages (list): The list of messages to append to
+        Returns:
+            notebookid: The ID for the new notebook
+        """
+        notebookid = ""
+        try:
+            with open(filepath, encoding="utf-8") as note_file:
+                note = note_file.read()
+            notebookid = cls._request(
+                "POST",
+                config,
+                "/api/notebook/import",
+                data=note.encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )["body"]
+        except (requests.RequestException, JSONDecodeError, KeyError) as req_err:
+            logging.exception(req_err)
+            messages.append(
+                "Exception encountered while trying to create a notebook: "
+                + filepath
+                + " for user in config: "
+                + config
+            )
+            messages.append(str(req_err))
+        return notebookid
+
+    @classmethod
+    def print_notebook(cls, notebookid: str, config: str) -> dict:
+        """
+        Print notebook
+        Args:
+            notebookid: ID of the notebook
+            config: User configuration file
+        Returns:
+            dict: JSON dictionary of notebook
+        """
+        return cls._request("GET", config, "/api/notebook/" + notebookid)["body"]
+
+    @classmethod
+    def run_paragraph(
+        cls, config: str, notebookid: str, paragraph: dict, timeout: float = None
+    ) -> tuple:
+        """
+        Run a single paragraph, blocking until it finishes or times out.
+        A paragraph that times out is stopped, and its status is TIMEOUT
+        Args:
+            config (str): The configuration for the user
+            notebookid (str): The notebook ID
+            paragraph (dict): JSON dictionary of the paragraph
+            timeout (float): Seconds the paragraph may run, no limit if None
+        Returns:
+            ParagraphTiming: The timing of the paragraph
+            bool: Whether the paragraph failed
+        Raises:
+            requests.RequestException: If the paragraph could not be run
+        """
+        start_iso = datetime.now()
+        start = time.perf_counter()
+        try:
+            body = cls._request(
+                "POST",
+                config,
+                "/api/notebook/run/" + notebookid + "/" + paragraph["id"],
+                timeout=(cls.TIMEOUT, timeout),
+            ).get("body") or {}
+            code = body.get("code", Status.SUCCESS.value)
+            status = "FINISHED" if code == Status.SUCCESS.value else "ERROR"
+        except requests.HTTPError as http_err:
+            # Zeppelin answers with an error code and the results when the paragraph fails,
+            # any other error (expired session, missing notebook) fails the notebook
+            if not cls._paragraph_failed(http_err.response):
+                raise
+            logging.info(http_err)
+            status = "ERROR"
+        except requests.ReadTimeout:
+            cls.stop_notebook(notebookid, config, paragraph["id"])
+            status = Status.TIMEOUT.value
+        duration = time.perf_counter() - start
+        timing = ParagraphTiming(
+            paragraphid=paragraph["id"],
+            title=paragraph_title(paragraph),
+            status=status,
+            start=start_iso.strftime(ISO_FORMAT),
+            finish=datetime.now().strftime(ISO_FORMAT),
+            duration=duration,
+        )
+        return timing, status != "FINISHED"
+
+    @staticmethod
+    def _paragraph_failed(response: Optional[requests.Response]) -> bool:
+        """
+        Args:
+            response: The error response of a paragraph run
+        Returns:
+            bool: Whether it is the response of a paragraph that failed, with its results
+        """
+        if response is None or response.status_code != 500:
+            return False
+        try:
+            body = json.loads(response.text, strict=False).get("body")
+        except (JSONDecodeError, AttributeError):
+            return False
+        return isinstance(body, dict) and body.get("code") == Status.ERROR.value
+
+    @classmethod
+    def execute_notebook(
+        cls,
+        config: str,
+        notebookid: str,
+        filepath: str,
+        messages: list,
+        paragraphs: list = None,
+        phases: dict = None,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> tuple:
+        """
+        Execute a notebook, running its paragraphs one at a time. The paragraph
+        running when the notebook or the paragraph times out is stopped, and the
+        remaining paragraphs are not run
+        Args:
+            config (str): The configuration for the user
+            notebookid (str): The notebook ID
+            filepath (str): The path for the notebook to create
+            messages (list): The list of messages to append to
+            paragraphs (list): The list to append the timing of each paragraph to
+            phases (dict): The time spent in each phase, to add the run and print times to
+            timeout (float): Seconds the notebook may run, no limit if 0
+            paragraph_timeout (float): Seconds each paragraph may run, no limit if 0
+        Returns:
+            output: A list of output, each element being a single cell output
+            msg: Result message
+            status: Status message
+        """
+        output = []
+        msg = ""
+        status = ""
+        timed_out = ""
+        paragraphs = [] if paragraphs is None else paragraphs
+        try:
+            with timed_phase(phases, "execute.print"):
+                json_notebook = cls.print_notebook(notebookid=notebookid, config=config)
+            deadline = time.perf_counter() + timeout if timeout else 0
+            with timed_phase(phases, "execute.run"):
+                for paragraph in json_notebook["paragraphs"]:
+                    limit = time_limit(deadline, paragraph_timeout)
+                    if limit is not None and limit <= 0:
+                        timed_out = f"Notebook timed out after {timeout} seconds"
+                        break
+                    timing, failed = cls.run_paragraph(
+                        config, notebookid, paragraph, timeout=limit
+                    )
+                    paragraphs.append(timing)
+                    if timing.status == Status.TIMEOUT.value:
+                        timed_out = (
+                            f"Paragraph {timing.paragraphid} timed out "
+                            f"after {limit:.3g} seconds"
+                        )
+                        break
+                    if failed:
+                        break
+
+            with timed_phase(phases, "execute.print"):
+                json_notebook = cls.print_notebook(notebookid=notebookid, config=config)
+            output, msg, status = parse_notebook_output(json_notebook)
+            add_job_urls(json_notebook, paragraphs)
+            if timed_out:
+                status, msg = Status.TIMEOUT, timed_out
+                messages.append(msg)
+
+        except (requests.RequestException, JSONDecodeError, KeyError) as req_err:
+            logging.exception(req_err)
+            status = Status.FAIL
+            messages.append(
+                "Exception encountered while trying to run a notebook: "
+                + filepath
+                + " for user in config: "
+                + config
+            )
+            messages.append(str(req_err))
+
+        return output, msg, status
+
+
+# Seconds each blocking call of the current task waited for a thread, if measured
+THREAD_WAITS = contextvars.ContextVar("thread_waits", default=None)
+
+
+async def run_in_thread(executor: Optional[ThreadPoolExecutor], func, *args, **kwargs):
+    """
+    Run a blocking call on a thread pool, recording how long it waited for a thread
+    in THREAD_WAITS, when the current task measures it
+    Args:
+        executor: The thread pool, the default one of the event loop if None
+        func: The blocking function
+        args: Its positional arguments
+        kwargs: Its keyword arguments
+    Returns:
+        The result of the call
+    """
+    waits = THREAD_WAITS.get()
+    call = functools.partial(func, *args, **kwargs)
+    if waits is not None:
+        submitted = time.perf_counter()
+
+        def measured():
+            waits.append(time.perf_counter() - submitted)
+            return func(*args, **kwargs)
+
+        call = measured
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+class AsyncZeppelinRestNotebookHandler:
+    """
+    Asynchronous Notebook Handler for the Zeppelin REST API, used by the asyncio runner.
+    Paragraphs are submitted as background jobs and their status is polled, so a
+    coroutine never blocks on a running notebook. The individual (short) HTTP calls
+    are made on a small shared thread pool, using the sessions of ZeppelinRestNotebookHandler
+    """
+
+    POLL_INTERVAL = 1.0
+    MAX_WORKERS = 8
+    RUNNING_STATES = ("READY", "PENDING", "RUNNING")
+    _executor = None
+
+    @classmethod
+    async def _call(cls, func, *args, **kwargs):
+        """Run a blocking call on the shared thread pool"""
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=cls.MAX_WORKERS)
+        return await run_in_thread(cls._executor, func, *args, **kwargs)
+
+    @classmethod
+    async def delete_notebook(cls, notebookid: str, config: str) -> bool:
+        """
+        Args:
+            notebookid (str): The ID of the notebook to delete
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was deleted
+        """
+        return await cls._call(
+            ZeppelinRestNotebookHandler.delete_notebook,
+            notebookid=notebookid,
+            config=config,
+        )
+
+    @classmethod
+    async def clear_notebook(cls, notebookid: str, config: str) -> bool:
+        """
+        Args:
+            notebookid (str): The ID of the notebook to clear
+            config (str): The configuration for the user
+        Returns:
+            bool: Whether the notebook was cleared
+        """
+        return await cls._call(
+            ZeppelinRestNotebookHandler.clear_notebook,
+            notebookid=notebookid,
+            config=config,
+        )
+
+    @classmethod
+    async def restart_interpreter(
+        cls, setting: str, config: str, notebookid: str = ""
+    ) -> None:
+        """
+        Args:
+            setting (str): The ID of the interpreter setting, i.e. "spark"
+            config (str): The configuration for the user
+            notebookid (str): The notebook whose session to restart
+        """
+        await cls._call(
+            ZeppelinRestNotebookHandler.restart_interpreter,
+            setting=setting,
+            config=config,
+            notebookid=notebookid,
+        )
+
+    @classmethod
+    async def create_notebook(cls, config: str, filepath: str, messages: list) -> str:
+        """
+        Args:
+            config (str): The configuration for the user
+            filepath (str): The path for the notebook to create
+            messages (list): The list of messages to append to
+        Returns:
+            notebookid: The ID for the new notebook
+        """
+        return await cls._call(
+            ZeppelinRestNotebookHandler.create_notebook,
+            config=config,
+            filepath=filepath,
+            messages=messages,
+        )
+
+    @classmethod
+    async def print_notebook(cls, notebookid: str, config: str) -> dict:
+        """
+        Print notebook
+        Args:
+            notebookid: ID of the notebook
+            config: User configuration file
+        Returns:
+            dict: JSON dictionary of notebook
+        """
+        return await cls._call(
+            ZeppelinRestNotebookHandler.print_notebook,
+            notebookid=notebookid,
+            config=config,
+        )
+
+    @classmethod
+    async def run_paragraph(
+        cls, config: str, notebookid: str, paragraph: dict, timeout: float = None
+    ) -> tuple:
+        """
+        Submit a single paragraph as a background job, and poll its status until it finishes
+        or times out. A paragraph that times out is stopped, and its status is TIMEOUT
+        Args:
+            config (str): The configuration for the user
+            notebookid (str): The notebook ID
+            paragraph (dict): JSON dictionary of the paragraph
+            timeout (float): Seconds the paragraph may run, no limit if None
+        Returns:
+            ParagraphTiming: The timing of the paragraph
+            bool: Whether the paragraph failed
+        Raises:
+            requests.RequestException: If the paragraph could not be run
+        """
+        # pylint: disable=protected-access
+        path = "/api/notebook/job/" + notebookid + "/" + paragraph["id"]
+        start_iso = datetime.now()
+        start = time.perf_counter()
+        await cls._call(ZeppelinRestNotebookHandler._request, "POST", config, path)
+        while True:
+            delay = cls.POLL_INTERVAL
+            if timeout is not None:
+                delay = max(min(delay, start + timeout - time.perf_counter()), 0)
+            await asyncio.sleep(delay)
+            status = (
+                await cls._call(
+                    ZeppelinRestNotebookHandler._request, "GET", config, path
+                )
+            )["body"].get("status", "")
+            if status not in cls.RUNNING_STATES:
+                break
+            if timeout is not None and time.perf_counter() - start >= timeout:
+                await cls._call(
+                    ZeppelinRestNotebookHandler.stop_notebook,
+                    notebookid,
+                    config,
+                    paragraph["id"],
+                )
+                status = Status.TIMEOUT.value
+                break
+        duration = time.perf_counter() - start
+        timing = ParagraphTiming(
+            paragraphid=paragraph["id"],
+            title=paragraph_title(paragraph),
+            status=status,
+            start=start_iso.strftime(ISO_FORMAT),
+            finish=datetime.now().strftime(ISO_FORMAT),
+            duration=duration,
+        )
+        return timing, status != "FINISHED"
+
+    @classmethod
+    async def execute_notebook(
+        cls,
+        config: str,
+        notebookid: str,
+        filepath: str,
+        messages: list,
+        paragraphs: list = None,
+        phases: dict = None,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> tuple:
+        """
+        Execute a notebook, running its paragraphs one at a time. The paragraph
+        running when the notebook or the paragraph times out is stopped, and the
+        remaining paragraphs are not run
+        Args:
+            config (str): The configuration for the user
+            notebookid (str): The notebook ID
+            filepath (str): The path for the notebook to create
+            messages (list): The list of messages to append to
+            paragraphs (list): The list to append the timing of each paragraph to
+            phases (dict): The time spent in each phase, to add the run and print times to
+            timeout (float): Seconds the notebook may run, no limit if 0
+            paragraph_timeout (float): Seconds each paragraph may run, no limit if 0
+        Returns:
+            output: A list of output, each element being a single cell output
+            msg: Result message
+            status: Status message
+        """
+        output = []
+        msg = ""
+        status = ""
+        timed_out = ""
+        paragraphs = [] if paragraphs is None else paragraphs
+        try:
+            with timed_phase(phases, "execute.print"):
+                json_notebook = await cls.print_notebook(
+                    notebookid=notebookid, config=config
+                )
+            deadline = time.perf_counter() + timeout if timeout else 0
+            with timed_phase(phases, "execute.run"):
+                for paragraph in json_notebook["paragraphs"]:
+                    limit = time_limit(deadline, paragraph_timeout)
+                    if limit is not None and limit <= 0:
+                        timed_out = f"Notebook timed out after {timeout} seconds"
+                        break
+                    timing, failed = await cls.run_paragraph(
+                        config, notebookid, paragraph, timeout=limit
+                    )
+                    paragraphs.append(timing)
+                    if timing.status == Status.TIMEOUT.value:
+                        timed_out = (
+                            f"Paragraph {timing.paragraphid} timed out "
+                            f"after {limit:.3g} seconds"
+                        )
+                        break
+                    if failed:
+                        break
+
+            with timed_phase(phases, "execute.print"):
+                json_notebook = await cls.print_notebook(
+                    notebookid=notebookid, config=config
+                )
+            output, msg, status = parse_notebook_output(json_notebook)
+            add_job_urls(json_notebook, paragraphs)
+            if timed_out:
+                status, msg = Status.TIMEOUT, timed_out
+                messages.append(msg)
+
+        except (requests.RequestException, JSONDecodeError, KeyError) as req_err:
+            logging.exception(req_err)
+            status = Status.FAIL
+            messages.append(
+                "Exception encountered while trying to run a notebook: "
+                + filepath
+                + " for user in config: "
+                + config
+            )
+            messages.append(str(req_err))
+
+        return output, msg, status
+
+
+class ThreadedAsyncNotebookHandler:
+    """
+    Adapter exposing a synchronous Notebook Handler to the asyncio runner,
+    by running each of its calls in a thread. Used for handlers without a native
+    asynchronous implementation (i.e. zdairi), where a thread is held for every running notebook,
+    so the threads of its own pool are sized to the notebooks that may run at once, see workers()
+    """
+
+    def __init__(self, handler: NotebookHandler, max_workers: int = 1):
+        self.handler = handler
+        self.max_workers = max_workers
+        self._executor = None
+
+    def workers(self, max_workers: int) -> None:
+        """
+        Size the thread pool to the notebooks that may run at once
+        Args:
+            max_workers: Number of threads, one for each notebook that may run at once
+        """
+        if max_workers != self.max_workers and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.max_workers = max_workers
+
+    async def _call(self, func, *args, **kwargs):
+        """Run a call of the handler on the thread pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return await run_in_thread(self._executor, func, *args, **kwargs)
+
+    async def delete_notebook(self, notebookid: str, config: str) -> bool:
+        """Delete a notebook, returning whether it was deleted"""
+        return await self._call(self.handler.delete_notebook, notebookid, config)
+
+    async def clear_notebook(self, notebookid: str, config: str) -> bool:
+        """Clear the output of a notebook, returning whether it was cleared"""
+        return await self._call(self.handler.clear_notebook, notebookid, config)
+
+    async def restart_interpreter(
+        self, setting: str, config: str, notebookid: str = ""
+    ) -> None:
+        """Restart an interpreter setting, if the handler can"""
+        if not hasattr(self.handler, "restart_interpreter"):
+            logging.warning("Interpreters cannot be restarted by %s", self.handler)
+            return
+        await self._call(self.handler.restart_interpreter, setting, config, notebookid)
+
+    async def create_notebook(self, config: str, filepath: str, messages: list) -> str:
+        """Create a notebook"""
+        return await self._call(self.handler.create_notebook, config, filepath, messages)
+
+    async def print_notebook(self, notebookid: str, config: str) -> dict:
+        """Print a notebook"""
+        return await self._call(self.handler.print_notebook, notebookid, config)
+
+    async def execute_notebook(
+        self,
+        config: str,
+        notebookid: str,
+        filepath: str,
+        messages: list,
+        paragraphs: list = None,
+        phases: dict = None,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> tuple:
+        """Execute a notebook"""
+        return await self._call(
+            self.handler.execute_notebook,
+            config,
+            notebookid,
+            filepath,
+            messages,
+            paragraphs=paragraphs,
+            phases=phases,
+            timeout=timeout,
+            paragraph_timeout=paragraph_timeout,
+        )
+
+
+NOTEBOOK_HANDLERS = {
+    "zdairi": ZDairiNotebookHandler,
+    "rest": ZeppelinRestNotebookHandler,
+}
+
+
+ASYNC_NOTEBOOK_HANDLERS = {
+    ZeppelinRestNotebookHandler: AsyncZeppelinRestNotebookHandler,
+}
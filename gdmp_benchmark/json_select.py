@@ -0,0 +1,278 @@
+"""
+Selection of the fields of JSON documents, decoding only the fields that are used
+"""
+import re
+from typing import Union
+import simplejson as json
+from simplejson.errors import JSONDecodeError
+
+
+JSON_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+
+
+# A member of an object, with its value and the next delimiter if the value is
+# a scalar or a short string without escapes
+JSON_MEMBER = re.compile(
+    rb'"([^"\\]*(?:\\.[^"\\]*)*)"[ \t\n\r]*:[ \t\n\r]*'
+    rb'(?:("[^"\\]{0,4096}"|[^,:{}\[\]\s"]+)[ \t\n\r]*([,}])[ \t\n\r]*)?',
+    re.DOTALL,
+)
+
+
+JSON_DELIMITER = re.compile(rb"[ \t\n\r]*([,}\]])[ \t\n\r]*")
+
+
+# Runs of a JSON value up to its next bracket, with its short strings without escapes
+JSON_SKIP = re.compile(rb'(?:[^"{}\[\]]+|"[^"\\]{0,4096}")*')
+
+
+JSON_SCALAR = re.compile(rb"[^,:{}\[\]\s]+")
+
+
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+# Documents up to this many bytes are decoded at once, then selected: their copies
+# are small, and decoding them is faster than selecting their fields
+JSON_SMALL_DOCUMENT = 65536
+
+
+# The fields of a printed notebook used by the results: its output is the first
+# message of each paragraph, further messages and the configurations are skipped
+NOTEBOOK_RESULT_FIELDS = {
+    "paragraphs": [
+        {
+            "id": True,
+            "title": True,
+            "text": True,
+            "status": True,
+            "dateStarted": True,
+            "dateFinished": True,
+            "runtimeInfos": True,
+            "results": {"code": True, "msg": [{"type": True, "data": True}, 1]},
+        }
+    ]
+}
+
+
+def skip_string(data: bytes, pos: int) -> int:
+    """
+    Find the end of a JSON string without decoding it, searching for its closing
+    quote, so long strings such as base64 images are skipped at memory speed
+    Args:
+        data: The JSON document, UTF-8 encoded
+        pos: The position of the opening quote
+    Returns:
+        int: The position after the string
+    Raises:
+        JSONDecodeError: If the string is not terminated
+    """
+    end = data.find(b'"', pos + 1)
+    while end != -1:
+        escape = end - 1
+        while data[escape] == ord("\\"):
+            escape -= 1
+        # The quote is escaped by an odd number of backslashes
+        if (end - escape) % 2:
+            return end + 1
+        end = data.find(b'"', end + 1)
+    # The document is not decoded, so the position is reported without a line
+    raise JSONDecodeError("Unterminated string", "", pos)
+
+
+def skip_json(data: bytes, pos: int) -> int:
+    """
+    Find the end of a JSON value without decoding it
+    Args:
+        data: The JSON document, UTF-8 encoded
+        pos: The position of the value
+    Returns:
+        int: The position after the value
+    Raises:
+        JSONDecodeError: If there is no value at the position
+    """
+    first = data[pos : pos + 1]
+    if first == b'"':
+        return skip_string(data, pos)
+    if first not in (b"{", b"["):
+        match = JSON_SCALAR.match(data, pos)
+        if match is None:
+            raise JSONDecodeError("Expecting value", "", pos)
+        return match.end()
+    depth = 0
+    while True:
+        pos = JSON_SKIP.match(data, pos).end()
+        char = data[pos : pos + 1]
+        if char == b'"':
+            # A long string, or one with escapes
+            pos = skip_string(data, pos)
+            continue
+        if not char:
+            raise JSONDecodeError("Unterminated value", "", pos)
+        depth += 1 if char in b"{[" else -1
+        pos += 1
+        if not depth:
+            return pos
+
+
+def decode_json(data: bytes, pos: int, end: int) -> object:
+    """
+    Decode a JSON value straight from the document, without copying its bytes
+    Args:
+        data: The JSON document, UTF-8 encoded. Line breaks are removed from the
+            value, as zdairi breaks the lines of the notebooks it prints
+        pos: The position of the value
+        end: The position after the value
+    Returns:
+        object: The decoded value
+    Raises:
+        JSONDecodeError: If the value is not valid JSON
+    """
+    with memoryview(data) as view:
+        if data[pos : pos + 1] == b'"' and data.find(b"\\", pos, end) == -1:
+            text = str(view[pos + 1 : end - 1], "utf-8")
+            return text.replace("\n", "") if "\n" in text else text
+        text = str(view[pos:end], "utf-8")
+    return JSON_DECODER.decode(text.replace("\n", "") if "\n" in text else text)
+
+
+def project_json(value: object, selection: Union[bool, dict, list]) -> object:
+    """
+    Args:
+        value: A decoded JSON value
+        selection: The fields to select, see select_json
+    Returns:
+        object: The selected fields of the value
+    """
+    if isinstance(selection, dict) and isinstance(value, dict):
+        return {
+            name: project_json(item, selection[name])
+            for name, item in value.items()
+            if name in selection
+        }
+    if isinstance(selection, list) and isinstance(value, list):
+        limit = selection[1] if len(selection) > 1 else None
+        return [project_json(item, selection[0]) for item in value[:limit]]
+    return value
+
+
+def select_json(data: bytes, pos: int, selection: Union[bool, dict, list]) -> tuple:
+    """
+    Parse the selected fields of a JSON value, skipping the others without decoding
+    or copying them
+    Args:
+        data: The JSON document, UTF-8 encoded
+        pos: The position of the value
+        selection: True for the whole value, a dictionary of the fields to select of
+            an object, or a list of the fields to select of each item of an array,
+            optionally followed by the number of items to select
+    Returns:
+        object: The selected value
+        int: The position after the value
+    Raises:
+        JSONDecodeError: If the value is not valid JSON
+    """
+    is_object = isinstance(selection, dict)
+    if selection is True or data[pos : pos + 1] != (b"{" if is_object else b"["):
+        end = skip_json(data, pos)
+        return decode_json(data, pos, end), end
+    return (select_object if is_object else select_array)(data, pos, selection)
+
+
+def select_object(data: bytes, pos: int, selection: dict) -> tuple:
+    """
+    Args:
+        data: The JSON document, UTF-8 encoded
+        pos: The position of the object
+        selection: The fields to select of the object, see select_json
+    Returns:
+        dict: The selected fields
+        int: The position after the object
+    Raises:
+        JSONDecodeError: If the object is not valid JSON
+    """
+    value = {}
+    pos = JSON_WHITESPACE.match(data, pos + 1).end()
+    if data[pos : pos + 1] == b"}":
+        return value, pos + 1
+    while True:
+        member = JSON_MEMBER.match(data, pos)
+        if member is None:
+            raise JSONDecodeError("Expecting property name", "", pos)
+        name = member.group(1)
+        name = (
+            name.decode("utf-8")
+            if b"\\" not in name
+            else decode_json(data, pos, member.end(1) + 1)
+        )
+        if member.group(3):
+            # A simple value, read along with its delimiter
+            if name in selection:
+                value[name] = decode_json(data, member.start(2), member.end(2))
+            if member.group(3) == b"}":
+                return value, member.end()
+            pos = member.end()
+            continue
+        if name in selection:
+            value[name], pos = select_json(data, member.end(), selection[name])
+        else:
+            pos = skip_json(data, member.end())
+        delimiter = JSON_DELIMITER.match(data, pos)
+        if delimiter is None or delimiter.group(1) not in b",}":
+            raise JSONDecodeError("Expecting ',' or '}'", "", pos)
+        pos = delimiter.end()
+        if delimiter.group(1) == b"}":
+            return value, pos
+
+
+def select_array(data: bytes, pos: int, selection: list) -> tuple:
+    """
+    Args:
+        data: The JSON document, UTF-8 encoded
+        pos: The position of the array
+        selection: The fields to select of each item of the array, and optionally
+            the number of items to select, see select_json
+    Returns:
+        list: The selected items
+        int: The position after the array
+    Raises:
+        JSONDecodeError: If the array is not valid JSON
+    """
+    value = []
+    limit = selection[1] if len(selection) > 1 else None
+    pos = JSON_WHITESPACE.match(data, pos + 1).end()
+    if data[pos : pos + 1] == b"]":
+        return value, pos + 1
+    while True:
+        if limit is None or len(value) < limit:
+            item, pos = select_json(data, pos, selection[0])
+            value.append(item)
+        else:
+            pos = skip_json(data, pos)
+        delimiter = JSON_DELIMITER.match(data, pos)
+        if delimiter is None or delimiter.group(1) not in b",]":
+            raise JSONDecodeError("Expecting ',' or ']'", "", pos)
+        pos = delimiter.end()
+        if delimiter.group(1) == b"]":
+            return value, pos
+
+
+def parse_json_fields(data: bytes, selection: Union[bool, dict, list]) -> object:
+    """
+    Parse the selected fields of a JSON document, see select_json. Small documents
+    are decoded at once
+    Args:
+        data: The JSON document, UTF-8 encoded
+        selection: The fields to select
+    Returns:
+        object: The selected fields
+    Raises:
+        JSONDecodeError: If the document is not valid JSON
+    """
+    if len(data) <= JSON_SMALL_DOCUMENT:
+        return project_json(decode_json(data, 0, len(data)), selection)
+    value, pos = select_json(data, JSON_WHITESPACE.match(data).end(), selection)
+    pos = JSON_WHITESPACE.match(data, pos).end()
+    if pos != len(data):
+        raise JSONDecodeError("Extra data", "", pos)
+    return value
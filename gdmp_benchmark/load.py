@@ -0,0 +1,525 @@
+"""
+Shape and limits of the load generated by the benchmarker
+"""
+import math
+import time
+import asyncio
+import threading
+import random
+import logging
+from datetime import datetime
+from contextlib import contextmanager, asynccontextmanager
+from queue import Queue, Empty
+from typing import List
+from dataclasses import dataclass, field
+from gdmp_benchmark.results import (
+    InvalidConfigurationError, Results, Status, validate, validate_positive,
+)
+from gdmp_benchmark.store import LatencyHistogram
+
+
+@dataclass
+class ArrivalProfile:
+    """
+    Arrival rate profile of an open-loop run, where notebook executions are launched
+    on schedule independently of the completion of earlier ones.
+    Attributes:
+        kind (str): "constant", "poisson", "step" or "ramp"
+        rate (float): Arrivals per minute (the starting rate of a ramp)
+        duration (float): Length of the run in seconds
+        end_rate (float): Arrivals per minute at the end of a ramp
+        steps (list): [duration, rate] pairs of a step profile, used instead of duration and rate
+        seed (int): Seed of the random arrivals of a poisson profile
+    """
+
+    kind: str = "constant"
+    rate: float = 1.0
+    duration: float = 60
+    end_rate: float = 0.0
+    steps: list = field(default_factory=list)
+    seed: int = 0
+
+    KINDS = ("constant", "poisson", "step", "ramp")
+
+    def __post_init__(self):
+        if self.kind not in self.KINDS:
+            raise InvalidConfigurationError(f"Unknown arrival profile: {self.kind}")
+        if self.kind == "step" and not self.steps:
+            raise InvalidConfigurationError("A step arrival profile needs steps")
+        if any(
+            length < 0 or start_rate < 0 or end_rate < 0
+            for length, start_rate, end_rate in self.segments()
+        ):
+            raise InvalidConfigurationError(
+                "Durations and rates of an arrival profile must not be negative"
+            )
+
+    def segments(self) -> List[tuple]:
+        """
+        Returns:
+            list: (length in seconds, start rate, end rate) of each segment of the
+                profile, with the rates in arrivals per second
+        """
+        if self.kind == "step":
+            return [(length, rate / 60, rate / 60) for length, rate in self.steps]
+        end_rate = self.end_rate if self.kind == "ramp" else self.rate
+        return [(self.duration, self.rate / 60, end_rate / 60)]
+
+    def arrivals(self) -> List[float]:
+        """
+        Compute the schedule of the run, by inverting the cumulative arrival rate.
+        Arrivals are evenly spaced in expected count, or exponentially spaced for a
+        poisson profile
+        Returns:
+            list: The offset of each arrival from the start of the run, in seconds
+        """
+        rng = random.Random(self.seed)
+
+        def gap():
+            return rng.expovariate(1.0) if self.kind == "poisson" else 1.0
+
+        arrivals = []
+        offset = 0.0
+        # The first arrival is at the start of the run, unless arrivals are random
+        needed = gap() if self.kind == "poisson" else 0.0
+        for length, start_rate, end_rate in self.segments():
+            if not length:
+                continue
+            position = 0.0
+            while True:
+                # Expected arrivals left in the segment
+                remaining = (
+                    length - position
+                ) * (start_rate + (end_rate - start_rate) * (length + position) / (2 * length))
+                if needed >= remaining - 1e-9:
+                    needed = max(needed - remaining, 0.0)
+                    break
+                rate = start_rate + (end_rate - start_rate) * position / length
+                slope = (end_rate - start_rate) / length
+                if abs(slope) < 1e-12:
+                    position += needed / rate
+                else:
+                    position += (
+                        -rate + math.sqrt(max(rate * rate + 2 * slope * needed, 0.0))
+                    ) / slope
+                arrivals.append(offset + position)
+                needed = gap()
+            offset += length
+        return arrivals
+
+
+@dataclass
+class LoadProfile:
+    """
+    Concurrency profile of a closed-loop run, as stages over which the number of active
+    users changes linearly to a target (i.e. ramp up to 40 users over 10 minutes, hold
+    for 30 minutes, ramp down). A user joins once the number of users reaches it, and
+    leaves once it falls below it. Profiles go up then down, so each user is active
+    over a single window
+    Attributes:
+        stages (list): [duration, users] pairs, the length of each stage in seconds
+            and the number of users at its end
+        start_users (int): Number of users at the start of the run
+    """
+
+    stages: list = field(default_factory=list)
+    start_users: int = 0
+
+    def __post_init__(self):
+        if not self.stages:
+            raise InvalidConfigurationError("A load profile needs stages")
+        levels = self.levels()
+        if max(levels) < 1:
+            raise InvalidConfigurationError("A load profile needs at least one user")
+        if any(length < 0 for length, _ in self.stages) or min(levels) < 0:
+            raise InvalidConfigurationError(
+                "Stage durations and users of a load profile must not be negative"
+            )
+        peak = levels.index(max(levels))
+        if any(a > b for a, b in zip(levels[:peak], levels[1:peak + 1])) or any(
+            a < b for a, b in zip(levels[peak:], levels[peak + 1:])
+        ):
+            raise InvalidConfigurationError(
+                "A load profile must ramp up, then down, not up again"
+            )
+
+    def levels(self) -> List[int]:
+        """
+        Returns:
+            list: The number of users at the start and at the end of each stage
+        """
+        return [self.start_users] + [users for _, users in self.stages]
+
+    @property
+    def peak(self) -> int:
+        """Largest number of users active at once"""
+        return max(self.levels())
+
+    @property
+    def duration(self) -> float:
+        """Length of the run in seconds"""
+        return sum(length for length, _ in self.stages)
+
+    def schedule(self) -> List[tuple]:
+        """
+        Compute when each user joins and leaves the run, where the number of users
+        crosses its number
+        Returns:
+            list: (join, leave) offsets from the start of the run in seconds, of
+                users 1 to peak
+        """
+        windows = []
+        for user in range(1, self.peak + 1):
+            join, leave = None, self.duration
+            position = 0.0
+            users = self.start_users
+            for length, end_users in self.stages:
+                if join is None and users >= user:
+                    join = position
+                elif join is None and end_users >= user:
+                    join = position + length * (user - users) / (end_users - users)
+                if join is not None and users >= user > end_users:
+                    leave = position + length * (users - user) / (users - end_users)
+                    break
+                position += length
+                users = end_users
+            windows.append((join, leave))
+        return windows
+
+
+@dataclass
+class Prewarm:
+    """
+    Warm-up of the interpreters of each user before the measured runs, so the first
+    notebook of a user does not absorb the start of its interpreters. The time each
+    interpreter takes to run a trivial paragraph is its cold start latency
+    Attributes:
+        interpreters (list): The interpreters to warm up (i.e. "spark.pyspark"), those
+            used by the paragraphs of the notebooks if empty
+        restart (bool): Restart the interpreters first, so they start cold
+        timeout (int): Seconds the warm-up of a user may take, no limit if 0
+    """
+
+    interpreters: list = field(default_factory=list)
+    restart: bool = False
+    timeout: int = 600
+
+    # Trivial paragraph of each interpreter, by the last part of its name
+    TEXTS = {
+        "pyspark": "print(1)",
+        "ipyspark": "print(1)",
+        "python": "print(1)",
+        "ipython": "print(1)",
+        "sql": "SELECT 1",
+        "sh": "true",
+        "md": "warm-up",
+    }
+    DEFAULT_TEXT = "1"
+
+    def __post_init__(self):
+        validate(self)
+        validate_positive(self.timeout)
+
+    @classmethod
+    def paragraph(cls, interpreter: str) -> str:
+        """
+        Args:
+            interpreter: The name of the interpreter
+        Returns:
+            str: The text of a trivial paragraph run by the interpreter
+        """
+        text = cls.TEXTS.get(interpreter.rsplit(".", 1)[-1], cls.DEFAULT_TEXT)
+        return f"%{interpreter}\n{text}"
+
+    @staticmethod
+    def settings(interpreters: List[str]) -> List[str]:
+        """
+        Args:
+            interpreters: The names of the interpreters
+        Returns:
+            list: The interpreter settings (groups) to restart, i.e. "spark"
+        """
+        return list(dict.fromkeys(name.split(".", 1)[0] for name in interpreters))
+
+    @classmethod
+    def note(cls, interpreters: List[str]) -> dict:
+        """
+        Args:
+            interpreters: The names of the interpreters
+        Returns:
+            dict: JSON dictionary of a notebook with a trivial paragraph per interpreter
+        """
+        return {
+            "paragraphs": [
+                {
+                    "id": f"paragraph_prewarm_{index}",
+                    "title": interpreter,
+                    "text": cls.paragraph(interpreter),
+                }
+                for index, interpreter in enumerate(interpreters)
+            ]
+        }
+
+
+class CircuitBreaker:
+    """
+    Stops a run early when the platform is clearly down. Results are recorded as they
+    are published, in the process that started the run. Once a user has failed a number
+    of notebooks in a row, or the users have failed a number of notebooks in total, the
+    breaker opens and the remaining notebooks of all the users are skipped.
+    The workers of the pool runner see it open through a shared event
+    """
+
+    ERRORS = (Status.ERROR, Status.FAIL, Status.TIMEOUT)
+
+    def __init__(self, max_errors: int = 0, max_user_errors: int = 0):
+        """
+        Args:
+            max_errors: Number of failed notebooks across all users that opens
+                the breaker, never if 0
+            max_user_errors: Number of failed notebooks in a row of a single user
+                that opens the breaker, never if 0
+        """
+        self.max_errors = max_errors
+        self.max_user_errors = max_user_errors
+        self.errors = 0
+        self.user_errors = {}
+        self.reason = ""
+        self.event = threading.Event()
+
+    def __getstate__(self):
+        """Get the state to pickle, a local event is not shared with other processes"""
+        state = self.__dict__.copy()
+        if isinstance(self.event, threading.Event):
+            state["event"] = None
+        return state
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any threshold is set"""
+        return bool(self.max_errors or self.max_user_errors)
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the remaining notebooks must be skipped"""
+        return bool(self.reason) or (self.event is not None and self.event.is_set())
+
+    def record(self, user: int, result: Results) -> None:
+        """
+        Record the results of a notebook run, opening the breaker if a threshold is reached
+        Args:
+            user: The user number
+            result: The results
+        """
+        if result.result == Status.SKIPPED or self.reason:
+            return
+        if result.result not in self.ERRORS:
+            self.user_errors[user] = 0
+            return
+        self.errors += 1
+        self.user_errors[user] = self.user_errors.get(user, 0) + 1
+        if self.max_user_errors and self.user_errors[user] >= self.max_user_errors:
+            self.open(f"User {user} failed {self.user_errors[user]} notebooks in a row")
+        elif self.max_errors and self.errors >= self.max_errors:
+            self.open(f"{self.errors} notebooks failed")
+
+    def open(self, reason: str) -> None:
+        """
+        Open the breaker, skipping the remaining notebooks
+        Args:
+            reason: Why the breaker opened
+        """
+        self.reason = reason
+        logging.warning("Skipping the remaining notebooks: %s", reason)
+        if self.event is not None:
+            self.event.set()
+
+    def to_dict(self) -> dict:
+        """Return as dictionary"""
+        return {"open": bool(self.reason), "reason": self.reason, "errors": self.errors}
+
+
+class CredentialPool:
+    """
+    Shares the credentials of the user configuration between more simulated users than
+    there are credentials. Each simulated user logs in with its own Zeppelin session and
+    creates its notebooks in its own folder, whichever credential it uses:
+        round-robin: User N uses credential (N - 1) % credentials + 1, for its whole run
+        leased: Each user leases a credential for its whole run, waiting for one while
+            all of them are leased sessions_per_credential times
+    The workers of the pool runner lease from a shared queue
+    """
+
+    MODES = ("round-robin", "leased")
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, mode: str = "round-robin", sessions_per_credential: int = 1):
+        """
+        Args:
+            mode: How credentials are assigned to users, "round-robin" or "leased"
+            sessions_per_credential: Number of users that lease a credential at a time
+        Raises:
+            InvalidConfigurationError: If the mode or the number of sessions is invalid
+        """
+        if mode not in self.MODES:
+            raise InvalidConfigurationError(f"Unknown credential mode: {mode}")
+        if sessions_per_credential < 1:
+            raise InvalidConfigurationError(
+                "Sessions per credential must be at least 1"
+            )
+        self.mode = mode
+        self.sessions_per_credential = sessions_per_credential
+        self.credentials = 0
+        self.leases = None
+
+    def __getstate__(self):
+        """Get the state to pickle, a local queue is not shared with other processes"""
+        state = self.__dict__.copy()
+        if isinstance(self.leases, Queue):
+            state["leases"] = None
+        return state
+
+    def start(self, credentials: int, leases=None) -> None:
+        """
+        Make all the credentials available for a run
+        Args:
+            credentials: Number of credentials
+            leases: Queue of the available credentials, a local one by default
+        Raises:
+            InvalidConfigurationError: If there are no credentials
+        """
+        if credentials < 1:
+            raise InvalidConfigurationError("Sharing credentials needs at least one")
+        self.credentials = credentials
+        if self.mode == "leased":
+            self.leases = leases if leases is not None else Queue()
+            for _ in range(self.sessions_per_credential):
+                for credential in range(1, credentials + 1):
+                    self.leases.put(credential)
+
+    def assign(self, user: int) -> int:
+        """
+        Args:
+            user: The user number
+        Returns:
+            int: The credential the user is assigned in turn
+        """
+        return (user - 1) % self.credentials + 1
+
+    @contextmanager
+    def lease(self, user: int):
+        """
+        Lease a credential for the run of a user, waiting for one if needed
+        Args:
+            user: The user number
+        Yields:
+            int: The credential
+            float: Seconds waited for it
+        """
+        if self.mode != "leased":
+            yield self.assign(user), 0.0
+            return
+        start = time.perf_counter()
+        credential = self.leases.get()
+        try:
+            yield credential, time.perf_counter() - start
+        finally:
+            self.leases.put(credential)
+
+    @asynccontextmanager
+    async def lease_async(self, user: int):
+        """
+        Lease a credential for the run of a user from a coroutine, polling the queue
+        so waiting does not block the event loop
+        Args:
+            user: The user number
+        Yields:
+            int: The credential
+            float: Seconds waited for it
+        """
+        if self.mode != "leased":
+            yield self.assign(user), 0.0
+            return
+        start = time.perf_counter()
+        while True:
+            try:
+                credential = self.leases.get_nowait()
+                break
+            except Empty:
+                await asyncio.sleep(self.POLL_INTERVAL)
+        try:
+            yield credential, time.perf_counter() - start
+        finally:
+            self.leases.put(credential)
+
+    def to_dict(self) -> dict:
+        """Return as dictionary"""
+        return {
+            "mode": self.mode,
+            "sessions_per_credential": self.sessions_per_credential,
+        }
+
+
+class CredentialContention:
+    """
+    Contention of the credentials shared by the users of a run (see CredentialPool):
+    how many users and concurrent executions shared each credential, how long users
+    waited to lease it, and the latency and errors of its executions
+    """
+
+    def __init__(self):
+        self.credentials = {}
+
+    def add(self, user: int, result: Results) -> None:
+        """
+        Record the results of a notebook run, unless it is skipped
+        Args:
+            user: The user number
+            result: The results, with the credential that ran them
+        """
+        if not result.credential or result.result == Status.SKIPPED:
+            return
+        credential = self.credentials.setdefault(
+            result.credential["name"],
+            {"waits": {}, "events": [], "errors": 0, "latency": LatencyHistogram()},
+        )
+        credential["waits"][user] = result.credential.get("lease_wait", 0.0)
+        credential["events"].extend(
+            [(datetime.fromisoformat(result.time.start), 1),
+             (datetime.fromisoformat(result.time.finish), -1)]
+        )
+        credential["errors"] += result.result in CircuitBreaker.ERRORS
+        if not result.warmup:
+            credential["latency"].record(result.time.elapsed)
+
+    @staticmethod
+    def peak(events: List[tuple]) -> int:
+        """
+        Args:
+            events: The start (1) and finish (-1) times of executions
+        Returns:
+            int: Largest number of executions running at once
+        """
+        peak = running = 0
+        for _, change in sorted(events):
+            running += change
+            peak = max(peak, running)
+        return peak
+
+    def to_dict(self) -> dict:
+        """Return as dictionary"""
+        return {
+            name: {
+                "users": len(credential["waits"]),
+                "executions": len(credential["events"]) // 2,
+                "peak_concurrent": self.peak(credential["events"]),
+                "errors": credential["errors"],
+                "lease_wait_mean": round(
+                    sum(credential["waits"].values()) / len(credential["waits"]), 6
+                ),
+                "lease_wait_max": round(max(credential["waits"].values()), 6),
+                "latency_mean": round(credential["latency"].mean, 6),
+                "latency_p90": credential["latency"].percentile(90),
+            }
+            for name, credential in sorted(self.credentials.items())
+        }
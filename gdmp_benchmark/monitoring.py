@@ -0,0 +1,671 @@
+"""
+Monitoring of the benchmarker and the platform during a run
+"""
+# pylint: disable-msg=too-many-locals
+import os
+import re
+import sys
+import math
+import time
+import functools
+import threading
+import cProfile
+import pstats
+import uuid
+import types
+import logging
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Optional
+from simplejson.errors import JSONDecodeError
+import requests
+from gdmp_benchmark.results import ISO_FORMAT, Results
+
+
+class Profiler:
+    """
+    Collects cProfile profiles of the hot paths of the harness, the methods decorated with
+    profiled. Calls made while a profile is active in the same thread are part of it. The
+    profiles are aggregated per method in each process, and written as pstats files to the
+    directory when a run or a user completes, to be merged once the run is over.
+    From Python 3.12, a profile sees every thread and only one can be active in a
+    process, so the calls made in other threads (the notebooks a user runs concurrently)
+    are part of the active profile instead of their own
+    """
+
+    PER_THREAD = sys.version_info < (3, 12)
+    FLUSH_AFTER = ("run", "_run_single")
+    HOT_PATHS = (
+        "run",
+        "_run_single",
+        "run_notebook",
+        "get_note",
+        "create_notebook",
+        "execute_notebook",
+        "print_notebook",
+        "parse_notebook_output",
+        "_process_result",
+        "delete_notebook",
+    )
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Directory of the profile files, created if needed
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.__setstate__({"directory": directory})
+
+    def __getstate__(self):
+        """Get the state to pickle, the profiles are local to each process"""
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        """Restore the state in a worker process, without any profile"""
+        self.__dict__.update(state)
+        # Whether a profile is active, in this thread or in this process
+        self._local = threading.local() if self.PER_THREAD else types.SimpleNamespace()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @contextmanager
+    def profile(self, name: str):
+        """
+        Profile the block, unless a profile is already active in this thread, or in this
+        process from Python 3.12
+        Args:
+            name: Name of the profiled method
+        """
+        with self._lock:
+            nested, self._local.active = getattr(self._local, "active", False), True
+        if nested:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            profile.create_stats()
+            with self._lock:
+                if name in self._stats:
+                    self._stats[name].add(profile)
+                else:
+                    self._stats[name] = pstats.Stats(profile)
+            if name in self.FLUSH_AFTER:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write the profiles of this process, one file per method"""
+        with self._lock:
+            stats, self._stats = self._stats, {}
+        for name, method_stats in stats.items():
+            method_stats.dump_stats(
+                os.path.join(
+                    self.directory, f"{name}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof"
+                )
+            )
+
+    def merge(self) -> dict:
+        """
+        Merge the profile files of all the processes into one per method, with a text
+        report of the functions with the most cumulative time
+        Returns:
+            dict: The calls, own time and cumulative time of the hot path functions
+        """
+        self.flush()
+        parts = {}
+        for filename in sorted(os.listdir(self.directory)):
+            name, sep, _ = filename.partition("-")
+            if sep and filename.endswith(".prof"):
+                parts.setdefault(name, []).append(os.path.join(self.directory, filename))
+        hot_paths = {}
+        for name, paths in parts.items():
+            path = os.path.join(self.directory, name + ".prof")
+            stats = pstats.Stats(*paths)
+            stats.dump_stats(path)
+            for part in paths:
+                os.remove(part)
+            with open(
+                os.path.join(self.directory, name + ".txt"), "w", encoding="utf-8"
+            ) as report:
+                pstats.Stats(path, stream=report).sort_stats("cumulative").print_stats(50)
+            for (_, _, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+                if function in self.HOT_PATHS:
+                    totals = hot_paths.setdefault(
+                        function, {"calls": 0, "tottime": 0.0, "cumtime": 0.0}
+                    )
+                    totals["calls"] += calls
+                    totals["tottime"] += tottime
+                    totals["cumtime"] += cumtime
+        return {
+            function: {
+                key: round(value, 6) if isinstance(value, float) else value
+                for key, value in totals.items()
+            }
+            for function, totals in sorted(hot_paths.items())
+        }
+
+
+def profiled(method: Callable) -> Callable:
+    """Profile the calls of a method of GDMPBenchmarker, when it has a profiler"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        with self.profiler.profile(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class ResourceSampler:
+    """
+    Samples the CPU, memory, open files and number of processes of the harness and all
+    its descendants (pool workers, zdairi commands) from /proc in a background thread,
+    to tell the load of the load generator apart from the latency of the platform.
+    Sampling is only available on Linux
+    """
+
+    PROC = "/proc"
+    METRICS = ("cpu_percent", "rss", "fds", "processes", "threads")
+
+    def __init__(self, interval: float = 1.0, pid: int = 0):
+        """
+        Args:
+            interval: Seconds between samples
+            pid: The root process, this process if 0
+        """
+        self.interval = interval
+        self.pid = pid or os.getpid()
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = None
+
+    @property
+    def available(self) -> bool:
+        """Whether the process information can be read"""
+        return os.path.isdir(os.path.join(self.PROC, str(self.pid)))
+
+    def _read_stat(self, pid: str) -> Optional[list]:
+        """The fields of /proc/{pid}/stat after the command name, None if it exited"""
+        try:
+            with open(os.path.join(self.PROC, pid, "stat"), encoding="utf-8") as stat:
+                return stat.read().rpartition(")")[2].split()
+        except OSError:
+            return None
+
+    def _tree(self) -> Dict[str, list]:
+        """The stat fields of the root process and its descendants"""
+        stats = {}
+        for pid in os.listdir(self.PROC):
+            if pid.isdigit():
+                stat = self._read_stat(pid)
+                if stat is not None:
+                    stats[pid] = stat
+        tree, pending = {}, [str(self.pid)]
+        while pending:
+            pid = pending.pop()
+            if pid in stats and pid not in tree:
+                tree[pid] = stats[pid]
+                pending.extend(child for child, stat in stats.items() if stat[1] == pid)
+        return tree
+
+    def sample(self) -> dict:
+        """
+        Take a sample of the process tree
+        Returns:
+            dict: The time, CPU usage since the previous sample (percent of a core),
+                resident memory (bytes), open file descriptors, processes and threads
+        """
+        now = time.perf_counter()
+        tree = self._tree()
+        # Own and reaped children user and system times, in clock ticks
+        ticks = sum(sum(int(value) for value in stat[11:15]) for stat in tree.values())
+        fds = 0
+        for pid in tree:
+            try:
+                fds += len(os.listdir(os.path.join(self.PROC, pid, "fd")))
+            except OSError:
+                continue
+        cpu = 0.0
+        if self._last is not None and now > self._last[0]:
+            cpu = max(ticks - self._last[1], 0) / os.sysconf("SC_CLK_TCK")
+            cpu = 100 * cpu / (now - self._last[0])
+        self._last = (now, ticks)
+        return {
+            "time": datetime.now().strftime(ISO_FORMAT),
+            "cpu_percent": round(cpu, 1),
+            "rss": sum(int(stat[21]) for stat in tree.values())
+            * os.sysconf("SC_PAGE_SIZE"),
+            "fds": fds,
+            "processes": len(tree),
+            "threads": sum(int(stat[17]) for stat in tree.values()),
+        }
+
+    def _run(self) -> None:
+        """Sample until stopped"""
+        while not self._stop.wait(self.interval):
+            self.samples.append(self.sample())
+
+    def start(self) -> "ResourceSampler":
+        """Start sampling in a background thread, if available"""
+        if not self.available:
+            logging.warning("Resource sampling needs %s, it is disabled", self.PROC)
+            return self
+        self._stop.clear()
+        self._last = None
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop sampling, taking a last sample"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.samples.append(self.sample())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: The mean and peak of each metric over the samples
+        """
+        summary = {}
+        for metric in self.METRICS if self.samples else ():
+            values = [sample[metric] for sample in self.samples]
+            summary[metric] = {
+                "mean": round(sum(values) / len(values), 1),
+                "max": max(values),
+            }
+        return summary
+
+    def to_dict(self) -> dict:
+        """Return as dictionary"""
+        return {
+            "interval": self.interval,
+            "summary": self.summary(),
+            "samples": self.samples,
+        }
+
+
+def parse_prometheus(text: str, metrics_filter: Optional[re.Pattern] = None) -> dict:
+    """
+    Parse metrics in the Prometheus text exposition format
+    Args:
+        text: The metrics
+        metrics_filter: Only keep the series whose name and labels match
+    Returns:
+        dict: The value of each series, keyed by its name and labels
+    """
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        # The labels may contain spaces, the value follows the closing brace
+        series, _, rest = line.rpartition("}")
+        if series:
+            series += "}"
+            sample = rest.split()
+        else:
+            series, *sample = line.split()
+        if not sample or (metrics_filter and not metrics_filter.search(series)):
+            continue
+        try:
+            values[series] = float(sample[0])
+        except ValueError:
+            continue
+    return values
+
+
+def epoch_microseconds(seconds: float) -> int:
+    """
+    Args:
+        seconds: A time in seconds since the epoch
+    Returns:
+        int: The time in whole microseconds, rounded as the times of the results are
+    """
+    whole = math.floor(seconds)
+    return whole * 1000000 + round((seconds - whole) * 1e6)
+
+
+class MetricsPoller:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Polls HTTP metrics endpoints of the platform in a background thread during a run,
+    so the results of each notebook can be correlated with the state of the platform
+    while it ran. Endpoints of the Spark monitoring REST API (ending with
+    /api/v1/applications) are summarised as the executors, cores, active tasks, GC time
+    and memory of the running applications; any other endpoint is read as Prometheus
+    metrics
+    """
+
+    SPARK_PATH = "/api/v1/applications"
+    TIMEOUT = 10
+
+    def __init__(
+        self, endpoints: List[str], interval: float = 5.0, metrics_filter: str = ""
+    ):
+        """
+        Args:
+            endpoints: URLs of the metrics endpoints
+            interval: Seconds between polls
+            metrics_filter: Regular expression of the Prometheus series to keep, all if empty
+        """
+        self.endpoints = endpoints
+        self.interval = interval
+        self.metrics_filter = re.compile(metrics_filter) if metrics_filter else None
+        self.samples = {endpoint: [] for endpoint in endpoints}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = requests.Session()
+
+    def _get(self, url: str) -> requests.Response:
+        """GET a metrics URL"""
+        response = self._session.get(url, timeout=self.TIMEOUT)
+        response.raise_for_status()
+        return response
+
+    def _spark(self, endpoint: str) -> dict:
+        """
+        Summarise the executors of the running Spark applications
+        Args:
+            endpoint: URL of the applications of the Spark REST API
+        Returns:
+            dict: The totals over the running applications
+        """
+        totals = dict.fromkeys(
+            ("applications", "executors", "cores", "active_tasks", "failed_tasks",
+             "gc_time", "memory_used"),
+            0,
+        )
+        for application in self._get(endpoint + "?status=running").json():
+            totals["applications"] += 1
+            executors = self._get(
+                f"{endpoint}/{application['id']}/executors"
+            ).json()
+            for executor in executors:
+                if executor.get("id") != "driver" and executor.get("isActive", True):
+                    totals["executors"] += 1
+                    totals["cores"] += executor.get("totalCores", 0)
+                totals["active_tasks"] += executor.get("activeTasks", 0)
+                totals["failed_tasks"] += executor.get("failedTasks", 0)
+                totals["gc_time"] += executor.get("totalGCTime", 0)
+                totals["memory_used"] += executor.get("memoryUsed", 0)
+        return totals
+
+    def poll(self) -> None:
+        """Poll every endpoint once, an endpoint that fails is skipped"""
+        for endpoint in self.endpoints:
+            try:
+                if endpoint.rstrip("/").endswith(self.SPARK_PATH):
+                    values = self._spark(endpoint.rstrip("/"))
+                else:
+                    values = parse_prometheus(self._get(endpoint).text, self.metrics_filter)
+            except (requests.RequestException, JSONDecodeError, KeyError, TypeError) as err:
+                logging.warning("Failed to poll metrics from %s: %s", endpoint, err)
+                continue
+            with self._lock:
+                self.samples[endpoint].append((time.time(), values))
+
+    def _run(self) -> None:
+        """Poll until stopped"""
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self) -> "MetricsPoller":
+        """Poll now, then every interval in a background thread"""
+        self._stop.clear()
+        self.poll()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop polling, polling a last time"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.poll()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def series(self, start: float, finish: float) -> dict:
+        """
+        The samples of each endpoint from the last one before the start to the finish
+        Args:
+            start: Start time, in seconds since the epoch
+            finish: Finish time, in seconds since the epoch
+        Returns:
+            dict: The time, offset from the start in seconds, and values of each sample
+        """
+        start, finish = epoch_microseconds(start), epoch_microseconds(finish)
+        series = {}
+        with self._lock:
+            for endpoint, samples in self.samples.items():
+                samples = [(epoch_microseconds(sampled), values) for sampled, values in samples]
+                before = [sample for sample in samples if sample[0] <= start][-1:]
+                series[endpoint] = [
+                    {
+                        "time": datetime.fromtimestamp(sampled / 1e6).strftime(ISO_FORMAT),
+                        "offset": round((sampled - start) / 1e6, 3),
+                        "values": values,
+                    }
+                    for sampled, values in before
+                    + [sample for sample in samples if start < sample[0] <= finish]
+                ]
+        return series
+
+    def annotate(self, result: Results) -> None:
+        """
+        Add the metrics sampled while a notebook ran to its results
+        Args:
+            result: The results of the notebook
+        """
+        try:
+            start = datetime.fromisoformat(result.time.start).timestamp()
+            finish = datetime.fromisoformat(result.time.finish).timestamp()
+        except (TypeError, ValueError):
+            return
+        result.metrics = self.series(start, finish)
+
+
+def parse_spark_time(value: str) -> Optional[datetime]:
+    """
+    Args:
+        value: A time of the Spark monitoring REST API, i.e. 2024-01-31T10:00:00.123GMT
+    Returns:
+        datetime: The parsed time, or None if it could not be parsed
+    """
+    try:
+        return datetime.strptime(value.replace("GMT", "+0000"), "%Y-%m-%dT%H:%M:%S.%f%z")
+    except (AttributeError, ValueError):
+        return None
+
+
+def spark_seconds(start: str, finish: str) -> float:
+    """
+    Args:
+        start: Start time of the Spark monitoring REST API
+        finish: Finish time of the Spark monitoring REST API
+    Returns:
+        float: The seconds between the two times, 0 if either is missing
+    """
+    start_time, finish_time = parse_spark_time(start), parse_spark_time(finish)
+    if start_time is None or finish_time is None:
+        return 0.0
+    return max((finish_time - start_time).total_seconds(), 0.0)
+
+
+class SparkJobCollector:
+    """
+    Summarises the Spark jobs launched by each paragraph, from the job URLs Zeppelin
+    records in its runtime infos and the Spark monitoring REST API of the same UI, so a
+    slow run can be attributed to scheduling, shuffle or I/O. Paragraphs are summarised
+    from several threads, each with its own HTTP session
+    """
+
+    TIMEOUT = 10
+    APPLICATION = re.compile(r"/(?:proxy|history)/(application_\d+_\d+|local-\d+)")
+    STAGE_BYTES = {
+        "input_bytes": "inputBytes",
+        "shuffle_read_bytes": "shuffleReadBytes",
+        "shuffle_write_bytes": "shuffleWriteBytes",
+    }
+
+    def __init__(self):
+        self._local = threading.local()
+        self._applications = {}
+
+    def __getstate__(self):
+        """Get the state to pickle, the sessions are local to each thread"""
+        return {}
+
+    def __setstate__(self, state):
+        """Restore the state in a worker process"""
+        self.__init__()
+
+    @staticmethod
+    def parse_job_url(url: str) -> tuple:
+        """
+        Args:
+            url: The URL of a job in the Spark UI, i.e. http://host:4040/jobs/job?id=3,
+                or proxied by YARN, i.e. http://host:8088/proxy/application_1_0001/jobs/job/?id=3
+        Returns:
+            str: The base URL of the Spark UI
+            str: The job ID
+        Raises:
+            ValueError: If the URL is not the URL of a job
+        """
+        base, sep, rest = url.partition("/jobs/job")
+        job_id = parse_qs(urlparse(rest).query).get("id", [""])[0]
+        if not sep or not job_id.isdigit():
+            raise ValueError(f"Not a Spark job URL: {url}")
+        return base.rstrip("/"), job_id
+
+    def _get(self, url: str):
+        """GET a JSON document of the Spark monitoring REST API, with the session of the thread"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.get(url, timeout=self.TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _application(self, base: str) -> str:
+        """
+        Args:
+            base: The base URL of a Spark UI
+        Returns:
+            str: The REST API URL of the application of the jobs of the UI, named by the
+                URL when proxied by YARN or served by the history server, or else the
+                single application of the UI
+        Raises:
+            ValueError: If the UI serves several applications, so the URL does not tell
+                which one ran the job
+        """
+        if base not in self._applications:
+            match = self.APPLICATION.search(base)
+            if match:
+                application = match.group(1)
+            else:
+                applications = self._get(base + "/api/v1/applications")
+                if len(applications) != 1:
+                    raise ValueError(
+                        f"The Spark UI {base} serves {len(applications)} applications, "
+                        "the job URL does not tell which one ran the job"
+                    )
+                application = applications[0]["id"]
+            self._applications[base] = f"{base}/api/v1/applications/{application}"
+        return self._applications[base]
+
+    def job(self, url: str) -> dict:
+        """
+        Summarise a single Spark job and its stages
+        Args:
+            url: The URL of the job in the Spark UI
+        Returns:
+            dict: The job summary
+        """
+        base, job_id = self.parse_job_url(url)
+        application = self._application(base)
+        job = self._get(f"{application}/jobs/{job_id}")
+        summary = {
+            "jobs": 1,
+            "stages": 0,
+            "tasks": job.get("numTasks", 0),
+            "failed_tasks": job.get("numFailedTasks", 0),
+            "job_time": spark_seconds(job.get("submissionTime"), job.get("completionTime")),
+            "scheduler_delay": 0.0,
+            "executor_run_time": 0.0,
+            "input_bytes": 0,
+            "shuffle_read_bytes": 0,
+            "shuffle_write_bytes": 0,
+        }
+        for stage_id in job.get("stageIds", []):
+            for attempt in self._get(f"{application}/stages/{stage_id}"):
+                if attempt.get("status") == "SKIPPED":
+                    continue
+                summary["stages"] += 1
+                summary["scheduler_delay"] += spark_seconds(
+                    attempt.get("submissionTime"), attempt.get("firstTaskLaunchedTime")
+                )
+                summary["executor_run_time"] += attempt.get("executorRunTime", 0) / 1000
+                for key, name in self.STAGE_BYTES.items():
+                    summary[key] += attempt.get(name, 0)
+        return summary
+
+    def summarise(self, urls: List[str]) -> dict:
+        """
+        Summarise the Spark jobs of a paragraph
+        Args:
+            urls: The URLs of the jobs in the Spark UI
+        Returns:
+            dict: The totals of the jobs, with the error of the jobs that could not be read
+        """
+        summary = {}
+        for url in urls:
+            try:
+                job = self.job(url)
+            except (requests.RequestException, JSONDecodeError, ValueError,
+                    KeyError, IndexError, TypeError) as err:
+                logging.warning("Failed to read the Spark job %s: %s", url, err)
+                summary["error"] = str(err)
+                continue
+            for key, value in job.items():
+                summary[key] = summary.get(key, 0) + value
+        return {
+            key: round(value, 3) if isinstance(value, float) else value
+            for key, value in summary.items()
+        }
+
+    def annotate(self, result: Results) -> None:
+        """
+        Add the summary of the Spark jobs of each paragraph to its timing
+        Args:
+            result: The results of the notebook
+        """
+        for paragraph in result.paragraphs:
+            if paragraph.job_urls:
+                paragraph.spark = self.summarise(paragraph.job_urls)
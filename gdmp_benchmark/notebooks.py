@@ -0,0 +1,688 @@
+"""
+Notebooks run by the benchmarker, and their output
+"""
+import os
+import re
+import math
+import fcntl
+import time
+import itertools
+import hashlib
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Protocol, Union
+from dataclasses import dataclass, field
+import simplejson as json
+from simplejson.errors import JSONDecodeError
+import requests
+from gdmp_benchmark.results import (
+    InvalidConfigurationError, ParagraphTiming, Results, Status, validate, validate_not_empty,
+    validate_positive, validate_seconds,
+)
+
+
+class OutputValidator(Protocol):
+    # pylint: disable=too-few-public-methods
+    """Protocol for the validation of the output of a notebook cell"""
+
+    def validate(self, actual: str) -> str:
+        """
+        Args:
+            actual: The output of the cell
+        Returns:
+            str: Why the output does not match, empty if it does
+        """
+
+
+class ExactValidator:
+    # pylint: disable=too-few-public-methods
+    """The output is the expected text, ignoring surrounding whitespace"""
+
+    def __init__(self, value: str):
+        self.value = value.strip()
+
+    def validate(self, actual: str) -> str:
+        """Validate the output of a cell"""
+        if actual.strip() == self.value:
+            return ""
+        return f"expected {self.value[:80]!r}, got {actual.strip()[:80]!r}"
+
+
+class HashValidator:
+    """
+    The hash of the output is the expected digest. The output is hashed in chunks,
+    so a large output is never copied as a whole
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, digest: str, algorithm: str = "blake2b"):
+        if algorithm not in hashlib.algorithms_available:
+            raise InvalidConfigurationError(f"Unknown hash algorithm: {algorithm}")
+        self.digest = digest.lower()
+        self.algorithm = algorithm
+
+    @classmethod
+    def hexdigest(cls, actual: str, algorithm: str = "blake2b") -> str:
+        """
+        Args:
+            actual: The output of a cell
+            algorithm: The hashlib algorithm
+        Returns:
+            str: The hex digest of the UTF-8 encoded output
+        """
+        digest = hashlib.new(algorithm)
+        for start in range(0, len(actual), cls.CHUNK_SIZE):
+            digest.update(actual[start : start + cls.CHUNK_SIZE].encode("utf-8"))
+        return digest.hexdigest()
+
+    def validate(self, actual: str) -> str:
+        """Validate the output of a cell"""
+        actual_digest = self.hexdigest(actual, self.algorithm)
+        if actual_digest == self.digest:
+            return ""
+        return f"expected {self.algorithm} {self.digest}, got {actual_digest}"
+
+
+class NumberValidator:
+    # pylint: disable=too-few-public-methods
+    """
+    The first numbers in the output are the expected values, within an absolute or
+    relative tolerance, i.e. the estimate of a Monte Carlo calculation
+    """
+
+    NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+    def __init__(
+        self,
+        value: Union[float, List[float]],
+        tolerance: float = 0.0,
+        relative: float = 0.0,
+    ):
+        self.values = [float(item) for item in value] if isinstance(value, list) else [float(value)]
+        self.tolerance = tolerance
+        self.relative = relative
+
+    def validate(self, actual: str) -> str:
+        """Validate the output of a cell"""
+        numbers = [
+            float(match.group())
+            for match in itertools.islice(self.NUMBER.finditer(actual), len(self.values))
+        ]
+        if len(numbers) < len(self.values):
+            return f"expected {len(self.values)} numbers, got {len(numbers)}"
+        for expected, number in zip(self.values, numbers):
+            if not math.isclose(
+                number, expected, rel_tol=self.relative, abs_tol=self.tolerance
+            ):
+                return f"expected {expected} within {self.tolerance or self.relative}, got {number}"
+        return ""
+
+
+class RegexValidator:
+    # pylint: disable=too-few-public-methods
+    """The output matches the expected regular expression"""
+
+    def __init__(self, pattern: str):
+        try:
+            self.pattern = re.compile(pattern)
+        except re.error as err:
+            raise InvalidConfigurationError(f"Invalid pattern {pattern}: {err}") from err
+
+    def validate(self, actual: str) -> str:
+        """Validate the output of a cell"""
+        if self.pattern.search(actual):
+            return ""
+        return f"expected a match of {self.pattern.pattern!r}, got {actual.strip()[:80]!r}"
+
+
+OUTPUT_VALIDATORS = {
+    "exact": ExactValidator,
+    "hash": HashValidator,
+    "number": NumberValidator,
+    "regex": RegexValidator,
+}
+
+
+MD5_DIGEST = re.compile(r"[0-9a-f]{32}")
+
+
+def make_validator(expected: Union[str, float, dict]) -> OutputValidator:
+    """
+    Create the validator of an expected output of the notebook configuration: an object
+    with the "type" of validator (see OUTPUT_VALIDATORS) and its arguments, a number,
+    or a string, compared as an md5 digest if it looks like one and as text otherwise
+    Args:
+        expected: The expected output
+    Returns:
+        OutputValidator: The validator
+    Raises:
+        InvalidConfigurationError: If the expected output is invalid
+    """
+    if isinstance(expected, str):
+        if MD5_DIGEST.fullmatch(expected):
+            return HashValidator(expected, "md5")
+        return ExactValidator(expected)
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        return NumberValidator(expected)
+    if not isinstance(expected, dict):
+        raise InvalidConfigurationError(f"Invalid expected output: {expected}")
+    arguments = dict(expected)
+    validator = OUTPUT_VALIDATORS.get(arguments.pop("type", "exact"))
+    if validator is None:
+        raise InvalidConfigurationError(f"Unknown output validator: {expected['type']}")
+    try:
+        return validator(**arguments)
+    except (TypeError, ValueError) as err:
+        raise InvalidConfigurationError(f"Invalid expected output {expected}: {err}") from err
+
+
+def make_validators(results: Union[list, dict]) -> Dict[int, OutputValidator]:
+    """
+    Args:
+        results: The expected outputs of a notebook, a list in cell order or a
+            dictionary keyed by cell number
+    Returns:
+        dict: The validator of each cell number with an expected output
+    Raises:
+        InvalidConfigurationError: If an expected output is invalid
+    """
+    if isinstance(results, dict):
+        items = results.items()
+    else:
+        items = enumerate(results)
+    return {
+        int(cell): make_validator(expected)
+        for cell, expected in items
+        if expected not in ("", None)
+    }
+
+
+def validate_output(output: list, validators: Dict[int, OutputValidator]) -> List[str]:
+    """
+    Validate all the cells of the output of a notebook
+    Args:
+        output: The output of each cell
+        validators: The validator of each cell number with an expected output
+    Returns:
+        list: A message for each cell that does not match its expected output
+    """
+    mismatches = []
+    for cell, validator in sorted(validators.items()):
+        if cell >= len(output):
+            mismatches.append(f"Missing output of cell #{cell}!")
+            continue
+        reason = validator.validate(str(output[cell]))
+        if reason:
+            mismatches.append(f"Expected/Actual output mismatch of cell #{cell}: {reason}")
+    return mismatches
+
+
+@dataclass
+class Notebook:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Stores Notebook info
+    Attributes:
+         name (str): The name of the notebook
+         filepath (str): The filepath of the notebook
+         totaltime (int): The totaltime of the notebook
+         results (list):  The expected outputs of the notebook, a list in cell order or a
+            dictionary keyed by cell number, see make_validator
+         mintime (int): Runs faster than this are suspicious, half the totaltime if 0
+         depends_on (list): Names of the notebooks that must complete before this one
+         timeout (int, float): Seconds the notebook may run before it is stopped, the
+            run-wide timeout if 0
+         paragraph_timeout (int, float): Seconds each paragraph may run before it is
+            stopped, the run-wide paragraph timeout if 0
+    """
+
+    name: str
+    filepath: str
+    totaltime: int
+    results: Union[list, dict]
+    mintime: int = 0
+    depends_on: list = field(default_factory=list)
+    timeout: Union[int, float] = 0
+    paragraph_timeout: Union[int, float] = 0
+
+    def __post_init__(self):
+        validate(self)
+        validate_positive(self.totaltime)
+        validate_positive(self.mintime)
+        validate_seconds(self.timeout)
+        validate_seconds(self.paragraph_timeout)
+        validate_not_empty(self.name)
+        self.expected_output = self.results
+        self.validators = make_validators(self.results)
+        self.expectedtime = self.totaltime
+        self.expectedmin = self.mintime or self.totaltime / 2
+
+
+@dataclass
+class PooledNotebook:
+    """
+    A notebook created in Zeppelin by a user, reused by later runs of the same source
+    Attributes:
+         notebookid (str): The ID of the notebook
+         filepath (str): The file the notebook was created from
+         config (str): The configuration of the user that created it
+         result (Results): The results of the last run of the notebook
+         busy (bool): Whether the notebook is running
+    """
+
+    notebookid: str
+    filepath: str
+    config: str
+    result: Optional[Results] = None
+    busy: bool = False
+
+    @staticmethod
+    def key(note: dict) -> str:
+        """
+        The key of a notebook in the pool, the hash of its source content
+        Args:
+            note: JSON dictionary of the notebook
+        Returns:
+            str: The key
+        """
+        return hashlib.sha256(
+            json.dumps(note, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+
+class NoteCache:
+    """
+    On-disk cache of remote notebooks, shared by all the worker processes of a run.
+    Content is stored once per content hash, and indexed by URL along with the ETag /
+    Last-Modified validators of the response. Entries are revalidated with conditional
+    requests once they are older than max_age, except for URLs pinned to a commit hash
+    which never change. The least recently used entries are evicted when the cache
+    grows beyond max_size bytes, checked after each download that adds to it. An entry
+    evicted by another process while it is read is fetched again. In offline mode only
+    cached entries are used.
+    """
+
+    DEFAULT_DIR = "/tmp/gdmp_note_cache/"
+    TIMEOUT = 30
+    COMMIT_HASH = re.compile(r"/[0-9a-f]{40}/")
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_DIR,
+        max_size: int = 512 * 1024 * 1024,
+        max_age: int = 60,
+        offline: bool = False,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.offline = offline
+
+    def _path(self, *parts: str) -> str:
+        """Get the path of a file in the cache, creating its directory if needed"""
+        path = os.path.join(self.directory, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @contextmanager
+    def _lock(self, name: str):
+        """Hold an exclusive lock shared between processes"""
+        with open(self._path("locks", name + ".lock"), "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        """Write a file atomically, so that readers never see a partial file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_entry(self, key: str) -> Optional[dict]:
+        """Read the index entry of a URL key, if it and its content exist"""
+        try:
+            with open(self._path("index", key + ".json"), encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, JSONDecodeError):
+            return None
+        if not os.path.exists(self._path("blobs", entry["blob"])):
+            return None
+        return entry
+
+    def _read_blob(self, key: str, entry: dict) -> Optional[bytes]:
+        """
+        Read the content of an entry, marking the entry as recently used, or None
+        if another process evicted the entry since it was read
+        """
+        try:
+            os.utime(self._path("index", key + ".json"))
+            with open(self._path("blobs", entry["blob"]), "rb") as blob_file:
+                return blob_file.read()
+        except FileNotFoundError:
+            return None
+
+    def is_fresh(self, url: str, entry: dict) -> bool:
+        """
+        Args:
+            url: The URL of the entry
+            entry: The index entry
+        Returns:
+            bool: Whether the entry can be used without revalidation
+        """
+        return (
+            self.offline
+            or self.COMMIT_HASH.search(url) is not None
+            or time.time() - entry["validated"] < self.max_age
+        )
+
+    def get(self, url: str) -> bytes:
+        """
+        Get the content of a URL, from the cache if possible
+        Args:
+            url: The URL
+        Returns:
+            bytes: The content
+        Raises:
+            InvalidConfigurationError: If running offline and the URL is not cached
+            requests.HTTPError: If the request fails
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        with self._lock(key):
+            entry = self._read_entry(key)
+            if entry is not None and self.is_fresh(url, entry):
+                content = self._read_blob(key, entry)
+                if content is not None:
+                    return content
+            if self.offline:
+                raise InvalidConfigurationError(
+                    f"Notebook is not cached, and running offline: {url}"
+                )
+            content, grown = self._fetch(url, key, entry)
+        if grown:
+            self.evict()
+        return content
+
+    def _fetch(self, url: str, key: str, entry: Optional[dict]) -> tuple:
+        """
+        Fetch the content of a URL, revalidating its entry if any, and index it
+        Args:
+            url: The URL
+            key: The key of the URL
+            entry: The index entry of the URL, None if it is not cached
+        Returns:
+            bytes: The content
+            bool: Whether the content was added to the cache
+        Raises:
+            requests.HTTPError: If the request fails
+        """
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        response = requests.get(url, headers=headers, timeout=self.TIMEOUT)
+
+        grown = False
+        if response.status_code == 304 and entry is not None:
+            content = self._read_blob(key, entry)
+            if content is None:
+                # Evicted since it was read, fetch it again
+                return self._fetch(url, key, None)
+        else:
+            response.raise_for_status()
+            content = response.content
+            entry = {
+                "url": url,
+                "blob": hashlib.sha256(content).hexdigest(),
+                "size": len(content),
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+            blob_path = self._path("blobs", entry["blob"])
+            if not os.path.exists(blob_path):
+                self._write_atomic(blob_path, content)
+                grown = True
+
+        entry["validated"] = time.time()
+        self._write_atomic(
+            self._path("index", key + ".json"), json.dumps(entry).encode("utf-8")
+        )
+        return content, grown
+
+    def evict(self) -> None:
+        """Evict the least recently used entries, until the cache fits in max_size"""
+        with self._lock("evict"):
+            entries = []
+            index_dir = os.path.dirname(self._path("index", "_"))
+            for name in os.listdir(index_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(index_dir, name)
+                try:
+                    with open(path, encoding="utf-8") as entry_file:
+                        entry = json.load(entry_file)
+                    entries.append((os.path.getmtime(path), path, entry))
+                except (OSError, JSONDecodeError):
+                    continue
+
+            blobs = {entry["blob"]: entry["size"] for _, _, entry in entries}
+            total = sum(blobs.values())
+            for _, path, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= self.max_size:
+                    break
+                os.remove(path)
+                if not any(
+                    other["blob"] == entry["blob"] and other_path != path
+                    and os.path.exists(other_path)
+                    for _, other_path, other in entries
+                ):
+                    try:
+                        os.remove(self._path("blobs", entry["blob"]))
+                        total -= blobs.pop(entry["blob"], 0)
+                    except FileNotFoundError:
+                        pass
+
+
+# Zeppelin result codes that are not statuses: an incomplete statement, and a
+# paragraph that keeps the results of its last run
+RESULT_CODES = {"INCOMPLETE": Status.ERROR, "KEEP_PREVIOUS_RESULT": Status.SUCCESS}
+
+
+def result_status(code: str) -> Status:
+    """
+    Args:
+        code: The code of the results of a paragraph
+    Returns:
+        Status: Its status, ERROR if the code is unknown
+    """
+    code = str(code).upper()
+    if code in RESULT_CODES:
+        return RESULT_CODES[code]
+    if code in (Status.SUCCESS.value, Status.ERROR.value):
+        return Status[code]
+    logging.warning("Unknown result code of a paragraph: %s", code)
+    return Status.ERROR
+
+
+def parse_notebook_output(json_notebook: dict) -> tuple:
+    """
+    Collect the output of an executed notebook. The output of every cell with
+    results is collected, successful or not
+    Args:
+        json_notebook: JSON dictionary of the notebook
+    Returns:
+        output: A list of output, each element being a single cell output
+        msg: Result message
+        status: Status message
+    """
+    output = []
+    msg = ""
+    status = ""
+    for cell in json_notebook["paragraphs"]:
+        if len(cell.get("results", [])) > 0:
+            status = result_status(cell["results"].get("code"))
+            if len(cell["results"].get("msg") or []) > 0:
+                result_msg = cell["results"]["msg"][0]["data"].strip()
+                output.append(result_msg)
+                if status == "ERROR":
+                    msg = result_msg
+                    break
+    return output, msg, status
+
+
+PARAGRAPH_DATE_FORMATS = (
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%b %d, %Y %I:%M:%S %p",
+)
+
+
+def parse_paragraph_date(value: str) -> Optional[datetime]:
+    """
+    Parse a date of a paragraph, as written by the different versions of Zeppelin
+    Args:
+        value: The date
+    Returns:
+        datetime: The parsed date, or None if it could not be parsed
+    """
+    for date_format in PARAGRAPH_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def paragraph_title(paragraph: dict) -> str:
+    """
+    Args:
+        paragraph: JSON dictionary of the paragraph
+    Returns:
+        str: The title of the paragraph, or the first line of its text
+    """
+    title = paragraph.get("title") or (paragraph.get("text") or "").strip()
+    return title.split("\n", maxsplit=1)[0] if title else ""
+
+
+INTERPRETER = re.compile(r"\s*%([\w.]+)")
+
+
+def notebook_interpreters(json_notebook: dict) -> List[str]:
+    """
+    Args:
+        json_notebook: JSON dictionary of the notebook
+    Returns:
+        list: The interpreters named by the paragraphs of the notebook, in order of
+            first use. Paragraphs using the default interpreter are not included
+    """
+    interpreters = []
+    for paragraph in json_notebook.get("paragraphs", []):
+        match = INTERPRETER.match(paragraph.get("text") or "")
+        if match and match.group(1) not in interpreters:
+            interpreters.append(match.group(1))
+    return interpreters
+
+
+def paragraph_job_urls(paragraph: dict) -> List[str]:
+    """
+    Args:
+        paragraph: JSON dictionary of the paragraph
+    Returns:
+        list: The Spark UI URLs of the jobs in the runtime infos of the paragraph
+    """
+    urls = []
+    for info in (paragraph.get("runtimeInfos") or {}).values():
+        if not isinstance(info, dict) or info.get("propertyName") != "jobUrl":
+            continue
+        for value in info.get("values") or []:
+            # Zeppelin 0.8 lists the URLs, later versions a dictionary per job
+            url = value.get("jobUrl", "") if isinstance(value, dict) else value
+            if url and url not in urls:
+                urls.append(url)
+    return urls
+
+
+def add_job_urls(json_notebook: dict, paragraphs: List[ParagraphTiming]) -> None:
+    """
+    Add the Spark job URLs of the paragraphs of a notebook to their timings
+    Args:
+        json_notebook: JSON dictionary of the notebook
+        paragraphs: The timings of the paragraphs that were run
+    """
+    urls = {
+        paragraph.get("id"): paragraph_job_urls(paragraph)
+        for paragraph in json_notebook.get("paragraphs", [])
+    }
+    for timing in paragraphs:
+        timing.job_urls = urls.get(timing.paragraphid, [])
+
+
+def parse_paragraph_timings(json_notebook: dict) -> List[ParagraphTiming]:
+    """
+    Collect the timing of each paragraph from the dates recorded by Zeppelin
+    Args:
+        json_notebook: JSON dictionary of the notebook
+    Returns:
+        list: The timing of each paragraph that was run
+    """
+    timings = []
+    for paragraph in json_notebook.get("paragraphs", []):
+        started = paragraph.get("dateStarted", "")
+        finished = paragraph.get("dateFinished", "")
+        if not started:
+            continue
+        start, finish = parse_paragraph_date(started), parse_paragraph_date(finished)
+        duration = 0.0
+        if start and finish and (start.tzinfo is None) == (finish.tzinfo is None):
+            duration = max((finish - start).total_seconds(), 0.0)
+        timings.append(
+            ParagraphTiming(
+                paragraphid=paragraph.get("id", ""),
+                title=paragraph_title(paragraph),
+                status=paragraph.get("status", ""),
+                start=started,
+                finish=finished,
+                duration=duration,
+                job_urls=paragraph_job_urls(paragraph),
+            )
+        )
+    return timings
+
+
+def time_limit(deadline: float, paragraph_timeout: float) -> Optional[float]:
+    """
+    Seconds the next paragraph of a notebook may run
+    Args:
+        deadline: perf_counter time at which the notebook times out, none if 0
+        paragraph_timeout: Seconds a paragraph may run, no limit if 0
+    Returns:
+        float: The time limit, not positive once the notebook timed out, None if unlimited
+    """
+    limits = [paragraph_timeout] if paragraph_timeout else []
+    if deadline:
+        limits.append(deadline - time.perf_counter())
+    return min(limits) if limits else None
+
+
+def read_user_config(config: str) -> Dict[str, str]:
+    """
+    Read a zdairi style user configuration (flat "key: value" yml)
+    Args:
+        config: Path to the user configuration
+    Returns:
+        dict: The configuration values
+    """
+    values = {}
+    with open(config, encoding="utf-8") as config_file:
+        for line in config_file:
+            key, sep, value = line.partition(":")
+            if sep and key.strip():
+                values[key.strip()] = value.strip()
+    return values
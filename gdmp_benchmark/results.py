@@ -0,0 +1,467 @@
+"""
+Results of the notebook runs of the benchmarker, their timings and the alerts on them
+"""
+import time
+from enum import Enum
+import logging
+from contextlib import contextmanager
+from typing import List, Optional
+from dataclasses import dataclass, field, fields
+import simplejson as json
+import requests
+
+
+class InvalidConfigurationError(Exception):
+    """Exception to be raised when the configuration passed in is invalid"""
+
+    __module__ = Exception.__module__
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
+
+
+def validate_not_empty(val):
+    """
+    Args:
+        val: The value to validate
+    Raises:
+         ValueError: If value is empty
+    """
+
+    if not val:
+        msg = "Value is empty"
+        raise ValueError(msg)
+
+
+def validate_positive(val):
+    """
+    Args:
+        val: The value to validate
+    Raises:
+         ValueError: If value is not positive
+         TypeError: If value is not an int
+    """
+    if not isinstance(val, int):
+        msg = f"Value is not an int: {val}"
+        raise TypeError(msg)
+
+    if val < 0:
+        msg = f"Value is not positive: {val}"
+        raise ValueError(msg)
+
+
+def validate_seconds(val):
+    """
+    Args:
+        val: The number of seconds to validate
+    Raises:
+         ValueError: If value is not positive
+         TypeError: If value is not an int or a float
+    """
+    if isinstance(val, bool) or not isinstance(val, (int, float)):
+        msg = f"Value is not a number: {val}"
+        raise TypeError(msg)
+
+    if val < 0:
+        msg = f"Value is not positive: {val}"
+        raise ValueError(msg)
+
+
+def validate(instance):
+    """
+    Validate the parameter types of a class instance
+    Args:
+        instance: The instance of a class
+    Raises:
+         TypeError: If type does not match Type hint
+    """
+    for fld in fields(instance):
+        attr = getattr(instance, fld.name)
+        if not isinstance(attr, fld.type):
+            msg = f"Field {fld.name} is of type {type(attr)}, should be {fld.type}"
+            raise TypeError(msg)
+
+
+class Status(str, Enum):
+    """Status of the timing for a notebook run"""
+
+    SLOW = "SLOW"
+    FAST = "FAST"
+    PASS = "PASS"
+    ERROR = "ERROR"
+    FAIL = "FAIL"
+    SUCCESS = "SUCCESS"
+    SKIPPED = "SKIPPED"
+    TIMEOUT = "TIMEOUT"
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
+
+    def to_json(self):
+        """Return as json"""
+        return self.value
+
+
+@dataclass
+class Timing:
+    """
+    Stores the Timing info of Notebook run.
+    Attributes:
+        result (Status): The result of the operation.
+        totaltime (int): The total execution time in whole seconds
+        start (str): The start time of the notebook run
+        finish (str): The end time of the notebook run
+        expected (str): The expected execution time
+        elapsed (float): The total execution time in seconds, measured with a
+            monotonic clock (defaults to totaltime)
+        phases (dict): The time in seconds spent in each phase of the run. A phase
+            named with a dot is part of the phase before the dot (i.e. execute.run is
+            part of execute), so only the phases without a dot add up
+    """
+
+    result: Status
+    totaltime: int
+    start: str
+    finish: str
+    expected: int = 0
+    elapsed: float = 0.0
+    phases: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if isinstance(self.elapsed, int):
+            self.elapsed = float(self.elapsed)
+        validate(self)
+        validate_positive(self.totaltime)
+        if not self.elapsed:
+            self.elapsed = float(self.totaltime)
+
+    @property
+    def percent_change(self) -> str:
+        """
+        Get percentage change (Total time - expected time) / expected_time
+        Returns:
+            str: Percentage change
+        """
+        if self.expected and self.elapsed > 0:
+            return f"{((self.elapsed - self.expected) / self.expected) * 100:.2f}"
+        return "0"
+
+    def __str__(self):
+        return str(
+            {
+                "result": self.result,
+                "elapsed": f"{self.elapsed:.2f}",
+                "percent": self.percent_change,
+                "start": self.start,
+                "finish": self.finish,
+            }
+        )
+
+    def __repr__(self):
+        """Return repr view"""
+        return str(
+            {
+                "result": self.result,
+                "elapsed": f"{self.elapsed:.2f}",
+                "percent": self.percent_change,
+                "start": self.start,
+                "finish": self.finish,
+            }
+        )
+
+    def to_json(self):
+        """Return as json"""
+        return {
+            "result": self.result.to_json(),
+            "elapsed": f"{self.elapsed:.2f}",
+            "percent": self.percent_change,
+            "start": self.start,
+            "finish": self.finish,
+            "phases": self.phases,
+        }
+
+    def to_dict(self):
+        """Return as dictionary"""
+        dict_view = self.__dict__
+        dict_view["percent_change"] = self.percent_change
+        return dict_view
+
+
+@dataclass
+class ParagraphTiming:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Stores the Timing info of a single paragraph of a Notebook run.
+    Attributes:
+        paragraphid (str): The ID of the paragraph
+        title (str): The title of the paragraph, or the first line of its text
+        status (str): The Zeppelin status the paragraph finished with (FINISHED, ERROR,
+            ABORT), whichever the handler, or TIMEOUT if it was stopped when it timed out
+        start (str): The start time of the paragraph run
+        finish (str): The end time of the paragraph run
+        duration (float): The execution time in seconds
+        job_urls (list): The Spark UI URLs of the jobs the paragraph launched
+        spark (dict): Summary of the Spark jobs of the paragraph, see SparkJobCollector
+    """
+
+    paragraphid: str
+    title: str
+    status: str
+    start: str
+    finish: str
+    duration: float = 0.0
+    job_urls: list = field(default_factory=list)
+    spark: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        validate(self)
+
+    def to_dict(self):
+        """Return as dictionary"""
+        return dict(self.__dict__)
+
+
+@dataclass
+class Results:
+    # pylint: disable=too-many-instance-attributes
+    # Need to refactor this
+    """
+    Stores Results Info.
+
+    Attributes:
+        result (Status): The result of the operation.
+        msg (str): A message describing the result.
+        output (List[str]): A list of output strings.
+        notebookid (str): The ID of the notebook.
+        user_config (str): The user configuration in JSON format.
+        messages (List[str]): A list of messages.
+        logs (str): Additional logs.
+        time (Timing): The timing information.
+        outputs (dict): Additional outputs.
+        name (str): A name attribute.
+        paragraphs (List[ParagraphTiming]): The timing of each paragraph.
+        arrival (dict): Scheduled arrival, queueing delay (including waits for a thread of
+            the notebook handler) and service time in an open-loop run.
+        warmup (bool): Whether this is a warm-up run, excluded from the statistics.
+        iteration (int): The repetition of the notebook by the same user, from 0.
+        metrics (dict): The samples of each metrics endpoint polled while the notebook ran.
+        credential (dict): Name of the shared credential that ran the notebook, and
+            seconds the user waited to lease it, see CredentialPool.
+        user (int): The number of the user that ran the notebook, 0 for the default user.
+    """
+
+    result: Status
+    msg: str
+    output: list
+    notebookid: str
+    user_config: str
+    messages: list
+    logs: str = ""
+    time: Timing = field(default_factory=Timing)
+    outputs: dict = field(default_factory=dict)
+    name: str = ""
+    paragraphs: list = field(default_factory=list)
+    arrival: dict = field(default_factory=dict)
+    warmup: bool = False
+    iteration: int = 0
+    metrics: dict = field(default_factory=dict)
+    credential: dict = field(default_factory=dict)
+    user: int = 0
+
+    def __post_init__(self):
+        """post_init method"""
+        validate(self)
+
+    def to_dict(self):
+        """Return as dictionary"""
+        return {
+            "result": self.result,
+            "msg": self.msg,
+            "output": self.output,
+            "notebookid": self.notebookid,
+            "user_config": self.user_config,
+            "messages": self.messages,
+            "logs": self.logs,
+            "time": self.time.__dict__,
+            "outputs": self.outputs,
+            "name": self.name,
+            "paragraphs": [paragraph.to_dict() for paragraph in self.paragraphs],
+            "arrival": self.arrival,
+            "warmup": self.warmup,
+            "iteration": self.iteration,
+            "metrics": self.metrics,
+            "credential": self.credential,
+            "user": self.user,
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "Results":
+        """
+        Args:
+            values: Results as returned by to_dict, i.e. read back from JSON
+        Returns:
+            Results: The results
+        """
+        time_values = values["time"]
+        timing = Timing(
+            result=Status(time_values["result"]),
+            totaltime=time_values["totaltime"],
+            start=time_values["start"],
+            finish=time_values["finish"],
+        )
+        for name in ("expected", "elapsed", "phases"):
+            if name in time_values:
+                setattr(timing, name, time_values[name])
+        result = cls(
+            result=Status(values["result"]),
+            msg=values["msg"],
+            output=values["output"],
+            notebookid=values["notebookid"],
+            user_config=values["user_config"],
+            messages=values["messages"],
+            time=timing,
+        )
+        for fld in fields(cls):
+            if fld.name in values and fld.name not in ("result", "time", "paragraphs"):
+                setattr(result, fld.name, values[fld.name])
+        result.paragraphs = [
+            ParagraphTiming(**paragraph) for paragraph in values.get("paragraphs", [])
+        ]
+        return result
+
+    def __str__(self):
+        return str(
+            {
+                "name": self.name,
+                "result": str(self.result),
+                "outputs": self.outputs,
+                "messages": self.messages,
+                "time": self.time,
+                "logs": self.msg,
+            }
+        )
+
+    def __repr__(self):
+        return str(
+            {
+                "name": self.name,
+                "result": str(self.result),
+                "outputs": self.outputs,
+                "messages": self.messages,
+                "time": self.time,
+                "logs": self.msg,
+            }
+        )
+
+    def to_json(self) -> str:
+        """Convert to JSON"""
+
+        return json.dumps(str(
+            {
+                "name": self.name,
+                "result": str(self.result),
+                "outputs": self.outputs,
+                "messages": self.messages,
+                "time": self.time.to_json(),
+                "logs": self.logs,
+                "paragraphs": [paragraph.to_dict() for paragraph in self.paragraphs],
+            }
+        ))
+
+
+class AlertStrategies(Enum):
+    """
+    Alerting Strategies
+    """
+
+    ONLY_ON_ERROR = "ONLY_ON_ERROR"
+    SLOW_AND_ERROR = "SLOW_AND_ERROR"
+    ALLWAYS = "ALLWAYS"
+
+
+ALERT_STRATEGIES_MAP = {
+    AlertStrategies.ONLY_ON_ERROR: (Status.ERROR, Status.FAIL),
+    AlertStrategies.SLOW_AND_ERROR: (Status.ERROR, Status.FAIL, Status.SLOW),
+    AlertStrategies.ALLWAYS: (
+        Status.ERROR,
+        Status.FAIL,
+        Status.SLOW,
+        Status.FAST,
+        Status.PASS,
+    ),
+}
+
+
+class SlackAlerter:
+    """Slack Alerter Class, used to send out alerts to slack channels"""
+
+    def __init__(self, webhook):
+        self.webhook = webhook
+
+    @staticmethod
+    def send_http(msg: str, url: str):
+        """Send an http request with msg as a 'text' parameter"""
+        response = requests.post(
+            url,
+            json={"text": msg},
+            headers={"Content-Type": "application/json"},
+            timeout=300,
+        )
+
+        if response.status_code == 200:
+            logging.info("Message sent successfully to Slack!")
+        else:
+            logging.warning(
+                "Failed to send message. Status code: %s", response.status_code
+            )
+
+    def send_alert(self, content: list, alert_strategy: AlertStrategies) -> None:
+        """Send an alert"""
+        for test in content:
+            if test.result in ALERT_STRATEGIES_MAP.get(
+                alert_strategy, True
+            ) or test.time.result in ALERT_STRATEGIES_MAP.get(alert_strategy, True):
+                self.send_http(self.format_message(test), self.webhook)
+                return
+
+    @staticmethod
+    def format_message(content: Results) -> str:
+        """Format a message"""
+        return json.dumps(content, default=str)
+
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
+def flatten_results(results: list) -> List[Results]:
+    """
+    Args:
+        results: The results of a run, a list per user or a single list
+    Returns:
+        list: The results of all the users
+    """
+    return [
+        result
+        for user_results in results
+        for result in (user_results if isinstance(user_results, list) else [user_results])
+    ]
+
+
+@contextmanager
+def timed_phase(phases: Optional[dict], name: str):
+    """
+    Add the time spent in the block to a phase, measured with a monotonic clock
+    Args:
+        phases: Seconds spent in each phase, nothing is recorded if None
+        name: Name of the phase
+    """
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + (time.perf_counter_ns() - start) / 1e9
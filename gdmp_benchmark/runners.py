@@ -0,0 +1,793 @@
+"""
+Runs of the notebooks of a user of the benchmarker, see GDMPBenchmarker
+"""
+# pylint: disable-msg=too-many-locals
+# pylint: disable-msg=too-many-arguments
+# pylint: disable-msg=too-many-positional-arguments
+import sys
+import time
+import asyncio
+import string
+import random
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Generator, Iterator, List, Optional
+from gdmp_benchmark.results import (
+    ISO_FORMAT, InvalidConfigurationError, Results, Status, Timing, timed_phase,
+)
+from gdmp_benchmark.load import CircuitBreaker
+from gdmp_benchmark.monitoring import profiled
+from gdmp_benchmark.notebooks import Notebook, PooledNotebook, validate_output
+from gdmp_benchmark.handlers import run_in_thread
+from gdmp_benchmark.core import BenchmarkerCore
+
+
+class NotebookSchedule:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Schedule of the runs of the notebooks of a user, shared by the runners. Each
+    notebook starts once the notebooks it depends on have completed, with up to
+    notebook_concurrency running at a time, and each repetition once the previous one
+    has completed. No repetition starts once the breaker has opened
+    """
+
+    def __init__(
+        self,
+        dependencies: List[set],
+        repetitions: Iterator[tuple],
+        notebook_concurrency: int,
+        breaker: CircuitBreaker,
+    ):
+        """
+        Args:
+            dependencies: The positions of the notebooks each notebook depends on
+            repetitions: The iteration number of each repetition, and whether it is a
+                warm-up run
+            notebook_concurrency: Maximum number of notebooks running at a time
+            breaker: The circuit breaker of the run
+        """
+        self.dependencies = dependencies
+        self.repetitions = repetitions
+        self.notebook_concurrency = notebook_concurrency
+        self.breaker = breaker
+        self.results = []
+        self.done = False
+        self.repetition, self.remaining, self.completed, self.running = None, {}, set(), 0
+        self.iteration, self.is_warmup = 0, False
+        self._advance()
+
+    def ready(self) -> list:
+        """
+        Take the notebooks whose dependencies have all completed, in configuration order
+        Returns:
+            list: The runs to start, as tuples of the position of the notebook, the
+                iteration and whether it is a warm-up run
+        """
+        ready = [
+            index
+            for index, depends_on in self.remaining.items()
+            if depends_on <= self.completed
+        ][: max(self.notebook_concurrency - self.running, 0)]
+        for index in ready:
+            del self.remaining[index]
+        self.running += len(ready)
+        return [(index, self.iteration, self.is_warmup) for index in ready]
+
+    def complete(self, index: int, result: Results) -> None:
+        """
+        Record a run that completed
+        Args:
+            index: The position of the notebook
+            result: The results
+        """
+        self.repetition[index] = result
+        self.completed.add(index)
+        self.running -= 1
+        self._advance()
+
+    def _advance(self) -> None:
+        """Go on to the next repetition once the current one has completed"""
+        while not self.done and not self.remaining and not self.running:
+            if self.repetition is not None:
+                self.results.extend(self.repetition)
+                if self.breaker.is_open:
+                    self.done = True
+                    return
+            repetition = next(self.repetitions, None)
+            if repetition is None:
+                self.done = True
+                return
+            self.iteration, self.is_warmup = repetition
+            self.remaining = dict(enumerate(self.dependencies))
+            self.completed = set()
+            self.repetition = [None] * len(self.dependencies)
+
+
+class NotebookRunner(BenchmarkerCore):
+    """
+    Runs the notebooks of a user. Base of GDMPBenchmarker
+    """
+
+    @profiled
+    def run_notebook(
+        self,
+        filepath: str,
+        name: str,
+        concurrent: bool = False,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> Results:
+        """
+        Run a Zeppelin notebook, given a path and name for it.
+        Return the status of the job and how long it took to execute.
+        The notebook is created on the first run of its content by the user,
+        later runs clear its output and run it again
+        Args:
+            filepath: String with the filepath
+            name: Name of the notebooks
+            concurrent: Whether the notebook is part of a concurrent run
+            timeout: Seconds the notebook may run before it is stopped, no limit if 0
+            paragraph_timeout: Seconds each paragraph may run, no limit if 0
+        Returns:
+            Results: The results
+        """
+        return self._drive(
+            self._notebook_steps(
+                filepath,
+                name,
+                self._user,
+                self._get_user_config(concurrent),
+                True,
+                timeout,
+                paragraph_timeout,
+            )
+        )
+
+    async def run_notebook_async(
+        self,
+        filepath: str,
+        name: str,
+        user: int,
+        reuse: bool = True,
+        timeout: float = 0,
+        paragraph_timeout: float = 0,
+    ) -> Results:
+        """
+        Run a Zeppelin notebook with the asynchronous notebook handler
+        Args:
+            filepath: String with the filepath
+            name: Name of the notebooks
+            user: The user number
+            reuse: Whether to reuse the notebook created by an earlier run of the same
+                content by the user, clearing its output, instead of creating a new one.
+                A reused notebook must not run concurrently
+            timeout: Seconds the notebook may run before it is stopped, no limit if 0
+            paragraph_timeout: Seconds each paragraph may run, no limit if 0
+        Returns:
+            Results: The results
+        """
+        return await self._drive_async(
+            self._notebook_steps(
+                filepath,
+                name,
+                user,
+                self._get_user_config(True, user),
+                reuse,
+                timeout,
+                paragraph_timeout,
+            )
+        )
+
+    def _notebook_steps(
+        self,
+        filepath: str,
+        name: str,
+        user: int,
+        config: str,
+        reuse: bool,
+        timeout: float,
+        paragraph_timeout: float,
+    ) -> Generator[tuple, object, Results]:
+        """
+        The steps of a notebook run, shared by run_notebook and run_notebook_async.
+        Yields the calls that block, see _drive, and is sent their results
+        Args:
+            filepath: String with the filepath
+            name: Name of the notebooks
+            user: The user number
+            config: The configuration of the user
+            reuse: Whether to reuse the notebook created by an earlier run of the same
+                content by the user
+            timeout: Seconds the notebook may run before it is stopped, no limit if 0
+            paragraph_timeout: Seconds each paragraph may run, no limit if 0
+        Returns:
+            Results: The results
+        """
+
+        tmpfile = self.DEFAULT_DIR + name + ".json"
+        messages = []
+        phases = {}
+        start = time.perf_counter_ns()
+        starttime_iso = datetime.now()
+
+        with timed_phase(phases, "fetch"):
+            data = yield self.get_note, {"path": filepath, "cache": self.note_cache}
+        key = PooledNotebook.key(data)
+        pooled = self._checkout_notebook(user, key) if reuse else None
+        if pooled is not None:
+            tmpfile, notebookid = pooled.filepath, pooled.notebookid
+            with timed_phase(phases, "clear"):
+                cleared = yield "clear_notebook", {"notebookid": notebookid, "config": config}
+            if not cleared:
+                # It would keep the output of its last run, replace it with a new one
+                self._discard_notebook(user, key, pooled)
+                yield from self._deletion_steps(user, [pooled])
+                tmpfile, pooled = self.DEFAULT_DIR + name + ".json", None
+        if pooled is None:
+            with timed_phase(phases, "write"):
+                yield self._write_data_to_file, {
+                    "data": data,
+                    "filepath": tmpfile,
+                    "name": self._note_name(user, tmpfile),
+                }
+
+            # Create Notebook
+            with timed_phase(phases, "create"):
+                notebookid = yield "create_notebook", {
+                    "config": config,
+                    "filepath": tmpfile,
+                    "messages": messages,
+                }
+            if notebookid and self.journal is not None:
+                self.journal.notebook_created(user, notebookid, config)
+            if notebookid and reuse:
+                pooled = self._add_notebook(
+                    user, key, PooledNotebook(notebookid, tmpfile, config)
+                )
+
+        # Run Notebook
+        paragraphs = []
+        with timed_phase(phases, "execute"), self._in_flight(notebookid, config):
+            output, msg, status = yield "execute_notebook", {
+                "config": config,
+                "notebookid": notebookid,
+                "filepath": tmpfile,
+                "messages": messages,
+                "paragraphs": paragraphs,
+                "phases": phases,
+                "timeout": timeout,
+                "paragraph_timeout": paragraph_timeout,
+            }
+
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        endtime_iso = datetime.now()
+
+        timing = Timing(
+            result=Status.PASS,
+            totaltime=int(elapsed),
+            start=starttime_iso.strftime(ISO_FORMAT),
+            finish=endtime_iso.strftime(ISO_FORMAT),
+            elapsed=elapsed,
+            phases=phases,
+        )
+
+        result = Results(
+            result=status,
+            msg=msg,
+            output=output,
+            time=timing,
+            notebookid=notebookid,
+            user_config=config,
+            messages=messages,
+            paragraphs=paragraphs,
+            credential=self._credential(user),
+            user=user,
+        )
+        if self.spark_jobs is not None:
+            with timed_phase(phases, "spark"):
+                yield self.spark_jobs.annotate, {"result": result}
+        if pooled is not None:
+            pooled.result = result
+            pooled.busy = False
+        return result
+
+    def _drive(self, steps: Generator[tuple, object, object]):
+        """
+        Run steps, calling the notebook handler. Steps yield the calls that block, as
+        the name of a method of the notebook handler or a function, and its keyword
+        arguments. The result of each call is sent to the steps, its error thrown in
+        Args:
+            steps: The steps
+        Returns:
+            The value the steps return
+        """
+        value, error = None, None
+        while True:
+            try:
+                call, kwargs = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                if isinstance(call, str):
+                    call = getattr(self.notebook_handler, call)
+                value, error = call(**kwargs), None
+            except BaseException as err:  # pylint: disable=broad-exception-caught
+                value, error = None, err
+
+    async def _drive_async(self, steps: Generator[tuple, object, object]):
+        """
+        Run steps like _drive, with the asynchronous notebook handler. Functions are
+        called in a thread
+        Args:
+            steps: The steps
+        Returns:
+            The value the steps return
+        """
+        value, error = None, None
+        while True:
+            try:
+                call, kwargs = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                if isinstance(call, str):
+                    value = await getattr(self.async_notebook_handler, call)(**kwargs)
+                else:
+                    value = await run_in_thread(None, call, **kwargs)
+                error = None
+            except BaseException as err:  # pylint: disable=broad-exception-caught
+                value, error = None, err
+
+    @staticmethod
+    def _repetitions(warmup: int = 0, iterations: int = 1, measure_duration: float = 0):
+        """
+        Generate the repetitions of the notebooks of a user, first the warm-up runs,
+        then the measured ones. With a duration, measured runs are repeated until it
+        has passed, checked as each repetition completes
+        Args:
+            warmup: Number of warm-up runs
+            iterations: Number of measured runs
+            measure_duration: Repeat the measured runs for this many seconds instead
+        Yields:
+            tuple: The iteration number and whether it is a warm-up run
+        """
+        for iteration in range(warmup):
+            yield iteration, True
+        measured = 0
+        start = time.monotonic()
+        while measured == 0 or (
+            time.monotonic() - start < measure_duration
+            if measure_duration
+            else measured < iterations
+        ):
+            yield warmup + measured, False
+            measured += 1
+
+    @staticmethod
+    def _window_duration(window: tuple) -> float:
+        """
+        Args:
+            window: Times a user joins and leaves a run, in seconds since the epoch
+        Returns:
+            float: Seconds to repeat the measured runs for, from now. A user runs
+                the notebooks at least once, however short its window
+        """
+        return max(window[1] - time.time(), sys.float_info.epsilon)
+
+    @staticmethod
+    def _dependencies(notebooks: List[Notebook]) -> list:
+        """
+        Resolve the dependencies of each notebook, by name, to the positions
+        of the notebooks it depends on
+        Args:
+            notebooks: Notebook list
+        Returns:
+            list: The set of positions each notebook depends on
+        Raises:
+            InvalidConfigurationError: If a dependency is unknown, or they form a cycle
+        """
+        positions = {}
+        for index, notebook in enumerate(notebooks):
+            positions.setdefault(notebook.name, []).append(index)
+        dependencies = []
+        for notebook in notebooks:
+            depends_on = set()
+            for name in notebook.depends_on:
+                if name not in positions:
+                    raise InvalidConfigurationError(
+                        f"Unknown dependency of notebook {notebook.name}: {name}"
+                    )
+                depends_on.update(positions[name])
+            dependencies.append(depends_on)
+
+        resolved = set()
+        while len(resolved) < len(notebooks):
+            ready = {
+                index
+                for index, depends_on in enumerate(dependencies)
+                if index not in resolved and depends_on <= resolved
+            }
+            if not ready:
+                cycle = [
+                    notebook.name
+                    for index, notebook in enumerate(notebooks)
+                    if index not in resolved
+                ]
+                raise InvalidConfigurationError(
+                    f"Notebook dependencies form a cycle: {', '.join(cycle)}"
+                )
+            resolved |= ready
+        return dependencies
+
+    def _skipped(self, notebook: Notebook) -> Results:
+        """
+        Results of a notebook that is skipped, because the circuit breaker is open
+        Args:
+            notebook: The notebook
+        Returns:
+            Results: The results
+        """
+        message = "Skipped, the circuit breaker is open: " + (
+            self.breaker.reason or "too many notebooks failed"
+        )
+        now = datetime.now().strftime(ISO_FORMAT)
+        return Results(
+            result=Status.SKIPPED,
+            msg=message,
+            output=[],
+            notebookid="",
+            user_config="",
+            messages=[message],
+            time=Timing(result=Status.SKIPPED, totaltime=0, start=now, finish=now),
+            name=notebook.name,
+        )
+
+    @profiled
+    def _run_single(
+        self,
+        iterable: int = 0,
+        notebooks: List = None,
+        concurrent: bool = False,
+        delay_start: int = 0,
+        delay_notebook: int = 0,
+        delete: bool = True,
+        warmup: int = 0,
+        iterations: int = 1,
+        measure_duration: float = 0,
+        notebook_concurrency: int = 1,
+        window: Optional[tuple] = None,
+    ) -> list:
+        """
+        Run a single instance of the benchmark test. Each notebook starts once the
+        notebooks it depends on have completed, with up to notebook_concurrency running
+        at a time. Each notebook is created by the first run of its content and reused
+        by the others, until the end of the run
+        Args:
+            iterable: Order of the user in a concurrent run
+            notebooks: Notebook list
+            concurrent: Whether this is part of a concurrent run
+            delay_start: Delay ot the start of the run in seconds
+            delay_notebook: Delay to the start of the notebook in seconds
+            delete: Whether to delete the notebooks after the run
+            warmup: Number of warm-up runs of the notebooks
+            iterations: Number of measured runs of the notebooks
+            measure_duration: Repeat the measured runs for this many seconds instead
+            notebook_concurrency: Maximum number of notebooks running at a time
+            window: Times the user joins and leaves a run with a load profile, in
+                seconds since the epoch, instead of the start delay and repetitions
+        Returns:
+           list: The results, in configuration order for each repetition
+        """
+
+        # Bind the user to this worker, so it does not depend on the process identity
+        self._user = iterable
+        dependencies = self._dependencies(notebooks)
+        time.sleep(self._start_user(iterable, delay_start, window))
+        if window is not None:
+            measure_duration = self._window_duration(window)
+
+        def run(index: int, iteration: int, is_warmup: bool) -> Results:
+            notebook = notebooks[index]
+            result = self._not_run(iterable, notebook, index, iteration)
+            ran = result is None
+            if ran:
+                result = self.run_notebook(
+                    notebook.filepath,
+                    self._generate_name(),
+                    concurrent,
+                    timeout=notebook.timeout,
+                    paragraph_timeout=notebook.paragraph_timeout,
+                )  # Results
+            # Run Notebook delay here
+            if self._finish_notebook(iterable, notebook, index, result, iteration, is_warmup, ran):
+                time.sleep(delay_notebook)
+            return result
+
+        schedule = NotebookSchedule(
+            dependencies,
+            self._repetitions(warmup, iterations, measure_duration),
+            notebook_concurrency,
+            self.breaker,
+        )
+        with self._session(iterable), ThreadPoolExecutor(
+            max_workers=notebook_concurrency
+        ) as executor:
+            running = {}
+            while not schedule.done:
+                for start in schedule.ready():
+                    running[executor.submit(run, *start)] = start[0]
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    schedule.complete(running.pop(future), future.result())
+
+        pool = self._take_pool(iterable)
+        if delete:
+            self._delete_notebooks(iterable, pool)
+        self._remove_session_configs(iterable)
+
+        return schedule.results
+
+    async def _run_single_async(
+        self,
+        user: int = 1,
+        notebooks: List = None,
+        delay_start: int = 0,
+        delay_notebook: int = 0,
+        delete: bool = True,
+        warmup: int = 0,
+        iterations: int = 1,
+        measure_duration: float = 0,
+        notebook_concurrency: int = 1,
+        window: Optional[tuple] = None,
+    ) -> list:
+        """
+        Run a single user of the benchmark test as a coroutine. Each notebook starts
+        once the notebooks it depends on have completed, with up to notebook_concurrency
+        running at a time. Each notebook is created by the first run of its content and
+        reused by the others, until the end of the run
+        Args:
+            user: The user number
+            notebooks: Notebook list
+            delay_start: Delay ot the start of the run in seconds
+            delay_notebook: Delay to the start of the notebook in seconds
+            delete: Whether to delete the notebooks after the run
+            warmup: Number of warm-up runs of the notebooks
+            iterations: Number of measured runs of the notebooks
+            measure_duration: Repeat the measured runs for this many seconds instead
+            notebook_concurrency: Maximum number of notebooks running at a time
+            window: Times the user joins and leaves a run with a load profile, in
+                seconds since the epoch, instead of the start delay and repetitions
+        Returns:
+           list: The results, in configuration order for each repetition
+        """
+
+        dependencies = self._dependencies(notebooks)
+        await asyncio.sleep(self._start_user(user, delay_start, window))
+        if window is not None:
+            measure_duration = self._window_duration(window)
+
+        async def run(index: int, iteration: int, is_warmup: bool) -> Results:
+            notebook = notebooks[index]
+            result = self._not_run(user, notebook, index, iteration)
+            ran = result is None
+            if ran:
+                result = await self.run_notebook_async(
+                    notebook.filepath,
+                    self._generate_name(),
+                    user,
+                    timeout=notebook.timeout,
+                    paragraph_timeout=notebook.paragraph_timeout,
+                )
+            if self._finish_notebook(user, notebook, index, result, iteration, is_warmup, ran):
+                await asyncio.sleep(delay_notebook)
+            return result
+
+        schedule = NotebookSchedule(
+            dependencies,
+            self._repetitions(warmup, iterations, measure_duration),
+            notebook_concurrency,
+            self.breaker,
+        )
+        async with self._session_async(user):
+            running = {}
+            while not schedule.done:
+                for start in schedule.ready():
+                    running[asyncio.ensure_future(run(*start))] = start[0]
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    schedule.complete(running.pop(task), task.result())
+
+        pool = self._take_pool(user)
+        if delete:
+            await self._delete_notebooks_async(user, pool)
+        self._remove_session_configs(user)
+
+        return schedule.results
+
+    def _start_user(self, user: int, delay_start: int, window: Optional[tuple]) -> float:
+        """
+        Start the run of a user, with an empty pool of notebooks
+        Args:
+            user: The user number
+            delay_start: Delay ot the start of the run in seconds
+            window: Times the user joins and leaves a run with a load profile
+        Returns:
+            float: Seconds to wait before the user starts
+        """
+        self._take_pool(user)
+        if window is None:
+            return delay_start * user
+        return max(window[0] - time.time(), 0)
+
+    def _not_run(
+        self, user: int, notebook: Notebook, index: int, iteration: int
+    ) -> Optional[Results]:
+        """
+        Args:
+            user: The user number
+            notebook: The notebook
+            index: The position of the notebook in the configuration
+            iteration: The repetition of the notebooks
+        Returns:
+            Results: The results of a notebook that does not run, those of the run it
+                resumes, or skipped once the breaker has opened. None if it runs
+        """
+        journaled = self._journaled(user, iteration, index)
+        if journaled is None and self.breaker.is_open:
+            return self._skipped(notebook)
+        return journaled
+
+    def _finish_notebook(
+        self,
+        user: int,
+        notebook: Notebook,
+        index: int,
+        result: Results,
+        iteration: int,
+        is_warmup: bool,
+        ran: bool,
+    ) -> bool:
+        """
+        Publish the results of a notebook of a user, processing and journaling them if
+        it ran
+        Args:
+            user: The user number
+            notebook: The notebook
+            index: The position of the notebook in the configuration
+            result: The results
+            iteration: The repetition of the notebooks
+            is_warmup: Whether it is a warm-up run
+            ran: Whether the notebook ran, see _not_run
+        Returns:
+            bool: Whether the user waits the notebook delay before its next notebook
+        """
+        if ran:
+            self._process_result(notebook, result)
+        result.warmup = is_warmup
+        result.iteration = iteration
+        self._publish(user, result)
+        if not ran:
+            return False
+        self._journal_result(user, index, result)
+        return not self.breaker.is_open
+
+    def _delete_notebooks(self, user: int, pool: List[PooledNotebook]) -> None:
+        """
+        Delete the notebooks of a user at the end of its run, adding the time spent
+        to its deletion. Only the notebooks that were deleted are journaled as deleted
+        Args:
+            user: The user number
+            pool: The notebooks of the user
+        """
+        self._drive(self._deletion_steps(user, pool))
+
+    async def _delete_notebooks_async(
+        self, user: int, pool: List[PooledNotebook]
+    ) -> None:
+        """
+        Delete the notebooks of a user with the asynchronous notebook handler, like
+        _delete_notebooks
+        Args:
+            user: The user number
+            pool: The notebooks of the user
+        """
+        await self._drive_async(self._deletion_steps(user, pool))
+
+    def _deletion_steps(
+        self, user: int, pool: List[PooledNotebook]
+    ) -> Generator[tuple, object, None]:
+        """
+        The steps deleting the notebooks of a user, see _drive
+        Args:
+            user: The user number
+            pool: The notebooks of the user
+        """
+        with timed_phase(self._deletion(user, len(pool)), "seconds"):
+            for pooled in pool:
+                deleted = yield "delete_notebook", {
+                    "notebookid": pooled.notebookid,
+                    "config": pooled.config,
+                }
+                if deleted and self.journal is not None:
+                    self.journal.notebook_deleted(pooled.notebookid)
+
+    def _deletion(self, user: int, notebooks: int) -> dict:
+        """
+        Args:
+            user: The user number
+            notebooks: Number of notebooks the user is deleting
+        Returns:
+            dict: The deletion of the user, counting the notebooks
+        """
+        deletion = self.deletion.setdefault(user, {"notebooks": 0, "seconds": 0.0})
+        deletion["notebooks"] += notebooks
+        return deletion
+
+    def _journaled(self, user: int, iteration: int, index: int) -> Optional[Results]:
+        """
+        Args:
+            user: The user number
+            iteration: The repetition of the notebooks
+            index: The position of the notebook in the configuration
+        Returns:
+            Results: The results of the notebook in the journal of the run it resumes,
+                None if it has to run
+        """
+        if self.journal is None:
+            return None
+        return self.journal.completed.get((user, iteration, index))
+
+    def _journal_result(self, user: int, index: int, result: Results) -> None:
+        """
+        Record a notebook that ran in the journal of the run, if it has one
+        Args:
+            user: The user number
+            index: The position of the notebook in the configuration
+            result: The results
+        """
+        if self.journal is not None and result.result != Status.SKIPPED:
+            self.journal.result(user, index, result)
+
+    @staticmethod
+    def _generate_name() -> str:
+        """Generate a random name for a notebook"""
+        return "".join(
+            random.choice(string.ascii_uppercase + string.digits) for _ in range(10)
+        )
+
+    def _process_result(self, notebook: Notebook, result: Results) -> Results:
+        """
+        Validate the output of a notebook run, reporting every cell that does not
+        match its expected output, and classify its timing
+        Args:
+            notebook: The notebook that was run
+            result: The results of the run
+        Returns:
+            Results: The updated results
+        """
+        output_valid = True
+        with timed_phase(result.time.phases, "validate"):
+            if notebook.validators and result.result not in (
+                Status.ERROR,
+                Status.TIMEOUT,
+            ):
+                mismatches = validate_output(result.output, notebook.validators)
+                if mismatches:
+                    output_valid = False
+                    result.result = Status.FAIL
+                    result.messages.extend(mismatches)
+                    result.logs += "\n".join(mismatches)
+
+        # Add result data to Results object
+        result.name = notebook.name
+        result.outputs = {"valid": output_valid}
+
+        if result.time.elapsed > notebook.expectedtime:
+            result.time.result = Status.SLOW
+        elif result.time.elapsed < notebook.expectedmin:
+            result.time.result = Status.ERROR
+        else:
+            result.time.result = Status.FAST
+
+        result.time.expected = notebook.expectedtime
+        return result
@@ -0,0 +1,517 @@
+"""
+Scheduling of the users of the benchmarker, see GDMPBenchmarker
+"""
+# pylint: disable-msg=too-many-locals
+# pylint: disable-msg=too-many-arguments
+# pylint: disable-msg=too-many-positional-arguments
+import os
+import math
+import time
+import asyncio
+import threading
+import logging
+from contextlib import ExitStack, AsyncExitStack
+from multiprocessing import Pool, Manager
+from typing import List, Optional
+from gdmp_benchmark.results import Results, Status
+from gdmp_benchmark.load import ArrivalProfile, LoadProfile, Prewarm
+from gdmp_benchmark.notebooks import Notebook, PooledNotebook, notebook_interpreters
+from gdmp_benchmark.handlers import THREAD_WAITS
+from gdmp_benchmark.runners import NotebookRunner
+
+
+class UserScheduler(NotebookRunner):
+    """
+    Runs the users of the benchmarker concurrently. Base of GDMPBenchmarker
+    """
+
+    @staticmethod
+    def _windows(load_profile: Optional[LoadProfile]) -> Optional[dict]:
+        """
+        Args:
+            load_profile: The load profile of a run starting now
+        Returns:
+            dict: The times each user joins and leaves the run, in seconds since
+                the epoch, None without a load profile
+        """
+        if load_profile is None:
+            return None
+        started = time.time()
+        return {
+            user: (started + join, started + leave)
+            for user, (join, leave) in enumerate(load_profile.schedule(), start=1)
+        }
+
+    async def _prewarm(
+        self, usercount: int, notebooks: List[Notebook], prewarm: Prewarm
+    ) -> dict:
+        """
+        Warm up the interpreters of all the users at once, by running a notebook with
+        a trivial paragraph per interpreter. When the interpreters are restarted, they
+        are restarted for all the users before any of them warms up
+        Args:
+            usercount: Number of users
+            notebooks: The notebooks of the run, whose interpreters are warmed up
+                unless the interpreters are configured
+            prewarm: The warm-up configuration
+        Returns:
+            dict: The cold start of each user, and a summary of each interpreter
+        Raises:
+            ValueError: If User count exceeds maximum
+        """
+        interpreters = prewarm.interpreters or list(
+            dict.fromkeys(
+                interpreter
+                for notebook in notebooks
+                for interpreter in notebook_interpreters(
+                    self.get_note(path=notebook.filepath, cache=self.note_cache)
+                )
+            )
+        )
+        if not interpreters:
+            return {}
+        if usercount > 1:
+            self._check_usercount(usercount)
+        users = range(1, max(usercount, 1) + 1)
+        configs = [self._get_user_config(True, user) for user in users]
+        messages = [[] for _ in users]
+        filepath = self.DEFAULT_DIR + "prewarm-" + self._generate_name() + ".json"
+        self._write_data_to_file(data=Prewarm.note(interpreters), filepath=filepath)
+        try:
+            notebookids = await asyncio.gather(
+                *[
+                    self.async_notebook_handler.create_notebook(
+                        config=config, filepath=filepath, messages=user_messages
+                    )
+                    for config, user_messages in zip(configs, messages)
+                ]
+            )
+            if self.journal is not None:
+                for user, config, notebookid in zip(users, configs, notebookids):
+                    if notebookid:
+                        self.journal.notebook_created(user, notebookid, config)
+            if prewarm.restart:
+                await asyncio.gather(
+                    *[
+                        self.async_notebook_handler.restart_interpreter(
+                            setting, config, notebookid
+                        )
+                        for config, notebookid in zip(configs, notebookids)
+                        if notebookid
+                        for setting in Prewarm.settings(interpreters)
+                    ]
+                )
+            cold_start = await asyncio.gather(
+                *[
+                    self._prewarm_user(
+                        user, config, notebookid, filepath, user_messages,
+                        interpreters, prewarm.timeout,
+                    )
+                    for user, config, notebookid, user_messages in zip(
+                        users, configs, notebookids, messages
+                    )
+                ]
+            )
+        finally:
+            os.remove(filepath)
+        return {
+            "users": list(cold_start),
+            "interpreters": self._cold_start_summary(cold_start, interpreters),
+        }
+
+    async def _prewarm_user(
+        self,
+        user: int,
+        config: str,
+        notebookid: str,
+        filepath: str,
+        messages: list,
+        interpreters: List[str],
+        timeout: float,
+    ) -> dict:
+        """
+        Run the warm-up notebook of a user, then delete it
+        Args:
+            user: The user number
+            config: The configuration of the user
+            notebookid: The ID of the warm-up notebook, empty if it was not created
+            filepath: The file the warm-up notebook was created from
+            messages: The list of messages to append to
+            interpreters: The interpreters of the paragraphs of the notebook
+            timeout: Seconds the warm-up may take, no limit if 0
+        Returns:
+            dict: The result and time of the warm-up, and the time of each interpreter
+        """
+        cold_start = {
+            "user": user,
+            "result": Status.FAIL,
+            "elapsed": 0.0,
+            "interpreters": {},
+            "messages": messages,
+        }
+        if not notebookid:
+            logging.warning("Warm-up notebook of user %s was not created", user)
+            return cold_start
+        paragraphs = []
+        start = time.perf_counter()
+        _, msg, status = await self.async_notebook_handler.execute_notebook(
+            config=config,
+            notebookid=notebookid,
+            filepath=filepath,
+            messages=messages,
+            paragraphs=paragraphs,
+            timeout=timeout,
+        )
+        cold_start["elapsed"] = time.perf_counter() - start
+        deleted = await self.async_notebook_handler.delete_notebook(
+            notebookid=notebookid, config=config
+        )
+        if deleted and self.journal is not None:
+            self.journal.notebook_deleted(notebookid)
+        if status != Status.SUCCESS:
+            logging.warning("Warm-up of user %s failed: %s", user, msg)
+        cold_start["result"] = status
+        cold_start["interpreters"] = {
+            interpreter: timing.duration
+            for interpreter, timing in zip(interpreters, paragraphs)
+        }
+        return cold_start
+
+    @staticmethod
+    def _cold_start_summary(cold_start: List[dict], interpreters: List[str]) -> dict:
+        """
+        Args:
+            cold_start: The cold start of each user
+            interpreters: The interpreters that were warmed up
+        Returns:
+            dict: Count, mean, min and max cold start latency of each interpreter
+        """
+        summary = {}
+        for interpreter in interpreters:
+            times = [
+                user["interpreters"][interpreter]
+                for user in cold_start
+                if interpreter in user["interpreters"]
+            ]
+            summary[interpreter] = {
+                "count": len(times),
+                "mean": sum(times) / len(times) if times else None,
+                "min": min(times, default=None),
+                "max": max(times, default=None),
+            }
+        return summary
+
+    @staticmethod
+    def _set_limits(
+        notebooks: List[Notebook],
+        thresholds: Optional[dict],
+        timeout_factor: float,
+        paragraph_timeout: float,
+    ) -> None:
+        """
+        Set the expected times and the timeouts of the notebooks for a run
+        Args:
+            notebooks: The notebooks
+            thresholds: Learned bands of expected times, replacing the configured ones
+            timeout_factor: Multiple of the expected time after which a notebook
+                without a configured timeout times out
+            paragraph_timeout: Paragraph timeout of the notebooks without a configured one
+        """
+        for notebook in notebooks:
+            if notebook.name in (thresholds or {}):
+                notebook.expectedtime = thresholds[notebook.name]["upper"]
+                notebook.expectedmin = thresholds[notebook.name]["lower"]
+            if not notebook.timeout:
+                notebook.timeout = math.ceil(timeout_factor * notebook.expectedtime)
+            notebook.paragraph_timeout = notebook.paragraph_timeout or paragraph_timeout
+
+    def _run_parallel(
+        self,
+        usercount: int = 1,
+        notebooks: List = None,
+        delay_start: int = 0,
+        delay_notebook: int = 0,
+        delete: bool = True,
+        warmup: int = 0,
+        iterations: int = 1,
+        measure_duration: float = 0,
+        notebook_concurrency: int = 1,
+        users: Optional[List[int]] = None,
+        windows: Optional[dict] = None,
+    ):
+        """
+        Run the benchmarks in the given configuration as a parallel test
+        with multiple concurrent users
+        Args:
+            usercount: Number of users
+            notebooks: Notebook List
+            delay_start: Delay start in seconds
+            delay_notebook: Delay to start of notebook in seconds
+            delete: Whether to delete the notebooks after the run
+            warmup: Number of warm-up runs of the notebooks by each user
+            iterations: Number of measured runs of the notebooks by each user
+            measure_duration: Repeat the measured runs for this many seconds instead
+            notebook_concurrency: Maximum number of notebooks each user runs at a time
+            users: The numbers of the users to run, 1 to usercount by default
+            windows: Times each user joins and leaves a run with a load profile
+        Returns:
+            dict: The results
+        Raises:
+            ValueError: If User count exceeds maximum
+        """
+        self._check_usercount(usercount)
+        users = users or list(range(1, usercount + 1))
+        leased = self.credential_pool is not None and self.credential_pool.mode == "leased"
+        with ExitStack() as stack:
+            if self._on_result is not None or self.breaker.enabled or leased:
+                manager = stack.enter_context(Manager())
+                # Share the breaker with the workers, then restore a local one
+                stack.callback(setattr, self.breaker, "event", threading.Event())
+                self.breaker.event = manager.Event()
+            if leased:
+                # The workers lease the credentials from a shared queue
+                self.credential_pool.start(self.credential_pool.credentials, manager.Queue())
+            if self._on_result is not None:
+                queue = manager.Queue()
+                listener = threading.Thread(
+                    target=self._forward_results, args=(queue, self._on_result)
+                )
+                listener.start()
+                stack.callback(listener.join)
+                stack.callback(queue.put, None)
+                self._result_queue = queue
+            try:
+                with Pool(processes=len(users)) as pool:
+                    outcomes = pool.starmap(
+                        self._run_worker,
+                        [
+                            (
+                                user,
+                                notebooks,
+                                True,
+                                delay_start,
+                                delay_notebook,
+                                delete,
+                                warmup,
+                                iterations,
+                                measure_duration,
+                                notebook_concurrency,
+                                (windows or {}).get(user),
+                            )
+                            for user in users
+                        ],
+                    )
+                pool.close()
+                pool.join()
+            finally:
+                self._result_queue = None
+        for user, (_, deletion) in zip(users, outcomes):
+            if deletion is not None:
+                self.deletion[user] = deletion
+        return [results for results, _ in outcomes]
+
+    def _run_worker(self, user: int, *arguments) -> tuple:
+        """
+        Run a single user in a worker process of the pool runner, see _run_single
+        Args:
+            user: The user number
+            arguments: The other arguments of _run_single
+        Returns:
+            list: The results of the user
+            dict: The deletion of the user, None if it deleted no notebooks
+        """
+        with self._stopping():
+            results = self._run_single(user, *arguments)
+        return results, self.deletion.get(user)
+
+    def _check_usercount(self, usercount: int) -> None:
+        """
+        Args:
+            usercount: Number of users
+        Raises:
+            ValueError: If User count exceeds maximum
+        """
+        if self.credential_pool is None and usercount > self.total_users:
+            err_msg = """
+            User count exceeds the number of users that 
+            were passed in the configuration!
+            """
+            raise ValueError(err_msg)
+
+    async def _run_async(
+        self,
+        usercount: int = 1,
+        notebooks: List = None,
+        delay_start: int = 0,
+        delay_notebook: int = 0,
+        delete: bool = True,
+        warmup: int = 0,
+        iterations: int = 1,
+        measure_duration: float = 0,
+        notebook_concurrency: int = 1,
+        users: Optional[List[int]] = None,
+        windows: Optional[dict] = None,
+    ) -> list:
+        """
+        Run the benchmarks in the given configuration with each user
+        as a coroutine on a single event loop
+        Args:
+            usercount: Number of users
+            notebooks: Notebook List
+            delay_start: Delay start in seconds
+            delay_notebook: Delay to start of notebook in seconds
+            delete: Whether to delete the notebooks after the run
+            warmup: Number of warm-up runs of the notebooks by each user
+            iterations: Number of measured runs of the notebooks by each user
+            measure_duration: Repeat the measured runs for this many seconds instead
+            notebook_concurrency: Maximum number of notebooks each user runs at a time
+            users: The numbers of the users to run, 1 to usercount by default
+            windows: Times each user joins and leaves a run with a load profile
+        Returns:
+            list: The results of each user
+        Raises:
+            ValueError: If User count exceeds maximum
+        """
+        if usercount > 1:
+            self._check_usercount(usercount)
+        users = users or list(range(1, usercount + 1))
+        return list(
+            await asyncio.gather(
+                *[
+                    self._run_single_async(
+                        user,
+                        notebooks,
+                        delay_start,
+                        delay_notebook,
+                        delete,
+                        warmup,
+                        iterations,
+                        measure_duration,
+                        notebook_concurrency,
+                        (windows or {}).get(user),
+                    )
+                    for user in users
+                ]
+            )
+        )
+
+    async def _run_open_loop(
+        self,
+        usercount: int = 1,
+        notebooks: List = None,
+        profile: ArrivalProfile = None,
+        max_in_flight: int = 0,
+        delete: bool = True,
+    ) -> list:
+        """
+        Run the benchmarks as an open-loop test, launching notebook executions at the
+        arrival times of the profile, whether or not earlier ones have completed.
+        Notebooks and users are assigned to arrivals in turn. When max_in_flight
+        executions are running, arrivals queue until one completes. The notebook of
+        each arrival is deleted as soon as it completes
+        Args:
+            usercount: Number of users
+            notebooks: Notebook List
+            profile: The arrival profile
+            max_in_flight: Maximum number of concurrent executions, unbounded if 0
+            delete: Whether to delete the notebooks after the run
+        Returns:
+            list: The results, in order of arrival
+        Raises:
+            ValueError: If User count exceeds maximum
+        """
+        if usercount > 1:
+            self._check_usercount(usercount)
+        slots = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def arrive(index: int, scheduled: float) -> Results:
+            notebook = notebooks[index % len(notebooks)]
+            user = index % usercount + 1
+            if self.breaker.is_open:
+                result = self._skipped(notebook)
+                self._publish(user, result)
+                return result
+            async with slots or AsyncExitStack():
+                started = loop.time()
+                # Waits for a thread of the notebook handler are queueing, not service
+                waits = []
+                THREAD_WAITS.set(waits)
+                # Arrivals of the same user overlap, so each creates its own notebook
+                result = await self.run_notebook_async(
+                    notebook.filepath,
+                    self._generate_name(),
+                    user,
+                    reuse=False,
+                    timeout=notebook.timeout,
+                    paragraph_timeout=notebook.paragraph_timeout,
+                )
+                result.arrival = {
+                    "scheduled": round(scheduled, 6),
+                    "queue_delay": round(started - start - scheduled + sum(waits), 6),
+                    "service_time": round(loop.time() - started - sum(waits), 6),
+                }
+            self._process_result(notebook, result)
+            self._publish(user, result)
+            if self.journal is not None:
+                self.journal.arrival(user, index, result)
+            if delete and result.notebookid:
+                await self._delete_notebooks_async(
+                    user, [PooledNotebook(result.notebookid, "", result.user_config)]
+                )
+            return result
+
+        # Each arrival starts at its time, only the running ones are in flight
+        arrivals, running = [], set()
+        try:
+            for index, scheduled in enumerate(profile.arrivals()):
+                await asyncio.sleep(max(start + scheduled - loop.time(), 0))
+                for task in [task for task in running if task.done()]:
+                    running.discard(task)
+                    task.result()
+                task = asyncio.create_task(arrive(index, scheduled))
+                running.add(task)
+                arrivals.append(task)
+            await asyncio.gather(*running)
+        finally:
+            for task in running:
+                task.cancel()
+        results = [task.result() for task in arrivals]
+        for user in range(1, usercount + 1):
+            self._remove_session_configs(user)
+        return results
+
+    @staticmethod
+    def open_loop_summary(results: List[Results], duration: float = 0) -> dict:
+        """
+        Summarise the queueing delay versus service time of an open-loop run
+        Args:
+            results: The results of the run
+            duration: Length of the run in seconds, to compute the throughput
+        Returns:
+            dict: Mean and maximum queueing delay and service time, and the
+                offered and completed throughput in executions per minute
+        """
+        arrivals = [result.arrival for result in results if result.arrival]
+        if not arrivals:
+            return {}
+        queue_delays = [arrival["queue_delay"] for arrival in arrivals]
+        service_times = [arrival["service_time"] for arrival in arrivals]
+        finished = max(
+            arrival["scheduled"] + arrival["queue_delay"] + arrival["service_time"]
+            for arrival in arrivals
+        )
+        return {
+            "executions": len(arrivals),
+            "queue_delay_mean": round(sum(queue_delays) / len(arrivals), 6),
+            "queue_delay_max": round(max(queue_delays), 6),
+            "service_time_mean": round(sum(service_times) / len(arrivals), 6),
+            "service_time_max": round(max(service_times), 6),
+            "offered_per_minute": round(len(arrivals) * 60 / duration, 6)
+            if duration
+            else 0,
+            "completed_per_minute": round(len(arrivals) * 60 / finished, 6)
+            if finished
+            else 0,
+        }
@@ -0,0 +1,709 @@
+"""
+Statistics of the results of the benchmarker, and the stores of its results
+"""
+# pylint: disable-msg=too-many-arguments
+# pylint: disable-msg=too-many-positional-arguments
+import os
+import sys
+import math
+import fcntl
+import subprocess
+import time
+import sqlite3
+import logging
+from datetime import datetime
+from statistics import NormalDist, median
+from typing import List, Optional, TextIO
+import simplejson as json
+from simplejson.errors import JSONDecodeError
+from gdmp_benchmark.results import ISO_FORMAT, InvalidConfigurationError, Results, Status
+
+
+class LatencyHistogram:
+    """
+    Streaming latency statistics with an HDR style histogram. Values are counted in
+    log-linear millisecond buckets: exact below 256ms, and within 1/128 of the value above,
+    so memory stays bounded however many values are recorded. Mean and standard deviation
+    are kept with Welford's algorithm
+    """
+
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    @classmethod
+    def bucket_index(cls, value_ms: int) -> int:
+        """Get the index of the bucket a value in milliseconds is counted in"""
+        shift = max(value_ms.bit_length() - cls.SUB_BUCKET_BITS - 1, 0)
+        return (shift << cls.SUB_BUCKET_BITS) + (value_ms >> shift)
+
+    @classmethod
+    def bucket_bounds(cls, index: int) -> tuple:
+        """Get the lowest and highest values in milliseconds counted in a bucket"""
+        shift = max((index >> cls.SUB_BUCKET_BITS) - 1, 0)
+        lower = (index - (shift << cls.SUB_BUCKET_BITS)) << shift
+        return lower, lower + (1 << shift) - 1
+
+    def record(self, value: float) -> None:
+        """
+        Record a value
+        Args:
+            value: The latency in seconds
+        """
+        index = self.bucket_index(max(int(value * 1000), 0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squares += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Merge the values recorded in another histogram into this one"""
+        if not other.count:
+            return
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.squares += other.squares + delta * delta * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def stddev(self) -> float:
+        """Sample standard deviation of the recorded values"""
+        return math.sqrt(self.squares / (self.count - 1)) if self.count > 1 else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """
+        Args:
+            percent: The percentile, between 0 and 100
+        Returns:
+            float: The highest value in seconds equivalent to the percentile
+        """
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                value = self.bucket_bounds(index)[1] / 1000
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Return as dictionary"""
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 3),
+            "stddev": round(self.stddev, 3),
+            "min": round(self.min, 3) if self.count else 0.0,
+            "p50": round(self.percentile(50), 3),
+            "p90": round(self.percentile(90), 3),
+            "p99": round(self.percentile(99), 3),
+            "max": round(self.max, 3),
+            "histogram": [
+                [bound / 1000 for bound in self.bucket_bounds(index)]
+                + [self.counts[index]]
+                for index in sorted(self.counts)
+            ],
+        }
+
+
+class LatencyStatistics:
+    """Aggregated latency statistics of each notebook, across all users and repetitions"""
+
+    def __init__(self):
+        self.notebooks = {}
+        self.statuses = {}
+
+    def add(self, user: int, result: Results) -> None:
+        """
+        Record the results of a notebook run, unless it is a warm-up run. Every run is
+        counted by status, only the successful ones go into the latency histogram
+        Args:
+            user: The user number
+            result: The results
+        """
+        # pylint: disable=unused-argument
+        if result.warmup:
+            return
+        statuses = self.statuses.setdefault(result.name, {})
+        statuses[str(result.result)] = statuses.get(str(result.result), 0) + 1
+        histogram = self.notebooks.setdefault(result.name, LatencyHistogram())
+        if result.result == Status.SUCCESS:
+            histogram.record(result.time.elapsed)
+
+    def merge(self, other: "LatencyStatistics") -> None:
+        """Merge the statistics of another run into these"""
+        for name, histogram in other.notebooks.items():
+            self.notebooks.setdefault(name, LatencyHistogram()).merge(histogram)
+        for name, statuses in other.statuses.items():
+            merged = self.statuses.setdefault(name, {})
+            for status, count in statuses.items():
+                merged[status] = merged.get(status, 0) + count
+
+    def to_dict(self) -> dict:
+        """Return as dictionary"""
+        return {
+            name: {**histogram.to_dict(), "results": self.statuses.get(name, {})}
+            for name, histogram in self.notebooks.items()
+        }
+
+
+class RunJournal:
+    """
+    Journal of a run, to resume it after a crash or an interrupt, and to delete the
+    notebooks it left behind. Every notebook created and deleted, and every completed
+    notebook result, is appended as a JSON line when it happens:
+        {"type": "run", ...}: The arguments of the run, first
+        {"type": "created", "user", "notebookid", "config"}: A notebook was created
+        {"type": "deleted", "notebookid"}: A notebook was deleted
+        {"type": "result", "user", "index", "iteration", "result"}: A notebook completed
+        {"type": "arrival", "user", "arrival", "result"}: An arrival of an open-loop
+            test completed, numbered in order of arrival
+        {"type": "resume"}: The run was resumed
+    Each line is written at once under an exclusive lock and synced to disk, so the
+    workers of the pool runner share the journal, and a crash loses at most the line
+    being written, which is ignored when the journal is read
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        """
+        Args:
+            path: The journal file
+            resume: Resume the run of the journal, instead of starting a new one
+        """
+        self.path = path
+        self.resume = resume
+        self.completed = {}
+
+    def open(self, header: dict) -> None:
+        """
+        Start the journal of a run, or load the journal of the run it resumes
+        Args:
+            header: The arguments of the run, the same as those of the run it resumes
+        Raises:
+            InvalidConfigurationError: If the journal of another run would be
+                overwritten, or the run resumed has other arguments
+        """
+        if not self.resume:
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                raise InvalidConfigurationError(
+                    f"Journal {self.path} exists, resume its run or remove it"
+                )
+            self.append({"type": "run", **header})
+            return
+        records = self.read(self.path) if os.path.exists(self.path) else []
+        if not records or records[0].get("type") != "run":
+            raise InvalidConfigurationError(f"No run to resume in journal {self.path}")
+        changed = [key for key, value in header.items() if records[0].get(key) != value]
+        if changed:
+            raise InvalidConfigurationError(
+                f"The run of journal {self.path} has other {', '.join(changed)}"
+            )
+        self.completed = {
+            (record["user"], record["iteration"], record["index"]): Results.from_dict(
+                record["result"]
+            )
+            for record in records
+            if record["type"] == "result"
+        }
+        self.truncate()
+        self.append({"type": "resume"})
+
+    def truncate(self) -> None:
+        """Remove a partly written last line, so the next record starts a line"""
+        with open(self.path, "rb+") as journal:
+            content = journal.read()
+            if content and not content.endswith(b"\n"):
+                journal.truncate(content.rfind(b"\n") + 1)
+
+    @staticmethod
+    def read(path: str) -> List[dict]:
+        """
+        Args:
+            path: The journal file
+        Returns:
+            list: The records of the journal, without a partly written last line
+        """
+        records = []
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    records.append(json.loads(line))
+                except JSONDecodeError:
+                    logging.warning("Ignoring a partly written line of journal %s", path)
+        return records
+
+    @staticmethod
+    def created(records: List[dict]) -> dict:
+        """
+        Args:
+            records: The records of a journal
+        Returns:
+            dict: The user configuration of each notebook created and not deleted
+        """
+        created = {}
+        for record in records:
+            if record["type"] == "created":
+                created[record["notebookid"]] = record["config"]
+            elif record["type"] == "deleted":
+                created.pop(record["notebookid"], None)
+        return created
+
+    def append(self, record: dict) -> None:
+        """
+        Append a record to the journal
+        Args:
+            record: The record
+        """
+        line = json.dumps(record, default=lambda value: value.to_dict()) + "\n"
+        with open(self.path, "a", encoding="utf-8") as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            try:
+                journal.write(line)
+                journal.flush()
+                os.fsync(journal.fileno())
+            finally:
+                fcntl.flock(journal, fcntl.LOCK_UN)
+
+    def result(self, user: int, index: int, result: Results) -> None:
+        """
+        Record a completed notebook
+        Args:
+            user: The user number
+            index: The position of the notebook in the configuration
+            result: The results
+        """
+        self.append(
+            {
+                "type": "result",
+                "user": user,
+                "index": index,
+                "iteration": result.iteration,
+                "result": result,
+            }
+        )
+
+    def arrival(self, user: int, arrival: int, result: Results) -> None:
+        """
+        Record a completed arrival of an open-loop test
+        Args:
+            user: The user number
+            arrival: The number of the arrival, in order of arrival
+            result: The results
+        """
+        self.append({"type": "arrival", "user": user, "arrival": arrival, "result": result})
+
+    def notebook_created(self, user: int, notebookid: str, config: str) -> None:
+        """
+        Record a created notebook
+        Args:
+            user: The user number
+            notebookid: The ID of the notebook
+            config: The configuration of the user that created it
+        """
+        self.append(
+            {"type": "created", "user": user, "notebookid": notebookid, "config": config}
+        )
+
+    def notebook_deleted(self, notebookid: str) -> None:
+        """
+        Record a deleted notebook
+        Args:
+            notebookid: The ID of the notebook
+        """
+        self.append({"type": "deleted", "notebookid": notebookid})
+
+
+class NDJSONResultWriter:
+    """
+    Writes results as newline delimited JSON records, one as soon as each notebook
+    completes, followed by a final summary record. Each line is flushed, so the stream
+    can be tailed while the benchmark runs and a partial run can be recovered
+    """
+
+    def __init__(self, stream: TextIO = sys.stdout):
+        self.stream = stream
+        self.start = time.time()
+        self.total = 0
+        self.status_counts = {}
+        self.time_counts = {}
+
+    def write(self, record: dict) -> None:
+        """Write a single record as a line of JSON"""
+        self.stream.write(json.dumps(record, default=str) + "\n")
+        self.stream.flush()
+
+    def __call__(self, user: int, result: Results) -> None:
+        """Write the record of a completed notebook"""
+        self.total += 1
+        status, time_status = str(result.result), str(result.time.result)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.time_counts[time_status] = self.time_counts.get(time_status, 0) + 1
+        self.write({"type": "result", **result.to_dict(), "user": user})
+
+    def write_summary(self, **extra) -> None:
+        """Write the final summary record"""
+        self.write(
+            {
+                "type": "summary",
+                "notebooks": self.total,
+                "results": self.status_counts,
+                "times": self.time_counts,
+                "elapsed": f"{time.time() - self.start:.2f}",
+                **extra,
+            }
+        )
+
+
+def mann_whitney_u(sample: list, baseline: list) -> tuple:
+    """
+    One-sided Mann-Whitney U test of whether the values of a sample tend to be larger
+    than those of a baseline, using the normal approximation with tie and continuity
+    corrections
+    Args:
+        sample: The values of the sample
+        baseline: The values of the baseline
+    Returns:
+        float: The U statistic of the sample
+        float: The p-value
+    """
+    count, base_count = len(sample), len(baseline)
+    values = sorted([(value, True) for value in sample] + [(value, False) for value in baseline])
+    total = count + base_count
+    rank_sum = 0.0
+    ties = 0.0
+    start = 0
+    while start < total:
+        end = start
+        while end + 1 < total and values[end + 1][0] == values[start][0]:
+            end += 1
+        tied = end - start + 1
+        ties += tied**3 - tied
+        rank = (start + end) / 2 + 1
+        rank_sum += rank * sum(1 for _, in_sample in values[start : end + 1] if in_sample)
+        start = end + 1
+    u_stat = rank_sum - count * (count + 1) / 2
+    variance = count * base_count / 12 * ((total + 1) - ties / (total * (total - 1)))
+    if variance <= 0:
+        return u_stat, 1.0
+    z_score = (u_stat - count * base_count / 2 - 0.5) / math.sqrt(variance)
+    return u_stat, 1 - NormalDist().cdf(z_score)
+
+
+def git_revision(directory: str = os.path.dirname(os.path.abspath(__file__))) -> str:
+    """
+    Get the git revision of a checkout
+    Args:
+        directory: A directory of the checkout
+    Returns:
+        str: The revision, empty if it is not a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def export_thresholds(notebook_config: dict, thresholds: dict) -> dict:
+    """
+    Write learned thresholds into a notebook configuration, as the totaltime
+    and mintime of each notebook
+    Args:
+        notebook_config: JSON dictionary of the notebook configuration
+        thresholds: The thresholds of each notebook, see ResultStore.thresholds
+    Returns:
+        dict: The notebook configuration with the learned thresholds
+    """
+    notebooks = []
+    for notebook in notebook_config["notebooks"]:
+        notebook = dict(notebook)
+        if notebook["name"] in thresholds:
+            notebook["totaltime"] = math.ceil(thresholds[notebook["name"]]["upper"])
+            notebook["mintime"] = math.floor(thresholds[notebook["name"]]["lower"])
+        notebooks.append(notebook)
+    return {**notebook_config, "notebooks": notebooks}
+
+
+class ResultStore:
+    """
+    SQLite database of the results of past runs, keyed by notebook, user count,
+    platform URL and git revision. Every run is appended, and the results of a run can
+    be compared against a rolling baseline of the previous runs of the same notebooks
+    on the same platform with the same number of users
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started TEXT NOT NULL,
+            zeppelin_url TEXT NOT NULL,
+            usercount INTEGER NOT NULL,
+            revision TEXT NOT NULL,
+            notebook_config TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            run_id INTEGER NOT NULL REFERENCES runs (id),
+            notebook TEXT NOT NULL,
+            user INTEGER NOT NULL,
+            iteration INTEGER NOT NULL,
+            warmup INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            elapsed REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_key ON runs (zeppelin_url, usercount, id);
+        CREATE INDEX IF NOT EXISTS results_notebook ON results (notebook, run_id);
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        """Close the database"""
+        self.connection.close()
+
+    def record_run(
+        self,
+        results: list,
+        zeppelin_url: str,
+        usercount: int,
+        revision: str = "",
+        notebook_config: str = "",
+    ) -> int:
+        """
+        Append the results of a run, except the skipped notebooks, each with the
+        number of the user that ran it
+        Args:
+            results: The results, a list of Results per user or a single list of Results
+            zeppelin_url: The URL of the platform
+            usercount: Number of users
+            revision: The git revision of the benchmarks
+            notebook_config: The notebook configuration
+        Returns:
+            int: The ID of the run
+        """
+        if results and isinstance(results[0], Results):
+            results = [results]
+        with self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (started, zeppelin_url, usercount, revision, notebook_config)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    datetime.now().strftime(ISO_FORMAT),
+                    zeppelin_url.strip("/"),
+                    usercount,
+                    revision,
+                    notebook_config,
+                ),
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO results (run_id, notebook, user, iteration, warmup, status, elapsed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        result.name,
+                        result.user,
+                        result.iteration,
+                        result.warmup,
+                        str(result.result),
+                        result.time.elapsed,
+                    )
+                    for user_results in results
+                    for result in user_results
+                    if result.result != Status.SKIPPED
+                ],
+            )
+        return run_id
+
+    def samples(self, run_id: int) -> dict:
+        """
+        Get the measured (successful, not warm-up) elapsed times of each notebook of a run
+        Args:
+            run_id: The ID of the run
+        Returns:
+            dict: The elapsed times of each notebook
+        """
+        samples = {}
+        for notebook, elapsed in self.connection.execute(
+            "SELECT notebook, elapsed FROM results WHERE run_id = ? AND warmup = 0"
+            " AND status = ?",
+            (run_id, str(Status.SUCCESS)),
+        ):
+            samples.setdefault(notebook, []).append(elapsed)
+        return samples
+
+    def baseline(
+        self,
+        notebook: str,
+        zeppelin_url: str,
+        usercount: int,
+        before: Optional[int] = None,
+        window: int = 10,
+        revision: Optional[str] = None,
+    ) -> list:
+        """
+        Get the measured (successful, not warm-up) elapsed times of a notebook in
+        the previous runs
+        Args:
+            notebook: The name of the notebook
+            zeppelin_url: The URL of the platform
+            usercount: Number of users
+            before: Only use runs before this run ID, all the runs if None
+            window: Number of previous runs that ran the notebook successfully
+            revision: Only use runs of this git revision, any revision if None
+        Returns:
+            list: The elapsed times
+        """
+        query = (
+            "SELECT id FROM runs WHERE zeppelin_url = ? AND usercount = ? AND id < ?"
+            " AND id IN (SELECT run_id FROM results WHERE notebook = ? AND status = ?)"
+        )
+        params = [
+            zeppelin_url.strip("/"),
+            usercount,
+            sys.maxsize if before is None else before,
+            notebook,
+            str(Status.SUCCESS),
+        ]
+        if revision is not None:
+            query += " AND revision = ?"
+            params.append(revision)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(window)
+        return [
+            elapsed
+            for (elapsed,) in self.connection.execute(
+                "SELECT elapsed FROM results WHERE notebook = ? AND warmup = 0"
+                f" AND status = ? AND run_id IN ({query})",
+                [notebook, str(Status.SUCCESS)] + params,
+            )
+        ]
+
+    def thresholds(
+        self,
+        zeppelin_url: str,
+        usercount: int,
+        window: int = 20,
+        width: float = 3.0,
+        min_samples: int = 5,
+        min_spread: float = 0.05,
+    ) -> dict:
+        """
+        Learn the band of expected times of each notebook from the recent runs on a
+        platform with a number of users, as the median plus or minus a number of
+        (normal consistent) median absolute deviations
+        Args:
+            zeppelin_url: The URL of the platform
+            usercount: Number of users
+            window: Number of recent runs of each notebook to learn from
+            width: Number of median absolute deviations either side of the median
+            min_samples: Notebooks with fewer measured times are left out
+            min_spread: Minimum deviation, as a fraction of the median, so that
+                a notebook with steady times is not flagged for small changes
+        Returns:
+            dict: Median, MAD, lower and upper bound and sample count of each notebook
+        """
+        thresholds = {}
+        for (notebook,) in self.connection.execute(
+            "SELECT DISTINCT notebook FROM results WHERE run_id IN"
+            " (SELECT id FROM runs WHERE zeppelin_url = ? AND usercount = ?)",
+            (zeppelin_url.strip("/"), usercount),
+        ):
+            samples = self.baseline(notebook, zeppelin_url, usercount, window=window)
+            if len(samples) < min_samples:
+                continue
+            middle = median(samples)
+            mad = median(abs(sample - middle) for sample in samples)
+            spread = width * max(1.4826 * mad, min_spread * middle)
+            thresholds[notebook] = {
+                "median": middle,
+                "mad": mad,
+                "lower": max(middle - spread, 0.0),
+                "upper": middle + spread,
+                "samples": len(samples),
+            }
+        return thresholds
+
+    def compare(
+        self,
+        run_id: int,
+        window: int = 10,
+        alpha: float = 0.01,
+        min_change: float = 0.05,
+        revision: Optional[str] = None,
+    ) -> dict:
+        """
+        Compare the elapsed times of each notebook of a run with a rolling baseline of
+        the previous runs on the same platform with the same number of users. A notebook
+        has regressed when it is significantly slower than the baseline (one-sided
+        Mann-Whitney U test) and its median is slower by more than the minimum change
+        Args:
+            run_id: The ID of the run
+            window: Number of previous runs in the baseline
+            alpha: Significance level of the test
+            min_change: Minimum relative change of the median to flag as a regression
+            revision: Only use runs of this git revision in the baseline, any if None
+        Returns:
+            dict: Medians, relative change, p-value and whether it regressed, of each notebook
+        Raises:
+            InvalidConfigurationError: If there is no such run
+        """
+        run = self.connection.execute(
+            "SELECT zeppelin_url, usercount FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        if run is None:
+            raise InvalidConfigurationError(f"Unknown run: {run_id}")
+        comparison = {}
+        for notebook, sample in self.samples(run_id).items():
+            baseline = self.baseline(notebook, *run, run_id, window, revision)
+            entry = {
+                "samples": len(sample),
+                "baseline_samples": len(baseline),
+                "median": median(sample),
+                "baseline_median": None,
+                "change": None,
+                "p_value": None,
+                "regression": False,
+            }
+            if baseline:
+                entry["baseline_median"] = median(baseline)
+                entry["p_value"] = mann_whitney_u(sample, baseline)[1]
+                if entry["baseline_median"] > 0:
+                    entry["change"] = entry["median"] / entry["baseline_median"] - 1
+                entry["regression"] = (
+                    entry["p_value"] < alpha
+                    and entry["change"] is not None
+                    and entry["change"] > min_change
+                )
+            comparison[notebook] = entry
+        return comparison
@@ -0,0 +1,69 @@
+"""
+Time and memory of parsing the notebooks printed by zdairi, on the bundled public examples
+
+Run with: python -m tests.bench_print_output [repeat]
+"""
+import codecs
+import glob
+import os
+import sys
+import time
+import tracemalloc
+import simplejson as json
+from gdmp_benchmark.gdmp_benchmark import NOTEBOOK_RESULT_FIELDS, parse_json_fields, parse_notebook_output, \
+    parse_paragraph_timings
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notebooks", "public_examples")
+
+
+def load_printed():
+    """Load the bundled public examples, as printed by zdairi, by name"""
+    printed = {}
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.json"))):
+        with open(path, "rb") as note_file:
+            printed[os.path.basename(path)] = note_file.read().removeprefix(codecs.BOM_UTF8)
+    return printed
+
+
+def legacy(output):
+    """The previous parse, decoding the whole output and joining its lines"""
+    json_notebook = json.loads("".join(output.decode().split("\n")), strict=False)
+    return parse_notebook_output(json_notebook), parse_paragraph_timings(json_notebook)
+
+
+def selected(output):
+    """Parse only the fields used by the results"""
+    json_notebook = parse_json_fields(output, NOTEBOOK_RESULT_FIELDS)
+    return parse_notebook_output(json_notebook), parse_paragraph_timings(json_notebook)
+
+
+def measure(function, output, repeat):
+    """Best time of the function parsing the output over the repeats, and its peak memory"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(output)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(output)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(repeat=20):
+    """Print the time and peak memory of each parse of each notebook, in ms and MB"""
+    print(f"{'notebook':>40} {'MB':>6} {'legacy ms':>10} {'selected ms':>12} {'legacy MB':>10} {'selected MB':>12}")
+    totals = [0, 0, 0, 0, 0]
+    for name, output in load_printed().items():
+        assert str(legacy(output)) == str(selected(output))
+        row = [len(output) / 1e6]
+        times, peaks = zip(*(measure(function, output, repeat) for function in (legacy, selected)))
+        row += [elapsed * 1e3 for elapsed in times] + [peak / 1e6 for peak in peaks]
+        totals = [total + value for total, value in zip(totals, row)]
+        print(f"{name[:40]:>40} {row[0]:6.2f} {row[1]:10.2f} {row[2]:12.2f} {row[3]:10.2f} {row[4]:12.2f}")
+    print(f"{'total':>40} {totals[0]:6.2f} {totals[1]:10.2f} {totals[2]:12.2f} {totals[3]:10.2f} {totals[4]:12.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
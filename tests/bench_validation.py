@@ -0,0 +1,79 @@
+"""
+Throughput of the output validators on the outputs of the bundled notebooks
+
+Run with: python -m tests.bench_validation [repeat]
+"""
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from gdmp_benchmark.gdmp_benchmark import make_validators, validate_output, NumberValidator
+
+NOTEBOOKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notebooks")
+
+
+def load_outputs():
+    """Load the output of each paragraph of the bundled notebooks"""
+    outputs = []
+    for path in sorted(glob.glob(os.path.join(NOTEBOOKS, "**", "*.json"), recursive=True)):
+        with open(path, encoding="utf-8-sig") as note_file:
+            note = json.load(note_file)
+        for paragraph in note.get("paragraphs", []):
+            for msg in paragraph.get("results", {}).get("msg", []):
+                outputs.append(msg.get("data", ""))
+    return outputs
+
+
+def first_number(output):
+    """The first numbers of an output, as expected by a number validator"""
+    match = NumberValidator.NUMBER.search(output)
+    return [float(match.group())] if match else []
+
+
+def legacy(outputs, expected):
+    """The previous validation, the md5 digest of each cell compared to a dictionary"""
+    for i, cell in enumerate(outputs):
+        if hashlib.md5(str(cell).encode("utf-8")).hexdigest() != expected.get(str(i)):
+            return False
+    return True
+
+
+def measure(function, repeat):
+    """Best time of the function over the repeats"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(repeat=20):
+    """Print the throughput of each validator in MB/s"""
+    outputs = load_outputs()
+    size = sum(len(output.encode("utf-8")) for output in outputs) / 1e6
+    strategies = {
+        "legacy md5": {str(i): hashlib.md5(output.encode("utf-8")).hexdigest() for i, output in enumerate(outputs)},
+        "md5": [hashlib.md5(output.encode("utf-8")).hexdigest() for output in outputs],
+        "blake2b": [{"type": "hash", "algorithm": "blake2b",
+                     "digest": hashlib.blake2b(output.encode("utf-8")).hexdigest()} for output in outputs],
+        "exact": [{"type": "exact", "value": output} for output in outputs],
+        "regex": [{"type": "regex", "pattern": "^"} for _ in outputs],
+        "number": [{"type": "number", "value": first_number(output), "tolerance": 0.01} for output in outputs],
+    }
+    print(f"{len(outputs)} outputs, {size:.2f} MB")
+    for name, expected in strategies.items():
+        if name == "legacy md5":
+            assert legacy(outputs, expected)
+            elapsed = measure(lambda expected=expected: legacy(outputs, expected), repeat)
+        else:
+            validators = make_validators(expected)
+            assert not validate_output(outputs, validators)
+            elapsed = measure(lambda validators=validators: validate_output(outputs, validators), repeat)
+        print(f"{name:>12}: {size / elapsed:10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,169 @@
+"""
+Tests for sharing a pool of credentials between more users than there are credentials
+"""
+import asyncio
+import glob
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from gdmp_benchmark import Results, Timing, Status
+from gdmp_benchmark.gdmp_benchmark import ZeppelinRestNotebookHandler, CredentialPool, CredentialContention, \
+    ArrivalProfile, InvalidConfigurationError, build_parser, parse_credential_pool
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+
+def make_result(name, start, elapsed, lease_wait=0.0, status=Status.SUCCESS):
+    """Create the Results of a notebook run with a shared credential, starting this many seconds into the run"""
+    started = datetime(2026, 1, 1).timestamp() + start
+    return Results(result=status, msg="", output=[], notebookid="", user_config="", messages=[],
+                   credential={"name": name, "lease_wait": lease_wait},
+                   time=Timing(result=Status.PASS, totaltime=5,
+                               start=datetime.fromtimestamp(started).isoformat(),
+                               finish=datetime.fromtimestamp(started + elapsed).isoformat(), elapsed=elapsed))
+
+
+class TestCredentialPool(unittest.TestCase):
+
+    #  Tests that users are assigned the credentials in turn.
+    def test_round_robin(self):
+        pool = CredentialPool()
+        pool.start(2)
+        self.assertEqual([pool.assign(user) for user in range(1, 6)], [1, 2, 1, 2, 1])
+        with pool.lease(3) as lease:
+            self.assertEqual(lease, (1, 0.0))
+        with self.assertRaises(InvalidConfigurationError):
+            pool.start(0)
+        for mode, sessions in (("random", 1), ("leased", 0)):
+            with self.assertRaises(InvalidConfigurationError):
+                CredentialPool(mode, sessions)
+
+    #  Tests that a leased credential is only leased again once it is released.
+    def test_lease(self):
+        pool = CredentialPool("leased", sessions_per_credential=2)
+        pool.start(1)
+        with pool.lease(1) as first, pool.lease(2) as second:
+            self.assertEqual((first[0], second[0]), (1, 1))
+
+            async def third():
+                async with pool.lease_async(3) as lease:
+                    return lease
+
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(third(), 0.2))
+        credential, waited = asyncio.run(third())
+        self.assertEqual((credential, waited < 0.1), (1, True))
+
+    #  Tests that the credentials are parsed from the command line.
+    def test_parse_credential_pool(self):
+        required = ["--zeppelin_url", "http://zeppelin:8080", "--usercount", "8", "--notebook_config",
+                    "notebooks.json", "--user_config", "users.json"]
+        parser = build_parser()
+        self.assertIsNone(parse_credential_pool(parser.parse_args(required)))
+        pool = parse_credential_pool(parser.parse_args(required + ["--credential_mode", "leased",
+                                                                   "--sessions_per_credential", "3"]))
+        self.assertEqual(pool.to_dict(), {"mode": "leased", "sessions_per_credential": 3})
+
+
+class TestCredentialContention(unittest.TestCase):
+
+    #  Tests that the contention of each credential is summarised across its users.
+    def test_contention(self):
+        contention = CredentialContention()
+        contention.add(1, make_result("alice", 0, 2))
+        contention.add(2, make_result("alice", 1, 4, lease_wait=1.0, status=Status.FAIL))
+        contention.add(2, make_result("alice", 6, 2, lease_wait=1.0))
+        contention.add(3, make_result("bob", 0, 1))
+        contention.add(3, make_result("bob", 1, 0, status=Status.SKIPPED))
+        summary = contention.to_dict()
+        self.assertEqual(list(summary), ["alice", "bob"])
+        alice = summary["alice"]
+        self.assertEqual((alice["users"], alice["executions"], alice["peak_concurrent"], alice["errors"]), (2, 3, 2, 1))
+        self.assertEqual((alice["lease_wait_mean"], alice["lease_wait_max"]), (0.5, 1.0))
+        self.assertAlmostEqual(alice["latency_mean"], 8 / 3, places=5)
+        self.assertEqual(summary["bob"]["executions"], 1)
+
+
+class TestSharedCredentials(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def make_benchmarker(self, credentials):
+        note = write_note(self.tmpdir.name, ["%sh sleep 0.2"])
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, credentials, {"note": note})
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest")
+        return benchmarker, notebook_config
+
+    #  Tests that more users than credentials share them in turn, each with its own session and notebook folder.
+    def test_round_robin(self):
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        with self.assertRaises(ValueError):
+            benchmarker.run(usercount=5, notebook_config=notebook_config, runner="asyncio")
+        names = []
+        self.server.users.clear()
+        results = benchmarker.run(usercount=5, notebook_config=notebook_config, runner="asyncio",
+                                  credential_pool=CredentialPool(), on_result=lambda user, result: names.append(
+                                      (user, self.server.notes[result.notebookid]["name"])))
+        self.assertEqual(len(results), 5)
+        for user, user_results in enumerate(results, start=1):
+            self.assertEqual(user_results[0].result, Status.SUCCESS)
+            self.assertEqual(user_results[0].credential, {"name": f"user{(user - 1) % 2 + 1}", "lease_wait": 0.0})
+        self.assertEqual(sorted(self.server.users), ["user1", "user1", "user1", "user2", "user2"])
+        for user, name in names:
+            self.assertIn(f"/session{user}/", name)
+        contention = benchmarker.contention.to_dict()
+        self.assertEqual((contention["user1"]["users"], contention["user2"]["users"]), (3, 2))
+        self.assertEqual(contention["user1"]["peak_concurrent"], 3)
+        self.assertEqual(self.server.notes, {})
+        # The copies of the credentials are removed once each user is done
+        self.assertEqual(glob.glob(os.path.join(benchmarker.DEFAULT_DIR, "session*")), [])
+
+    #  Tests that users of the pool runner wait for a leased credential, one at a time.
+    def test_leased(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        start = time.perf_counter()
+        results = benchmarker.run(usercount=3, notebook_config=notebook_config,
+                                  credential_pool=CredentialPool("leased"))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.6)
+        self.assertTrue(all(user_results[0].result == Status.SUCCESS for user_results in results))
+        contention = benchmarker.contention.to_dict()["user1"]
+        self.assertEqual((contention["users"], contention["executions"], contention["peak_concurrent"]), (3, 3, 1))
+        self.assertGreaterEqual(contention["lease_wait_max"], 0.4)
+        self.assertEqual(self.server.notes, {})
+        self.assertEqual(glob.glob(os.path.join(benchmarker.DEFAULT_DIR, "session*")), [])
+
+    #  Tests that the copies of the credentials are only readable by their owner, in a private directory removed with the run.
+    def test_session_config_private(self):
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        modes = []
+        benchmarker.run(usercount=3, notebook_config=notebook_config, runner="asyncio", credential_pool=CredentialPool(),
+                        on_result=lambda user, result: modes.append((
+                            os.stat(os.path.dirname(result.user_config)).st_mode & 0o777,
+                            os.stat(result.user_config).st_mode & 0o777)))
+        self.assertEqual(modes, [(0o700, 0o600)] * 3)
+        self.assertIsNone(benchmarker._session_dir)  # pylint: disable=protected-access
+        self.assertEqual(glob.glob(os.path.join(benchmarker.DEFAULT_DIR, "gdmp-sessions-*")), [])
+
+    #  Tests that a single user sharing a credential runs as user 1, and that open-loop tests cannot lease.
+    def test_single_user(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config, credential_pool=CredentialPool())
+        self.assertEqual(results[0].credential["name"], "user1")
+        self.assertIn("session1-user1.yml", results[0].user_config)
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, credential_pool=CredentialPool("leased"),
+                            arrival_profile=ArrivalProfile())
+
+
+if __name__ == '__main__':
+    unittest.main()
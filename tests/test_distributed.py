@@ -0,0 +1,267 @@
+"""
+Tests for distributed runs, with a coordinator and local agents
+"""
+import os
+import sys
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from unittest import mock
+from gdmp_benchmark import Results, Timing, Status
+from gdmp_benchmark.gdmp_benchmark import ZeppelinRestNotebookHandler, ParagraphTiming, Agent, Coordinator, \
+    InvalidConfigurationError, LoadProfile, parse_address, shift_result, parse_coordinator, build_parser
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+AUTHKEY = b"secret"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestCoordinator(unittest.TestCase):
+
+    #  Tests that users are assigned to the agents in turn.
+    def test_partition(self):
+        self.assertEqual(Coordinator.partition(5, 2), [[1, 3, 5], [2, 4]])
+        self.assertEqual(Coordinator.partition(1, 3), [[1], [], []])
+        with self.assertRaises(InvalidConfigurationError):
+            Coordinator([], AUTHKEY)
+
+    #  Tests that agent addresses are parsed, and invalid ones rejected.
+    def test_parse_address(self):
+        self.assertEqual(parse_address("load1.example.org:7077"), ("load1.example.org", 7077))
+        for invalid in ("load1", ":7077", "load1:port"):
+            with self.assertRaises(InvalidConfigurationError):
+                parse_address(invalid)
+
+    #  Tests that a distributed run from the command line needs the key of the agents.
+    def test_parse_coordinator(self):
+        required = ["--zeppelin_url", "http://zeppelin:8080", "--usercount", "2", "--notebook_config", "notebooks.json",
+                    "--user_config", "users.json", "--agent_authkey", ""]
+        parser = build_parser()
+        self.assertIsNone(parse_coordinator(parser.parse_args(required)))
+        with self.assertRaises(InvalidConfigurationError):
+            parse_coordinator(parser.parse_args(required + ["--agent", "load1:7077"]))
+        coordinator = parse_coordinator(parser.parse_args(required + ["--agent", "load1:7077", "--agent", "load2:7077",
+                                                                      "--agent_authkey", "key"]))
+        self.assertEqual(coordinator.agents, [("load1", 7077), ("load2", 7077)])
+        self.assertEqual(coordinator.authkey, b"key")
+
+    #  Tests that timestamps recorded by an agent are moved to the clock of the coordinator.
+    def test_shift_result(self):
+        result = Results(result=Status.SUCCESS, msg="", output=[], notebookid="", user_config="", messages=[],
+                         time=Timing(result=Status.PASS, totaltime=5, start="2026-01-01T00:00:10.000000",
+                                     finish="2026-01-01T00:00:15.500000", elapsed=5.5),
+                         paragraphs=[ParagraphTiming(paragraphid="a", title="", status="SUCCESS",
+                                                     start="2026-01-01T00:00:11.000000", finish="", duration=1.0)])
+        shift_result(result, 10.5)
+        self.assertEqual(result.time.start, "2025-12-31T23:59:59.500000")
+        self.assertEqual(result.time.finish, "2026-01-01T00:00:05.000000")
+        self.assertEqual(result.paragraphs[0].start, "2026-01-01T00:00:00.500000")
+        self.assertEqual(result.paragraphs[0].finish, "")
+        self.assertEqual(result.time.elapsed, 5.5)
+
+    #  Tests that the clock offset of an agent is estimated from the exchange with the shortest round trip.
+    def test_clock_offset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            agent = Agent(("127.0.0.1", 0), AUTHKEY, directory)
+            agent.clock = lambda: time.time() + 100
+            server = threading.Thread(target=agent.serve, args=(1,))
+            server.start()
+            with Client(agent.address, authkey=AUTHKEY) as conn:
+                offset, rtt = Coordinator([agent.address], AUTHKEY).clock_offset(conn)
+                conn.send(("close",))
+            server.join()
+            agent.close()
+        self.assertAlmostEqual(offset, 100, delta=0.05)
+        self.assertLess(rtt, 0.05)
+
+    #  Tests that an agent rejects coordinators without its key, and keeps serving.
+    def test_wrong_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            agent = Agent(("127.0.0.1", 0), AUTHKEY, directory)
+            server = threading.Thread(target=agent.serve, args=(1,))
+            server.start()
+            with self.assertRaises(AuthenticationError):
+                Client(agent.address, authkey=b"wrong")
+            with Client(agent.address, authkey=AUTHKEY) as conn:
+                conn.send(("close",))
+            server.join(timeout=10)
+            agent.close()
+        self.assertFalse(server.is_alive())
+
+
+class TestDistributedRun(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def start_agents(self, count, directory=None):
+        """Start local agents with the command line, each serving one run, returning their addresses"""
+        addresses = []
+        for _ in range(count):
+            process = subprocess.Popen(
+                [sys.executable, "-m", "gdmp_benchmark.agent", "--listen", "127.0.0.1:0",
+                 "--sessions", "1", "--directory", directory or self.tmpdir.name],
+                cwd=ROOT, stdout=subprocess.PIPE, text=True,
+                env=dict(os.environ, GDMP_AGENT_AUTHKEY=AUTHKEY.decode()))
+            self.processes.append(process)
+            addresses.append(parse_address(process.stdout.readline().split()[-1]))
+        return addresses
+
+    def serve(self, agent):
+        """Serve one run with an agent of this process, returning its address"""
+        thread = threading.Thread(target=agent.serve, args=(1,), daemon=True)
+        thread.start()
+        self.addCleanup(agent.close)
+        self.addCleanup(thread.join, 30)
+        return agent.address
+
+    def make_benchmarker(self, usercount):
+        notes = {"first": write_note(self.tmpdir.name, ["%md hello", "%sh sleep 0.2"], name="first"),
+                 "second": write_note(self.tmpdir.name, ["%md world"], name="second")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, usercount, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest")
+        return benchmarker, notebook_config
+
+    #  Tests that the users are run by the agents, with their results streamed back and merged in user order.
+    def test_distributed_run(self):
+        coordinator = Coordinator(self.start_agents(2), AUTHKEY)
+        benchmarker, notebook_config = self.make_benchmarker(3)
+        streamed = []
+        before = datetime.now()
+        results = benchmarker.run(usercount=3, notebook_config=notebook_config, coordinator=coordinator,
+                                  on_result=lambda user, result: streamed.append((user, result.name)))
+        after = datetime.now()
+        self.assertEqual(len(results), 3)
+        for user, user_results in enumerate(results, start=1):
+            self.assertEqual([result.name for result in user_results], ["first", "second"])
+            for result in user_results:
+                self.assertEqual(result.result, Status.SUCCESS)
+                self.assertTrue(result.user_config.endswith(f"user{user}.yml"))
+                self.assertTrue(before <= datetime.fromisoformat(result.time.start) <= after)
+        self.assertEqual(sorted(streamed), [(user, name) for user in (1, 2, 3) for name in ("first", "second")])
+        self.assertEqual(benchmarker.summarise()["first"]["count"], 3)
+        agents = coordinator.to_dict()
+        self.assertEqual(sorted(agent["users"] for agent in agents.values()), [[1, 3], [2]])
+        self.assertEqual(self.server.notes, {})
+        self.assertEqual({user: deletion["notebooks"] for user, deletion in benchmarker.deletion.items()},
+                         {1: 2, 2: 2, 3: 2})
+
+    #  Tests that all the agents start their users at the same time, after all of them are ready.
+    def test_synchronised_start(self):
+        coordinator = Coordinator(self.start_agents(2), AUTHKEY)
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        results = benchmarker.run(usercount=2, notebook_config=notebook_config, coordinator=coordinator,
+                                  runner="asyncio")
+        starts = [datetime.fromisoformat(user_results[0].time.start) for user_results in results]
+        self.assertLess(abs((starts[0] - starts[1]).total_seconds()), 0.5)
+
+    #  Tests that the agents schedule their users with the load profile of the run.
+    def test_load_profile(self):
+        coordinator = Coordinator(self.start_agents(2), AUTHKEY)
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        profile = LoadProfile(stages=[[1.0, 2], [0.5, 2]])
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config, coordinator=coordinator,
+                                  load_profile=profile, runner="asyncio")
+        self.assertEqual(sorted(agent["users"] for agent in coordinator.to_dict().values()), [[1], [2]])
+        starts = [datetime.fromisoformat(user_results[0].time.start) for user_results in results]
+        self.assertGreater((starts[1] - starts[0]).total_seconds(), 0.3)
+
+    #  Tests that the agents remove the configurations of their runs, which hold the passwords of the users.
+    def test_configurations_removed(self):
+        directory = os.path.join(self.tmpdir.name, "agents")
+        os.makedirs(directory)
+        coordinator = Coordinator(self.start_agents(2, directory=directory), AUTHKEY)
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        benchmarker.run(usercount=2, notebook_config=notebook_config, coordinator=coordinator)
+        for process in self.processes:
+            self.assertEqual(process.wait(timeout=30), 0)
+        self.assertEqual(os.listdir(directory), [])
+        agent = Agent(("127.0.0.1", 0), AUTHKEY)
+        self.assertTrue(os.path.isdir(agent.directory))
+        agent.close()
+        self.assertFalse(os.path.exists(agent.directory))
+
+    #  Tests that an agent that cannot prepare its users fails the run.
+    def test_agent_error(self):
+        coordinator = Coordinator(self.start_agents(1, directory=self.tmpdir.name + "/missing"), AUTHKEY)
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, coordinator=coordinator)
+
+    #  Tests that an agent whose run fails with any exception fails the run, instead of leaving the coordinator waiting.
+    def test_agent_crash(self):
+        class CrashingAgent(Agent):
+            def prepare(self, assignment):
+                benchmarker, arguments = super().prepare(assignment)
+                benchmarker.run = mock.Mock(side_effect=KeyError("boom"))
+                return benchmarker, arguments
+
+        coordinator = Coordinator([self.serve(CrashingAgent(("127.0.0.1", 0), AUTHKEY, self.tmpdir.name))], AUTHKEY)
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        with self.assertRaisesRegex(InvalidConfigurationError, "KeyError"):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, coordinator=coordinator)
+
+    #  Tests that an agent that goes silent fails the run, while an agent with a long notebook keeps it alive.
+    def test_silent_agent(self):
+        listener = Listener(("127.0.0.1", 0), authkey=AUTHKEY)
+        self.addCleanup(listener.close)
+
+        def silent_agent():
+            with listener.accept() as conn:
+                for message in iter(conn.recv, ("close",)):
+                    if message[0] == "clock":
+                        conn.send(("clock", time.time()))
+                    elif message[0] == "run":
+                        conn.send(("ready",))
+
+        thread = threading.Thread(target=silent_agent, daemon=True)
+        thread.start()
+        coordinator = Coordinator([listener.address], AUTHKEY)
+        coordinator.SILENCE_TIMEOUT = 0.5
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        with self.assertRaisesRegex(InvalidConfigurationError, "silent"):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, coordinator=coordinator)
+        thread.join(30)
+
+        agent = Agent(("127.0.0.1", 0), AUTHKEY, self.tmpdir.name)
+        agent.HEARTBEAT = 0.1
+        coordinator = Coordinator([self.serve(agent)], AUTHKEY)
+        coordinator.SILENCE_TIMEOUT = 0.5
+        note = write_note(self.tmpdir.name, ["%sh sleep 1.5"], name="long")
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 1, {"long": note})
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest")
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config, coordinator=coordinator)
+        self.assertEqual(results[0].result, Status.SUCCESS)
+
+    #  Tests that open-loop tests cannot be distributed.
+    def test_open_loop_rejected(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, coordinator=Coordinator([("a", 1)], AUTHKEY),
+                            arrival_profile=object())
+
+
+if __name__ == '__main__':
+    unittest.main()
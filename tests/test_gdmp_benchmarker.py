@@ -1,5 +1,11 @@
+import io
+import functools
+import json
+import time
+import threading
 import unittest
 from gdmp_benchmark import GDMPBenchmarker, Results, Timing, Notebook, Status
+from gdmp_benchmark.gdmp_benchmark import NDJSONResultWriter, InvalidConfigurationError
 
 """
 The GDMPBenchmarker class is responsible for benchmarking Zeppelin notebooks. It allows users to run notebooks and compare their output against expected output. The class can run notebooks in parallel, and it can delete the notebooks after they have been run. The class also generates user configurations for Zeppelin, and it can validate the configuration passed in by the user.
@@ -38,7 +44,7 @@ class TestGDMPBenchmarker(unittest.TestCase):
         result = Results(result=Status.PASS, msg="", output=["expected_output"], time=Timing(result=Status.FAST, totaltime=9, start="", finish=""), notebookid="", user_config="", messages=[])
         # create a mock GDMPBenchmarker object
         benchmarker = GDMPBenchmarker()
-        benchmarker.run_notebook = lambda x, y, z: result
+        benchmarker.run_notebook = lambda x, y, z, **kwargs: result
         # run the test
         actual_result = benchmarker._run_single(notebooks=[notebook])
         # assert that the actual result matches the expected result
@@ -55,7 +61,7 @@ class TestGDMPBenchmarker(unittest.TestCase):
         result2 = Results(result=Status.PASS, msg="", output=["expected_output2"], time=Timing(result=Status.FAST, totaltime=4, start="", finish=""), notebookid="", user_config="", messages=[])
         # create a mock GDMPBenchmarker object
         benchmarker = GDMPBenchmarker()
-        benchmarker.run_notebook = lambda x, y, z: result1 if x == "test_filepath1" else result2
+        benchmarker.run_notebook = lambda x, y, z, **kwargs: result1 if x == "test_filepath1" else result2
         # run the test
         actual_result = benchmarker._run_single(notebooks=[notebook1, notebook2])
         # assert that the actual result matches the expected result
@@ -70,7 +76,7 @@ class TestGDMPBenchmarker(unittest.TestCase):
         result = Results(result=Status.PASS, msg="", output=["actual_output"], time=Timing(result=Status.FAST, totaltime=9, start="", finish=""), notebookid="", user_config="", messages=[])
         # create a mock GDMPBenchmarker object
         benchmarker = GDMPBenchmarker()
-        benchmarker.run_notebook = lambda x, y, z: result
+        benchmarker.run_notebook = lambda x, y, z, **kwargs: result
         # run the test
         actual_result = benchmarker._run_single(notebooks=[notebook])
         # assert that the actual result matches the expected result
@@ -85,13 +91,156 @@ class TestGDMPBenchmarker(unittest.TestCase):
         result = Results(result=Status.PASS, msg="", output=["expected_output"], time=Timing(result=Status.FAST, totaltime=9, start="", finish=""), notebookid="", user_config="", messages=[])
         # create a mock GDMPBenchmarker object
         benchmarker = GDMPBenchmarker()
-        benchmarker.run_notebook = lambda x, y, z: result
+        benchmarker.run_notebook = lambda x, y, z, **kwargs: result
         # run the test
         actual_result = benchmarker._run_single(notebooks=[notebook])
         # assert that the actual result matches the expected result
         expected_result = [result]
         self.assertEqual(actual_result, expected_result)
 
+    #  Tests that times are classified against the expected band of the notebook.
+    def test_process_result_band(self):
+        notebook = Notebook(name="test_notebook", filepath="test_filepath", totaltime=10, results=[], mintime=8)
+        benchmarker = GDMPBenchmarker()
+        verdicts = []
+        for elapsed in (7.5, 9.0, 10.5):
+            result = Results(result=Status.SUCCESS, msg="", output=[], notebookid="", user_config="", messages=[],
+                             time=Timing(result=Status.PASS, totaltime=int(elapsed), start="", finish="",
+                                         elapsed=elapsed))
+            verdicts.append(benchmarker._process_result(notebook, result).time.result)
+        self.assertEqual(verdicts, [Status.ERROR, Status.FAST, Status.SLOW])
+
+    #  Tests that each result is published as soon as its notebook completes.
+    def test_run_single_publishes_results(self):
+        notebook1 = Notebook(name="test_notebook1", filepath="test_filepath1", totaltime=10, results=[])
+        notebook2 = Notebook(name="test_notebook2", filepath="test_filepath2", totaltime=5, results=[])
+        published = []
+        benchmarker = GDMPBenchmarker()
+
+        def run_notebook(filepath, name, concurrent, **kwargs):
+            # The previous notebook must have been published before the next one runs
+            self.assertEqual(len(published), 0 if filepath == "test_filepath1" else 1)
+            return Results(result=Status.PASS, msg="", output=[], notebookid="", user_config="", messages=[],
+                           time=Timing(result=Status.FAST, totaltime=4, start="", finish=""))
+
+        benchmarker.run_notebook = run_notebook
+        benchmarker._on_result = lambda user, result: published.append((user, result.name))
+        benchmarker._run_single(notebooks=[notebook1, notebook2])
+        self.assertEqual(published, [(0, "test_notebook1"), (0, "test_notebook2")])
+
+    #  Tests that the notebooks are repeated after the warm-up runs, which are tagged.
+    def test_run_single_repetitions(self):
+        notebook1 = Notebook(name="test_notebook1", filepath="test_filepath1", totaltime=10, results=[])
+        notebook2 = Notebook(name="test_notebook2", filepath="test_filepath2", totaltime=5, results=[])
+        benchmarker = GDMPBenchmarker()
+        benchmarker.run_notebook = lambda x, y, z, **kwargs: Results(
+            result=Status.PASS, msg="", output=[], notebookid="", user_config="", messages=[],
+            time=Timing(result=Status.FAST, totaltime=4, start="", finish=""))
+        results = benchmarker._run_single(notebooks=[notebook1, notebook2], warmup=1, iterations=2)
+        self.assertEqual([(result.name, result.iteration, result.warmup) for result in results],
+                         [("test_notebook1", 0, True), ("test_notebook2", 0, True),
+                          ("test_notebook1", 1, False), ("test_notebook2", 1, False),
+                          ("test_notebook1", 2, False), ("test_notebook2", 2, False)])
+
+    #  Tests that independent notebooks run concurrently, once the notebooks they depend on have completed.
+    def test_run_single_dependencies(self):
+        notebooks = [Notebook(name="SetUp", filepath="setup", totaltime=10, results=[]),
+                     Notebook(name="first", filepath="first", totaltime=10, results=[], depends_on=["SetUp"]),
+                     Notebook(name="second", filepath="second", totaltime=10, results=[], depends_on=["SetUp"]),
+                     Notebook(name="third", filepath="third", totaltime=10, results=[], depends_on=["SetUp"]),
+                     Notebook(name="last", filepath="last", totaltime=10, results=[], depends_on=["first"])]
+        events = []
+        lock = threading.Lock()
+        benchmarker = GDMPBenchmarker()
+
+        def run_notebook(filepath, name, concurrent, **kwargs):
+            with lock:
+                events.append(("start", filepath))
+            time.sleep(0.1)
+            with lock:
+                events.append(("end", filepath))
+            return Results(result=Status.PASS, msg="", output=[], notebookid="", user_config="", messages=[],
+                           time=Timing(result=Status.FAST, totaltime=4, start="", finish=""))
+
+        benchmarker.run_notebook = run_notebook
+        results = benchmarker._run_single(notebooks=notebooks, notebook_concurrency=2)
+        self.assertEqual([result.name for result in results], ["SetUp", "first", "second", "third", "last"])
+        self.assertEqual(events[:3], [("start", "setup"), ("end", "setup"), ("start", "first")])
+        self.assertEqual(events[3], ("start", "second"))
+        self.assertLess(events.index(("end", "first")), events.index(("start", "last")))
+        self.assertLess(min(events.index(("end", "first")), events.index(("end", "second"))),
+                        events.index(("start", "third")))
+        running = max_running = 0
+        for event, _ in events:
+            running += 1 if event == "start" else -1
+            max_running = max(running, max_running)
+        self.assertEqual(max_running, 2)
+
+    #  Tests that the results of notebooks running in several threads are recorded one at a time.
+    def test_run_single_record_results(self):
+        notebooks = [Notebook(name=f"note{i}", filepath=f"note{i}", totaltime=10, results=[]) for i in range(8)]
+        recording = threading.Lock()
+        recorded = []
+        benchmarker = GDMPBenchmarker()
+
+        def run_notebook(filepath, name, concurrent, **kwargs):
+            return Results(result=Status.SUCCESS, msg="", output=[], notebookid="", user_config="", messages=[],
+                           time=Timing(result=Status.FAST, totaltime=4, start="", finish="", elapsed=1))
+
+        def on_result(user, result):
+            self.assertTrue(recording.acquire(blocking=False))
+            time.sleep(0.02)
+            recorded.append(result)
+            recording.release()
+
+        benchmarker.run_notebook = run_notebook
+        benchmarker._on_result = functools.partial(benchmarker._record_result, on_result=on_result)
+        benchmarker._run_single(notebooks=notebooks, notebook_concurrency=4)
+        self.assertEqual(len(recorded), 8)
+        self.assertEqual(sum(summary["count"] for summary in benchmarker.summarise().values()), 8)
+
+    #  Tests that unknown and circular dependencies are rejected.
+    def test_invalid_dependencies(self):
+        with self.assertRaises(InvalidConfigurationError):
+            GDMPBenchmarker._dependencies([Notebook(name="a", filepath="a", totaltime=1, results=[],
+                                                    depends_on=["b"])])
+        with self.assertRaises(InvalidConfigurationError):
+            GDMPBenchmarker._dependencies([
+                Notebook(name="a", filepath="a", totaltime=1, results=[], depends_on=["b"]),
+                Notebook(name="b", filepath="b", totaltime=1, results=[], depends_on=["a"])])
+        self.assertEqual(GDMPBenchmarker._dependencies([
+            Notebook(name="a", filepath="a", totaltime=1, results=[]),
+            Notebook(name="b", filepath="b", totaltime=1, results=[], depends_on=["a"])]), [set(), {0}])
+
+    #  Tests that measured runs are repeated for a duration, at least once.
+    def test_repetitions_duration(self):
+        self.assertEqual(list(GDMPBenchmarker._repetitions(2, 1)), [(0, True), (1, True), (2, False)])
+        self.assertEqual(list(GDMPBenchmarker._repetitions(0, 5, 1e-9)), [(0, False)])
+        repetitions = GDMPBenchmarker._repetitions(0, 1, 0.05)
+        self.assertEqual([next(repetitions), next(repetitions)], [(0, False), (1, False)])
+        time.sleep(0.05)
+        self.assertEqual(list(repetitions), [])
+
+
+class TestNDJSONResultWriter(unittest.TestCase):
+
+    #  Tests that results are written as one JSON record per line, followed by a summary.
+    def test_write_records(self):
+        stream = io.StringIO()
+        writer = NDJSONResultWriter(stream)
+        for status in (Status.SUCCESS, Status.ERROR, Status.SUCCESS):
+            writer(2, Results(result=status, msg="", output=[], notebookid="", user_config="", messages=[],
+                              time=Timing(result=Status.FAST, totaltime=4, start="", finish=""), name="note"))
+        writer.write_summary()
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([record["type"] for record in records], ["result"] * 3 + ["summary"])
+        self.assertEqual(records[0]["user"], 2)
+        self.assertEqual(records[0]["name"], "note")
+        self.assertEqual(records[1]["result"], "ERROR")
+        self.assertEqual(records[3]["notebooks"], 3)
+        self.assertEqual(records[3]["results"], {"SUCCESS": 2, "ERROR": 1})
+        self.assertEqual(records[3]["times"], {"FAST": 3})
+
 
 if __name__ == '__main__':
     unittest.main()
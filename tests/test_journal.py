@@ -0,0 +1,215 @@
+"""
+Tests for the journal of a run, resuming an interrupted run and deleting the notebooks it left behind
+"""
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from gdmp_benchmark import Results, Timing, Status
+from gdmp_benchmark.gdmp_benchmark import ZeppelinRestNotebookHandler, RunJournal, ParagraphTiming, \
+    ArrivalProfile, Coordinator, InvalidConfigurationError, build_parser, parse_journal, cleanup_main, \
+    main
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+HEADER = {"zeppelin_url": "http://zeppelin:8080", "usercount": 2}
+
+
+def make_result():
+    """Create the Results of a notebook run"""
+    return Results(result=Status.SUCCESS, msg="", output=["1"], notebookid="2ABC", user_config="user1.yml",
+                   messages=[], name="note", iteration=1,
+                   time=Timing(result=Status.FAST, totaltime=2, start="2026-01-01T00:00:00.000000",
+                               finish="2026-01-01T00:00:02.500000", expected=10, elapsed=2.5, phases={"execute": 2.4}),
+                   paragraphs=[ParagraphTiming(paragraphid="a", title="", status="FINISHED",
+                                               start="2026-01-01T00:00:00.100000", finish="", duration=2.3)])
+
+
+class TestRunJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "journal.ndjson")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    #  Tests that a resumed journal loads the completed notebooks, ignoring a partly written last line.
+    def test_resume(self):
+        journal = RunJournal(self.path)
+        journal.open(HEADER)
+        journal.notebook_created(1, "2ABC", "user1.yml")
+        journal.notebook_created(2, "2DEF", "user2.yml")
+        journal.result(1, 0, make_result())
+        journal.notebook_deleted("2ABC")
+        with open(self.path, "a", encoding="utf-8") as partial:
+            partial.write('{"type": "result", "us')
+        resumed = RunJournal(self.path, resume=True)
+        resumed.open(HEADER)
+        self.assertEqual(list(resumed.completed), [(1, 1, 0)])
+        result = resumed.completed[(1, 1, 0)]
+        self.assertEqual(result.to_dict(), make_result().to_dict())
+        self.assertEqual(result.paragraphs[0].duration, 2.3)
+        records = RunJournal.read(self.path)
+        self.assertEqual([record["type"] for record in records], ["run", "created", "created", "result", "deleted",
+                                                                  "resume"])
+        self.assertEqual(RunJournal.created(records), {"2DEF": "user2.yml"})
+
+    #  Tests that a journal is not overwritten by another run, nor resumed by a run with other arguments.
+    def test_invalid(self):
+        with self.assertRaises(InvalidConfigurationError):
+            RunJournal(self.path, resume=True).open(HEADER)
+        RunJournal(self.path).open(HEADER)
+        with self.assertRaises(InvalidConfigurationError):
+            RunJournal(self.path).open(HEADER)
+        with self.assertRaises(InvalidConfigurationError):
+            RunJournal(self.path, resume=True).open(dict(HEADER, usercount=3))
+
+    #  Tests that the journal is parsed from the command line.
+    def test_parse_journal(self):
+        required = ["--zeppelin_url", "http://zeppelin:8080", "--usercount", "1", "--notebook_config",
+                    "notebooks.json", "--user_config", "users.json"]
+        parser = build_parser()
+        self.assertIsNone(parse_journal(parser.parse_args(required)))
+        with self.assertRaises(InvalidConfigurationError):
+            parse_journal(parser.parse_args(required + ["--resume"]))
+        journal = parse_journal(parser.parse_args(required + ["--journal", self.path, "--resume"]))
+        self.assertEqual((journal.path, journal.resume), (self.path, True))
+
+
+class TestJournaledRun(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "journal.ndjson")
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def make_benchmarker(self, usercount):
+        notes = {"first": write_note(self.tmpdir.name, ["%md hello"], name="first"),
+                 "second": write_note(self.tmpdir.name, ["%md world"], name="second")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, usercount, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest")
+        return benchmarker, notebook_config
+
+    def interrupt(self, completed):
+        """Truncate the journal after the given number of results, as if the run was interrupted"""
+        records = RunJournal.read(self.path)
+        kept = []
+        for record in records:
+            if record["type"] == "result":
+                if not completed:
+                    continue
+                completed -= 1
+            if record["type"] != "deleted":
+                kept.append(record)
+        with open(self.path, "w", encoding="utf-8") as journal:
+            journal.writelines(json.dumps(record) + "\n" for record in kept)
+
+    #  Tests that a resumed run deletes the notebooks left behind, and only runs the notebooks not completed.
+    def check_resume(self, runner):
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        first = benchmarker.run(usercount=2, notebook_config=notebook_config, runner=runner,
+                                journal=RunJournal(self.path))
+        self.assertEqual(self.server.notes, {})
+        self.interrupt(completed=3)
+        left_behind = set(RunJournal.created(RunJournal.read(self.path)))
+        self.assertEqual(len(left_behind), 4)
+        streamed = []
+        results = benchmarker.run(usercount=2, notebook_config=notebook_config, runner=runner,
+                                  journal=RunJournal(self.path, resume=True),
+                                  on_result=lambda user, result: streamed.append(result.notebookid))
+        self.assertEqual(len(streamed), 4)
+        resumed = [result.notebookid for user_results in results for result in user_results]
+        previous = [result.notebookid for user_results in first for result in user_results]
+        self.assertEqual(len(set(resumed) & set(previous)), 3)
+        self.assertTrue(all(result.result == Status.SUCCESS for user_results in results for result in user_results))
+        self.assertEqual(self.server.notes, {})
+        self.assertEqual(RunJournal.created(RunJournal.read(self.path)), {})
+        self.assertEqual(sum(record["type"] == "result" for record in RunJournal.read(self.path)), 4)
+
+    #  Tests that the pool runner resumes an interrupted run.
+    def test_resume_pool(self):
+        self.check_resume("pool")
+
+    #  Tests that the asyncio runner resumes an interrupted run.
+    def test_resume_asyncio(self):
+        self.check_resume("asyncio")
+
+    #  Tests that the cleanup command deletes the notebooks a run failed to delete.
+    def test_cleanup(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        self.server.fail_delete = True
+        benchmarker.run(usercount=1, notebook_config=notebook_config, journal=RunJournal(self.path))
+        self.assertEqual(len(self.server.notes), 2)
+        self.assertEqual(len(RunJournal.created(RunJournal.read(self.path))), 2)
+        self.server.fail_delete = False
+        output = io.StringIO()
+        with redirect_stdout(output):
+            cleanup_main(["--journal", self.path, "--notebook_handler", "rest"])
+        self.assertEqual(len(json.loads(output.getvalue())["deleted"]), 2)
+        self.assertEqual(self.server.notes, {})
+        self.assertEqual(RunJournal.created(RunJournal.read(self.path)), {})
+
+    #  Tests that the notebooks of a run that keeps them are not deleted by the cleanup command, nor on resume.
+    def test_keep_notebooks(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        benchmarker.run(usercount=1, notebook_config=notebook_config, delete=False, journal=RunJournal(self.path))
+        self.assertFalse(RunJournal.read(self.path)[0]["delete"])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            cleanup_main(["--journal", self.path, "--notebook_handler", "rest"])
+        self.assertEqual(json.loads(output.getvalue())["deleted"], [])
+        self.interrupt(completed=1)
+        benchmarker.run(usercount=1, notebook_config=notebook_config, delete=False,
+                        journal=RunJournal(self.path, resume=True))
+        self.assertEqual(len(self.server.notes), 3)
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, journal=RunJournal(self.path, resume=True))
+
+    #  Tests that the CLI deletes the notebooks of a run by default, and keeps them with --no-delete.
+    def test_main_delete(self):
+        _, notebook_config = self.make_benchmarker(1)
+        for flags, delete, notes in (([], True, 0), (["--no-delete"], False, 2)):
+            with redirect_stdout(io.StringIO()):
+                main(["--zeppelin_url", self.server.url, "--usercount", "1", "--notebook_config", notebook_config,
+                      "--user_config", os.path.join(self.tmpdir.name, "users.json"), "--notebook_handler", "rest",
+                      "--results_db", os.path.join(self.tmpdir.name, "results.sqlite"), "--journal", self.path]
+                     + flags)
+            self.assertEqual(RunJournal.read(self.path)[0]["delete"], delete)
+            self.assertEqual(len(self.server.notes), notes)
+            os.remove(self.path)
+
+    #  Tests that the arrivals of an open-loop test are journaled apart from the notebooks of the configuration.
+    def test_open_loop(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config, journal=RunJournal(self.path),
+                                  arrival_profile=ArrivalProfile(rate=1200, duration=0.15))
+        records = RunJournal.read(self.path)
+        self.assertEqual(sorted(record["arrival"] for record in records if record["type"] == "arrival"), [0, 1, 2])
+        self.assertFalse(any(record["type"] == "result" for record in records))
+        self.assertEqual([result.arrival["scheduled"] for result in results], [0, 0.05, 0.1])
+        self.assertEqual(RunJournal.created(records), {})
+
+    #  Tests that distributed runs cannot be journaled, nor open-loop tests resumed.
+    def test_rejected(self):
+        benchmarker, notebook_config = self.make_benchmarker(1)
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, journal=RunJournal(self.path),
+                            coordinator=Coordinator([("a", 1)], b"secret"))
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(usercount=1, notebook_config=notebook_config, journal=RunJournal(self.path, resume=True),
+                            arrival_profile=ArrivalProfile())
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.sweep([1], notebook_config, journal=RunJournal(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
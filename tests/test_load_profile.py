@@ -0,0 +1,216 @@
+"""
+Tests for the load profiles and concurrency sweeps of closed-loop runs
+"""
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from gdmp_benchmark import GDMPBenchmarker, Results, Timing, Status
+from gdmp_benchmark.gdmp_benchmark import ZeppelinRestNotebookHandler, LoadProfile, LatencyStatistics, \
+    InvalidConfigurationError, ResultStore, build_parser, parse_load_profile, parse_sweep, learn_thresholds, main
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+REQUIRED = ["--zeppelin_url", "http://zeppelin:8080", "--notebook_config", "notebooks.json",
+            "--user_config", "users.json"]
+
+
+def make_result(start, elapsed, status=Status.SUCCESS):
+    """Create the Results of a notebook run starting this many seconds into the run"""
+    started = datetime(2026, 1, 1, 0, 0, 0).timestamp() + start
+    return Results(result=status, msg="", output=[], notebookid="", user_config="", messages=[], name="note",
+                   time=Timing(result=Status.PASS, totaltime=5,
+                               start=datetime.fromtimestamp(started).isoformat(),
+                               finish=datetime.fromtimestamp(started + elapsed).isoformat(), elapsed=elapsed))
+
+
+class TestLoadProfile(unittest.TestCase):
+
+    #  Tests that users join as the profile ramps up to them, and leave as it ramps down below them.
+    def test_schedule(self):
+        profile = LoadProfile(stages=[[600, 40], [1800, 40], [300, 0]], start_users=1)
+        self.assertEqual((profile.peak, profile.duration), (40, 2700))
+        schedule = profile.schedule()
+        self.assertEqual(len(schedule), 40)
+        self.assertEqual(schedule[0], (0.0, 2692.5))
+        self.assertEqual(schedule[-1], (600.0, 2400.0))
+        self.assertAlmostEqual(schedule[20][0], 600 * 20 / 39)
+
+    #  Tests that users active at the end of the profile stay until its end.
+    def test_schedule_hold(self):
+        profile = LoadProfile(stages=[[10, 2], [0, 4], [10, 4]])
+        self.assertEqual(profile.schedule(), [(5.0, 20), (10.0, 20), (10.0, 20), (10.0, 20)])
+
+    #  Tests that profiles without users, or ramping up again after ramping down, are rejected.
+    def test_invalid(self):
+        for stages in ([], [[10, 0]], [[10, 2], [10, 1], [10, 3]], [[-10, 2]], [[10, -1]]):
+            with self.assertRaises(InvalidConfigurationError):
+                LoadProfile(stages=stages)
+
+    #  Tests that the load profile and the sweep are parsed from the command line.
+    def test_parse(self):
+        parser = build_parser()
+        args = parser.parse_args(REQUIRED + ["--usercount", "10"])
+        self.assertIsNone(parse_load_profile(args))
+        self.assertIsNone(parse_sweep(args))
+        args = parser.parse_args(REQUIRED + ["--usercount", "10", "--load_profile", "60:10,120:10,30:0",
+                                             "--load_start_users", "1", "--sweep"])
+        self.assertEqual(parse_load_profile(args), LoadProfile(stages=[[60, 10], [120, 10], [30, 0]], start_users=1))
+        self.assertEqual(parse_sweep(args), [1, 2, 4, 8, 10])
+        self.assertEqual(parse_sweep(parser.parse_args(REQUIRED + ["--usercount", "8", "--sweep"])), [1, 2, 4, 8])
+        self.assertEqual(parse_sweep(parser.parse_args(REQUIRED + ["--usercount", "1", "--sweep_usercounts", "3,1"])),
+                         [3, 1])
+
+    #  Tests that a sweep learns the thresholds of each of its numbers of users, and a load profile none.
+    def test_learn_thresholds(self):
+        with tempfile.TemporaryDirectory() as directory:
+            required = REQUIRED + ["--results_db", os.path.join(directory, "results.sqlite"), "--adaptive_thresholds"]
+            with ResultStore(os.path.join(directory, "results.sqlite")) as store:
+                for _ in range(5):
+                    for usercount, elapsed in ((1, 10), (2, 20)):
+                        store.record_run([make_result(0, elapsed)] * usercount, "http://zeppelin:8080", usercount)
+            args = build_parser().parse_args(required + ["--usercount", "2", "--sweep"])
+            thresholds = learn_thresholds(args, parse_sweep(args))
+            self.assertEqual({usercount: band["note"]["median"] for usercount, band in thresholds.items()},
+                             {1: 10, 2: 20})
+            args = build_parser().parse_args(required + ["--usercount", "2"])
+            self.assertEqual(learn_thresholds(args, None)["note"]["median"], 20)
+            # Thresholds are not learned for a load profile, nor without the results database
+            for invalid in (required + ["--usercount", "2", "--load_profile", "60:2"],
+                            REQUIRED + ["--usercount", "1", "--adaptive_thresholds"]):
+                with self.assertRaises(InvalidConfigurationError):
+                    learn_thresholds(build_parser().parse_args(invalid), None)
+        self.assertIsNone(learn_thresholds(build_parser().parse_args(REQUIRED + ["--usercount", "1"]), None))
+
+
+class TestSweepCurve(unittest.TestCase):
+
+    #  Tests that the throughput of a run is measured from its first start to its last finish.
+    def test_sweep_point(self):
+        results = [[make_result(0, 2), make_result(2, 4, Status.FAIL)], [make_result(1, 5)]]
+        warmup = make_result(0, 1)
+        warmup.warmup = True
+        results[1].insert(0, warmup)
+        statistics = LatencyStatistics()
+        for result in [result for user_results in results for result in user_results]:
+            statistics.add(1, result)
+        point = GDMPBenchmarker.sweep_point(2, results, statistics)
+        self.assertEqual((point["users"], point["executions"], point["errors"]), (2, 3, 1))
+        self.assertEqual(point["duration"], 6)
+        self.assertEqual(point["throughput"], 30)
+        # The failed run counts in the throughput, not in the latency
+        self.assertAlmostEqual(point["latency"]["mean"], 3.5, places=5)
+        self.assertAlmostEqual(point["latency"]["p50"], 2, delta=0.02)
+        self.assertAlmostEqual(point["power"], 30 / 3.5, places=5)
+
+    #  Tests that the knee is the point where throughput stops growing faster than latency.
+    def test_knee(self):
+        points = [{"users": users, "throughput": throughput, "power": throughput / latency}
+                  for users, throughput, latency in ((1, 6, 10), (2, 12, 10), (4, 20, 12), (8, 22, 22), (16, 22, 44))]
+        self.assertEqual(GDMPBenchmarker.knee(points)["users"], 4)
+        self.assertIsNone(GDMPBenchmarker.knee([]))
+
+
+class TestLoadProfileRun(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def make_benchmarker(self, usercount):
+        note = write_note(self.tmpdir.name, ["%sh sleep 0.1"])
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, usercount, {"note": note})
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest")
+        return benchmarker, notebook_config
+
+    def check_profile(self, runner):
+        benchmarker, notebook_config = self.make_benchmarker(3)
+        profile = LoadProfile(stages=[[0.6, 3], [0.6, 3], [0.6, 0]])
+        before = datetime.now().timestamp()
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config, load_profile=profile,
+                                  runner=runner)
+        self.assertEqual(len(results), 3)
+        for (join, leave), user_results in zip(profile.schedule(), results):
+            starts = [datetime.fromisoformat(result.time.start).timestamp() - before for result in user_results]
+            self.assertGreaterEqual(min(starts), join - 0.05)
+            self.assertLess(max(starts), leave + 0.05)
+            self.assertTrue(all(result.result == Status.SUCCESS for result in user_results))
+        self.assertGreater(len(results[0]), len(results[2]))
+        self.assertEqual(self.server.notes, {})
+
+    #  Tests that users of the pool runner join and leave as the profile ramps up and down.
+    def test_pool(self):
+        self.check_profile("pool")
+
+    #  Tests that users of the asyncio runner join and leave as the profile ramps up and down.
+    def test_asyncio(self):
+        self.check_profile("asyncio")
+
+    #  Tests that a sweep runs the notebooks with each number of users, and finds the knee of the curve.
+    def test_sweep(self):
+        benchmarker, notebook_config = self.make_benchmarker(2)
+        results, curve = benchmarker.sweep([2, 1], notebook_config, runner="asyncio", iterations=2)
+        self.assertEqual(list(results), [1, 2])
+        self.assertEqual(len(results[2]), 2)
+        self.assertEqual([(point["users"], point["executions"]) for point in curve["points"]], [(1, 2), (2, 4)])
+        self.assertTrue(all(point["throughput"] > 0 for point in curve["points"]))
+        self.assertIn(curve["knee"], curve["points"])
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.sweep([1], notebook_config, load_profile=LoadProfile(stages=[[1, 1]]))
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.sweep([0], notebook_config)
+
+    #  Tests that the CLI summarises the curve of a sweep, and records each of its runs.
+    def test_main_sweep(self):
+        _, notebook_config = self.make_benchmarker(2)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(["--zeppelin_url", self.server.url, "--usercount", "2", "--notebook_config", notebook_config,
+                  "--user_config", os.path.join(self.tmpdir.name, "users.json"), "--notebook_handler", "rest",
+                  "--runner", "asyncio", "--results_db", os.path.join(self.tmpdir.name, "results.sqlite"),
+                  "--sweep"])
+        summary = json.loads(output.getvalue().split("---summary---")[1].split("---end---")[0])
+        self.assertEqual([point["users"] for point in summary["sweep"]["points"]], [1, 2])
+        self.assertEqual(sorted(summary["history"]), ["1", "2"])
+        self.assertNotIn("latency", summary)
+
+    #  Tests that the CLI records the runs only when given a results database.
+    def test_main_no_results_db(self):
+        _, notebook_config = self.make_benchmarker(1)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(["--zeppelin_url", self.server.url, "--usercount", "1", "--notebook_config", notebook_config,
+                  "--user_config", os.path.join(self.tmpdir.name, "users.json"), "--notebook_handler", "rest",
+                  "--runner", "asyncio", "--sweep"])
+        summary = json.loads(output.getvalue().split("---summary---")[1].split("---end---")[0])
+        self.assertEqual([point["users"] for point in summary["sweep"]["points"]], [1])
+        self.assertNotIn("history", summary)
+        self.assertEqual(build_parser().parse_args(REQUIRED + ["--usercount", "1"]).results_db, None)
+
+    #  Tests that the CLI does not record the runs with a load profile, which have no single number of users.
+    def test_main_load_profile(self):
+        _, notebook_config = self.make_benchmarker(2)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(["--zeppelin_url", self.server.url, "--usercount", "1", "--notebook_config", notebook_config,
+                  "--user_config", os.path.join(self.tmpdir.name, "users.json"), "--notebook_handler", "rest",
+                  "--runner", "asyncio", "--results_db", os.path.join(self.tmpdir.name, "results.sqlite"),
+                  "--load_profile", "0.3:2"])
+        summary = json.loads(output.getvalue().split("---summary---")[1].split("---end---")[0])
+        self.assertEqual(summary["load_profile"]["peak"], 2)
+        self.assertNotIn("run", summary)
+        with ResultStore(os.path.join(self.tmpdir.name, "results.sqlite")) as store:
+            self.assertEqual(store.connection.execute("SELECT COUNT(*) FROM runs").fetchone(), (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
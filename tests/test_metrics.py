@@ -0,0 +1,159 @@
+"""
+Tests for the polling of the metrics endpoints of the platform, against a fake metrics server
+"""
+import re
+import json
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gdmp_benchmark import Results, Timing, Status
+from gdmp_benchmark.gdmp_benchmark import MetricsPoller, ZeppelinRestNotebookHandler, parse_prometheus, \
+    ISO_FORMAT
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+EXECUTORS = [
+    {"id": "driver", "isActive": True, "totalCores": 0, "activeTasks": 0, "totalGCTime": 10, "memoryUsed": 100},
+    {"id": "1", "isActive": True, "totalCores": 4, "activeTasks": 3, "failedTasks": 1, "totalGCTime": 200,
+     "memoryUsed": 1000},
+    {"id": "2", "isActive": False, "totalCores": 4, "activeTasks": 0, "totalGCTime": 50, "memoryUsed": 0},
+]
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves Prometheus metrics with a counter of the scrapes, and the Spark REST API"""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            self.server.scrapes += 1
+            scrapes = self.server.scrapes
+        if path == "/metrics":
+            body = ("# HELP scrapes_total Scrapes\n# TYPE scrapes_total counter\n"
+                    f"scrapes_total {scrapes}\n"
+                    'jvm_gc_seconds{gc="G1 Young Generation"} 1.5\n').encode()
+        elif path == "/api/v1/applications":
+            body = json.dumps([{"id": "app-1", "name": "zeppelin"}]).encode()
+        elif path == "/api/v1/applications/app-1/executors":
+            body = json.dumps(EXECUTORS).encode()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeMetricsServer(ThreadingHTTPServer):
+    """Fake metrics server, running in a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MetricsHandler)
+        self.lock = threading.Lock()
+        self.scrapes = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        """URL of the running server"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class TestParsePrometheus(unittest.TestCase):
+
+    #  Tests that series are keyed by name and labels, skipping comments and invalid values.
+    def test_parse(self):
+        text = ('# HELP up Up\nup 1\nhttp_requests_total{method="post",code="200"} 1027 1395066363000\n'
+                'rate{le="+Inf"} +Inf\nbroken value\n\n')
+        self.assertEqual(parse_prometheus(text), {"up": 1.0, 'http_requests_total{method="post",code="200"}': 1027.0,
+                                                  'rate{le="+Inf"}': float("inf")})
+
+    #  Tests that only the series matching the filter are kept.
+    def test_filter(self):
+        self.assertEqual(parse_prometheus("up 1\nhttp_requests_total 2\n", re.compile("^http_")),
+                         {"http_requests_total": 2.0})
+
+
+class TestMetricsPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeMetricsServer()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    #  Tests that Prometheus and Spark endpoints are polled until the poller is stopped.
+    def test_poll(self):
+        prometheus, spark = self.server.url + "/metrics", self.server.url + "/api/v1/applications"
+        with MetricsPoller([prometheus, spark, self.server.url + "/missing"], interval=0.05) as poller:
+            time.sleep(0.3)
+        self.assertGreaterEqual(len(poller.samples[prometheus]), 4)
+        self.assertEqual(poller.samples[self.server.url + "/missing"], [])
+        counts = [values["scrapes_total"] for _, values in poller.samples[prometheus]]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(poller.samples[prometheus][0][1]['jvm_gc_seconds{gc="G1 Young Generation"}'], 1.5)
+        self.assertEqual(poller.samples[spark][-1][1], {"applications": 1, "executors": 1, "cores": 4,
+                                                        "active_tasks": 3, "failed_tasks": 1, "gc_time": 260,
+                                                        "memory_used": 1100})
+
+    #  Tests that a notebook gets the last sample before its start and the samples until it finished.
+    def test_annotate(self):
+        poller = MetricsPoller(["endpoint"])
+        base = time.time()
+        poller.samples["endpoint"] = [(base + offset, {"value": offset}) for offset in range(6)]
+        result = Results(result=Status.SUCCESS, msg="", output=[], notebookid="", user_config="", messages=[],
+                         time=Timing(result=Status.FAST, totaltime=2,
+                                     start=datetime.fromtimestamp(base + 1.5).strftime(ISO_FORMAT),
+                                     finish=datetime.fromtimestamp(base + 4).strftime(ISO_FORMAT)))
+        poller.annotate(result)
+        self.assertEqual([sample["values"]["value"] for sample in result.metrics["endpoint"]], [1, 2, 3, 4])
+        self.assertEqual(result.metrics["endpoint"][0]["offset"], -0.5)
+        self.assertEqual(result.to_dict()["metrics"], result.metrics)
+
+
+class TestBenchmarkMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = FakeMetricsServer()
+        self.zeppelin = ZeppelinStubServer().start()
+        self.zeppelin.paragraph_delay = 0.3
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.zeppelin.stop()
+        self.metrics.shutdown()
+        self.metrics.server_close()
+        self.tmpdir.cleanup()
+
+    #  Tests that the results of both runners have the metrics sampled while each notebook ran.
+    def test_run(self):
+        notes = {"first": write_note(self.tmpdir.name, ["%md hello"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.zeppelin.url, 2, notes)
+        endpoint = self.metrics.url + "/metrics"
+        for runner in ("pool", "asyncio"):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.zeppelin.url, notebook_handler="rest")
+            results = benchmarker.run(usercount=2, notebook_config=notebook_config, runner=runner,
+                                      metrics=MetricsPoller([endpoint], interval=0.05))
+            for (result,) in results:
+                samples = result.metrics[endpoint]
+                self.assertGreaterEqual(len(samples), 3)
+                self.assertLessEqual(samples[0]["offset"], 0)
+                self.assertTrue(all(0 < sample["offset"] <= result.time.elapsed + 0.01 for sample in samples[1:]))
+            self.assertIsNone(benchmarker.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
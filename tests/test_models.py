@@ -1,8 +1,13 @@
 """
 Tests for Classes of gdmp_benchmark
 """
+import os
+import json
 import unittest
-from gdmp_benchmark import Results, Timing, Notebook, Status
+from gdmp_benchmark import Results, Timing, Notebook, Status, GDMPBenchmarker
+import random
+from gdmp_benchmark.gdmp_benchmark import ParagraphTiming, parse_paragraph_timings, ArrivalProfile, \
+    InvalidConfigurationError, LatencyHistogram, LatencyStatistics, CircuitBreaker
 
 class TestResults(unittest.TestCase):
     #  Tests that a Results object can be created with all required attributes.
@@ -118,10 +123,194 @@ class TestTiming(unittest.TestCase):
             "start": "2022-01-01 00:00:00",
             "finish": "2022-01-01 00:00:10",
             "expected": 0,
+            "elapsed": 10.0,
+            "phases": {},
             "percent_change": "0"
         }
         self.assertEqual(timing.to_dict(), expected_dict)
 
+    #  Tests that sub-second timings are kept, and used for the percentage change.
+    def test_timing_sub_second(self):
+        timing = Timing(result=Status.PASS, totaltime=0, start="", finish="", expected=1, elapsed=0.25,
+                        phases={"fetch": 0.05, "execute": 0.2})
+        self.assertIn("'elapsed': '0.25', 'percent': '-75.00'", str(timing))
+        self.assertEqual(timing.to_json()["phases"], {"fetch": 0.05, "execute": 0.2})
+
+    #  Tests that the elapsed time defaults to the total time.
+    def test_timing_elapsed_default(self):
+        timing = Timing(result=Status.PASS, totaltime=3, start="", finish="", elapsed=0)
+        self.assertEqual(timing.elapsed, 3.0)
+
+
+class TestParagraphTiming(unittest.TestCase):
+    #  Tests that paragraph timings are collected from the dates recorded in a notebook.
+    def test_parse_paragraph_timings(self):
+        path = os.path.join(os.path.dirname(__file__), "..", "notebooks", "pi_quick.json")
+        with open(path, encoding="utf-8") as note_file:
+            timings = parse_paragraph_timings(json.load(note_file))
+        self.assertEqual(len(timings), 1)
+        self.assertEqual(timings[0].paragraphid, "20201207-170314_91795958")
+        self.assertEqual(timings[0].title, "%spark.pyspark")
+        self.assertEqual(timings[0].status, "FINISHED")
+        self.assertEqual(timings[0].duration, 151.0)
+
+    #  Tests that paragraphs without dates or with unparseable dates are handled.
+    def test_parse_paragraph_timings_missing_dates(self):
+        note = {"paragraphs": [{"id": "a", "text": "%md x"},
+                               {"id": "b", "dateStarted": "soon", "dateFinished": "later", "title": "B"}]}
+        timings = parse_paragraph_timings(note)
+        self.assertEqual(len(timings), 1)
+        self.assertEqual(timings[0].title, "B")
+        self.assertEqual(timings[0].duration, 0.0)
+
+    #  Tests that paragraph timings are included in the results dictionary.
+    def test_results_to_dict_paragraphs(self):
+        paragraph = ParagraphTiming(paragraphid="a", title="%md x", status="FINISHED",
+                                    start="2022-01-01 00:00:00", finish="2022-01-01 00:00:02", duration=2.0)
+        result = Results(result=Status.PASS, msg="", output=[], notebookid="1234", user_config="",
+                         messages=[], time=Timing(result=Status.PASS, totaltime=2, start="", finish=""),
+                         paragraphs=[paragraph])
+        self.assertEqual(result.to_dict()["paragraphs"][0]["duration"], 2.0)
+        self.assertIn('duration', result.to_json())
+
+
+class TestArrivalProfile(unittest.TestCase):
+    #  Tests that a constant profile spaces arrivals evenly from the start of the run.
+    def test_constant(self):
+        self.assertEqual(ArrivalProfile(rate=6, duration=60).arrivals(), [0, 10, 20, 30, 40, 50])
+
+    #  Tests that a poisson profile has about rate * duration random arrivals.
+    def test_poisson(self):
+        arrivals = ArrivalProfile(kind="poisson", rate=60, duration=600, seed=1).arrivals()
+        self.assertAlmostEqual(len(arrivals), 600, delta=75)
+        self.assertEqual(arrivals, sorted(arrivals))
+        self.assertEqual(arrivals, ArrivalProfile(kind="poisson", rate=60, duration=600, seed=1).arrivals())
+
+    #  Tests that a step profile changes rate at each step.
+    def test_step(self):
+        arrivals = ArrivalProfile(kind="step", steps=[[60, 2], [60, 4]]).arrivals()
+        self.assertEqual(arrivals, [0, 30, 60, 75, 90, 105])
+
+    #  Tests that a ramp profile has as many arrivals as the area under its rate.
+    def test_ramp(self):
+        arrivals = ArrivalProfile(kind="ramp", rate=0, end_rate=12, duration=60).arrivals()
+        self.assertEqual(len(arrivals), 6)
+        gaps = [later - earlier for earlier, later in zip(arrivals[1:], arrivals[2:])]
+        self.assertEqual(gaps, sorted(gaps, reverse=True))
+
+    #  Tests that an unknown, incomplete or negative profile is rejected.
+    def test_invalid(self):
+        with self.assertRaises(InvalidConfigurationError):
+            ArrivalProfile(kind="burst")
+        with self.assertRaises(InvalidConfigurationError):
+            ArrivalProfile(kind="step")
+        with self.assertRaises(InvalidConfigurationError):
+            ArrivalProfile(kind="step", steps=[[-60, 2]])
+        with self.assertRaises(InvalidConfigurationError):
+            ArrivalProfile(rate=-1)
+
+    #  Tests that steps of no length are skipped.
+    def test_empty_step(self):
+        arrivals = ArrivalProfile(kind="step", steps=[[0, 10], [60, 2], [0, 10]]).arrivals()
+        self.assertEqual(arrivals, [0, 30])
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    #  Tests that percentiles are within the bucket resolution of the exact values.
+    def test_percentiles(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(3, 1) for _ in range(10000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        ordered = sorted(values)
+        for percent in (50, 90, 99):
+            exact = ordered[int(percent / 100 * len(values)) - 1]
+            self.assertAlmostEqual(histogram.percentile(percent), exact, delta=exact / 64 + 0.001)
+        self.assertEqual(histogram.percentile(100), max(values))
+        self.assertAlmostEqual(histogram.mean, sum(values) / len(values))
+        self.assertLess(len(histogram.counts), 2000)
+
+    #  Tests that buckets are contiguous and each value falls within its bucket.
+    def test_bucket_bounds(self):
+        previous_upper = -1
+        for index in range(LatencyHistogram.bucket_index(10 ** 7) + 1):
+            lower, upper = LatencyHistogram.bucket_bounds(index)
+            self.assertEqual(lower, previous_upper + 1)
+            self.assertEqual(LatencyHistogram.bucket_index(lower), index)
+            self.assertEqual(LatencyHistogram.bucket_index(upper), index)
+            previous_upper = upper
+
+    #  Tests that merging histograms is equivalent to recording all the values in one.
+    def test_merge(self):
+        first, second, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for value in (1.5, 2.0, 30.0):
+            first.record(value)
+            both.record(value)
+        for value in (0.2, 45.0):
+            second.record(value)
+            both.record(value)
+        first.merge(second)
+        self.assertEqual(first.counts, both.counts)
+        self.assertAlmostEqual(first.mean, both.mean)
+        self.assertAlmostEqual(first.stddev, both.stddev)
+        self.assertEqual((first.min, first.max), (0.2, 45.0))
+
+    #  Tests that statistics are aggregated per notebook across users.
+    def test_statistics(self):
+        statistics = LatencyStatistics()
+        for user, totaltime in ((1, 10), (2, 20), (3, 30)):
+            statistics.add(user, Results(result=Status.SUCCESS, msg="", output=[], notebookid="", user_config="",
+                                         messages=[], name="note",
+                                         time=Timing(result=Status.FAST, totaltime=totaltime, start="", finish="")))
+        summary = statistics.to_dict()["note"]
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(summary["mean"], 20)
+        self.assertEqual(summary["stddev"], 10)
+        self.assertAlmostEqual(summary["p50"], 20, delta=20 / 128)
+        self.assertEqual(summary["max"], 30)
+        self.assertEqual(summary["results"], {"SUCCESS": 3})
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    @staticmethod
+    def result(status):
+        return Results(result=status, msg="", output=[], notebookid="", user_config="", messages=[],
+                       time=Timing(result=Status.FAST, totaltime=1, start="", finish=""), name="note")
+
+    #  Tests that the breaker opens once a user fails enough notebooks in a row.
+    def test_user_errors(self):
+        breaker = CircuitBreaker(max_user_errors=2)
+        for user, status in ((1, Status.ERROR), (1, Status.SUCCESS), (1, Status.ERROR), (2, Status.ERROR),
+                             (1, Status.SKIPPED)):
+            breaker.record(user, self.result(status))
+        self.assertFalse(breaker.is_open)
+        breaker.record(1, self.result(Status.FAIL))
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(breaker.event.is_set())
+        self.assertEqual(breaker.to_dict(), {"open": True, "reason": "User 1 failed 2 notebooks in a row",
+                                             "errors": 4})
+
+    #  Tests that the breaker opens once enough notebooks fail across all users.
+    def test_total_errors(self):
+        breaker = CircuitBreaker(max_errors=3)
+        for user in (1, 2):
+            breaker.record(user, self.result(Status.ERROR))
+        self.assertFalse(breaker.is_open)
+        breaker.record(3, self.result(Status.ERROR))
+        self.assertEqual(breaker.reason, "3 notebooks failed")
+        self.assertFalse(CircuitBreaker().enabled)
+
+    #  Tests that skipped and failed notebooks are counted, but not in the latency histogram.
+    def test_statistics_skipped(self):
+        statistics = LatencyStatistics()
+        for status in (Status.SKIPPED, Status.ERROR, Status.TIMEOUT, Status.SUCCESS):
+            statistics.add(1, self.result(status))
+        self.assertEqual(statistics.to_dict()["note"]["count"], 1)
+        self.assertEqual(statistics.to_dict()["note"]["results"], {"SKIPPED": 1, "ERROR": 1, "TIMEOUT": 1,
+                                                                   "SUCCESS": 1})
+
 
 class TestNotebook(unittest.TestCase):
     #  Tests that a Notebook object can be created with valid input parameters.
@@ -150,6 +339,30 @@ class TestNotebook(unittest.TestCase):
         with self.assertRaises(ValueError):
             Notebook(name="test_notebook", filepath="/path/to/notebook", totaltime=-10, results=[1, 2, 3])
 
+    #  Tests that the minimum time defaults to half the total time.
+    def test_notebook_mintime(self):
+        self.assertEqual(Notebook(name="a", filepath="/a", totaltime=10, results=[]).expectedmin, 5)
+        self.assertEqual(Notebook(name="a", filepath="/a", totaltime=10, results=[], mintime=8).expectedmin, 8)
+
+    #  Tests that negative timeouts are rejected.
+    def test_notebook_timeouts(self):
+        for timeouts in ({"timeout": -1}, {"paragraph_timeout": -1}):
+            with self.assertRaises(ValueError):
+                Notebook(name="a", filepath="/a", totaltime=10, results=[], **timeouts)
+        notebook = Notebook(name="a", filepath="/a", totaltime=10, results=[], timeout=90, paragraph_timeout=0.5)
+        self.assertEqual((notebook.timeout, notebook.paragraph_timeout), (90, 0.5))
+
+    #  Tests that notebooks do not time out by default, and take the run-wide timeouts they do not set.
+    def test_notebook_limits(self):
+        notebooks = [Notebook(name="a", filepath="/a", totaltime=10, results=[]),
+                     Notebook(name="b", filepath="/b", totaltime=10, results=[], timeout=5, paragraph_timeout=2)]
+        GDMPBenchmarker._set_limits(notebooks, None, 0, 0)
+        self.assertEqual([(notebook.timeout, notebook.paragraph_timeout) for notebook in notebooks],
+                         [(0, 0), (5, 2)])
+        GDMPBenchmarker._set_limits(notebooks, None, 1.5, 0.25)
+        self.assertEqual([(notebook.timeout, notebook.paragraph_timeout) for notebook in notebooks],
+                         [(15, 0.25), (5, 2)])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
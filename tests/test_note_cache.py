@@ -0,0 +1,169 @@
+"""
+Tests for the on-disk cache of remote notebooks
+"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from multiprocessing import Pool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gdmp_benchmark import GDMPBenchmarker
+from gdmp_benchmark.gdmp_benchmark import NoteCache, InvalidConfigurationError, build_parser, parse_note_cache
+
+NOTE = {"paragraphs": [{"id": "a", "text": "%md hello"}], "name": "note"}
+
+
+class NoteHandler(BaseHTTPRequestHandler):
+    """Serves the same note on every path, with an ETag"""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        with self.server.lock:
+            self.server.hits.append(self.path)
+        body = json.dumps(dict(NOTE, name=self.path)).encode()
+        etag = '"' + str(len(body)) + '"'
+        if self.headers.get("If-None-Match") == etag:
+            with self.server.lock:
+                self.server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def fetch(args):
+    """Fetch a URL through a cache, used by the worker processes"""
+    directory, url = args
+    return NoteCache(directory=directory).get(url)
+
+
+class TestNoteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), NoteHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits = []
+        self.server.not_modified = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    #  Tests that a fresh entry is served from the cache without any request.
+    def test_cached(self):
+        cache = NoteCache(directory=self.tmpdir.name)
+        first = cache.get(self.url + "/note.json")
+        second = cache.get(self.url + "/note.json")
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.hits), 1)
+
+    #  Tests that a stale entry is revalidated with a conditional request.
+    def test_revalidated(self):
+        cache = NoteCache(directory=self.tmpdir.name, max_age=0)
+        cache.get(self.url + "/note.json")
+        content = cache.get(self.url + "/note.json")
+        self.assertEqual(json.loads(content)["name"], "/note.json")
+        self.assertEqual(len(self.server.hits), 2)
+        self.assertEqual(self.server.not_modified, 1)
+
+    #  Tests that URLs pinned to a commit hash are never revalidated.
+    def test_commit_hash_not_revalidated(self):
+        cache = NoteCache(directory=self.tmpdir.name, max_age=0)
+        url = self.url + "/wfau/aglais-testing/bc9b9787b5b6225e11df5a4ef0272bcec660a44e/note.json"
+        cache.get(url)
+        cache.get(url)
+        self.assertEqual(len(self.server.hits), 1)
+
+    #  Tests that offline mode only uses cached entries.
+    def test_offline(self):
+        NoteCache(directory=self.tmpdir.name, max_age=0).get(self.url + "/note.json")
+        offline = NoteCache(directory=self.tmpdir.name, max_age=0, offline=True)
+        self.assertEqual(json.loads(offline.get(self.url + "/note.json"))["name"], "/note.json")
+        with self.assertRaises(InvalidConfigurationError):
+            offline.get(self.url + "/other.json")
+        self.assertEqual(len(self.server.hits), 1)
+
+    #  Tests that the least recently used entries are evicted when the cache is full.
+    def test_evict_least_recently_used(self):
+        size = len(NoteCache(directory=self.tmpdir.name + "/sizing").get(self.url + "/a.json"))
+        cache = NoteCache(directory=self.tmpdir.name, max_size=2 * size)
+        cache.get(self.url + "/a.json")
+        index = os.path.join(self.tmpdir.name, "index")
+        oldest = os.path.join(index, os.listdir(index)[0])
+        os.utime(oldest, (0, 0))
+        cache.get(self.url + "/b.json")
+        cache.get(self.url + "/c.json")
+        self.assertEqual(len(os.listdir(index)), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmpdir.name, "blobs"))), 2)
+        self.assertFalse(os.path.exists(oldest))
+
+    #  Tests that the cache is only checked for eviction after a download added to it.
+    def test_evict_after_growth(self):
+        cache = NoteCache(directory=self.tmpdir.name, max_age=0)
+        with mock.patch.object(cache, "evict") as evict:
+            cache.get(self.url + "/note.json")
+            cache.get(self.url + "/note.json")
+        self.assertEqual(evict.call_count, 1)
+
+    #  Tests that an entry evicted by another process while it is read is fetched again.
+    def test_evicted_while_read(self):
+        cache = NoteCache(directory=self.tmpdir.name, max_age=0)
+        url = self.url + "/note.json"
+        expected = cache.get(url)
+        read_entry = cache._read_entry  # pylint: disable=protected-access
+
+        def evicted(key):
+            entry = read_entry(key)
+            os.remove(os.path.join(self.tmpdir.name, "blobs", entry["blob"]))
+            return entry
+
+        with mock.patch.object(cache, "_read_entry", evicted):
+            self.assertEqual(cache.get(url), expected)
+        self.assertEqual(len(self.server.hits), 3)
+        self.assertEqual(self.server.not_modified, 1)
+        cache.max_age = 60
+        self.assertEqual(cache.get(url), expected)
+        self.assertEqual(len(self.server.hits), 3)
+
+    #  Tests that the cache is configured from the command line, and offline runs need it.
+    def test_parse_note_cache(self):
+        required = ["--zeppelin_url", "http://zeppelin:8080", "--usercount", "1", "--notebook_config",
+                    "notebooks.json", "--user_config", "users.json"]
+        parser = build_parser()
+        self.assertTrue(parse_note_cache(parser.parse_args(required + ["--offline"])).offline)
+        self.assertIsNone(parse_note_cache(parser.parse_args(required + ["--no_cache"])))
+        with self.assertRaises(InvalidConfigurationError):
+            parse_note_cache(parser.parse_args(required + ["--no_cache", "--offline"]))
+
+    #  Tests that concurrent worker processes fetch a notebook once.
+    def test_shared_between_processes(self):
+        url = self.url + "/note.json"
+        with Pool(processes=4) as pool:
+            contents = pool.map(fetch, [(self.tmpdir.name, url)] * 8)
+        self.assertEqual(len(set(contents)), 1)
+        self.assertEqual(len(self.server.hits), 1)
+
+    #  Tests that the benchmarker gets remote notebooks through its cache.
+    def test_benchmarker_get_note(self):
+        benchmarker = GDMPBenchmarker(note_cache=NoteCache(directory=self.tmpdir.name))
+        note = benchmarker.get_note(self.url + "/note.json", cache=benchmarker.note_cache)
+        self.assertEqual(note["name"], "/note.json")
+        benchmarker.get_note(self.url + "/note.json", cache=benchmarker.note_cache)
+        self.assertEqual(len(self.server.hits), 1)
+        self.assertIsNone(GDMPBenchmarker(note_cache=False).note_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Tests for the warm-up of the interpreters before the measured runs
+"""
+import tempfile
+import unittest
+from gdmp_benchmark import Status
+from gdmp_benchmark.gdmp_benchmark import ZeppelinRestNotebookHandler, Prewarm, \
+    notebook_interpreters, build_parser, parse_prewarm
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+STARTUP = 0.4
+
+
+class TestPrewarmNote(unittest.TestCase):
+
+    #  Tests that the interpreters of a notebook are listed in order of first use.
+    def test_notebook_interpreters(self):
+        note = {"paragraphs": [{"text": "%md intro"}, {"text": "\n%spark.pyspark(key=value)\nx = 1"},
+                               {"text": "no interpreter"}, {"text": None}, {"text": "%md again"}]}
+        self.assertEqual(notebook_interpreters(note), ["md", "spark.pyspark"])
+
+    #  Tests that the warm-up notebook runs a trivial paragraph per interpreter.
+    def test_note(self):
+        note = Prewarm.note(["spark.pyspark", "md", "sh", "spark.sql", "spark"])
+        self.assertEqual([paragraph["text"] for paragraph in note["paragraphs"]],
+                         ["%spark.pyspark\nprint(1)", "%md\nwarm-up", "%sh\ntrue", "%spark.sql\nSELECT 1", "%spark\n1"])
+        self.assertEqual(Prewarm.settings(["spark.pyspark", "md", "spark.sql"]), ["spark", "md"])
+        with self.assertRaises(ValueError):
+            Prewarm(timeout=-1)
+
+    #  Tests that the command line options are parsed into a warm-up.
+    def test_parse_prewarm(self):
+        parser = build_parser()
+        required = ["--zeppelin_url", "http://zeppelin:8080", "--usercount", "1", "--notebook_config", "notebooks.json",
+                    "--user_config", "users.json"]
+        self.assertIsNone(parse_prewarm(parser.parse_args(required)))
+        prewarm = parse_prewarm(parser.parse_args(required + ["--prewarm", "--prewarm_interpreters", "spark.pyspark, md",
+                                                              "--restart_interpreters"]))
+        self.assertEqual(prewarm, Prewarm(interpreters=["spark.pyspark", "md"], restart=True, timeout=600))
+
+
+class TestPrewarm(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.server.interpreter_startup = STARTUP
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def run_benchmark(self, usercount, prewarm, **kwargs):
+        note = write_note(self.tmpdir.name, ["%spark.pyspark\nx = 1", "%md done"])
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, usercount, {"note": note})
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest")
+        results = benchmarker.run(usercount=usercount, notebook_config=notebook_config, prewarm=prewarm, **kwargs)
+        return benchmarker, results
+
+    #  Tests that the interpreters of each user start before the measured runs, and their cold start is reported.
+    def test_prewarm(self):
+        benchmarker, results = self.run_benchmark(2, Prewarm(restart=True))
+        cold_start = benchmarker.cold_start
+        self.assertEqual([user["user"] for user in cold_start["users"]], [1, 2])
+        for user in cold_start["users"]:
+            self.assertEqual(user["result"], Status.SUCCESS)
+            self.assertEqual(sorted(user["interpreters"]), ["md", "spark.pyspark"])
+        self.assertGreaterEqual(cold_start["interpreters"]["spark.pyspark"]["max"], STARTUP)
+        self.assertEqual(cold_start["interpreters"]["md"]["count"], 2)
+        self.assertEqual(sorted(setting for setting, _ in self.server.restarts), ["md", "md", "spark", "spark"])
+        self.assertTrue(all(notebookid for _, notebookid in self.server.restarts))
+        for user_results in results:
+            self.assertLess(user_results[0].time.elapsed, STARTUP)
+        self.assertEqual(self.server.notes, {})
+
+    #  Tests that only the configured interpreters are warmed up, by the asyncio runner.
+    def test_prewarm_interpreters(self):
+        benchmarker, results = self.run_benchmark(1, Prewarm(interpreters=["md"]), runner="asyncio")
+        self.assertEqual(list(benchmarker.cold_start["interpreters"]), ["md"])
+        self.assertEqual(self.server.restarts, [])
+        self.assertGreaterEqual(results[0].time.elapsed, STARTUP)
+
+    #  Tests that the first notebook absorbs the start of the interpreters without a warm-up.
+    def test_no_prewarm(self):
+        benchmarker, results = self.run_benchmark(1, None)
+        self.assertEqual(benchmarker.cold_start, {})
+        self.assertGreaterEqual(results[0].time.elapsed, STARTUP)
+
+
+if __name__ == '__main__':
+    unittest.main()
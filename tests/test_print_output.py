@@ -0,0 +1,105 @@
+"""
+Tests for parsing the fields of a printed notebook used by the results, skipping the others
+"""
+import codecs
+import glob
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+import simplejson as json
+from simplejson.errors import JSONDecodeError
+from gdmp_benchmark.gdmp_benchmark import ZDairiNotebookHandler, NOTEBOOK_RESULT_FIELDS, parse_json_fields, \
+    project_json, select_json, parse_notebook_output, parse_paragraph_timings, Status
+
+NOTEBOOKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notebooks")
+
+
+def load_printed():
+    """Load the bundled notebooks, as printed by zdairi"""
+    printed = []
+    for path in sorted(glob.glob(os.path.join(NOTEBOOKS, "**", "*.json"), recursive=True)):
+        with open(path, "rb") as note_file:
+            printed.append(note_file.read().removeprefix(codecs.BOM_UTF8))
+    return printed
+
+
+def parse_results(json_notebook):
+    """The output and paragraph timings of a printed notebook"""
+    output = parse_notebook_output(json_notebook)
+    return output, [timing.to_dict() for timing in parse_paragraph_timings(json_notebook)]
+
+
+class TestSelectJson(unittest.TestCase):
+
+    #  Tests that the results of the bundled notebooks are the same as with the whole notebooks.
+    def test_bundled_notebooks(self):
+        for printed in load_printed():
+            expected = parse_results(json.loads("".join(printed.decode().split("\n")), strict=False))
+            self.assertEqual(parse_results(parse_json_fields(printed, NOTEBOOK_RESULT_FIELDS)), expected)
+            # Small documents are decoded at once, so select their fields too
+            self.assertEqual(parse_results(select_json(printed, 0, NOTEBOOK_RESULT_FIELDS)[0]), expected)
+
+    #  Tests that the selected fields are parsed, past skipped strings with escapes, long strings and nested values.
+    def test_select(self):
+        document = {"skipped": {"nested": [1, {"a": "}]\"\\"}], "empty": {}}, "long": "x\"" * 5000,
+                    "kept": {"number": -1.5e3, "flag": True, "none": None, "text": "é \"quoted\" " + "y" * 5000},
+                    "items": [{"a": 1, "b": [2]}, {"a": 3, "b": [4]}, {"a": 5}], "empty": []}
+        selection = {"kept": True, "items": [{"a": True}, 2], "empty": [True], "missing": True}
+        data = json.dumps(document, indent=2).encode("utf-8")
+        selected, end = select_json(data, 0, selection)
+        self.assertEqual(end, len(data))
+        self.assertEqual(selected, {"kept": document["kept"], "items": [{"a": 1}, {"a": 3}], "empty": []})
+        self.assertEqual(project_json(document, selection), selected)
+        self.assertEqual(select_json(data, 0, True)[0], document)
+
+    #  Tests that the output of successful cells is collected, and Zeppelin codes that are not statuses are mapped.
+    def test_result_codes(self):
+        def cell(code, data):
+            return {"results": {"code": code, "msg": [{"type": "TEXT", "data": data}]}}
+
+        notebook = {"paragraphs": [cell("SUCCESS", "1 "), cell("KEEP_PREVIOUS_RESULT", "2"), {"text": "%md"}]}
+        self.assertEqual(parse_notebook_output(notebook), (["1", "2"], "", Status.SUCCESS))
+        for code in ("INCOMPLETE", "UNKNOWN"):
+            notebook = {"paragraphs": [cell("SUCCESS", "1"), cell(code, "oops"), cell("SUCCESS", "3")]}
+            self.assertEqual(parse_notebook_output(notebook), (["1", "oops"], "oops", Status.ERROR))
+
+    #  Tests that line breaks are removed from the selected values, as zdairi breaks the lines it prints.
+    def test_line_breaks(self):
+        data = b'{"paragraphs": [{"text": "%md\nhello", "results": {"code": "SUCCESS", "msg": [\n]}}]}'
+        self.assertEqual(parse_json_fields(data, NOTEBOOK_RESULT_FIELDS)["paragraphs"][0]["text"], "%mdhello")
+        self.assertEqual(select_json(data, 0, NOTEBOOK_RESULT_FIELDS)[0],
+                         {"paragraphs": [{"text": "%mdhello", "results": {"code": "SUCCESS", "msg": []}}]})
+
+    #  Tests that output that is not a whole JSON document is rejected.
+    def test_invalid(self):
+        data = json.dumps({"paragraphs": [{"id": "a", "config": {"x": "y" * 70000}}]}).encode("utf-8")
+        for invalid in (b"", b"Error: notebook not found", data[:-2], data + b"{}", data.replace(b",", b";"),
+                        data.replace(b'"config"', b"config")):
+            with self.assertRaises(JSONDecodeError):
+                parse_json_fields(invalid, NOTEBOOK_RESULT_FIELDS)
+
+
+class TestZDairiPrint(unittest.TestCase):
+
+    #  Tests that the notebook printed by zdairi is parsed into the fields used by the results.
+    def test_print_notebook(self):
+        printed = max(load_printed(), key=len)
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "note.json"), "wb") as note_file:
+                note_file.write(printed)
+            zdairi = os.path.join(directory, "zdairi")
+            with open(zdairi, "w", encoding="utf-8") as script:
+                script.write(f"#!/bin/sh\ncat {directory}/note.json\n")
+            os.chmod(zdairi, stat.S_IRWXU)
+            with mock.patch.dict(os.environ, {"PATH": directory + os.pathsep + os.environ["PATH"]}):
+                json_notebook = ZDairiNotebookHandler.print_notebook("2ABC", "user1.yml")
+        self.assertEqual(parse_results(json_notebook), parse_results(json.loads(printed)))
+        for paragraph in json_notebook["paragraphs"]:
+            self.assertNotIn("config", paragraph)
+            self.assertLessEqual(len(paragraph.get("results", {}).get("msg", [])), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
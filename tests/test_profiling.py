@@ -0,0 +1,113 @@
+"""
+Tests for the profiling of the harness, its hot paths and its resources
+"""
+import os
+import json
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from gdmp_benchmark import Status
+from gdmp_benchmark.gdmp_benchmark import Profiler, ResourceSampler, ZeppelinRestNotebookHandler, main
+from tests.zeppelin_stub import ZeppelinStubServer, write_note
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+
+class TestResourceSampler(unittest.TestCase):
+
+    #  Tests that the samples cover the CPU, memory, files and child processes of the harness.
+    def test_sample(self):
+        sampler = ResourceSampler(interval=0.05)
+        with sampler, subprocess.Popen(["sleep", "1"]) as child:
+            deadline = time.perf_counter() + 0.3
+            while time.perf_counter() < deadline:
+                pass
+            child.kill()
+        self.assertGreaterEqual(len(sampler.samples), 3)
+        summary = sampler.summary()
+        self.assertEqual(sorted(summary), sorted(ResourceSampler.METRICS))
+        self.assertGreaterEqual(summary["processes"]["max"], 2)
+        self.assertGreater(summary["cpu_percent"]["max"], 50)
+        self.assertGreater(summary["rss"]["max"], 1024 * 1024)
+        self.assertGreater(summary["fds"]["max"], 2)
+        self.assertEqual(sampler.to_dict()["samples"], sampler.samples)
+
+    #  Tests that sampling is skipped without /proc.
+    def test_unavailable(self):
+        sampler = ResourceSampler(interval=0.05)
+        sampler.PROC = "/nonexistent"
+        with sampler:
+            pass
+        self.assertEqual(sampler.samples, [])
+        self.assertEqual(sampler.summary(), {})
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.profile_dir = os.path.join(self.tmpdir.name, "profile")
+        notes = {name: write_note(self.tmpdir.name, ["%md hello"], name) for name in ("first", "second")}
+        self.user_config, self.notebook_config = write_configs(self.tmpdir.name, self.server.url, 2, notes)
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    #  Tests that the profiles of the worker processes are merged into one per hot path.
+    def test_pool_runner(self):
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=self.user_config, zeppelin_url=self.server.url,
+                                       notebook_handler="rest", profiler=Profiler(self.profile_dir))
+        results = benchmarker.run(usercount=2, notebook_config=self.notebook_config, iterations=2)
+        self.assertTrue(all(result.result == Status.SUCCESS for user_results in results for result in user_results))
+        hot_paths = benchmarker.profiler.merge()
+        self.assertEqual(hot_paths["run"]["calls"], 1)
+        self.assertEqual(hot_paths["_run_single"]["calls"], 2)
+        self.assertEqual(hot_paths["run_notebook"]["calls"], 8)
+        self.assertEqual(hot_paths["print_notebook"]["calls"], 16)
+        self.assertGreaterEqual(hot_paths["run_notebook"]["cumtime"], hot_paths["print_notebook"]["cumtime"] / 2)
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         ["_run_single.prof", "_run_single.txt", "run.prof", "run.txt",
+                          "run_notebook.prof", "run_notebook.txt"])
+
+    #  Tests that a single profile is active per process, as from Python 3.12, whichever thread enabled it.
+    def test_per_process(self):
+        with mock.patch.object(Profiler, "PER_THREAD", False):
+            profiler = Profiler(self.profile_dir)
+
+        def run_notebook():
+            with profiler.profile("run_notebook"):
+                time.sleep(0.01)
+
+        with profiler.profile("run"):
+            threads = [threading.Thread(target=run_notebook) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([name.partition("-")[0] for name in os.listdir(self.profile_dir)], ["run"])
+        run_notebook()
+        profiler.merge()
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         ["run.prof", "run.txt", "run_notebook.prof", "run_notebook.txt"])
+
+    #  Tests that the CLI writes the profiles and the resource samples to the profile directory.
+    def test_main(self):
+        main(["--zeppelin_url", self.server.url, "--usercount", "1", "--notebook_config", self.notebook_config,
+              "--user_config", self.user_config, "--notebook_handler", "rest",
+              "--output_format", "ndjson", "--profile_dir", self.profile_dir, "--sample_interval", "0.05"])
+        self.assertIn("run_notebook.prof", os.listdir(self.profile_dir))
+        with open(os.path.join(self.profile_dir, "run_notebook.txt"), encoding="utf-8") as report:
+            self.assertIn("print_notebook", report.read())
+        with open(os.path.join(self.profile_dir, "resources.json"), encoding="utf-8") as resources:
+            resources = json.load(resources)
+        self.assertGreaterEqual(len(resources["samples"]), 1)
+        self.assertEqual(resources["summary"]["processes"]["max"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Tests for the database of past results and the regression detection
+"""
+import os
+import tempfile
+import unittest
+from gdmp_benchmark import Results, Timing, Status
+from gdmp_benchmark.gdmp_benchmark import ResultStore, InvalidConfigurationError, mann_whitney_u, \
+    git_revision, export_thresholds
+
+URL = "http://zeppelin:8080"
+
+
+def make_result(name, elapsed, warmup=False, status=Status.SUCCESS, user=0):
+    """Create the Results of a notebook run that took the given time"""
+    return Results(result=status, msg="", output=[], notebookid="", user_config="", messages=[],
+                   time=Timing(result=Status.FAST, totaltime=int(elapsed), start="", finish="",
+                               elapsed=elapsed), name=name, warmup=warmup, user=user)
+
+
+class TestMannWhitneyU(unittest.TestCase):
+
+    #  Tests that a sample that is larger than the baseline gets a low p-value.
+    def test_larger_sample(self):
+        u_stat, p_value = mann_whitney_u([4, 5, 6], [1, 2, 3])
+        self.assertEqual(u_stat, 9)
+        self.assertAlmostEqual(p_value, 0.0404, places=3)
+
+    #  Tests that a sample that is smaller than the baseline is not significant.
+    def test_smaller_sample(self):
+        u_stat, p_value = mann_whitney_u([1, 2, 3], [4, 5, 6])
+        self.assertEqual(u_stat, 0)
+        self.assertGreater(p_value, 0.9)
+
+    #  Tests that identical values are never significant.
+    def test_ties(self):
+        self.assertEqual(mann_whitney_u([1, 1], [1, 1, 1])[1], 1.0)
+        self.assertEqual(mann_whitney_u([1, 2], [2, 3])[0], 0.5)
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.tmpdir.name, "history", "results.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def record_baseline(self, runs=5, usercount=2):
+        """Record runs where the first notebook takes about 10 seconds and the second 5"""
+        for run in range(runs):
+            self.store.record_run([[make_result("first", 10 + run * 0.1), make_result("second", 5)]
+                                   for _ in range(usercount)], URL, usercount, revision="abc")
+
+    #  Tests that a significantly slower run is flagged as a regression.
+    def test_regression(self):
+        self.record_baseline()
+        run_id = self.store.record_run([[make_result("first", 20, warmup=True), make_result("second", 5)]
+                                        + [make_result("first", 15)] * 3 for _ in range(2)], URL + "/", 2)
+        comparison = self.store.compare(run_id)
+        self.assertTrue(comparison["first"]["regression"])
+        self.assertEqual(comparison["first"]["samples"], 6)
+        self.assertEqual(comparison["first"]["baseline_samples"], 10)
+        self.assertAlmostEqual(comparison["first"]["change"], 15 / 10.2 - 1)
+        self.assertLess(comparison["first"]["p_value"], 0.01)
+        self.assertFalse(comparison["second"]["regression"])
+        self.assertEqual(comparison["second"]["change"], 0)
+
+    #  Tests that runs with another number of users are not part of the baseline.
+    def test_baseline_keyed_by_usercount(self):
+        self.record_baseline(usercount=1)
+        run_id = self.store.record_run([make_result("first", 30)], URL, 2)
+        comparison = self.store.compare(run_id)
+        self.assertEqual(comparison["first"]["baseline_samples"], 0)
+        self.assertFalse(comparison["first"]["regression"])
+        self.assertIsNone(comparison["first"]["p_value"])
+
+    #  Tests that the baseline is limited to the most recent runs, and optionally a revision.
+    def test_rolling_baseline(self):
+        for run in range(2000):
+            self.store.record_run([[make_result("first", run)]], URL, 1,
+                                  revision="old" if run < 1990 else "new")
+        run_id = self.store.record_run([[make_result("first", 1000)]], URL, 1)
+        self.assertEqual(sorted(self.store.baseline("first", URL, 1, run_id, window=3)), [1997, 1998, 1999])
+        self.assertEqual(self.store.baseline("first", URL, 1, run_id, window=1, revision="old"), [1989])
+        self.assertEqual(self.store.compare(run_id, window=3)["first"]["baseline_median"], 1998)
+
+    #  Tests that thresholds are learned from the median and MAD of the runs with the same number of users.
+    def test_thresholds(self):
+        for elapsed in (10, 11, 12, 13, 30):
+            self.store.record_run([[make_result("first", elapsed), make_result("second", 5)]], URL, 1)
+        self.store.record_run([[make_result("first", 100)]] * 2, URL, 2)
+        self.store.record_run([[make_result("rare", 1)]], URL, 1)
+        thresholds = self.store.thresholds(URL, 1, width=2)
+        self.assertEqual(sorted(thresholds), ["first", "second"])
+        self.assertEqual(thresholds["first"]["median"], 12)
+        self.assertEqual(thresholds["first"]["mad"], 1)
+        self.assertAlmostEqual(thresholds["first"]["upper"], 12 + 2 * 1.4826)
+        self.assertAlmostEqual(thresholds["first"]["lower"], 12 - 2 * 1.4826)
+        # Steady times get a minimum spread of 5% of the median
+        self.assertAlmostEqual(thresholds["second"]["upper"], 5.5)
+        self.assertEqual(self.store.thresholds(URL, 2, min_samples=2)["first"]["median"], 100)
+
+    #  Tests that failed notebooks are recorded, but left out of the samples and the baselines.
+    def test_failed_results(self):
+        for run in range(3):
+            self.store.record_run([[make_result("first", 10 + run)]], URL, 1)
+        self.store.record_run([[make_result("first", 1, status=Status.TIMEOUT)]] * 2, URL, 1)
+        run_id = self.store.record_run([[make_result("first", 12), make_result("first", 0.5, status=Status.ERROR),
+                                         make_result("first", 60, status=Status.FAIL)]], URL, 1)
+        self.assertEqual(self.store.samples(run_id), {"first": [12]})
+        self.assertEqual(sorted(self.store.baseline("first", URL, 1, run_id, window=2)), [11, 12])
+        self.assertEqual(self.store.thresholds(URL, 1, min_samples=4)["first"]["median"], 11.5)
+        statuses = self.store.connection.execute("SELECT status FROM results WHERE run_id = ?", (run_id,))
+        self.assertEqual([status for (status,) in statuses], ["SUCCESS", "ERROR", "FAIL"])
+
+    #  Tests that each result is recorded with the number of the user that ran it.
+    def test_users(self):
+        run_id = self.store.record_run([make_result("first", 1, user=user) for user in (2, 1, 2, 0)], URL, 2)
+        users = self.store.connection.execute("SELECT user FROM results WHERE run_id = ?", (run_id,))
+        self.assertEqual([user for (user,) in users], [2, 1, 2, 0])
+
+    #  Tests that learned thresholds are exported in the notebook configuration format.
+    def test_export_thresholds(self):
+        config = {"notebooks": [{"name": "first", "filepath": "/first", "totaltime": 50, "results": []},
+                                {"name": "second", "filepath": "/second", "totaltime": 20, "results": []}]}
+        exported = export_thresholds(config, {"first": {"lower": 9.5, "upper": 14.2}})
+        self.assertEqual(exported["notebooks"][0], {"name": "first", "filepath": "/first", "totaltime": 15,
+                                                    "mintime": 9, "results": []})
+        self.assertEqual(exported["notebooks"][1], config["notebooks"][1])
+        self.assertEqual(config["notebooks"][0]["totaltime"], 50)
+
+    #  Tests that comparing an unknown run is rejected.
+    def test_unknown_run(self):
+        with self.assertRaises(InvalidConfigurationError):
+            self.store.compare(1)
+
+    #  Tests that a directory outside a git checkout has no revision.
+    def test_git_revision(self):
+        self.assertEqual(git_revision(self.tmpdir.name), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
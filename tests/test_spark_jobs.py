@@ -0,0 +1,202 @@
+"""
+Tests for the summaries of the Spark jobs of the paragraphs, against a fake Spark UI
+"""
+import json
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from gdmp_benchmark import Status
+from gdmp_benchmark.gdmp_benchmark import SparkJobCollector, ZeppelinRestNotebookHandler, paragraph_job_urls
+from tests.zeppelin_stub import ZeppelinStubServer
+from tests.test_zeppelin_rest import write_configs, make_benchmarker
+
+APPLICATION = "/api/v1/applications/app-1"
+DOCUMENTS = {
+    "/api/v1/applications": [{"id": "app-1", "name": "zeppelin"}],
+    APPLICATION + "/jobs/0": {"jobId": 0, "stageIds": [0, 1], "numTasks": 10, "numFailedTasks": 1,
+                              "submissionTime": "2024-01-31T10:00:00.000GMT",
+                              "completionTime": "2024-01-31T10:00:05.500GMT"},
+    APPLICATION + "/jobs/1": {"jobId": 1, "stageIds": [2], "numTasks": 2, "numFailedTasks": 0,
+                              "submissionTime": "2024-01-31T10:00:06.000GMT",
+                              "completionTime": "2024-01-31T10:00:06.500GMT"},
+    APPLICATION + "/stages/0": [{"status": "COMPLETE", "submissionTime": "2024-01-31T10:00:00.000GMT",
+                                 "firstTaskLaunchedTime": "2024-01-31T10:00:00.500GMT",
+                                 "executorRunTime": 3000, "inputBytes": 1000, "shuffleWriteBytes": 200}],
+    APPLICATION + "/stages/1": [{"status": "COMPLETE", "submissionTime": "2024-01-31T10:00:02.000GMT",
+                                 "firstTaskLaunchedTime": "2024-01-31T10:00:02.250GMT",
+                                 "executorRunTime": 1500, "shuffleReadBytes": 200}],
+    APPLICATION + "/stages/2": [{"status": "SKIPPED", "executorRunTime": 0}],
+}
+
+
+class SparkUIHandler(BaseHTTPRequestHandler):
+    """Serves the Spark monitoring REST API of a single application, also behind a YARN proxy"""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        path = re.sub(r"/(proxy|history)/application_1_0001", "", self.path).replace("application_1_0001", "app-1")
+        with self.server.lock:
+            self.server.requests.append(path)
+        documents = dict(DOCUMENTS, **{"/api/v1/applications": self.server.applications})
+        if path not in documents:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(documents[path]).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeSparkUI(ThreadingHTTPServer):
+    """Fake Spark UI, running in a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SparkUIHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.applications = DOCUMENTS["/api/v1/applications"]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        """URL of the running server"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def job_info(*urls, legacy=False):
+    """Runtime infos of a paragraph that launched the jobs"""
+    return {"jobUrl": {"propertyName": "jobUrl", "label": "SPARK JOB", "group": "spark",
+                       "values": list(urls) if legacy else [{"jobUrl": url} for url in urls]}}
+
+
+class TestJobUrls(unittest.TestCase):
+
+    #  Tests that job URLs are read from the runtime infos of both formats of Zeppelin.
+    def test_paragraph_job_urls(self):
+        self.assertEqual(paragraph_job_urls({"runtimeInfos": job_info("a", "b", "a")}), ["a", "b"])
+        self.assertEqual(paragraph_job_urls({"runtimeInfos": job_info("a", legacy=True)}), ["a"])
+        self.assertEqual(paragraph_job_urls({"runtimeInfos": {"other": {"propertyName": "x", "values": ["y"]}}}), [])
+        self.assertEqual(paragraph_job_urls({"text": "%md"}), [])
+
+    #  Tests that the UI and the job are parsed from direct and YARN proxied URLs.
+    def test_parse_job_url(self):
+        self.assertEqual(SparkJobCollector.parse_job_url("http://host:4040/jobs/job?id=3"), ("http://host:4040", "3"))
+        self.assertEqual(SparkJobCollector.parse_job_url("http://rm:8088/proxy/application_1_0001/jobs/job/?id=12"),
+                         ("http://rm:8088/proxy/application_1_0001", "12"))
+        with self.assertRaises(ValueError):
+            SparkJobCollector.parse_job_url("http://host:4040/stages/")
+
+
+class TestSparkJobCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeSparkUI()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    #  Tests that the jobs of a paragraph are totalled over their stages, skipping skipped stages.
+    def test_summarise(self):
+        collector = SparkJobCollector()
+        summary = collector.summarise([self.server.url + "/jobs/job?id=0", self.server.url + "/jobs/job?id=1"])
+        self.assertEqual(summary, {"jobs": 2, "stages": 2, "tasks": 12, "failed_tasks": 1, "job_time": 6.0,
+                                   "scheduler_delay": 0.75, "executor_run_time": 4.5, "input_bytes": 1000,
+                                   "shuffle_read_bytes": 200, "shuffle_write_bytes": 200})
+        self.assertEqual(self.server.requests.count("/api/v1/applications"), 1)
+
+    #  Tests that the application of a YARN proxied UI is taken from its URL.
+    def test_yarn_proxy(self):
+        summary = SparkJobCollector().summarise([self.server.url + "/proxy/application_1_0001/jobs/job/?id=1"])
+        self.assertEqual(summary["jobs"], 1)
+        self.assertNotIn("/api/v1/applications", self.server.requests)
+
+    #  Tests that the application of a history server UI is taken from its URL.
+    def test_history_server(self):
+        summary = SparkJobCollector().summarise([self.server.url + "/history/application_1_0001/jobs/job/?id=0"])
+        self.assertEqual(summary["jobs"], 1)
+        self.assertNotIn("/api/v1/applications", self.server.requests)
+
+    #  Tests that a job of a UI serving several applications is not read from an arbitrary one.
+    def test_ambiguous_application(self):
+        self.server.applications = [{"id": "app-2", "name": "other"}, {"id": "app-1", "name": "zeppelin"}]
+        summary = SparkJobCollector().summarise([self.server.url + "/jobs/job?id=0"])
+        self.assertNotIn("jobs", summary)
+        self.assertIn("2 applications", summary["error"])
+        self.assertFalse(any(path.startswith("/api/v1/applications/") for path in self.server.requests))
+
+    #  Tests that each thread reads the Spark UI with its own session.
+    def test_session_per_thread(self):
+        collector = SparkJobCollector()
+        sessions = []
+        original = requests.Session.get
+
+        def get(session, *args, **kwargs):
+            with self.server.lock:
+                sessions.append(session)
+            return original(session, *args, **kwargs)
+
+        with mock.patch.object(requests.Session, "get", get):
+            threads = [threading.Thread(target=collector.summarise, args=([self.server.url + "/jobs/job?id=0"],))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(set(map(id, sessions))), 2)
+
+    #  Tests that a job that cannot be read is reported in the summary.
+    def test_unreadable_job(self):
+        summary = SparkJobCollector().summarise([self.server.url + "/jobs/job?id=0", self.server.url + "/jobs/job?id=9"])
+        self.assertEqual(summary["jobs"], 1)
+        self.assertIn("404", summary["error"])
+
+
+class TestBenchmarkSparkJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.spark = FakeSparkUI()
+        self.zeppelin = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.zeppelin.stop()
+        self.spark.shutdown()
+        self.spark.server_close()
+        self.tmpdir.cleanup()
+
+    #  Tests that the Spark jobs of each paragraph are summarised in the results of both runners.
+    def test_run(self):
+        path = f"{self.tmpdir.name}/spark.json"
+        with open(path, "w", encoding="utf-8") as note_file:
+            json.dump({"name": "spark", "paragraphs": [
+                {"id": "query", "text": "%spark count", "runtimeInfos": job_info(self.spark.url + "/jobs/job?id=0")},
+                {"id": "show", "text": "%md done"}]}, note_file)
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.zeppelin.url, 2, {"spark": path})
+        for runner in ("pool", "asyncio"):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.zeppelin.url, notebook_handler="rest")
+            results = benchmarker.run(usercount=2, notebook_config=notebook_config, runner=runner, spark_jobs=True)
+            for (result,) in results:
+                self.assertEqual(result.result, Status.SUCCESS)
+                query, show = result.paragraphs
+                self.assertEqual(query.job_urls, [self.spark.url + "/jobs/job?id=0"])
+                self.assertEqual(query.spark["jobs"], 1)
+                self.assertEqual(query.to_dict()["spark"]["shuffle_write_bytes"], 200)
+                self.assertEqual(show.spark, {})
+                self.assertIn("spark", result.time.phases)
+
+
+if __name__ == '__main__':
+    unittest.main()
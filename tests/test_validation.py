@@ -0,0 +1,115 @@
+"""
+Tests for the validation of the output of notebooks against their expected results
+"""
+import hashlib
+import unittest
+from gdmp_benchmark import GDMPBenchmarker, Results, Timing, Notebook, Status
+from gdmp_benchmark.gdmp_benchmark import make_validator, make_validators, validate_output, \
+    ExactValidator, HashValidator, NumberValidator, RegexValidator, InvalidConfigurationError
+
+
+def make_result(output):
+    """Create the successful Results of a notebook run with the given output"""
+    return Results(result=Status.SUCCESS, msg="", output=output, notebookid="", user_config="", messages=[],
+                   time=Timing(result=Status.PASS, totaltime=5, start="", finish="", elapsed=5))
+
+
+class TestValidators(unittest.TestCase):
+
+    #  Tests that exact outputs are compared ignoring surrounding whitespace.
+    def test_exact(self):
+        self.assertEqual(ExactValidator("Pi is roughly 3.14").validate("Pi is roughly 3.14\n"), "")
+        self.assertIn("got 'Pi is roughly 3.15'", ExactValidator("Pi is roughly 3.14").validate("Pi is roughly 3.15"))
+
+    #  Tests that outputs are hashed in chunks to the same digest as the whole output.
+    def test_hash(self):
+        output = "row\n" * 100000
+        digest = hashlib.blake2b(output.encode("utf-8")).hexdigest()
+        self.assertEqual(HashValidator.hexdigest(output), digest)
+        self.assertEqual(HashValidator(digest.upper()).validate(output), "")
+        self.assertIn("expected blake2b", HashValidator(digest).validate(output + "row\n"))
+        with self.assertRaises(InvalidConfigurationError):
+            HashValidator(digest, "unknown")
+
+    #  Tests that md5 digests of the existing configurations are still accepted.
+    def test_legacy_md5(self):
+        validator = make_validator(hashlib.md5(b"table").hexdigest())
+        self.assertIsInstance(validator, HashValidator)
+        self.assertEqual(validator.validate("table"), "")
+        self.assertIsInstance(make_validator("3.141210"), ExactValidator)
+
+    #  Tests that numbers are compared within an absolute or relative tolerance.
+    def test_number(self):
+        self.assertEqual(NumberValidator(3.1416, tolerance=0.01).validate("Pi is roughly 3.141210\n"), "")
+        self.assertIn("got 3.2", NumberValidator(3.1416, tolerance=0.01).validate("Pi is roughly 3.2"))
+        self.assertEqual(NumberValidator([100, 2e-3], relative=0.1).validate("count 105, rate 2.1e-3"), "")
+        self.assertIn("expected 2 numbers", NumberValidator([1, 2]).validate("1 only"))
+        self.assertEqual(make_validator(3).validate("3"), "")
+
+    #  Tests that outputs are searched for a regular expression.
+    def test_regex(self):
+        self.assertEqual(RegexValidator(r"Pi is roughly 3\.14\d+").validate("Pi is roughly 3.141210"), "")
+        self.assertIn("expected a match", RegexValidator(r"^\d+ rows$").validate("no rows"))
+        with self.assertRaises(InvalidConfigurationError):
+            RegexValidator("(")
+
+    #  Tests that validators are created from their specification.
+    def test_make_validator(self):
+        self.assertIsInstance(make_validator({"type": "number", "value": 3.14, "tolerance": 0.01}), NumberValidator)
+        self.assertIsInstance(make_validator({"type": "hash", "digest": "ab", "algorithm": "sha256"}), HashValidator)
+        self.assertIsInstance(make_validator({"value": "text"}), ExactValidator)
+        for invalid in ({"type": "unknown"}, {"type": "number"}, {"type": "regex", "value": "x"}, [1]):
+            with self.assertRaises(InvalidConfigurationError):
+                make_validator(invalid)
+
+    #  Tests that expected outputs are keyed by cell number, from a list or a dictionary.
+    def test_make_validators(self):
+        self.assertEqual(sorted(make_validators(["", "a", None, "b"])), [1, 3])
+        self.assertEqual(sorted(make_validators({"2": "a", "0": {"type": "regex", "pattern": "b"}})), [0, 2])
+        notebook = Notebook(name="pi", filepath="pi.json", totaltime=10, results={"1": "a"})
+        self.assertEqual(sorted(notebook.validators), [1])
+        with self.assertRaises(InvalidConfigurationError):
+            Notebook(name="pi", filepath="pi.json", totaltime=10, results=[{"type": "unknown"}])
+
+    #  Tests that every mismatch is reported, including missing cells.
+    def test_validate_output(self):
+        validators = make_validators(["a", "b", "c", "d"])
+        mismatches = validate_output(["a", "x", "y"], validators)
+        self.assertEqual(len(mismatches), 3)
+        self.assertTrue(mismatches[0].startswith("Expected/Actual output mismatch of cell #1"))
+        self.assertTrue(mismatches[1].startswith("Expected/Actual output mismatch of cell #2"))
+        self.assertEqual(mismatches[2], "Missing output of cell #3!")
+        self.assertEqual(validate_output(["a", "b", "c", "d"], validators), [])
+
+
+class TestProcessResult(unittest.TestCase):
+
+    #  Tests that a run whose output does not match fails with all its mismatches.
+    def test_mismatches_fail(self):
+        notebook = Notebook(name="pi", filepath="pi.json", totaltime=10,
+                            results=["%md intro", {"type": "number", "value": 3.1416, "tolerance": 0.01}, "end"])
+        result = GDMPBenchmarker()._process_result(notebook, make_result(["%md intro", "Pi is roughly 3.5"]))
+        self.assertEqual(result.result, Status.FAIL)
+        self.assertEqual(len(result.messages), 2)
+        self.assertFalse(result.outputs["valid"])
+        self.assertIn("Missing output of cell #2!", result.logs)
+
+    #  Tests that a run whose output matches within the tolerance succeeds.
+    def test_tolerance_passes(self):
+        notebook = Notebook(name="pi", filepath="pi.json", totaltime=10,
+                            results=["", {"type": "number", "value": 3.1416, "tolerance": 0.01}])
+        result = GDMPBenchmarker()._process_result(notebook, make_result(["%md intro", "Pi is roughly 3.141210\n"]))
+        self.assertEqual(result.result, Status.SUCCESS)
+        self.assertEqual(result.messages, [])
+        self.assertTrue(result.outputs["valid"])
+
+    #  Tests that the output of a run that errored is not validated.
+    def test_error_not_validated(self):
+        notebook = Notebook(name="pi", filepath="pi.json", totaltime=10, results=["a"])
+        result = make_result([])
+        result.result = Status.ERROR
+        self.assertEqual(GDMPBenchmarker()._process_result(notebook, result).messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,515 @@
+"""
+Tests for the Zeppelin REST notebook handler, run against a local stub Zeppelin server
+"""
+import asyncio
+import os
+import json
+import threading
+import time
+import tempfile
+import unittest
+from unittest import mock
+import requests
+from gdmp_benchmark import GDMPBenchmarker, Status
+from gdmp_benchmark.gdmp_benchmark import ZeppelinRestNotebookHandler, \
+    AsyncZeppelinRestNotebookHandler, InvalidConfigurationError, ArrivalProfile, build_parser
+from gdmp_benchmark.notebooks import read_user_config
+from tests.zeppelin_stub import ZeppelinStubServer, write_user_config, write_note
+
+
+def write_configs(directory, url, usercount, notes, dependencies=None):
+    """Write the user and notebook configurations for a benchmark against the stub"""
+    users = {"users": [{"username": f"user{i}", "shirouser": {"name": f"user{i}", "password": "pass"}}
+                       for i in range(1, usercount + 1)]}
+    user_config = f"{directory}/users.json"
+    with open(user_config, "w", encoding="utf-8") as config_file:
+        json.dump(users, config_file)
+    notebooks = {"notebooks": [{"name": name, "filepath": path, "totaltime": 10, "results": [],
+                                "depends_on": (dependencies or {}).get(name, [])}
+                               for name, path in notes.items()]}
+    notebook_config = f"{directory}/notebooks.json"
+    with open(notebook_config, "w", encoding="utf-8") as config_file:
+        json.dump(notebooks, config_file)
+    return user_config, notebook_config
+
+
+class StubBenchmarker(GDMPBenchmarker):
+    """Benchmarker that writes its user configurations to the given directory"""
+
+    def __init__(self, directory, **kwargs):
+        self.DEFAULT_DIR = directory + "/"
+        super().__init__(**kwargs)
+
+
+def make_benchmarker(directory, **kwargs):
+    """Create a benchmarker that writes its user configurations to the given directory"""
+    return StubBenchmarker(directory, **kwargs)
+
+
+class SyncRestHandler(ZeppelinRestNotebookHandler):
+    """The REST handler, run in threads by the asyncio runner like the zdairi handler"""
+
+
+class TestZeppelinRestNotebookHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config = write_user_config(self.tmpdir.name, self.server.url)
+
+    def tearDown(self):
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    #  Tests that a notebook can be created, executed, printed and deleted.
+    def test_notebook_lifecycle(self):
+        filepath = write_note(self.tmpdir.name, ["%md hello", "%md world"])
+        messages = []
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, messages)
+        self.assertIn(notebookid, self.server.notes)
+        output, msg, status = ZeppelinRestNotebookHandler.execute_notebook(
+            self.config, notebookid, filepath, messages)
+        self.assertEqual(status, Status.SUCCESS)
+        self.assertEqual(msg, "")
+        self.assertEqual(messages, [])
+        note = ZeppelinRestNotebookHandler.print_notebook(notebookid, self.config)
+        self.assertEqual(len(note["paragraphs"]), 2)
+        ZeppelinRestNotebookHandler.delete_notebook(notebookid, self.config)
+        self.assertNotIn(notebookid, self.server.notes)
+
+    #  Tests that a failing paragraph is reported as an error with its message, after the output of the cells run.
+    def test_failing_notebook(self):
+        filepath = write_note(self.tmpdir.name, ["%md fine", "%sh fail here", "%md never"])
+        messages = []
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, messages)
+        output, msg, status = ZeppelinRestNotebookHandler.execute_notebook(
+            self.config, notebookid, filepath, messages)
+        self.assertEqual(status, Status.ERROR)
+        self.assertEqual(msg, "%sh fail here")
+        self.assertEqual(output, ["%md fine", "%sh fail here"])
+
+    #  Tests that each paragraph is run individually and timed, stopping at the first failure.
+    def test_paragraph_timings(self):
+        self.server.paragraph_delay = 0.05
+        filepath = write_note(self.tmpdir.name, ["%md fine", "%sh fail here", "%md never"])
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+        paragraphs = []
+        ZeppelinRestNotebookHandler.execute_notebook(self.config, notebookid, filepath, [], paragraphs)
+        self.assertEqual([paragraph.paragraphid for paragraph in paragraphs], ["paragraph_0", "paragraph_1"])
+        self.assertEqual([paragraph.status for paragraph in paragraphs], ["FINISHED", "ERROR"])
+        self.assertEqual(paragraphs[0].title, "%md fine")
+        self.assertTrue(all(paragraph.duration >= 0.05 for paragraph in paragraphs))
+
+    #  Tests that only a failed paragraph is an error, other HTTP errors failing the notebook on both handlers.
+    def test_paragraph_http_error(self):
+        filepath = write_note(self.tmpdir.name, ["%md fine"])
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+        missing = {"id": "missing", "text": "%md missing"}
+        with self.assertRaises(requests.HTTPError):
+            ZeppelinRestNotebookHandler.run_paragraph(self.config, notebookid, missing)
+        with self.assertRaises(requests.HTTPError):
+            asyncio.run(AsyncZeppelinRestNotebookHandler.run_paragraph(self.config, notebookid, missing))
+        messages = []
+        _, _, status = ZeppelinRestNotebookHandler.execute_notebook(self.config, "missing", filepath, messages)
+        self.assertEqual(status, Status.FAIL)
+
+    #  Tests that a paragraph running past its timeout is stopped, and the notebook times out.
+    def test_paragraph_timeout(self):
+        filepath = write_note(self.tmpdir.name, ["%md fine", "%sh sleep 5", "%md never"])
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+        messages, paragraphs = [], []
+        start = time.perf_counter()
+        _, msg, status = ZeppelinRestNotebookHandler.execute_notebook(
+            self.config, notebookid, filepath, messages, paragraphs, paragraph_timeout=0.3)
+        self.assertLess(time.perf_counter() - start, 3)
+        self.assertEqual(status, Status.TIMEOUT)
+        self.assertEqual(msg, "Paragraph paragraph_1 timed out after 0.3 seconds")
+        self.assertEqual(messages, [msg])
+        self.assertEqual([paragraph.status for paragraph in paragraphs], ["FINISHED", "TIMEOUT"])
+        self.assertIn(("DELETE", f"/api/notebook/job/{notebookid}/paragraph_1"), self.server.requests)
+        note = self.server.notes[notebookid]
+        self.assertEqual([paragraph.get("status") for paragraph in note["paragraphs"]],
+                         ["FINISHED", "ABORT", None])
+
+    #  Tests that the paragraphs share the time left before the notebook times out.
+    def test_notebook_timeout(self):
+        filepath = write_note(self.tmpdir.name, ["%sh sleep 0.2", "%sh sleep 5"])
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+        paragraphs = []
+        _, _, status = ZeppelinRestNotebookHandler.execute_notebook(
+            self.config, notebookid, filepath, [], paragraphs, timeout=0.5)
+        self.assertEqual(status, Status.TIMEOUT)
+        self.assertEqual([paragraph.status for paragraph in paragraphs], ["FINISHED", "TIMEOUT"])
+        self.assertLess(sum(paragraph.duration for paragraph in paragraphs), 1)
+
+    #  Tests that the user logs in once and reuses the same connection for every call.
+    def test_session_reused(self):
+        filepath = write_note(self.tmpdir.name, ["%md hello"])
+        for _ in range(3):
+            notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+            ZeppelinRestNotebookHandler.execute_notebook(self.config, notebookid, filepath, [])
+            ZeppelinRestNotebookHandler.delete_notebook(notebookid, self.config)
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(self.server.connections, 1)
+
+    #  Tests that the user configuration is read once, when the session is created.
+    def test_session_config_cached(self):
+        filepath = write_note(self.tmpdir.name, ["%md hello"])
+        with mock.patch("gdmp_benchmark.handlers.read_user_config", wraps=read_user_config) as reader:
+            for _ in range(3):
+                notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+                ZeppelinRestNotebookHandler.delete_notebook(notebookid, self.config)
+        self.assertEqual(reader.call_count, 1)
+
+    #  Tests that an expired session logs in again instead of failing the request.
+    def test_session_expired(self):
+        filepath = write_note(self.tmpdir.name, ["%md hello"])
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+        session, _ = ZeppelinRestNotebookHandler.get_session(self.config)
+        session.cookies.clear()
+        self.assertTrue(ZeppelinRestNotebookHandler.delete_notebook(notebookid, self.config))
+        self.assertEqual(self.server.logins, 2)
+        self.assertEqual(self.server.notes, {})
+
+    #  Tests that clearing a notebook removes the output of its paragraphs.
+    def test_clear_notebook(self):
+        filepath = write_note(self.tmpdir.name, ["%md hello"])
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, [])
+        ZeppelinRestNotebookHandler.execute_notebook(self.config, notebookid, filepath, [])
+        self.assertTrue(ZeppelinRestNotebookHandler.clear_notebook(notebookid, self.config))
+        paragraph = ZeppelinRestNotebookHandler.print_notebook(notebookid, self.config)["paragraphs"][0]
+        self.assertNotIn("results", paragraph)
+        self.assertEqual(paragraph["status"], "READY")
+        self.assertFalse(ZeppelinRestNotebookHandler.clear_notebook("missing", self.config))
+
+    #  Tests that a failed request is recorded in the messages instead of raising.
+    def test_create_notebook_unreachable(self):
+        self.server.stop()
+        filepath = write_note(self.tmpdir.name, ["%md hello"])
+        messages = []
+        notebookid = ZeppelinRestNotebookHandler.create_notebook(self.config, filepath, messages)
+        self.assertEqual(notebookid, "")
+        self.assertEqual(len(messages), 2)
+        self.server = ZeppelinStubServer().start()
+
+
+class TestAsyncRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ZeppelinStubServer().start()
+        self.server.paragraph_delay = 0.05
+        self.tmpdir = tempfile.TemporaryDirectory()
+        AsyncZeppelinRestNotebookHandler.POLL_INTERVAL = 0.01
+
+    def tearDown(self):
+        AsyncZeppelinRestNotebookHandler.POLL_INTERVAL = 1.0
+        ZeppelinRestNotebookHandler.close_sessions()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    #  Tests that many users run as coroutines, returning one list of Results per user.
+    def test_run_many_users(self):
+        notes = {
+            "first": write_note(self.tmpdir.name, ["%md one"], "first"),
+            "second": write_note(self.tmpdir.name, ["%md two", "%md three"], "second"),
+        }
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 10, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler="rest")
+        results = benchmarker.run(usercount=10, notebook_config=notebook_config, runner="asyncio")
+        self.assertEqual(len(results), 10)
+        for user, user_results in enumerate(results, start=1):
+            self.assertEqual([result.name for result in user_results], ["first", "second"])
+            self.assertTrue(all(result.result == Status.SUCCESS for result in user_results))
+            self.assertTrue(user_results[0].user_config.endswith(f"user{user}.yml"))
+            self.assertEqual(len(user_results[1].paragraphs), 2)
+            phases = user_results[1].time.phases
+            self.assertEqual(set(phases), {"fetch", "write", "create", "execute", "execute.print",
+                                           "execute.run", "validate"})
+            self.assertGreater(user_results[1].time.elapsed, 0.1)
+            self.assertLess(sum(phases[name] for name in ("fetch", "write", "create", "execute")),
+                            user_results[1].time.elapsed)
+            self.assertEqual(user_results[1].paragraphs[1].status, "FINISHED")
+        self.assertEqual(self.server.logins, 10)
+        self.assertEqual(self.server.notes, {})
+        self.assertEqual(sorted(benchmarker.deletion), list(range(1, 11)))
+        self.assertTrue(all(deletion["notebooks"] == 2 and deletion["seconds"] > 0
+                            for deletion in benchmarker.deletion.values()))
+
+    #  Tests that a synchronous handler gets a thread for each user, more than the default executor has.
+    def test_run_many_users_threaded(self):
+        barrier = threading.Barrier(40, timeout=30)
+
+        class BarrierHandler(ZeppelinRestNotebookHandler):
+            """Synchronous handler whose notebooks only run once every user is running one"""
+
+            @staticmethod
+            def execute_notebook(*args, **kwargs):
+                barrier.wait()
+                return ZeppelinRestNotebookHandler.execute_notebook(*args, **kwargs)
+
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 40, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler=BarrierHandler)
+        results = benchmarker.run(usercount=40, notebook_config=notebook_config, runner="asyncio")
+        self.assertTrue(all(result.result == Status.SUCCESS for (result,) in results))
+        self.assertEqual(benchmarker.async_notebook_handler.max_workers, 40)
+
+    #  Tests that both runners raise the errors of the notebook handler, leaving no notebook registered as running.
+    def test_handler_error(self):
+        class FailingHandler(ZeppelinRestNotebookHandler):
+            """Handler losing the notebooks it executes"""
+
+            @staticmethod
+            def execute_notebook(*args, **kwargs):
+                raise RuntimeError("lost")
+
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 1, notes)
+        for runner in ("pool", "asyncio"):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.server.url, notebook_handler=FailingHandler)
+            with self.assertRaisesRegex(RuntimeError, "lost"):
+                benchmarker.run(usercount=1, notebook_config=notebook_config, runner=runner)
+            self.assertEqual(benchmarker._running, {})  # pylint: disable=protected-access
+
+    #  Tests that a single user run returns a flat list of Results, like the pool runner.
+    def test_run_single_user(self):
+        notes = {"first": write_note(self.tmpdir.name, ["%md one", "%sh fail"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 1, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler="rest")
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config, runner="asyncio")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].result, Status.ERROR)
+        self.assertEqual(results[0].msg, "%sh fail")
+
+    #  Tests that results from every worker process are published as each notebook completes.
+    def test_pool_runner_publishes_results(self):
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first"),
+                 "second": write_note(self.tmpdir.name, ["%md two"], "second")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 3, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler="rest")
+        published = []
+        results = benchmarker.run(usercount=3, notebook_config=notebook_config,
+                                  on_result=lambda user, result: published.append((user, result.name)))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(published), sorted((user, name) for user in (1, 2, 3)
+                                                   for name in ("first", "second")))
+        summary = benchmarker.summarise()
+        self.assertEqual(sorted(summary), ["first", "second"])
+        self.assertEqual(summary["first"]["count"], 3)
+        self.assertEqual(summary["first"]["results"], {"SUCCESS": 3})
+        self.assertEqual({user: deletion["notebooks"] for user, deletion in benchmarker.deletion.items()},
+                         {1: 2, 2: 2, 3: 2})
+
+    #  Tests that an open-loop run launches notebooks on schedule, queueing beyond the in-flight limit.
+    def test_open_loop(self):
+        self.server.paragraph_delay = 0.3
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first"),
+                 "second": write_note(self.tmpdir.name, ["%md two"], "second")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 2, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler="rest")
+        profile = ArrivalProfile(rate=600, duration=0.4)
+        results = benchmarker.run(usercount=2, notebook_config=notebook_config,
+                                  arrival_profile=profile, max_in_flight=2)
+        self.assertEqual(len(results), 4)
+        self.assertEqual([result.name for result in results], ["first", "second"] * 2)
+        self.assertTrue(results[0].user_config.endswith("user1.yml"))
+        self.assertTrue(results[1].user_config.endswith("user2.yml"))
+        self.assertEqual([result.arrival["scheduled"] for result in results], [0, 0.1, 0.2, 0.3])
+        # The first two start on schedule, the others wait for a free slot
+        self.assertLess(results[0].arrival["queue_delay"], 0.1)
+        self.assertGreater(results[3].arrival["queue_delay"], 0.1)
+        self.assertTrue(all(result.arrival["service_time"] >= 0.3 for result in results))
+        summary = GDMPBenchmarker.open_loop_summary(results, 0.4)
+        self.assertEqual(summary["executions"], 4)
+        self.assertEqual(summary["offered_per_minute"], 600)
+        self.assertLess(summary["completed_per_minute"], 600)
+        self.assertEqual(self.server.notes, {})
+
+    #  Tests that the time an open-loop arrival waits for a thread of a synchronous handler is queueing.
+    def test_open_loop_thread_wait(self):
+        self.server.paragraph_delay = 0.3
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 1, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler=SyncRestHandler)
+        results = benchmarker.run(usercount=1, notebook_config=notebook_config,
+                                  arrival_profile=ArrivalProfile(rate=1200, duration=0.1))
+        self.assertEqual([result.arrival["scheduled"] for result in results], [0, 0.05])
+        # A single thread runs the notebooks one at a time
+        self.assertGreater(results[1].arrival["queue_delay"], 0.2)
+        self.assertTrue(all(0.3 <= result.arrival["service_time"] < 0.55 for result in results))
+
+    #  Tests that repeated runs reuse each user's notebooks, excluding warm-up runs from the statistics.
+    def test_warmup_and_iterations(self):
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 2, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler="rest")
+        results = benchmarker.run(usercount=2, notebook_config=notebook_config, runner="asyncio",
+                                  warmup=1, iterations=3, thresholds={"first": {"lower": 0, "upper": 60}})
+        for user_results in results:
+            self.assertEqual([result.warmup for result in user_results], [True, False, False, False])
+            self.assertTrue(all(result.time.result == Status.FAST for result in user_results))
+            self.assertEqual(user_results[0].time.expected, 60)
+            self.assertEqual(len({result.notebookid for result in user_results}), 1)
+            self.assertNotIn("create", user_results[1].time.phases)
+        imports = [path for method, path in self.server.requests if path == "/api/notebook/import"]
+        self.assertEqual(len(imports), 2)
+        self.assertEqual(benchmarker.summarise()["first"]["count"], 6)
+        self.assertEqual(self.server.notes, {})
+        with self.assertRaises(InvalidConfigurationError):
+            benchmarker.run(notebook_config=notebook_config, iterations=0)
+
+    #  Tests that notebooks with the same content are imported once per user, and cleared before each rerun.
+    def test_notebook_pool(self):
+        os.mkdir(os.path.join(self.tmpdir.name, "copy"))
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first"),
+                 "second": write_note(self.tmpdir.name, ["%md two"], "second"),
+                 "copy": write_note(os.path.join(self.tmpdir.name, "copy"), ["%md one"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 1, notes)
+        benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                       zeppelin_url=self.server.url, notebook_handler="rest")
+        results = benchmarker.run(notebook_config=notebook_config, iterations=2)
+        self.assertEqual([result.name for result in results], ["first", "second", "copy"] * 2)
+        self.assertEqual(results[0].notebookid, results[2].notebookid)
+        self.assertEqual(len({result.notebookid for result in results}), 2)
+        self.assertEqual(set(results[2].time.phases), {"fetch", "clear", "execute", "execute.print",
+                                                       "execute.run", "validate"})
+        self.assertTrue(all(result.result == Status.SUCCESS for result in results))
+        methods = [method for method, path in self.server.requests
+                   if path == "/api/notebook/import" or path.endswith("/clear")]
+        self.assertEqual(methods, ["POST", "POST", "PUT", "PUT", "PUT", "PUT"])
+        self.assertNotIn("delete", results[5].time.phases)
+        self.assertEqual(benchmarker.deletion[0]["notebooks"], 2)
+        self.assertEqual(self.server.notes, {})
+
+    #  Tests that a pooled notebook that cannot be cleared is replaced by a new one, with both runners.
+    def test_notebook_pool_clear_failed(self):
+        self.server.fail_clear = True
+        notes = {"first": write_note(self.tmpdir.name, ["%md one"], "first")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 1, notes)
+        for runner in ("pool", "asyncio"):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.server.url, notebook_handler="rest")
+            results = benchmarker.run(notebook_config=notebook_config, iterations=3, runner=runner)
+            self.assertTrue(all(result.result == Status.SUCCESS for result in results))
+            self.assertEqual(len({result.notebookid for result in results}), 3)
+            self.assertEqual(sum(deletion["notebooks"] for deletion in benchmarker.deletion.values()), 3)
+            self.assertEqual(self.server.notes, {})
+
+    #  Tests that each user runs independent notebooks concurrently, after the notebook they depend on.
+    def test_notebook_dependencies(self):
+        self.server.paragraph_delay = 0.3
+        notes = {"SetUp": write_note(self.tmpdir.name, ["%md setup"], "SetUp"),
+                 "first": write_note(self.tmpdir.name, ["%md one"], "first"),
+                 "second": write_note(self.tmpdir.name, ["%md two"], "second"),
+                 "copy": write_note(self.tmpdir.name, ["%md two"], "second")}
+        user_config, notebook_config = write_configs(
+            self.tmpdir.name, self.server.url, 2, notes,
+            {name: ["SetUp"] for name in ("first", "second", "copy")})
+        for runner in ("asyncio", "pool"):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.server.url, notebook_handler="rest")
+            results = benchmarker.run(usercount=2, notebook_config=notebook_config, runner=runner,
+                                      notebook_concurrency=3)
+            for user_results in results:
+                self.assertEqual([result.name for result in user_results], list(notes))
+                self.assertTrue(all(result.result == Status.SUCCESS for result in user_results))
+                setup, dependents = user_results[0].time, [result.time for result in user_results[1:]]
+                self.assertTrue(all(timing.start >= setup.finish for timing in dependents))
+                self.assertLess(max(timing.start for timing in dependents),
+                                min(timing.finish for timing in dependents))
+                # Notebooks with the same content running at the same time get their own copy
+                self.assertNotEqual(user_results[2].notebookid, user_results[3].notebookid)
+            self.assertEqual(self.server.notes, {})
+
+    #  Tests that the remaining notebooks of all the users are skipped once too many have failed.
+    def test_circuit_breaker(self):
+        self.server.paragraph_delay = 0.2
+        notes = {f"note{i}": write_note(self.tmpdir.name, [f"%sh fail {i}"], f"note{i}") for i in range(4)}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 3, notes)
+        for runner, thresholds in (("pool", {"max_errors": 4}), ("asyncio", {"max_user_errors": 1})):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.server.url, notebook_handler="rest")
+            results = benchmarker.run(usercount=3, notebook_config=notebook_config, runner=runner,
+                                      iterations=5, **thresholds)
+            statuses = [result.result for user_results in results for result in user_results]
+            self.assertEqual(len(results), 3)
+            self.assertTrue(all(len(user_results) == 4 for user_results in results))
+            self.assertIn(Status.SKIPPED, statuses)
+            self.assertLess(statuses.count(Status.ERROR), 3 * 4)
+            skipped = next(result for user_results in results for result in user_results
+                           if result.result == Status.SKIPPED)
+            self.assertTrue(skipped.msg.startswith("Skipped, the circuit breaker is open"))
+            self.assertTrue(benchmarker.breaker.to_dict()["open"])
+            self.assertEqual(self.server.notes, {})
+
+    #  Tests that the notebooks still running when the breaker opens are stopped, in every runner.
+    def test_circuit_breaker_stops_running(self):
+        notes = {"fail": write_note(self.tmpdir.name, ["%sh fail"], "fail"),
+                 "slow": write_note(self.tmpdir.name, ["%sh sleep 5"], "slow")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 2, notes)
+        for runner, usercount in (("pool", 1), ("pool", 2), ("asyncio", 2)):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.server.url, notebook_handler="rest")
+            start = time.perf_counter()
+            results = benchmarker.run(usercount=usercount, notebook_config=notebook_config, runner=runner,
+                                      notebook_concurrency=2, max_errors=1)
+            self.assertLess(time.perf_counter() - start, 4)
+            for failed, slow in results if usercount > 1 else [results]:
+                self.assertEqual(failed.result, Status.ERROR)
+                self.assertEqual(slow.result, Status.ERROR)
+            self.assertEqual(self.server.notes, {})
+
+    #  Tests that both runners stop a notebook that times out, and go on with the next one.
+    def test_timeouts(self):
+        notes = {"slow": write_note(self.tmpdir.name, ["%sh sleep 5"], "slow"),
+                 "quick": write_note(self.tmpdir.name, ["%md hello"], "quick")}
+        user_config, notebook_config = write_configs(self.tmpdir.name, self.server.url, 2, notes)
+        # Notebooks are expected to take 10 seconds, so a factor of 0.05 times out after 1
+        for runner, timeouts in (("pool", {"timeout_factor": 0.05}), ("asyncio", {"paragraph_timeout": 0.3})):
+            benchmarker = make_benchmarker(self.tmpdir.name, userconfig=user_config,
+                                           zeppelin_url=self.server.url, notebook_handler="rest")
+            start = time.perf_counter()
+            results = benchmarker.run(usercount=2, notebook_config=notebook_config, runner=runner, **timeouts)
+            self.assertLess(time.perf_counter() - start, 4)
+            for slow, quick in results:
+                self.assertEqual(slow.result, Status.TIMEOUT)
+                self.assertIn("timed out", slow.msg)
+                self.assertEqual(quick.result, Status.SUCCESS)
+            self.assertEqual(benchmarker.statistics.to_dict()["slow"]["results"], {str(Status.TIMEOUT): 2})
+        with self.assertRaises(InvalidConfigurationError):
+            GDMPBenchmarker().run(timeout_factor=-1)
+        # Notebooks time out after 3 times their expected time unless told otherwise
+        args = build_parser().parse_args(["--zeppelin_url", self.server.url, "--usercount", "1",
+                                          "--notebook_config", notebook_config, "--user_config", user_config])
+        self.assertEqual(args.timeout_factor, 3)
+
+    #  Tests that an unknown runner is rejected.
+    def test_unknown_runner(self):
+        with self.assertRaises(InvalidConfigurationError):
+            GDMPBenchmarker().run(runner="threads")
+
+
+class TestNotebookHandlerSelection(unittest.TestCase):
+
+    #  Tests that the notebook handler can be selected by name.
+    def test_select_by_name(self):
+        benchmarker = GDMPBenchmarker(notebook_handler="rest")
+        self.assertIs(benchmarker.notebook_handler, ZeppelinRestNotebookHandler)
+
+    #  Tests that an unknown notebook handler name is rejected.
+    def test_select_unknown(self):
+        with self.assertRaises(InvalidConfigurationError):
+            GDMPBenchmarker(notebook_handler="unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+"""
+Minimal stub of the Zeppelin REST API, used to test the REST notebook handlers
+"""
+import re
+import json
+import time
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class ZeppelinStubHandler(BaseHTTPRequestHandler):
+    """Request handler for the stub server"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send(self, code, body=None, headers=None):
+        payload = json.dumps({"status": "OK" if code < 400 else "ERROR", "body": body}).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _authorised(self):
+        return "JSESSIONID=stub" in self.headers.get("Cookie", "")
+
+    def _record(self, method):
+        path = urlparse(self.path).path
+        with self.server.lock:
+            self.server.requests.append((method, path))
+        return path, parse_qs(urlparse(self.path).query)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle POST requests"""
+        path, query = self._record("POST")
+        body = self._read_body()
+        if path == "/api/login":
+            with self.server.lock:
+                self.server.logins += 1
+                self.server.users.append(parse_qs(body.decode()).get("userName", [""])[0])
+            self._send(200, {"principal": "user"}, {"Set-Cookie": "JSESSIONID=stub; Path=/"})
+            return
+        if not self._authorised():
+            self._send(403)
+            return
+        if path == "/api/notebook/import":
+            note = json.loads(body)
+            noteid = "NOTE" + str(next(self.server.ids))
+            note["id"] = noteid
+            with self.server.lock:
+                self.server.notes[noteid] = note
+            self._send(200, noteid)
+            return
+        if path.startswith("/api/notebook/run/"):
+            paragraph = self.server.find_paragraph(path)
+            if paragraph is None:
+                self._send(404)
+                return
+            failed = self.server.run_paragraph(paragraph)
+            self._send(500 if failed else 200, paragraph["results"])
+            return
+        if path.startswith("/api/notebook/job/") and len(path.split("/")) == 6:
+            paragraph = self.server.find_paragraph(path)
+            if paragraph is None:
+                self._send(404)
+                return
+            paragraph["status"] = "PENDING"
+            threading.Thread(target=self.server.run_paragraph, args=(paragraph,), daemon=True).start()
+            self._send(200)
+            return
+        if path.startswith("/api/notebook/job/"):
+            note = self.server.notes.get(path.split("/")[4])
+            if note is None:
+                self._send(404)
+                return
+            if query.get("blocking") == ["true"]:
+                failed = self.server.run_note(note)
+                self._send(500 if failed else 200)
+            else:
+                self.server.run_note_in_background(note)
+                self._send(200)
+            return
+        self._send(404)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle GET requests"""
+        path, _ = self._record("GET")
+        if not self._authorised():
+            self._send(403)
+            return
+        if path.startswith("/api/notebook/job/") and len(path.split("/")) == 6:
+            paragraph = self.server.find_paragraph(path)
+            if paragraph is None:
+                self._send(404)
+                return
+            self._send(200, {"id": paragraph["id"], "status": paragraph.get("status", "READY")})
+            return
+        if path.startswith("/api/notebook/job/"):
+            note = self.server.notes.get(path.split("/")[4])
+            if note is None:
+                self._send(404)
+                return
+            self._send(200, self.server.job_status(note))
+            return
+        if path.startswith("/api/notebook/"):
+            note = self.server.notes.get(path.split("/")[3])
+            if note is None:
+                self._send(404)
+                return
+            self._send(200, note)
+            return
+        self._send(404)
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Handle PUT requests"""
+        path, _ = self._record("PUT")
+        body = self._read_body()
+        if not self._authorised():
+            self._send(403)
+            return
+        if path.startswith("/api/interpreter/setting/restart/"):
+            setting = path.split("/")[5]
+            with self.server.lock:
+                self.server.started.discard(setting)
+                self.server.restarts.append((setting, json.loads(body or b"{}").get("noteId", "")))
+            self._send(200)
+            return
+        if path.startswith("/api/notebook/") and path.endswith("/clear"):
+            note = self.server.notes.get(path.split("/")[3])
+            if note is None or self.server.fail_clear:
+                self._send(404 if note is None else 500)
+                return
+            self.server.clear_note(note)
+            self._send(200, note)
+            return
+        self._send(404)
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Handle DELETE requests"""
+        path, _ = self._record("DELETE")
+        if not self._authorised():
+            self._send(403)
+            return
+        if path.startswith("/api/notebook/job/"):
+            note = self.server.notes.get(path.split("/")[4])
+            if note is None:
+                self._send(404)
+                return
+            paragraph = self.server.find_paragraph(path) if len(path.split("/")) == 6 else None
+            for running in [paragraph] if paragraph else note.get("paragraphs", []):
+                if running.get("status") in ("PENDING", "RUNNING"):
+                    running["aborted"] = True
+            self._send(200)
+            return
+        if path.startswith("/api/notebook/"):
+            if self.server.fail_delete:
+                self._send(500)
+                return
+            with self.server.lock:
+                self.server.notes.pop(path.split("/")[3], None)
+            self._send(200)
+            return
+        self._send(404)
+
+
+class ZeppelinStubServer(ThreadingHTTPServer):
+    """
+    Stub Zeppelin server. Paragraphs are "run" by echoing their text as output,
+    a paragraph whose text contains "fail" finishes with an error and one whose text
+    contains "sleep N" runs for N more seconds, unless it is stopped. The first
+    paragraph of an interpreter setting takes interpreter_startup more seconds,
+    until the setting is restarted. Notebooks cannot be cleared while fail_clear is set,
+    nor deleted while fail_delete is set
+    """
+
+    daemon_threads = True
+    # Users log in and connect in parallel, more than the default backlog of 5
+    request_queue_size = 128
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ZeppelinStubHandler)
+        self.lock = threading.Lock()
+        self.notes = {}
+        self.requests = []
+        self.logins = 0
+        self.users = []
+        self.connections = 0
+        self.ids = itertools.count(1)
+        self.paragraph_delay = 0
+        self.interpreter_startup = 0
+        self.started = set()
+        self.restarts = []
+        self.fail_clear = False
+        self.fail_delete = False
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """URL of the running server"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def find_paragraph(self, path):
+        """Find the paragraph addressed by a /api/notebook/{run,job}/{noteId}/{paragraphId} path"""
+        parts = path.split("/")
+        note = self.notes.get(parts[4], {})
+        for paragraph in note.get("paragraphs", []):
+            if paragraph.get("id") == parts[5]:
+                return paragraph
+        return None
+
+    def run_paragraph(self, paragraph):
+        """Run a single paragraph, returns whether it failed"""
+        paragraph["status"] = "RUNNING"
+        paragraph["dateStarted"] = time.strftime("%Y-%m-%d %H:%M:%S.000")
+        text = paragraph.get("text", "")
+        sleep = re.search(r"sleep (\d+(\.\d+)?)", text)
+        deadline = time.monotonic() + self.paragraph_delay + (float(sleep.group(1)) if sleep else 0)
+        setting = re.match(r"\s*%(\w+)", text)
+        with self.lock:
+            if setting and setting.group(1) not in self.started:
+                self.started.add(setting.group(1))
+                deadline += self.interpreter_startup
+        while time.monotonic() < deadline and not paragraph.get("aborted"):
+            time.sleep(0.005)
+        if paragraph.pop("aborted", False):
+            paragraph["results"] = {"code": "ERROR", "msg": [{"type": "TEXT", "data": "Aborted"}]}
+            paragraph["dateFinished"] = time.strftime("%Y-%m-%d %H:%M:%S.000")
+            paragraph["status"] = "ABORT"
+            return True
+        failed = "fail" in text
+        paragraph["results"] = {
+            "code": "ERROR" if failed else "SUCCESS",
+            "msg": [{"type": "TEXT", "data": text}],
+        }
+        paragraph["dateFinished"] = time.strftime("%Y-%m-%d %H:%M:%S.000")
+        paragraph["status"] = "ERROR" if failed else "FINISHED"
+        return failed
+
+    def run_note(self, note):
+        """Run all the paragraphs of a note, stopping at the first failure"""
+        for paragraph in note.get("paragraphs", []):
+            if self.run_paragraph(paragraph):
+                return True
+        return False
+
+    def run_note_in_background(self, note):
+        """Run all the paragraphs of a note in a background job"""
+        note["running"] = True
+        for paragraph in note.get("paragraphs", []):
+            paragraph["status"] = "PENDING"
+
+        def job():
+            self.run_note(note)
+            for paragraph in note.get("paragraphs", []):
+                if paragraph["status"] == "PENDING":
+                    paragraph["status"] = "READY"
+            note["running"] = False
+
+        threading.Thread(target=job, daemon=True).start()
+
+    @staticmethod
+    def clear_note(note):
+        """Clear the output of all the paragraphs of a note"""
+        for paragraph in note.get("paragraphs", []):
+            for key in ("results", "dateStarted", "dateFinished"):
+                paragraph.pop(key, None)
+            paragraph["status"] = "READY"
+
+    @staticmethod
+    def job_status(note):
+        """Status of the job of a note"""
+        return {
+            "isRunning": note.get("running", False),
+            "paragraphs": [
+                {"id": paragraph.get("id"), "status": paragraph.get("status", "READY")}
+                for paragraph in note.get("paragraphs", [])
+            ],
+        }
+
+    def start(self):
+        """Start serving in a background thread"""
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server"""
+        self.shutdown()
+        self.server_close()
+
+
+def write_user_config(directory, url, name="user1"):
+    """Write a zdairi style user configuration for the stub server"""
+    path = f"{directory}/{name}.yml"
+    with open(path, "w", encoding="utf-8") as config_file:
+        config_file.write(f"zeppelin_url: {url}\n")
+        config_file.write("zeppelin_auth: true\n")
+        config_file.write(f"zeppelin_user: {name}\n")
+        config_file.write("zeppelin_password: pass\n")
+    return path
+
+
+def write_note(directory, texts, name="note"):
+    """Write a notebook with one paragraph per text"""
+    path = f"{directory}/{name}.json"
+    note = {
+        "name": name,
+        "paragraphs": [
+            {"id": f"paragraph_{i}", "text": text} for i, text in enumerate(texts)
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as note_file:
+        json.dump(note, note_file)
+    return path